@@ -93,35 +93,22 @@ class Base(Device):
     # ###################################################
 
     def wait_for_contact(self, timeout=5.0):
-        ts = time.time()
-        while (time.time() - ts < timeout):
-            self.pull_status()
-            if self.left_wheel.status['in_guarded_event'] or self.right_wheel.status['in_guarded_event']:
-                return True
-            time.sleep(0.01)
-        return False
+        self.pull_status(max_age=self.robot_params['robot']['status_cache_max_age'])
+        return self.wait_for_status(lambda: self.left_wheel.status['in_guarded_event'] or
+                                    self.right_wheel.status['in_guarded_event'], timeout, period=0.01)
 
     def wait_while_is_moving(self,timeout=15.0, use_motion_generator=True):
-        done = []
-        def check_wait(wait_method):
-            done.append(wait_method(timeout,use_motion_generator))
-        threads = []
-        threads.append(threading.Thread(target=check_wait, args=(self.left_wheel.wait_while_is_moving,)))
-        threads.append(threading.Thread(target=check_wait, args=(self.right_wheel.wait_while_is_moving,)))
-        [thread.start() for thread in threads]
-        [thread.join() for thread in threads]
+        #The waits are woken by the status updates, so one after the other takes as long as the slowest
+        ts = time.time()
+        done = [w(max(0.0, timeout - (time.time() - ts)), use_motion_generator) for w in
+                (self.left_wheel.wait_while_is_moving, self.right_wheel.wait_while_is_moving)]
         return all(done)
 
     def wait_until_at_setpoint(self, timeout=15.0):
         #Assume both are in motion. This will exit once both are at setpoints
-        at_setpoint = []
-        def check_wait(wait_method):
-            at_setpoint.append(wait_method(timeout))
-        threads = []
-        threads.append(threading.Thread(target=check_wait, args=(self.left_wheel.wait_until_at_setpoint,)))
-        threads.append(threading.Thread(target=check_wait, args=(self.right_wheel.wait_until_at_setpoint,)))
-        [done_thread.start() for done_thread in threads]
-        [done_thread.join() for done_thread in threads]
+        ts = time.time()
+        at_setpoint = [w(max(0.0, timeout - (time.time() - ts))) for w in
+                       (self.left_wheel.wait_until_at_setpoint, self.right_wheel.wait_until_at_setpoint)]
         return all(at_setpoint)
 
     def contact_thresh_to_motor_current(self,is_translate,contact_thresh):
@@ -545,13 +532,15 @@ class Base(Device):
         self.left_wheel.push_command()
         self.right_wheel.push_command()
 
-    def pull_status(self):
+    def pull_status(self, max_age=None):
         """
         Computes base odometery based on stepper positions / velocities
+        max_age: passed to the wheels, see Stepper.pull_status
         """
-        self.left_wheel.pull_status()
-        self.right_wheel.pull_status()
+        self.left_wheel.pull_status(max_age=max_age)
+        self.right_wheel.pull_status(max_age=max_age)
         self.__update_status()
+        self.notify_status()
 
     async def pull_status_async(self):
         """
@@ -560,6 +549,7 @@ class Base(Device):
         await self.left_wheel.pull_status_async()
         await self.right_wheel.pull_status_async()
         self.__update_status()
+        self.notify_status()
 
     def __update_status(self):
 
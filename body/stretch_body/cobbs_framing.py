@@ -7,9 +7,29 @@ from array import array
 #MIT License
 #Copyright (c) 2017 Christopher Baker https://christopherbaker.net
 
+
+def _make_crc_table(): #Modbus CRC, reflected polynomial 0xA001
+    table = []
+    for b in range(256):
+        crc = b
+        for i in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+CRC_TABLE = _make_crc_table()
+COBS_MAX_BLOCK = 254 #Max number of non-zero bytes that follow a single code byte
+
+
 class CobbsFraming():
     """
     Encoding for communications
+
+    Data is Cobbs encoded on bytes / memoryview slices, splitting on the zero bytes of the
+    source rather than moving one byte at a time. The Modbus CRC uses a precomputed 256 entry table.
     """
     def __init__(self):
         pass
@@ -19,11 +39,10 @@ class CobbsFraming():
         Encode data (len nb bytes)
         Append CRC first
         Return buffer of encoded data
+        The caller's buffer is not modified
         """
-        crc=self._calc_crc(data,len(data))
-        data.append((crc>>8)&0xFF)
-        data.append(crc & 0xFF)
-        encoded_data=self._encode(data)
+        crc = self._calc_crc(data, len(data))
+        encoded_data = self._encode(bytes(data) + bytes(((crc >> 8) & 0xFF, crc & 0xFF)))
         encoded_data.append(0x00)
         return encoded_data
 
@@ -31,78 +50,118 @@ class CobbsFraming():
         """
         Decode data into decode buffer
         Check CRC
-        Return crc ok, num bytes in decoded buffer
+        Return crc ok, num bytes in decoded buffer, decoded buffer (array of 'B')
         """
         crc1, nr, decode_buffer = self._decode(data)
+        if nr == 0:
+            return False, 0, decode_buffer
         crc2 = self._calc_crc(decode_buffer, nr)
         return crc1 == crc2, nr, decode_buffer
 
+    def encode_into(self, src, nb, dst):
+        """
+        Encode the first nb bytes of src (bytearray) into dst (bytearray), without allocating buffers
+        The CRC is written in place to src[nb:nb+2], so src must have two spare bytes
+        Return num bytes written to dst, including the trailing packet marker
+        """
+        crc = self._calc_crc(src, nb)
+        src[nb] = (crc >> 8) & 0xFF
+        src[nb + 1] = crc & 0xFF
+        nb = nb + 2
+        sv = memoryview(src)
+        dv = memoryview(dst)
+        read_index = 0
+        write_index = 0
+        while True:
+            z = src.find(0, read_index, nb)
+            end = nb if z == -1 else z
+            while end - read_index >= COBS_MAX_BLOCK:
+                dst[write_index] = 0xFF
+                dv[write_index + 1:write_index + 1 + COBS_MAX_BLOCK] = sv[read_index:read_index + COBS_MAX_BLOCK]
+                write_index = write_index + 1 + COBS_MAX_BLOCK
+                read_index = read_index + COBS_MAX_BLOCK
+            n = end - read_index
+            dst[write_index] = n + 1
+            dv[write_index + 1:write_index + 1 + n] = sv[read_index:end]
+            write_index = write_index + 1 + n
+            if z == -1:
+                break
+            read_index = z + 1
+        dst[write_index] = 0x00
+        return write_index + 1
+
+    def decode_into(self, src, nb, dst):
+        """
+        Decode the first nb bytes of src (a frame without its packet marker) into dst (bytearray)
+        Check CRC
+        Return crc ok, num bytes of decoded data in dst (less CRC)
+        A frame that would overrun dst is reported as invalid rather than growing dst
+        """
+        sv = memoryview(src)
+        dv = memoryview(dst)
+        cap = len(dst)
+        read_index = 0
+        write_index = 0
+        while read_index < nb:
+            code = src[read_index]
+            if code == 0 or (read_index + code > nb and code != 1) or write_index + code > cap:
+                return False, 0
+            n = code - 1
+            dv[write_index:write_index + n] = sv[read_index + 1:read_index + code]
+            write_index = write_index + n
+            read_index = read_index + code
+            if code != 0xFF and read_index != nb:
+                dst[write_index] = 0
+                write_index = write_index + 1
+        if write_index < 2:
+            return False, 0
+        nr = write_index - 2
+        crc = (dst[nr] << 8) | dst[nr + 1]
+        return crc == self._calc_crc(dst, nr), nr
+
     # ######################################
 
     def _calc_crc(self, buf, nr): #Modbus CRC
         crc = 0xFFFF
+        table = CRC_TABLE
         for i in range(nr):
-            crc ^= buf[i]
-            for i in range(8):
-                if ((crc & 1) != 0):
-                    crc >>= 1
-                    crc ^= 0xA001
-                else:
-                    crc >>= 1
+            crc = (crc >> 8) ^ table[(crc ^ buf[i]) & 0xFF]
         return crc
 
-
     def _encode(self,data):
         """
         Cobbs encode the data buffer of nb bytes
-        Return encoded data
+        Return encoded data (bytearray)
         """
-        nb=len(data)
-        read_index = 0
-        write_index = 1
-        code_index = 0
-        code = 1
-        encode_buffer=array('B',[0]*2*nb)
-        while (read_index < nb):
-            if (data[read_index] == 0):
-                encode_buffer[code_index] = code
-                code = 1
-                code_index = write_index
-                write_index=write_index+1
-                read_index=read_index+1
-            else:
-                encode_buffer[write_index]=data[read_index]
-                read_index=read_index+1
-                write_index=write_index+1
-                code=code+1
-                if (code == 0xFF):
-                    encode_buffer[code_index] = code
-                    code = 1
-                    code_index = write_index
-                    write_index=write_index+1
-        encode_buffer[code_index] = code
-        return encode_buffer[:write_index]
+        encode_buffer = bytearray()
+        for chunk in bytes(data).split(b'\x00'):
+            while len(chunk) >= COBS_MAX_BLOCK:
+                encode_buffer.append(0xFF)
+                encode_buffer += chunk[:COBS_MAX_BLOCK]
+                chunk = chunk[COBS_MAX_BLOCK:]
+            encode_buffer.append(len(chunk) + 1)
+            encode_buffer += chunk
+        return encode_buffer
 
     def _decode(self, data):
-        #return crc valid, num bytes in decode buffer, decoded data
-        nb=len(data)
-        if nb==0:
-            return 0,0
-        read_index=0
-        write_index=0
-        code =0
-        decode_buffer=array('B',[0]*2*nb)
+        #return crc, num bytes in decode buffer (less CRC), decoded data
+        #num bytes of 0 indicates an invalid frame
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        nb = len(data)
+        decode_buffer = array('B')
+        read_index = 0
         while read_index < nb:
             code = data[read_index]
-            if (read_index + code > nb and code != 1):
-                return 0,0
-            read_index=read_index+1
-            for i in range(1,code):
-                decode_buffer[write_index]=data[read_index]
-                read_index=read_index+1
-                write_index=write_index+1
-            if (code != 0xFF and read_index != nb):
-                decode_buffer[write_index]=0
-                write_index=write_index+1
-        crc = (decode_buffer[write_index- 2]<<8)|decode_buffer[write_index-1]
-        return crc, write_index-2, decode_buffer[:write_index-2]
\ No newline at end of file
+            if code == 0 or (read_index + code > nb and code != 1):
+                return 0, 0, array('B')
+            decode_buffer.frombytes(data[read_index + 1:read_index + code])
+            read_index = read_index + code
+            if code != 0xFF and read_index != nb:
+                decode_buffer.append(0)
+        write_index = len(decode_buffer)
+        if write_index < 2:
+            return 0, 0, array('B')
+        crc = (decode_buffer[write_index - 2] << 8) | decode_buffer[write_index - 1]
+        del decode_buffer[write_index - 2:]
+        return crc, write_index - 2, decode_buffer
@@ -28,6 +28,26 @@ class DeviceTimestamp:
         return self.ts_start+s
 
 
+_protocol_classes = {}
+
+
+def get_protocol_class(cls, protocol_classes):
+    """
+    Return the subclass of the device class cls for a firmware protocol
+    protocol_classes: the *_Protocol_P* classes of the protocol, in descending order so more recent protocols/methods
+    override less recent (an entry of supported_protocols)
+    The class is built once per (cls, protocol_classes) and shared by all the devices on that protocol
+    """
+    cls = cls.__dict__.get('protocol_base', cls)  # Already a protocol class
+    key = (cls, tuple(protocol_classes))
+    pc = _protocol_classes.get(key)
+    if pc is None:
+        pc = type(cls.__name__, (cls,) + key[1], {'protocol_base': cls, '__module__': cls.__module__,
+                                                  '__qualname__': cls.__qualname__})
+        _protocol_classes[key] = pc
+    return pc
+
+
 class Device:
     logging_params = RobotParams.get_params()[1]['logging']
     os.system('mkdir -p '+hello_utils.get_stretch_directory("/log/stretch_body_logger")) #Some robots may not have this directory yet
@@ -51,6 +71,8 @@ class Device:
         self.thread_stats = None
         self.thread = None
         self.thread_shutdown_flag = threading.Event()
+        self.status_cond = threading.Condition()
+        self.status_seq = 0  # Count of status updates, see notify_status
 
     # ########### Primary interface #############
 
@@ -92,12 +114,61 @@ class Device:
     def pull_status(self):
         pass
 
+    def notify_status(self):
+        """
+        Wake the wait_for_status callers. Called each time the status is updated
+        """
+        with self.status_cond:
+            self.status_seq += 1
+            self.status_cond.notify_all()
+
+    def wait_for_status(self, predicate, timeout=15.0, period=None, pull=None):
+        """
+        Wait until predicate() is true of the latest status
+
+        The predicate is checked on each status update (notify_status). While a status thread is pulling
+        the status, the wait wakes within one status cycle and adds no RPCs of its own.
+        If no update arrives within period (s) the status is pulled with pull (default pull_status),
+        so the wait works the same without a status thread.
+
+        Returns
+        -------
+        bool
+            True if the predicate became true, False if timeout
+        """
+        if period is None:
+            period = self.robot_params['robot']['status_wait_period']
+        if pull is None:
+            pull = self.pull_status
+        ts = time.time()
+        seq = self.status_seq
+        while not predicate():
+            remaining = timeout - (time.time() - ts)
+            if remaining <= 0:
+                return False
+            with self.status_cond:
+                if self.status_seq == seq:
+                    self.status_cond.wait(min(remaining, period))
+                updated = self.status_seq != seq
+                seq = self.status_seq
+            if not updated:
+                pull()
+                seq = self.status_seq
+        return True
+
     def home(self,end_pos,to_positive_stop, measuring=False):
         pass
 
     def step_sentry(self,robot):
         pass
 
+    def set_protocol_class(self, protocol_classes):
+        """
+        Switch this device to the class of its firmware protocol, see get_protocol_class
+        Called on startup once the protocol version is read from the board
+        """
+        self.__class__ = get_protocol_class(type(self), protocol_classes)
+
     def pretty_print(self):
         print('----- {0} ------ '.format(self.name))
         hello_utils.pretty_print_dict("params", self.params)
@@ -0,0 +1,440 @@
+from __future__ import print_function
+import array as arr
+import collections
+import os
+import random
+import select
+import struct
+import threading
+import time
+import stretch_body.cobbs_framing as cobbs_framing
+from stretch_body.transport import *
+
+"""
+Firmware emulators for the Stepper, Pimu and Wacc boards
+
+A DeviceEmulator speaks the device side of the Transport RPC protocol (V0 blocks and V1 frames, see transport.py),
+and answers the RPC set of its board with replies packed to match the unpack_* methods of the latest
+supported protocol in stepper.py, pimu.py and wacc.py.
+
+A PtyDeviceEmulator serves an emulator on a pseudo-terminal pair. Its port (eg /dev/pts/5) can be opened by a
+Transport, or used as the usb param of a Stepper / Pimu / Wacc, so the non-Dynamixel stack can run without hardware:
+
+    emu = PtyDeviceEmulator(StepperEmulator(), reply_delay=0.0005)
+    emu.start()
+    s = Stepper('/dev/hello-motor-lift')
+    s.usb = emu.port  # Or set the usb param in the robot params
+    ...
+    emu.stop()
+
+Latency (reply_delay) and error injection (drop_rate, corrupt_rate) are set on the PtyDeviceEmulator.
+The emulated motion is kinematic only: commanded positions and velocities are reflected back in the status.
+"""
+
+EMULATOR_STEPPER_FIRMWARE = 'Stepper.v0.6.1p5'
+EMULATOR_PIMU_FIRMWARE = 'Pimu.v0.7.0p6'
+EMULATOR_WACC_FIRMWARE = 'Wacc.v0.5.0p3'
+
+
+def pack_string(s, n):
+    return s.encode('utf-8')[:n].ljust(n, b'\x00')
+
+
+class DeviceEmulator():
+    """
+    Device side of the Transport protocol, without the board specific RPCs
+
+    Call write() with the bytes the host sent. Replies are queued and returned by read().
+    Subclasses implement handle_rpc(rpc), which returns the RPC reply (bytes, first byte the reply RPC ID).
+    """
+    TRACE_TYPE_STATUS = 0
+    TRACE_TYPE_DEBUG = 1
+    TRACE_TYPE_PRINT = 2
+
+    def __init__(self, board_variant, firmware_version):
+        self.framer = cobbs_framing.CobbsFraming()
+        self.board_variant = board_variant
+        self.firmware_version = firmware_version
+        self.rx = bytearray()
+        self.out = bytearray()
+        self.rpc_in = bytearray()  # RPC data being received (V0 blocks / V1 frames)
+        self.reply = b''  # RPC reply being sent
+        self.reply_idx = 0
+        self.ts_start = time.monotonic()
+        self.status = {'rpcs': 0, 'frames_in': 0, 'frames_out': 0, 'crc_error': 0, 'unknown_rpc': 0}
+        self.load_test_payload = bytes(arr.array('B', range(256)) * 4)
+        self.frame_filter = None  # Called with each encoded reply frame, returns the bytes to send (see PtyDeviceEmulator)
+        self.trace = collections.deque()  # Recorded (type, data) entries, drained by RPC_READ_TRACE
+
+    # ###################### Transport ########################
+
+    def write(self, data):
+        self.rx += data
+        while True:
+            idx = self.rx.find(0)
+            if idx == -1:
+                break
+            frame = bytes(self.rx[:idx])
+            del self.rx[:idx + 1]
+            if len(frame):
+                self.handle_frame(frame)
+        return len(data)
+
+    def read(self):
+        b = bytes(self.out)
+        self.out = bytearray()
+        return b
+
+    def send_frame(self, data):
+        frame = bytes(self.framer.encode_data(arr.array('B', data)))
+        self.status['frames_out'] += 1
+        if self.frame_filter is not None:
+            frame = self.frame_filter(frame)
+        self.out += frame
+
+    def handle_frame(self, frame):
+        crc_ok, nr, d = self.framer.decode_data(frame)
+        self.status['frames_in'] += 1
+        if not crc_ok or nr == 0:
+            self.status['crc_error'] += 1  # Firmware drops the frame, the host times out
+            return
+        cmd = d[0]
+        data = bytes(d[1:nr])
+        # ############ V1 ##############
+        if cmd == RPC_V1_PUSH_FRAME_FIRST_ONLY or cmd == RPC_V1_PUSH_FRAME_FIRST_MORE:
+            self.rpc_in = bytearray(data)
+        elif cmd == RPC_V1_PUSH_FRAME_MORE or cmd == RPC_V1_PUSH_FRAME_LAST:
+            self.rpc_in += data
+        if cmd == RPC_V1_PUSH_FRAME_FIRST_ONLY or cmd == RPC_V1_PUSH_FRAME_LAST:
+            reply = self.do_rpc(bytes(self.rpc_in))
+            self.send_frame(bytes([RPC_V1_PUSH_ACK]) + reply)  # RPC_ID_ACK and any reply data (eg Stepper P5 ctrl_cycle_cnt)
+        elif cmd == RPC_V1_PUSH_FRAME_FIRST_MORE or cmd == RPC_V1_PUSH_FRAME_MORE:
+            self.send_frame([RPC_V1_PUSH_ACK])
+        elif cmd == RPC_V1_PULL_FRAME_FIRST or cmd == RPC_V1_PULL_FRAME_MORE:
+            if cmd == RPC_V1_PULL_FRAME_FIRST:
+                self.reply = self.do_rpc(data)
+                self.reply_idx = 0
+            chunk = self.reply[self.reply_idx:self.reply_idx + RPC_V1_FRAME_DATA_MAX_BYTES]
+            self.reply_idx += len(chunk)
+            ack = RPC_V1_PULL_FRAME_ACK_LAST if self.reply_idx >= len(self.reply) else RPC_V1_PULL_FRAME_ACK_MORE
+            self.send_frame(bytes([ack]) + chunk)
+        # ############ V0 ##############
+        elif cmd == RPC_V0_START_NEW_RPC:
+            self.rpc_in = bytearray()
+            self.send_frame([RPC_V0_ACK_NEW_RPC])
+        elif cmd == RPC_V0_SEND_BLOCK_MORE:
+            self.rpc_in += data
+            self.send_frame([RPC_V0_ACK_SEND_BLOCK_MORE])
+        elif cmd == RPC_V0_SEND_BLOCK_LAST:
+            self.rpc_in += data
+            self.reply = self.do_rpc(bytes(self.rpc_in))
+            self.reply_idx = 0
+            self.send_frame([RPC_V0_ACK_SEND_BLOCK_LAST])
+        elif cmd == RPC_V0_GET_BLOCK:
+            chunk = self.reply[self.reply_idx:self.reply_idx + RPC_V0_BLOCK_SIZE]
+            self.reply_idx += len(chunk)
+            ack = RPC_V0_ACK_GET_BLOCK_LAST if self.reply_idx >= len(self.reply) else RPC_V0_ACK_GET_BLOCK_MORE
+            self.send_frame(bytes([ack]) + chunk)
+
+    def do_rpc(self, rpc):
+        self.status['rpcs'] += 1
+        if len(rpc) == 0:
+            return b'\x00'
+        reply = self.handle_rpc(rpc)
+        if reply is None:
+            self.status['unknown_rpc'] += 1
+            return b'\x00'  # Host reports the bad reply id
+        return reply
+
+    # ###################### Board ########################
+
+    def handle_rpc(self, rpc):
+        raise NotImplementedError
+
+    def get_timestamp(self):
+        """
+        Board timestamp (us since power up)
+        """
+        return int((time.monotonic() - self.ts_start) * 1e6)
+
+    def board_info(self):
+        return pack_string(self.board_variant, 20) + pack_string(self.firmware_version, 20)
+
+    def record_trace(self, trace_type=TRACE_TYPE_STATUS, data=None):
+        """
+        Record an entry to the trace, as the firmware does each control cycle while the trace is on
+        data: packed entry (a status by default)
+        """
+        self.trace.append((trace_type, self.pack_status() if data is None else bytes(data)))
+
+    def read_trace(self, reply_id):
+        """
+        Reply to RPC_READ_TRACE: the oldest entry and the number remaining (uint8)
+        With no trace recorded, a single status entry and none remaining
+        """
+        if not self.trace:
+            return bytes([reply_id, 0, self.TRACE_TYPE_STATUS]) + self.pack_status()
+        trace_type, data = self.trace.popleft()
+        return bytes([reply_id, min(len(self.trace), 255), trace_type]) + data
+
+    def load_test_push(self, rpc):
+        self.load_test_payload = rpc[1:RPC_DATA_MAX_BYTES + 1]
+
+    def load_test_pull(self):
+        """
+        Reply with the last pushed load test data rotated by one byte, as the firmware does
+        """
+        d = self.load_test_payload
+        self.load_test_payload = d[1:] + d[:1]
+        return self.load_test_payload
+
+
+class StepperEmulator(DeviceEmulator):
+    """
+    Stepper firmware, protocol p5
+    """
+    MODE_SAFETY = 0
+    MODE_VEL_PID = 4
+    MODE_VEL_TRAJ = 6
+    MODE_POS_TRAJ_INCR = 8
+    DIAG_POS_CALIBRATED = 1
+    DIAG_TRAJ_ACTIVE = 4096
+
+    command_fmt = struct.Struct('<B7fB')  # mode, x_des, v_des, a_des, stiffness, i_feedforward, i_contact_pos, i_contact_neg, incr_trigger
+    status_fmt = struct.Struct('<BfdffIQfIfHf')  # P4 / P5 status
+    segment_fmt = struct.Struct('<7fB')  # duration, a0-a5, segment_id
+    n_gains = 85  # P4 / P5 gains
+
+    def __init__(self, board_variant='Stepper.1', firmware_version=EMULATOR_STEPPER_FIRMWARE, stepper_type=0):
+        DeviceEmulator.__init__(self, board_variant, firmware_version)
+        self.stepper_type = stepper_type
+        self.gains = bytes(self.n_gains)
+        self.mode = self.MODE_SAFETY
+        self.pos = 0.0
+        self.vel = 0.0
+        self.diag = 0
+        self.guarded_event = 0
+        self.ctrl_cycle_cnt = 0
+        self.incr_trigger = 0
+        self.trigger = 0
+        self.segment_id = 0
+        self.setpoint = 0.0
+        self.voltage_raw = 12.3 * 1024 / 20.0 + 0.3
+
+    def pack_status(self):
+        return self.status_fmt.pack(self.mode, 0.0, self.pos, self.vel, 0.0, self.diag, self.get_timestamp(), 0.0,
+                                    self.guarded_event, self.setpoint, self.segment_id, self.voltage_raw)
+
+    def set_segment(self, rpc):
+        if len(rpc) >= 1 + self.segment_fmt.size:
+            seg = self.segment_fmt.unpack_from(rpc, 1)
+            self.setpoint = seg[1]
+            self.segment_id = seg[7]
+
+    def handle_rpc(self, rpc):
+        rpc_id = rpc[0]
+        if rpc_id == 1:  # RPC_SET_COMMAND
+            c = self.command_fmt.unpack_from(rpc, 1)
+            self.mode = c[0]
+            if self.mode == self.MODE_VEL_PID or self.mode == self.MODE_VEL_TRAJ:
+                self.vel = c[2]
+            elif self.mode == self.MODE_POS_TRAJ_INCR:
+                if c[8] != self.incr_trigger:
+                    self.pos = self.pos + c[1]
+                    self.incr_trigger = c[8]
+                self.vel = 0.0
+            elif self.mode != self.MODE_SAFETY:
+                self.pos = c[1]
+                self.vel = 0.0
+            self.ctrl_cycle_cnt = (self.ctrl_cycle_cnt + 1) & 0xFFFF
+            return struct.pack('<BH', 2, self.ctrl_cycle_cnt)
+        if rpc_id == 3:  # RPC_GET_STATUS
+            return b'\x04' + self.pack_status()
+        if rpc_id == 5:  # RPC_SET_GAINS
+            self.gains = rpc[1:1 + self.n_gains]
+            return b'\x06'
+        if rpc_id == 7:  # RPC_LOAD_TEST_PUSH
+            self.load_test_push(rpc)
+            return b'\x08'
+        if rpc_id == 9:  # RPC_SET_TRIGGER
+            self.trigger = struct.unpack_from('<I', rpc, 1)[0]
+            if self.trigger & 1:  # TRIGGER_MARK_POS
+                self.diag |= self.DIAG_POS_CALIBRATED
+            return struct.pack('<BI', 10, self.trigger)
+        if rpc_id == 11:  # RPC_SET_ENC_CALIB
+            return b'\x0c'
+        if rpc_id == 13:  # RPC_READ_GAINS_FROM_FLASH
+            return b'\x0e' + self.gains
+        if rpc_id == 15:  # RPC_SET_MENU_ON
+            return b'\x10'
+        if rpc_id == 17:  # RPC_GET_STEPPER_BOARD_INFO
+            return b'\x12' + self.board_info() + bytes([self.stepper_type])
+        if rpc_id == 19:  # RPC_SET_MOTION_LIMITS
+            return b'\x14'
+        if rpc_id == 21:  # RPC_SET_NEXT_TRAJECTORY_SEG
+            self.set_segment(rpc)
+            return b'\x16\x01'
+        if rpc_id == 23:  # RPC_START_NEW_TRAJECTORY
+            self.diag |= self.DIAG_TRAJ_ACTIVE
+            self.set_segment(rpc)
+            return b'\x18\x01'
+        if rpc_id == 25:  # RPC_RESET_TRAJECTORY
+            self.diag &= ~self.DIAG_TRAJ_ACTIVE
+            self.segment_id = 0
+            return b'\x1a'
+        if rpc_id == 27:  # RPC_READ_TRACE
+            return self.read_trace(28)
+        if rpc_id == 29:  # RPC_GET_STATUS_AUX
+            return struct.pack('<B5H', 30, self.ctrl_cycle_cnt, self.ctrl_cycle_cnt, 0, 0, 0)
+        if rpc_id == 31:  # RPC_LOAD_TEST_PULL
+            return b'\x20' + self.load_test_pull()
+        if rpc_id == 33:  # RPC_SET_STEPPER_TYPE
+            self.stepper_type = rpc[1]
+            return b'\x22'
+        if rpc_id == 35:  # RPC_READ_STEPPER_TYPE_FROM_FLASH
+            return bytes([36, self.stepper_type])
+        return None
+
+
+class PimuEmulator(DeviceEmulator):
+    """
+    Pimu firmware, protocol p6
+    """
+    imu_fmt = struct.Struct('<17f')  # IMU P1: accel, gyro, mag, roll / pitch / heading, quaternion, bump
+    status_fmt = struct.Struct('<7fIQHffB')  # voltage, current, temp, cliff x4, state, timestamp, bump_event_cnt, debug, current_charge, over_tilt_type
+
+    def __init__(self, board_variant='Pimu.1', firmware_version=EMULATOR_PIMU_FIRMWARE):
+        DeviceEmulator.__init__(self, board_variant, firmware_version)
+        self.state = 0
+        self.trigger = 0
+        self.motor_sync_cnt = 0
+        self.voltage_raw = 12.3 * 1024 / 20.0
+        self.current_raw = 50.0
+        self.temp_raw = (400 + 25 * 19.5) * 1024 / 3300.0
+        self.cliff_range = [0.0, 0.0, 0.0, 0.0]
+
+    def pack_status(self):
+        return self.imu_fmt.pack(0.0, 0.0, 9.8, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0) + \
+               self.status_fmt.pack(self.voltage_raw, self.current_raw, self.temp_raw, *self.cliff_range,
+                                    self.state, self.get_timestamp(), 0, 0.0, 0.0, 0)
+
+    def handle_rpc(self, rpc):
+        rpc_id = rpc[0]
+        if rpc_id == 1:  # RPC_SET_PIMU_CONFIG
+            return b'\x02'
+        if rpc_id == 3:  # RPC_GET_PIMU_STATUS
+            return b'\x04' + self.pack_status()
+        if rpc_id == 5:  # RPC_SET_PIMU_TRIGGER
+            self.trigger = struct.unpack_from('<I', rpc, 1)[0]
+            return struct.pack('<BI', 6, self.trigger)
+        if rpc_id == 7:  # RPC_GET_PIMU_BOARD_INFO
+            return b'\x08' + self.board_info()
+        if rpc_id == 9:  # RPC_SET_MOTOR_SYNC
+            self.motor_sync_cnt = (self.motor_sync_cnt + 1) & 0x7FFF
+            return struct.pack('<Bh', 10, self.motor_sync_cnt)
+        if rpc_id == 11:  # RPC_READ_TRACE
+            return self.read_trace(12)
+        if rpc_id == 13:  # RPC_GET_PIMU_STATUS_AUX
+            return struct.pack('<Bh', 14, 0)
+        if rpc_id == 15:  # RPC_LOAD_TEST_PULL
+            return b'\x10' + self.load_test_pull()
+        if rpc_id == 17:  # RPC_LOAD_TEST_PUSH
+            self.load_test_push(rpc)
+            return b'\x12'
+        return None
+
+
+class WaccEmulator(DeviceEmulator):
+    """
+    Wacc firmware, protocol p3
+    """
+    command_fmt = struct.Struct('<BBI')  # d2, d3, trigger
+    status_fmt = struct.Struct('<fffhBBBBIIQI')
+
+    def __init__(self, board_variant='Wacc.1', firmware_version=EMULATOR_WACC_FIRMWARE):
+        DeviceEmulator.__init__(self, board_variant, firmware_version)
+        self.d2 = 0
+        self.d3 = 0
+        self.state = 0
+        self.single_tap_count = 0
+
+    def pack_status(self):
+        return self.status_fmt.pack(0.0, 0.0, 9.8, 0, 0, 0, self.d2, self.d3, self.single_tap_count, self.state,
+                                    self.get_timestamp(), 0)
+
+    def handle_rpc(self, rpc):
+        rpc_id = rpc[0]
+        if rpc_id == 1:  # RPC_SET_WACC_CONFIG
+            return b'\x02'
+        if rpc_id == 3:  # RPC_GET_WACC_STATUS
+            return b'\x04' + self.pack_status()
+        if rpc_id == 5:  # RPC_SET_WACC_COMMAND, the last bytes of the RPC (after any ext_command_cb data)
+            if len(rpc) >= 1 + self.command_fmt.size:
+                self.d2, self.d3, trigger = self.command_fmt.unpack_from(rpc, len(rpc) - self.command_fmt.size)
+            return b'\x06'
+        if rpc_id == 7:  # RPC_GET_WACC_BOARD_INFO
+            return b'\x08' + self.board_info()
+        if rpc_id == 9:  # RPC_READ_TRACE
+            return self.read_trace(10)
+        if rpc_id == 11:  # RPC_LOAD_TEST_PUSH
+            self.load_test_push(rpc)
+            return b'\x0c'
+        if rpc_id == 13:  # RPC_LOAD_TEST_PULL
+            return b'\x0e' + self.load_test_pull()
+        return None
+
+
+class PtyDeviceEmulator(threading.Thread):
+    """
+    Serve a DeviceEmulator on the master side of a pty pair. A Transport opens self.port.
+
+    reply_delay: device / USB turnaround (s) added before each batch of replies is written
+    drop_rate: probability a reply frame is lost (the host sees a receive timeout)
+    corrupt_rate: probability a reply frame has a byte flipped (the host sees a CRC / framing error)
+    seed: seed of the error injection, so a failing run can be repeated
+    """
+    def __init__(self, device, reply_delay=0.0, drop_rate=0.0, corrupt_rate=0.0, seed=0):
+        threading.Thread.__init__(self, daemon=True)
+        self.device = device
+        self.reply_delay = reply_delay
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.rand = random.Random(seed)
+        self.status = {'dropped': 0, 'corrupted': 0}
+        self.master, self.slave = os.openpty()
+        self.port = os.ttyname(self.slave)
+        self.device.frame_filter = self.inject_errors
+        self.shutdown_flag = threading.Event()
+
+    def inject_errors(self, frame):
+        if self.drop_rate and self.rand.random() < self.drop_rate:
+            self.status['dropped'] += 1
+            return b''
+        if self.corrupt_rate and self.rand.random() < self.corrupt_rate:
+            self.status['corrupted'] += 1
+            frame = bytearray(frame)
+            idx = self.rand.randrange(len(frame) - 1)  # Keep the packet marker so the host stays in sync
+            frame[idx] = frame[idx] ^ 0x01 if frame[idx] != 0x01 else 0x03
+            return bytes(frame)
+        return frame
+
+    def run(self):
+        poller = select.poll()
+        poller.register(self.master, select.POLLIN)
+        while not self.shutdown_flag.is_set():
+            if poller.poll(50):
+                try:
+                    self.device.write(os.read(self.master, 1024))
+                except OSError:  # Port closed
+                    break
+                out = self.device.read()
+                if out:
+                    if self.reply_delay:
+                        time.sleep(self.reply_delay)
+                    os.write(self.master, out)
+
+    def stop(self):
+        self.shutdown_flag.set()
+        self.join()
+        os.close(self.master)
+        os.close(self.slave)
@@ -113,14 +113,9 @@ class DynamixelXChain(Device):
         self.hw_valid = False
 
     def wait_until_at_setpoint(self, timeout=15.0, use_motion_generator=True):
-        at_setpoint = []
-        def check_wait(wait_method):
-            at_setpoint.append(wait_method(timeout,use_motion_generator))
-        threads = []
-        for motor in self.motors:
-            threads.append(threading.Thread(target=check_wait, args=(self.motors[motor].wait_until_at_setpoint,)))
-        [done_thread.start() for done_thread in threads]
-        [done_thread.join() for done_thread in threads]
+        ts = time.time()
+        at_setpoint = [self.motors[motor].wait_until_at_setpoint(max(0.0, timeout - (time.time() - ts)), use_motion_generator)
+                       for motor in self.motors]
         return all(at_setpoint)
 
     def is_trajectory_active(self):
@@ -375,6 +375,7 @@ class DynamixelHelloXL430(Device):
         else:
             self.ts_over_eff_start=None
             self.status['stall_overload'] = False
+        self.notify_status()
 
     def mark_zero(self):
         if not self.hw_valid:
@@ -385,23 +386,21 @@ class DynamixelHelloXL430(Device):
         self.write_device_params(self.name, self.params)
 
     def wait_until_at_setpoint(self,timeout=15.0, use_motion_generator=True):
-        """Polls for moving status to wait until at commanded position goal
+        """Waits for the moving status to show the commanded position goal is reached
+
+        The moving status is not part of the servo status, so it is read from the servo,
+        once per status update (see Device.wait_for_status) rather than on a fixed poll
 
         Returns
         -------
         bool
             True if success, False if timeout
         """
-        ts = time.time()
-        while time.time() - ts < timeout:
-            if use_motion_generator:
-                if  self.motor.get_moving_status() & (1 << 1) == 0:
-                    return True
-            else:
-                if self.motor.is_moving() == False:
-                    return True
-            time.sleep(0.1)
-        return False
+        if use_motion_generator:
+            done = lambda: self.motor.get_moving_status() & (1 << 1) == 0
+        else:
+            done = lambda: self.motor.is_moving() == False
+        return self.wait_for_status(done, timeout, pull=lambda: None)
 
     def pretty_print(self):
         if not self.hw_valid:
@@ -0,0 +1,76 @@
+from __future__ import print_function
+import os
+import zlib
+import numpy as np
+
+"""
+Storage of the Stepper encoder calibration table (16384 floats, one per encoder count of a motor revolution)
+
+The table is kept in the fleet directory next to its YAML (calibration_steppers/<device>_<serial_no>.npy),
+as a little-endian float32 .npy, the layout of the table in flash. Loading memory-maps the file,
+so reading it costs a page-in rather than parsing 16384 YAML floats.
+
+The checksum of a table is the CRC32 of those bytes, ie of the data sent by RPC_SET_ENC_CALIB.
+"""
+
+ENCODER_CALIBRATION_SIZE = 16384
+ENCODER_CALIBRATION_DTYPE = np.dtype('<f4')
+ENCODER_CALIBRATION_PAGE_SIZE = 64  # Floats per RPC_SET_ENC_CALIB
+
+
+def parse_menu_dump(s):
+    """
+    Return the float64 array of the comma separated table printed by the menu interface (bytes or str)
+    Parsed in a single pass. A malformed dump gives a short array, check its length.
+    """
+    if isinstance(s, bytes):
+        s = s.decode('utf-8')
+    return np.fromstring(s, dtype=np.float64, sep=',')
+
+
+def to_table(data):
+    """
+    Return data (list, array or memmap) as a contiguous float32 table, raise ValueError if it is not 16384 long
+    """
+    t = np.ascontiguousarray(data, dtype=ENCODER_CALIBRATION_DTYPE)
+    if t.shape != (ENCODER_CALIBRATION_SIZE,):
+        raise ValueError('Encoder calibration must be %d floats, got shape %s' % (ENCODER_CALIBRATION_SIZE, t.shape))
+    return t
+
+
+def calibration_checksum(data):
+    return zlib.crc32(to_table(data).tobytes())
+
+
+def calibration_pages(data):
+    """
+    Yield (page, bytes) of the table in the chunks written by RPC_SET_ENC_CALIB
+    """
+    b = to_table(data).tobytes()
+    n = ENCODER_CALIBRATION_PAGE_SIZE * ENCODER_CALIBRATION_DTYPE.itemsize
+    for p in range(ENCODER_CALIBRATION_SIZE // ENCODER_CALIBRATION_PAGE_SIZE):
+        yield p, b[p * n:(p + 1) * n]
+
+
+def save_calibration(filename, data):
+    """
+    Write the table to filename (.npy), replacing any previous file in one step
+    Return its checksum
+    """
+    t = to_table(data)
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, t)
+    os.replace(tmp, filename)
+    return zlib.crc32(t.tobytes())
+
+
+def load_calibration(filename, mmap=True):
+    """
+    Return the table saved at filename, memory-mapped read-only by default
+    Raise ValueError if the file does not hold a table
+    """
+    t = np.load(filename, mmap_mode='r' if mmap else None)
+    if t.dtype != ENCODER_CALIBRATION_DTYPE or t.shape != (ENCODER_CALIBRATION_SIZE,):
+        raise ValueError('Bad encoder calibration file %s' % filename)
+    return t
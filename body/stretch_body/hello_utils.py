@@ -164,10 +164,10 @@ def pretty_print_dict(title, d):
     """
     print('-------- {0} --------'.format(title))
     for k in d.keys():
-        if type(d[k]) != dict:
+        if not isinstance(d[k], dict):
             print(k, ' : ', d[k])
     for k in d.keys():
-        if type(d[k]) == dict:
+        if isinstance(d[k], dict):  # Including the read only status of a snapshot
             pretty_print_dict(k, d[k])
 
 
@@ -280,12 +280,16 @@ class LoopStats():
         """
         return max(0.0, self.sleep_time_s)
 
-    def wait_until_ready_to_run(self,sleep=.0005):
+    def wait_until_ready_to_run(self):
+        """
+        Sleep until one period after the start of the last loop, in one sleep rather than polling
+        """
         if self.ts_loop_start is None:
             time.sleep(.01)
             return True
-        while time.time()-self.ts_loop_start<(1/self.target_loop_rate):
-            time.sleep(sleep)
+        dt = (1/self.target_loop_rate) - (time.time()-self.ts_loop_start)
+        if dt > 0:
+            time.sleep(dt)
 
 
 class ThreadServiceExit(Exception):
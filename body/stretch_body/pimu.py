@@ -2,6 +2,8 @@ from __future__ import print_function
 from stretch_body.transport import *
 from stretch_body.device import Device
 from stretch_body.hello_utils import *
+from stretch_body.rpc_schema import *
+from stretch_body.trace_reader import FirmwareTraceReader
 import textwrap
 import threading
 import psutil
@@ -59,25 +61,14 @@ class IMUBase(Device):
     def unpack_status(self, s, unpack_to=None):
         if unpack_to is None:
             unpack_to = self.status
-        sidx = 0
-        unpack_to['ax'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['ay'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['az'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['gx'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['gy'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['gz'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['mx'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['my'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['mz'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['roll'] = deg_to_rad(unpack_float_t(s[sidx:]));sidx += 4
-        unpack_to['pitch'] = deg_to_rad(unpack_float_t(s[sidx:]));sidx += 4
-        unpack_to['heading'] = deg_to_rad(unpack_float_t(s[sidx:]));sidx += 4
-        unpack_to['qw'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['qx'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['qy'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['qz'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['bump'] = unpack_float_t(s[sidx:]);sidx += 4
-        return sidx
+        return self.unpack_status_schema(IMU_STATUS_P1, s, unpack_to)
+
+    def unpack_status_schema(self, schema, s, unpack_to):
+        schema.unpack_into(s, 0, unpack_to, self)
+        unpack_to['roll'] = deg_to_rad(unpack_to['roll'])
+        unpack_to['pitch'] = deg_to_rad(unpack_to['pitch'])
+        unpack_to['heading'] = deg_to_rad(unpack_to['heading'])
+        return schema.size
 
 
 # ######################## IMU PROTOCOL P0 #################################
@@ -85,30 +76,25 @@ class IMU_Protocol_P0(IMUBase):
     def unpack_status(self, s, unpack_to=None):
         if unpack_to is None:
             unpack_to = self.status
-        sidx =  IMUBase.unpack_status(self, s, unpack_to)
-        self.status['timestamp'] = self.timestamp.set(unpack_uint32_t(s[sidx:]));sidx += 4
-        return sidx
+        return self.unpack_status_schema(IMU_STATUS_P0, s, unpack_to)
 
 # ######################## IMU PROTOCOL P1 #################################
 class IMU_Protocol_P1(IMUBase):
     def unpack_status(self, s, unpack_to=None):
         if unpack_to is None:
             unpack_to = self.status
-        sidx = IMUBase.unpack_status(self, s, unpack_to)
-        return sidx
+        return self.unpack_status_schema(IMU_STATUS_P1, s, unpack_to)
 
 # ######################## IMU #################################
 class IMU(IMUBase):
-    def __init__(self):
-        IMUBase.__init__(self)
-        # Order in descending order so more recent protocols/methods override less recent
-        self.supported_protocols = {'p0': (IMU_Protocol_P0,), 
-                                    'p1': (IMU_Protocol_P1,IMU_Protocol_P0,),
-                                    'p2': (IMU_Protocol_P1,IMU_Protocol_P0,),
-                                    'p3': (IMU_Protocol_P1,IMU_Protocol_P0,),
-                                    'p4': (IMU_Protocol_P1,IMU_Protocol_P0,),
-                                    'p5': (IMU_Protocol_P1,IMU_Protocol_P0,),
-                                    'p6': (IMU_Protocol_P1,IMU_Protocol_P0,)}
+    # Order in descending order so more recent protocols/methods override less recent
+    supported_protocols = {'p0': (IMU_Protocol_P0,),
+                           'p1': (IMU_Protocol_P1,IMU_Protocol_P0,),
+                           'p2': (IMU_Protocol_P1,IMU_Protocol_P0,),
+                           'p3': (IMU_Protocol_P1,IMU_Protocol_P0,),
+                           'p4': (IMU_Protocol_P1,IMU_Protocol_P0,),
+                           'p5': (IMU_Protocol_P1,IMU_Protocol_P0,),
+                           'p6': (IMU_Protocol_P1,IMU_Protocol_P0,)}
 
 # ##################################################################################
 class PimuBase(Device):
@@ -149,6 +135,15 @@ class PimuBase(Device):
     STATE_BOOT_DETECTED = 4096
     STATE_IS_TRACE_ON = 8192
     STATE_IS_CHARGER_CHARGING = 16384
+    STATE_AT_CLIFF = (STATE_AT_CLIFF_0, STATE_AT_CLIFF_1, STATE_AT_CLIFF_2, STATE_AT_CLIFF_3)
+
+    STATE_FLAGS_P1 = StatusFlags([('runstop_event', STATE_RUNSTOP_EVENT), ('cliff_event', STATE_CLIFF_EVENT),
+                                  ('fan_on', STATE_FAN_ON), ('buzzer_on', STATE_BUZZER_ON),
+                                  ('low_voltage_alert', STATE_LOW_VOLTAGE_ALERT), ('high_current_alert', STATE_HIGH_CURRENT_ALERT),
+                                  ('over_tilt_alert', STATE_OVER_TILT_ALERT)])
+    STATE_FLAGS_P2 = StatusFlags(STATE_FLAGS_P1.flags + (('trace_on', STATE_IS_TRACE_ON),))
+    STATE_FLAGS_CHARGER = StatusFlags([('charger_connected', STATE_CHARGER_CONNECTED), ('boot_detected', STATE_BOOT_DETECTED)]) #hardware_id>0 (P1 and later)
+    STATE_FLAGS_P0 = StatusFlags(STATE_FLAGS_P1.flags + STATE_FLAGS_CHARGER.flags)
 
     TRIGGER_BOARD_RESET = 1
     TRIGGER_RUNSTOP_RESET = 2
@@ -214,9 +209,13 @@ class PimuBase(Device):
             Device.startup(self, threaded=threaded)
             self.hw_valid = self.transport.startup()
             if self.hw_valid:
+                self.transport.configure_timeouts(self.robot_params['robot']['use_adaptive_rpc_timeout'],
+                                                  self.robot_params['robot']['rpc_max_retries'])
                 payload = arr.array('B', [self.RPC_GET_PIMU_BOARD_INFO])
                 self.transport.do_pull_rpc_sync(payload, self.rpc_board_info_reply)
                 self.transport.configure_version(self.board_info['firmware_version'])
+                if self.robot_params['robot']['use_transport_worker']:
+                    self.transport.start_worker()
                 return True
             return False
         except KeyError:
@@ -237,11 +236,11 @@ class PimuBase(Device):
         self.config=c.copy()
         self._dirty_config = True
 
-    def pull_status(self, exiting=False):
+    def pull_status(self, exiting=False, max_age=None):
         if not self.hw_valid:
             return
         payload = arr.array('B', [self.RPC_GET_PIMU_STATUS])
-        self.transport.do_pull_rpc_sync(payload, self.rpc_status_reply)
+        self.transport.do_pull_rpc_sync(payload, self.rpc_status_reply, max_age=max_age)
 
     async def pull_status_async(self, exiting=False):
         if not self.hw_valid:
@@ -252,36 +251,46 @@ class PimuBase(Device):
     async def push_command_async(self, exiting=False):
         if not self.hw_valid:
             return
-        payload = self.transport.get_empty_payload()
+        payload = self.transport.get_empty_payload(reuse=False)  # Not shared with other coroutines
+        rpcs = []  # Each RPC is packed into its own slice of the payload, then sent as one batch
+        sidx = 0
         if self._dirty_config:
-            payload[0] = self.RPC_SET_PIMU_CONFIG
-            sidx = self.pack_config(payload, 1)
-            await self.transport.do_push_rpc_async(payload[:sidx], self.rpc_config_reply)
+            payload[sidx] = self.RPC_SET_PIMU_CONFIG
+            rpc_start = sidx
+            sidx = self.pack_config(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_config_reply))
             self._dirty_config = False
 
         if self._dirty_trigger:
-            payload[0] = self.RPC_SET_PIMU_TRIGGER
-            sidx = self.pack_trigger(payload, 1)
-            await self.transport.do_push_rpc_async(payload[:sidx], self.rpc_trigger_reply)
+            payload[sidx] = self.RPC_SET_PIMU_TRIGGER
+            rpc_start = sidx
+            sidx = self.pack_trigger(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_trigger_reply))
             self._trigger = 0
             self._dirty_trigger = False
+        await self.transport.do_push_rpc_batch_async(rpcs)
 
     def push_command(self, exiting=False):
         if not self.hw_valid:
             return
         payload = self.transport.get_empty_payload()
+        rpcs = []  # Each RPC is packed into its own slice of the payload, then sent as one batch
+        sidx = 0
         if self._dirty_config:
-            payload[0] = self.RPC_SET_PIMU_CONFIG
-            sidx = self.pack_config(payload, 1)
-            self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_config_reply)
+            payload[sidx] = self.RPC_SET_PIMU_CONFIG
+            rpc_start = sidx
+            sidx = self.pack_config(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_config_reply))
             self._dirty_config = False
 
         if self._dirty_trigger:
-            payload[0] = self.RPC_SET_PIMU_TRIGGER
-            sidx = self.pack_trigger(payload, 1)
-            self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_trigger_reply)
+            payload[sidx] = self.RPC_SET_PIMU_TRIGGER
+            rpc_start = sidx
+            sidx = self.pack_trigger(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_trigger_reply))
             self._trigger = 0
             self._dirty_trigger = False
+        self.transport.do_push_rpc_batch_sync(rpcs)
 
     def pretty_print(self):
         print('------ Pimu -----')
@@ -379,6 +388,14 @@ class PimuBase(Device):
         self.transport.do_push_rpc_sync(payload, self.rpc_motor_sync_reply)
         self.ts_last_motor_sync = time.time()
 
+    async def trigger_motor_sync_async(self):
+        # Push out immediately, from the caller's event loop
+        if not self.hw_valid:
+            return
+        payload = arr.array('B', [self.RPC_SET_MOTOR_SYNC])
+        await self.transport.do_push_rpc_async(payload, self.rpc_motor_sync_reply)
+        self.ts_last_motor_sync = time.time()
+
 
     def set_fan_on(self):
         self._trigger=self._trigger | self.TRIGGER_FAN_ON
@@ -513,6 +530,10 @@ class PimuBase(Device):
         raise NotImplementedError('This method not supported for firmware on protocol {0}.'
                                   .format(self.board_info['protocol_version']))
 
+    def read_firmware_trace_arrays(self, out=None):
+        raise NotImplementedError('This method not supported for firmware on protocol {0}.'
+                                  .format(self.board_info['protocol_version']))
+
     def rpc_read_firmware_trace_reply(self, reply):
         raise NotImplementedError('This method not supported for firmware on protocol {0}.'
                                   .format(self.board_info['protocol_version']))
@@ -613,82 +634,46 @@ class Pimu_Protocol_P0(PimuBase):
     def unpack_status(self,s, unpack_to=None):
         if unpack_to is None:
             unpack_to = self.status
-        sidx=0
-        sidx +=self.imu.unpack_status((s[sidx:]))
-        unpack_to['voltage']=self.get_voltage(unpack_float_t(s[sidx:]));sidx+=4
-        unpack_to['current'] = self.get_current(unpack_float_t(s[sidx:]));sidx+=4
-        unpack_to['temp'] = self.get_temp(unpack_float_t(s[sidx:]));sidx+=4
-
-        for i in range(4):
-            unpack_to['cliff_range'][i]=unpack_float_t(s[sidx:])
-            sidx+=4
-
-        unpack_to['state'] = unpack_uint32_t(s[sidx:])
-        sidx += 4
-
-        unpack_to['at_cliff']=[]
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_0) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_1) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_2) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_3) != 0)
-        unpack_to['runstop_event'] = (unpack_to['state'] & self.STATE_RUNSTOP_EVENT) != 0
-        unpack_to['cliff_event'] = (unpack_to['state'] & self.STATE_CLIFF_EVENT) != 0
-        unpack_to['fan_on'] = (unpack_to['state'] & self.STATE_FAN_ON) != 0
-        unpack_to['buzzer_on'] = (unpack_to['state'] & self.STATE_BUZZER_ON) != 0
-        unpack_to['low_voltage_alert'] = (unpack_to['state'] & self.STATE_LOW_VOLTAGE_ALERT) != 0
-        unpack_to['high_current_alert'] = (unpack_to['state'] & self.STATE_HIGH_CURRENT_ALERT) != 0
-        unpack_to['over_tilt_alert'] = (unpack_to['state'] & self.STATE_OVER_TILT_ALERT) != 0
-        unpack_to['charger_connected'] = (unpack_to['state'] & self.STATE_CHARGER_CONNECTED) != 0
-        unpack_to['boot_detected'] = (unpack_to['state'] & self.STATE_BOOT_DETECTED) != 0
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint32_t(s[sidx:])); sidx += 4
-        unpack_to['bump_event_cnt'] = unpack_uint16_t(s[sidx:]);sidx += 2
-        unpack_to['debug'] = unpack_float_t(s[sidx:]); sidx += 4
-        return sidx
+        sidx=self.imu.unpack_status(s)
+        PIMU_STATUS_P0.unpack_into(s,sidx,unpack_to,self)
+        state=unpack_to['state']
+        unpack_to['at_cliff']=[(state & m) != 0 for m in self.STATE_AT_CLIFF]
+        self.STATE_FLAGS_P0.expand(state,unpack_to)
+        return sidx+PIMU_STATUS_P0.size
 
 # ######################## PIMU PROTOCOL P1 #################################
 class Pimu_Protocol_P1(PimuBase):
     def unpack_status(self, s, unpack_to=None):
         if unpack_to is None:
             unpack_to = self.status
+        return Pimu_Protocol_P1.unpack_status_schema(self,PIMU_STATUS_P1,self.STATE_FLAGS_P1,s,unpack_to)
 
-        sidx=0
-        sidx +=self.imu.unpack_status((s[sidx:]))
-        unpack_to['voltage']=self.get_voltage(unpack_float_t(s[sidx:]));sidx+=4
-        unpack_to['current'] = self.get_current(unpack_float_t(s[sidx:]));sidx+=4
-        unpack_to['temp'] = self.get_temp(unpack_float_t(s[sidx:]));sidx+=4
-
-        for i in range(4):
-            unpack_to['cliff_range'][i]=unpack_float_t(s[sidx:])
-            sidx+=4
-
-        unpack_to['state'] = unpack_uint32_t(s[sidx:])
-        sidx += 4
-        unpack_to['at_cliff']=[]
-        unpack_to['at_cliff'].append((unpack_to['state'] & PimuBase.STATE_AT_CLIFF_0) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_1) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_2) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_3) != 0)
-        unpack_to['runstop_event'] = (unpack_to['state'] & self.STATE_RUNSTOP_EVENT) != 0
-        unpack_to['cliff_event'] = (unpack_to['state'] & self.STATE_CLIFF_EVENT) != 0
-        unpack_to['fan_on'] = (unpack_to['state'] & self.STATE_FAN_ON) != 0
-        unpack_to['buzzer_on'] = (unpack_to['state'] & self.STATE_BUZZER_ON) != 0
-        unpack_to['low_voltage_alert'] = (unpack_to['state'] & self.STATE_LOW_VOLTAGE_ALERT) != 0
-        unpack_to['high_current_alert'] = (unpack_to['state'] & self.STATE_HIGH_CURRENT_ALERT) != 0
-        unpack_to['over_tilt_alert'] = (unpack_to['state'] & self.STATE_OVER_TILT_ALERT) != 0
+    def unpack_status_schema(self, schema, flags, s, unpack_to):
+        """
+        Decode the IMU status then the Pimu status (P1 and later) using schema and the state table flags
+        """
+        sidx=self.imu.unpack_status(s)
+        schema.unpack_into(s,sidx,unpack_to,self)
+        state=unpack_to['state']
+        unpack_to['at_cliff']=[(state & m) != 0 for m in self.STATE_AT_CLIFF]
+        flags.expand(state,unpack_to)
         if self.board_info['hardware_id']>0:
-            unpack_to['charger_connected'] = (unpack_to['state'] & self.STATE_CHARGER_CONNECTED) != 0
-            unpack_to['boot_detected'] = (unpack_to['state'] & self.STATE_BOOT_DETECTED) != 0
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint64_t(s[sidx:])); sidx += 8
+            self.STATE_FLAGS_CHARGER.expand(state,unpack_to)
         self.imu.status['timestamp'] = unpack_to['timestamp']
-        unpack_to['bump_event_cnt'] = unpack_uint16_t(s[sidx:]);sidx += 2
-        unpack_to['debug'] = unpack_float_t(s[sidx:]); sidx += 4
-        return sidx
+        return sidx+schema.size
 
 
 
 
 # ######################## PIMU PROTOCOL P2 #################################
 class Pimu_Protocol_P2(PimuBase):
+    trace_status_schema = IMU_STATUS_P1.extend(PIMU_STATUS_P2.fields)  # The trace status holds the IMU status first
+
+    def read_firmware_trace_arrays(self, out=None):
+        """
+        Trace of the Pimu (IMU and Pimu status entries) as NumPy arrays, see FirmwareTraceReader
+        """
+        return FirmwareTraceReader(self.transport, self.RPC_READ_TRACE, self.trace_status_schema).read(out=out)
 
     def read_firmware_trace(self):
         self.trace_buf = []
@@ -697,7 +682,8 @@ class Pimu_Protocol_P2(PimuBase):
         ts=time.time()
         while ( self.n_trace_read) and time.time()-ts<60.0:
             payload = arr.array('B', [self.RPC_READ_TRACE])
-            self.transport.do_pull_rpc_sync(payload, self.rpc_read_firmware_trace_reply)
+            self.transport.do_pull_rpc_sync(payload, self.rpc_read_firmware_trace_reply, priority=RPC_PRIORITY_TRACE,
+                                            retries=0)
             time.sleep(.001)
         return self.trace_buf
 
@@ -746,41 +732,7 @@ class Pimu_Protocol_P2(PimuBase):
     def unpack_status(self, s, unpack_to=None): #P2
         if unpack_to is None:
             unpack_to = self.status
-
-        sidx=0
-        sidx +=self.imu.unpack_status((s[sidx:]))
-        unpack_to['voltage']=self.get_voltage(unpack_float_t(s[sidx:]));sidx+=4
-        unpack_to['current'] = self.get_current(unpack_float_t(s[sidx:]));sidx+=4
-        unpack_to['temp'] = self.get_temp(unpack_float_t(s[sidx:]));sidx+=4
-
-        for i in range(4):
-            unpack_to['cliff_range'][i]=unpack_float_t(s[sidx:])
-            sidx+=4
-
-        unpack_to['state'] = unpack_uint32_t(s[sidx:])
-        sidx += 4
-
-        unpack_to['at_cliff']=[]
-        unpack_to['at_cliff'].append((unpack_to['state'] & PimuBase.STATE_AT_CLIFF_0) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_1) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_2) != 0)
-        unpack_to['at_cliff'].append((unpack_to['state'] & self.STATE_AT_CLIFF_3) != 0)
-        unpack_to['runstop_event'] = (unpack_to['state'] & self.STATE_RUNSTOP_EVENT) != 0
-        unpack_to['cliff_event'] = (unpack_to['state'] & self.STATE_CLIFF_EVENT) != 0
-        unpack_to['fan_on'] = (unpack_to['state'] & self.STATE_FAN_ON) != 0
-        unpack_to['buzzer_on'] = (unpack_to['state'] & self.STATE_BUZZER_ON) != 0
-        unpack_to['low_voltage_alert'] = (unpack_to['state'] & self.STATE_LOW_VOLTAGE_ALERT) != 0
-        unpack_to['high_current_alert'] = (unpack_to['state'] & self.STATE_HIGH_CURRENT_ALERT) != 0
-        unpack_to['over_tilt_alert'] = (unpack_to['state'] & self.STATE_OVER_TILT_ALERT) != 0
-        if self.board_info['hardware_id']>0:
-            unpack_to['charger_connected'] = (unpack_to['state'] & self.STATE_CHARGER_CONNECTED) != 0
-            unpack_to['boot_detected'] = (unpack_to['state'] & self.STATE_BOOT_DETECTED) != 0
-        unpack_to['trace_on'] = (unpack_to['state'] & self.STATE_IS_TRACE_ON) != 0
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint64_t(s[sidx:])); sidx += 8
-        self.imu.status['timestamp'] = unpack_to['timestamp']
-        unpack_to['bump_event_cnt'] = unpack_uint16_t(s[sidx:]);sidx += 2
-        unpack_to['debug'] = unpack_float_t(s[sidx:]); sidx += 4
-        return sidx
+        return Pimu_Protocol_P1.unpack_status_schema(self,PIMU_STATUS_P2,self.STATE_FLAGS_P2,s,unpack_to)
 
 # ######################## PIMU PROTOCOL P3 #################################
 class Pimu_Protocol_P3(PimuBase):
@@ -798,7 +750,18 @@ class Pimu_Protocol_P3(PimuBase):
         payload = arr.array('B', [self.RPC_SET_MOTOR_SYNC])
         old_sync_cnt = self.status['motor_sync_cnt']
         self.transport.do_push_rpc_sync(payload, self.rpc_motor_sync_reply)
+        self.mark_motor_sync(old_sync_cnt)
 
+    async def trigger_motor_sync_async(self):
+        # Push out immediately, from the caller's event loop
+        if not self.hw_valid:
+            return
+        payload = arr.array('B', [self.RPC_SET_MOTOR_SYNC])
+        old_sync_cnt = self.status['motor_sync_cnt']
+        await self.transport.do_push_rpc_async(payload, self.rpc_motor_sync_reply)
+        self.mark_motor_sync(old_sync_cnt)
+
+    def mark_motor_sync(self, old_sync_cnt):
         t=time.time()
         # Should motor_sync_cnt should increment with each call to trigger_motor_sync, if not it is an overrun
         if self.status['motor_sync_cnt'] == old_sync_cnt:
@@ -857,7 +820,7 @@ class Pimu_Protocol_P3(PimuBase):
         if not self.hw_valid:
             return
         payload = arr.array('B',[self.RPC_LOAD_TEST_PULL])
-        self.transport.do_pull_rpc_sync(payload, self.rpc_load_test_pull_reply)
+        self.transport.do_pull_rpc_sync(payload, self.rpc_load_test_pull_reply, retries=0)
 
 
     def rpc_load_test_push_reply(self, reply):
@@ -870,67 +833,64 @@ class Pimu_Protocol_P3(PimuBase):
             for i in range(1024):
                 if d[i] != self.load_test_payload[(i + 1) % 1024]:
                     print('Load test pull bad data', d[i], self.load_test_payload[(i + 1) % 1024])
-            self.load_test_payload = d
+            self.load_test_payload = bytearray(d)  # Reply is a view of a reused transport buffer
             print('Successful load test pull')
         else:
             print('Error RPC_REPLY_LOAD_TEST_PULL', reply[0])
 
 # ######################## PIMU PROTOCOL P4 #################################
 class Pimu_Protocol_P4(PimuBase):
+    trace_status_schema = IMU_STATUS_P1.extend(PIMU_STATUS_P4.fields)
+
     def unpack_status(self, s, unpack_to=None):  # P4
         if unpack_to is None:
             unpack_to = self.status
-        sidx = 0
-        sidx = sidx + Pimu_Protocol_P2.unpack_status(self, s, unpack_to)
-        self.status['current_charge'] = self.get_current_charge(unpack_float_t(s[sidx:]));sidx += 4
-        return sidx
+        return Pimu_Protocol_P1.unpack_status_schema(self,PIMU_STATUS_P4,self.STATE_FLAGS_P2,s,unpack_to)
 
 # ######################## PIMU PROTOCOL P5 #################################
 class Pimu_Protocol_P5(PimuBase):
     def unpack_status(self, s, unpack_to=None):  # P5
         if unpack_to is None:
             unpack_to = self.status
-        sidx = 0
-        sidx = sidx + Pimu_Protocol_P4.unpack_status(self, s, unpack_to)
+        sidx = Pimu_Protocol_P1.unpack_status_schema(self,PIMU_STATUS_P5,self.STATE_FLAGS_P2,s,unpack_to)
         unpack_to['charger_is_charging'] = (unpack_to['state'] & self.STATE_IS_CHARGER_CHARGING) != 0
         return sidx
 
 # ######################## PIMU PROTOCOL P6 #################################
 class Pimu_Protocol_P6(PimuBase):
+    trace_status_schema = IMU_STATUS_P1.extend(PIMU_STATUS_P6.fields)
+
     def unpack_status(self, s, unpack_to=None):  # P6
         if unpack_to is None:
             unpack_to = self.status
-        sidx = 0
-        sidx = sidx + Pimu_Protocol_P5.unpack_status(self, s, unpack_to)
-        unpack_to['over_tilt_type'] = self.get_tilt_type(unpack_uint8_t(s[sidx:]));sidx += 1
+        sidx = Pimu_Protocol_P1.unpack_status_schema(self,PIMU_STATUS_P6,self.STATE_FLAGS_P2,s,unpack_to)
+        unpack_to['charger_is_charging'] = (unpack_to['state'] & self.STATE_IS_CHARGER_CHARGING) != 0
         return sidx
 # ######################## PIMU #################################
 class Pimu(PimuBase):
     """
     API to the Stretch Power and IMU board (Pimu)
     """
-    def __init__(self, event_reset=False, usb=None):
-        PimuBase.__init__(self, event_reset,usb)
-        # Order in descending order so more recent protocols/methods override less recent
-        self.supported_protocols = {'p0': (Pimu_Protocol_P0,),
-                                    'p1': (Pimu_Protocol_P1, Pimu_Protocol_P0,),
-                                    'p2': (Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,),
-                                    'p3': (Pimu_Protocol_P3, Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,),
-                                    'p4': (Pimu_Protocol_P4, Pimu_Protocol_P3, Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,),
-                                    'p5': (Pimu_Protocol_P5, Pimu_Protocol_P4, Pimu_Protocol_P3, Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,),
-                                    'p6': (Pimu_Protocol_P6, Pimu_Protocol_P5, Pimu_Protocol_P4, Pimu_Protocol_P3, Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,)
-                                    }
+    # Order in descending order so more recent protocols/methods override less recent
+    supported_protocols = {'p0': (Pimu_Protocol_P0,),
+                           'p1': (Pimu_Protocol_P1, Pimu_Protocol_P0,),
+                           'p2': (Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,),
+                           'p3': (Pimu_Protocol_P3, Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,),
+                           'p4': (Pimu_Protocol_P4, Pimu_Protocol_P3, Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,),
+                           'p5': (Pimu_Protocol_P5, Pimu_Protocol_P4, Pimu_Protocol_P3, Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,),
+                           'p6': (Pimu_Protocol_P6, Pimu_Protocol_P5, Pimu_Protocol_P4, Pimu_Protocol_P3, Pimu_Protocol_P2, Pimu_Protocol_P1, Pimu_Protocol_P0,)
+                           }
 
     def startup(self, threaded=False):
         """
         First determine which protocol version the uC firmware is running.
-        Based on that version, replaces PimuBase class inheritance with a inheritance to a child class of PimuBase that supports that protocol
+        Based on that version, switches to the Pimu (and IMU) class inheriting from the child classes of PimuBase that support that protocol (see Device.set_protocol_class)
         """
         PimuBase.startup(self, threaded=threaded)
         if self.hw_valid:
             if self.board_info['protocol_version'] in self.supported_protocols:
-                Pimu.__bases__ = self.supported_protocols[self.board_info['protocol_version']]
-                IMU.__bases__= self.imu.supported_protocols[self.board_info['protocol_version']]
+                self.set_protocol_class(self.supported_protocols[self.board_info['protocol_version']])
+                self.imu.set_protocol_class(self.imu.supported_protocols[self.board_info['protocol_version']])
             else:
                 if self.board_info['protocol_version'] is None:
                     protocol_msg = """
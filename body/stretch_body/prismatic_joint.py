@@ -62,8 +62,8 @@ class PrismaticJoint(Device):
             self.motor.stop_waypoint_trajectory()
         self.motor.stop()
 
-    def pull_status(self):
-        self.motor.pull_status()
+    def pull_status(self, max_age=None):
+        self.motor.pull_status(max_age=max_age)
         self.__update_status()
 
     async def pull_status_async(self):
@@ -571,13 +571,9 @@ class PrismaticJoint(Device):
         return self.motor.wait_while_is_moving(timeout=timeout, use_motion_generator=use_motion_generator)
 
     def wait_for_contact(self, timeout=5.0):
-        ts=time.time()
-        while (time.time()-ts<timeout):
-            self.pull_status()
-            if self.motor.status['in_guarded_event']:
-                return True
-            time.sleep(0.01)
-        return False
+        self.pull_status(max_age=self.robot_params['robot']['status_cache_max_age'])
+        return self.motor.wait_for_status(lambda: self.motor.status['in_guarded_event'], timeout, period=0.01,
+                                          pull=self.pull_status)
 
     def step_collision_avoidance(self,in_collision):
         """
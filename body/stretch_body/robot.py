@@ -1,6 +1,7 @@
 from __future__ import print_function
 import threading
 import time
+import os
 import signal
 import importlib
 import asyncio
@@ -20,181 +21,176 @@ from serial import SerialException
 from stretch_body.robot_monitor import RobotMonitor
 from stretch_body.robot_trace import RobotTrace
 from stretch_body.robot_collision import RobotCollisionMgmt
+from stretch_body.transport_capture import TransportCapture
+from stretch_body.transport_reactor import TransportReactor
+from stretch_body.scheduler import DeadlineScheduler, PeriodicTask
+from stretch_body.status_snapshot import StatusSnapshots
+from stretch_body.transport_stats import LatencyHistogram
 
 # #############################################################
-class DXLHeadStatusThread(threading.Thread):
+class DXLHeadStatusThread():
     """
-    This thread polls the status data of the Dynamixel devices
-    at 15Hz
+    Polls the status data of the head Dynamixel devices at 15Hz
+    Stepped by its own scheduler thread, see Robot.startup
     """
     def __init__(self, robot, target_rate_hz=15.0):
-        threading.Thread.__init__(self, name = self.__class__.__name__)
         self.robot=robot
         self.robot_update_rate_hz = target_rate_hz
         self.stats = hello_utils.LoopStats(loop_name='DXLHeadStatusThread',target_loop_rate=self.robot_update_rate_hz)
-        self.shutdown_flag = threading.Event()
-        self.running=False
 
     def step(self):
-        self.stats.mark_loop_start()
         self.robot._pull_status_head_dynamixel()
         self.robot._update_trajectory_head_dynamixel()
-        self.stats.mark_loop_end()
 
-    def run(self):
-        self.running=True
-        while not self.shutdown_flag.is_set():
-            self.stats.wait_until_ready_to_run()
-            if not self.shutdown_flag.is_set():
-                self.step()
-        self.robot.logger.debug('Shutting down DXLHeadStatusThread')
-
-class DXLEndOfArmStatusThread(threading.Thread):
+class DXLEndOfArmStatusThread():
     """
-    This thread polls the status data of the Dynamixel devices
-    at 15Hz
+    Polls the status data of the end of arm Dynamixel devices at 15Hz
+    Stepped by its own scheduler thread, see Robot.startup
     """
     def __init__(self, robot, target_rate_hz=15.0):
-        threading.Thread.__init__(self, name = self.__class__.__name__)
         self.robot=robot
         self.robot_update_rate_hz = target_rate_hz
         self.stats = hello_utils.LoopStats(loop_name='DXLEndOfArmStatusThread',target_loop_rate=self.robot_update_rate_hz)
-        self.shutdown_flag = threading.Event()
-        self.running = False
+
     def step(self):
-        self.stats.mark_loop_start()
         self.robot._pull_status_end_of_arm_dynamixel()
         self.robot._update_trajectory_end_of_arm_dynamixel()
-        self.stats.mark_loop_end()
-    def run(self):
-        self.running=True
-        while not self.shutdown_flag.is_set():
-            self.stats.wait_until_ready_to_run()
-            if not self.shutdown_flag.is_set():
-                self.step()
-        self.robot.logger.debug('Shutting down DXLEndOfArmStatusThread')
 
-class NonDXLStatusThread(threading.Thread):
+class NonDXLStatusThread():
     """
-    This thread runs at 25Hz.
+    Runs at 25Hz.
     It updates the status data of the Devices.
-    It also steps the Sentry, Monitor, and Collision functions
+    With use_asyncio it runs as a long-lived coroutine on the Robot's event loop (run_async), otherwise as steps
+    of the Robot's scheduler. The per-board status latency is in get_latency().
     """
+    BOARDS = ('wacc', 'base', 'lift', 'arm', 'pimu')
+
     def __init__(self, robot, target_rate_hz=25.0):
-        threading.Thread.__init__(self, name = self.__class__.__name__)
         self.robot=robot
         self.robot_update_rate_hz = target_rate_hz
         self.shutdown_flag = threading.Event()
         self.stats = hello_utils.LoopStats(loop_name='NonDXLStatusThread',target_loop_rate=self.robot_update_rate_hz)
-        self.titr=0
         self.first_status = False
         self.loop = asyncio.new_event_loop()
         self.running = False
+        self.future = None  # Of run_async() on the Robot's event loop
+        self.board_latency = {b: LatencyHistogram() for b in self.BOARDS}  # From the start of the cycle to the board's status
+        self.cycle_latency = LatencyHistogram()
+        self.status = {'cycles': 0, 'overruns': 0, 'errors': 0}
+
+    def board_pulls(self):
+        """
+        The pull_status_async of each board, recording its latency from now
+        """
+        t0 = time.perf_counter()
+
+        async def pull(name):
+            await self.robot.devices[name].pull_status_async()
+            self.board_latency[name].record(time.perf_counter() - t0)
+        return [pull(b) for b in self.BOARDS]
 
     def step(self):
-        asyncio.set_event_loop(self.loop)
         self.stats.mark_loop_start()
-        if self.robot.params['use_asyncio']:
-            asyncio.get_event_loop().run_until_complete(asyncio.gather(
-                self.robot.wacc.pull_status_async(),
-                self.robot.base.pull_status_async(),
-                self.robot.lift.pull_status_async(),
-                self.robot.arm.pull_status_async(),
-                self.robot.pimu.pull_status_async()))
+        t0 = time.perf_counter()
+        if self.robot.transport_reactor is not None:
+            self.robot.transport_reactor.run_until_complete(self.board_pulls())
+        elif self.robot.params['use_asyncio']:
+            self.loop.run_until_complete(asyncio.gather(*self.board_pulls()))
         else:
             self.robot._pull_status_non_dynamixel()
+        self.end_cycle(t0)
+
+    def end_cycle(self, t0):
+        self.cycle_latency.record(time.perf_counter() - t0)
+        self.status['cycles'] += 1
+        self.robot._publish_status(*self.BOARDS)
         self.stats.mark_loop_end()
-    def run(self):
-        self.running=True
+        self.first_status = True
+
+    def start_async(self, loop):
+        """
+        Run the status loop as a long-lived coroutine on loop (the Robot's event loop) rather than as steps
+        """
+        self.future = asyncio.run_coroutine_threadsafe(self.run_async(), loop)
+
+    async def run_async(self):
+        """
+        Pull the boards together at robot_update_rate_hz, on absolute deadlines of the running loop.
+        Robot.push_command hands its work to the same loop, so user pushes are interleaved with the pulls
+        of the cycle (each port's TransportLock orders the RPCs of that port) rather than waiting for it to end.
+        A cycle still running at its next release is an overrun: the missed releases are skipped.
+        """
+        loop = asyncio.get_running_loop()
+        period = 1.0 / self.robot_update_rate_hz
+        t_next = loop.time()
+        self.running = True
         while not self.shutdown_flag.is_set():
-            self.stats.wait_until_ready_to_run()
-            if not self.shutdown_flag.is_set():
-                self.step()
-            self.first_status = True
-        self.stop()
-        self.robot.logger.debug('Shutting down NonDXLStatusThread')
-    
+            self.stats.mark_loop_start()
+            t0 = time.perf_counter()
+            try:
+                await asyncio.gather(*self.board_pulls())
+            except Exception:
+                self.status['errors'] += 1
+                self.robot.logger.exception('Error in NonDXLStatusThread status cycle')
+            self.end_cycle(t0)
+            t_next += period
+            now = loop.time()
+            if t_next <= now:
+                self.status['overruns'] += 1
+                t_next += (int((now - t_next) / period) + 1) * period
+            await asyncio.sleep(t_next - now)
+        self.running = False
+
+    def get_latency(self):
+        """
+        Per-board and whole cycle status latency (s), as LatencyHistogram snapshots
+        """
+        s = {b: self.board_latency[b].snapshot() for b in self.BOARDS}
+        s['cycle'] = self.cycle_latency.snapshot()
+        return s
+
+    def pretty_print_latency(self):
+        print('--------- NonDXLStatusThread latency (ms) -----------')
+        print('Cycles: %d  Overruns: %d  Errors: %d' % (self.status['cycles'], self.status['overruns'], self.status['errors']))
+        for k, l in self.get_latency().items():
+            print('%-6s p50 %.2f  p90 %.2f  p99 %.2f  max %.2f' % (k, l['p50'] * 1e3, l['p90'] * 1e3, l['p99'] * 1e3, l['max'] * 1e3))
+
     def stop(self):
+        self.shutdown_flag.set()
+        if self.future is not None:
+            try:
+                self.future.result(timeout=1.0)
+            except Exception:
+                self.future.cancel()
+            self.future = None
         self.loop.stop()
 
-class SystemMonitorThread(threading.Thread):
+class SystemMonitorThread():
     """
-    This thread runs at 25Hz.
-    It updates the status data of the Devices.
-    It also steps the Sentry, Monitor, and Collision functions
+    Runs at the SystemMonitorThread_Hz rate.
+    Its work (the Sentry, Monitor, Trace and non-DXL trajectory updates) is stepped as separate, down-rated,
+    tasks of the Robot's scheduler, see Robot.startup
     """
     def __init__(self, robot, target_rate_hz=25.0):
-        threading.Thread.__init__(self, name = self.__class__.__name__)
         self.robot=robot
         self.robot_update_rate_hz = target_rate_hz
-        self.monitor_downrate_int = int(robot.params['rates']['SystemMonitorThread_monitor_downrate_int'])  # Step the monitor at every Nth iteration
-        self.trace_downrate_int = int(robot.params['rates']['SystemMonitorThread_trace_downrate_int'])  # Step the trace at every Nth iteration
-        self.sentry_downrate_int = int(robot.params['rates']['SystemMonitorThread_sentry_downrate_int']) # Step the sentry at every Nth iteration
-        #self.collision_downrate_int = int(robot.params['rates']['SystemMonitorThread_collision_downrate_int'])  # Step the monitor at every Nth iteration
-        self.trajectory_downrate_int = int(robot.params['rates']['SystemMonitorThread_nondxl_trajectory_downrate_int'])  # Update hardware with waypoint trajectory segments at every Nth iteration
-
         if self.robot.params['use_monitor']:
             self.robot.monitor.startup()
-        self.shutdown_flag = threading.Event()
         self.stats = hello_utils.LoopStats(loop_name='SystemMonitorThread',target_loop_rate=self.robot_update_rate_hz)
-        self.titr=0
-        self.running=False
-
-    def step(self):
-        self.titr = self.titr + 1
-        self.stats.mark_loop_start()
-        if self.robot.params['use_monitor']:
-            if (self.titr % self.monitor_downrate_int) == 0:
-                self.robot.monitor.step()
-        if self.robot.params['use_trace']:
-            if (self.titr % self.trace_downrate_int) == 0:
-                self.robot.trace.step()
-        if self.robot.params['use_sentry']:
-            if (self.titr % self.sentry_downrate_int) == 0:
-                self.robot._step_sentry()
-        # if self.robot.is_homed():
-        #     self.robot.collision.step()
-        if (self.titr % self.trajectory_downrate_int) == 0:
-            self.robot._update_trajectory_non_dynamixel()
-        self.stats.mark_loop_end()
 
-    def run(self):
-        self.running=True
-        while not self.shutdown_flag.is_set():
-            self.stats.wait_until_ready_to_run()
-            if not self.shutdown_flag.is_set():
-                self.step()
-        self.robot.logger.debug('Shutting down SystemMonitorThread')
-
-class CollisionMonitorThread(threading.Thread):
+class CollisionMonitorThread():
     """
-    This thread runs at 25Hz.
-    It updates the status data of the Devices.
-    It also steps the Sentry, Monitor, and Collision functions
+    Runs at 100Hz (see Robot.startup).
+    Steps the collision manager once the robot is homed. Stepped by its own scheduler thread, see Robot.startup
     """
     def __init__(self, robot, target_rate_hz=25.0):
-        threading.Thread.__init__(self, name = self.__class__.__name__)
         self.robot=robot
         self.robot_update_rate_hz = target_rate_hz
-        self.shutdown_flag = threading.Event()
         self.stats = hello_utils.LoopStats(loop_name='CollisionMonitorThread',target_loop_rate=self.robot_update_rate_hz)
-        self.titr=0
-        self.running=False
 
     def step(self):
-        self.titr = self.titr + 1
-        self.stats.mark_loop_start()
         if self.robot.is_homed():
             self.robot.collision.step()
-        self.stats.mark_loop_end()
-
-    def run(self):
-        self.running=True
-        while not self.shutdown_flag.is_set():
-            self.stats.wait_until_ready_to_run()
-            if not self.shutdown_flag.is_set():
-                self.step()
-        self.robot.logger.debug('Shutting down CollisionMonitorThread')
 
 class Robot(Device):
     """
@@ -208,7 +204,11 @@ class Robot(Device):
         self.dirty_push_command = False
         self.lock = threading.RLock() #Prevent status thread from triggering motor sync prematurely
         self.status = {'pimu': {}, 'base': {}, 'lift': {}, 'arm': {}, 'head': {}, 'wacc': {}, 'end_of_arm': {}}
+        self.snapshots = StatusSnapshots()
+        self.status_publisher_running = False  # The non-DXL status task / coroutine publishes the status snapshots
         self.async_event_loop = None
+        self.transport_capture = None
+        self.transport_reactor = None
 
         self.pimu=pimu.Pimu()
         self.status['pimu']=self.pimu.status
@@ -239,6 +239,8 @@ class Robot(Device):
         self.dxl_head_thread = None
         self.event_loop_thread = None
         self.collision_mgmt_thread = None
+        self.scheduler = None
+        self.schedulers = []
 
         self.eoa_name= self.params['tool']
         module_name = self.robot_params[self.eoa_name]['py_module_name']
@@ -293,6 +295,8 @@ class Robot(Device):
             return False
 
         self.logger.debug('Starting up Robot {0} of batch {1}'.format(self.params['serial_no'], self.params['batch_name']))
+        if self.params['use_transport_capture']:
+            self.start_transport_capture()
         success = True
         for k in self.devices:
             if self.devices[k] is not None:
@@ -304,11 +308,14 @@ class Robot(Device):
                 or self.base.right_wheel.transport.version == 0 \
                 or self.base.left_wheel.transport.version == 0 \
                 or self.wacc.transport.version==0 \
-                or self.pimu.transport.version==0) and self.params['use_asyncio'] :
+                or self.pimu.transport.version==0) and (self.params['use_asyncio'] or self.params['use_transport_reactor']):
             self.logger.warning('Not able to use asyncio for transport communications. Defaulting to sync.')
             self.params['use_asyncio']=0
+            self.params['use_transport_reactor']=0
         else:
             self.start_event_loop()
+            if self.params['use_transport_reactor']:
+                self.transport_reactor = TransportReactor()
 
         #Always startup to load URDFs now and not while thread is running
         self.collision.startup()
@@ -321,34 +328,77 @@ class Robot(Device):
         signal.signal(signal.SIGTERM, hello_utils.thread_service_shutdown)
         signal.signal(signal.SIGINT, hello_utils.thread_service_shutdown)
 
-        self.non_dxl_thread = NonDXLStatusThread(self, target_rate_hz=self.params['rates']['NonDXLStatusThread_Hz'])
-        self.dxl_end_of_arm_thread = DXLEndOfArmStatusThread(self,target_rate_hz=self.params['rates']['DXLStatusThread_Hz'])
-        self.sys_thread = SystemMonitorThread(self, target_rate_hz=self.params['rates']['SystemMonitorThread_Hz'])
-        self.dxl_head_thread = DXLHeadStatusThread(self, target_rate_hz=self.params['rates']['DXLStatusThread_Hz'])
+        rates = self.params['rates']
+        self.non_dxl_thread = NonDXLStatusThread(self, target_rate_hz=rates['NonDXLStatusThread_Hz'])
+        self.dxl_end_of_arm_thread = DXLEndOfArmStatusThread(self,target_rate_hz=rates['DXLStatusThread_Hz'])
+        self.sys_thread = SystemMonitorThread(self, target_rate_hz=rates['SystemMonitorThread_Hz'])
+        self.dxl_head_thread = DXLHeadStatusThread(self, target_rate_hz=rates['DXLStatusThread_Hz'])
         self.collision_mgmt_thread = CollisionMonitorThread(self, target_rate_hz=100)
 
+        # The work of the status / monitor threads runs as tasks of deadline scheduler threads, which sleep until
+        # the next task is due (see scheduler.py). The non-DXL status and the system monitor share the RobotScheduler.
+        # Each Dynamixel chain and the collision monitor get a scheduler thread of their own, so that a slow bus or
+        # collision check does not hold up the other loops.
+        self.scheduler = DeadlineScheduler('RobotScheduler')
+        self.schedulers = [self.scheduler]
+        if start_non_dxl_thread:
+            if self.params['use_asyncio'] and self.transport_reactor is None and self.async_event_loop is not None:
+                self.non_dxl_thread.start_async(self.async_event_loop)
+            else:
+                self._add_task('non_dxl_status', self.non_dxl_thread.step, rates['NonDXLStatusThread_Hz'])  # step() updates its own stats
+            self.status_publisher_running = True
+
+        if start_dxl_thread:
+            self._add_task('dxl_head', self.dxl_head_thread.step, rates['DXLStatusThread_Hz'], self.dxl_head_thread.stats,
+                           self._add_scheduler('DXLHeadScheduler'))
+            self._add_task('dxl_end_of_arm', self.dxl_end_of_arm_thread.step, rates['DXLStatusThread_Hz'], self.dxl_end_of_arm_thread.stats,
+                           self._add_scheduler('DXLEndOfArmScheduler'))
+
+        if start_sys_mon_thread:
+            r = rates['SystemMonitorThread_Hz']
+            self._add_task('non_dxl_trajectory', self._update_trajectory_non_dynamixel, r / rates['SystemMonitorThread_nondxl_trajectory_downrate_int'])
+            self._add_task('monitor', self._step_if('use_monitor', self.monitor.step), r / rates['SystemMonitorThread_monitor_downrate_int'])
+            self._add_task('trace', self._step_if('use_trace', self.trace.step), r / rates['SystemMonitorThread_trace_downrate_int'])
+            self._add_task('sentry', self._step_if('use_sentry', self._step_sentry), r / rates['SystemMonitorThread_sentry_downrate_int'])
+            if self.collision_mgmt_thread:
+                self._add_task('collision', self.collision_mgmt_thread.step, self.collision_mgmt_thread.robot_update_rate_hz, self.collision_mgmt_thread.stats,
+                               self._add_scheduler('CollisionScheduler'))
+
+        self.snapshots.publish(self.status)  # All devices, before the threads publish theirs
+        for s in self.schedulers:
+            s.start()
         if start_non_dxl_thread:
-            self.non_dxl_thread.daemon = True
-            self.non_dxl_thread.start()
             ts = time.time()
             while not self.non_dxl_thread.first_status and time.time() - ts < 3.0:
                 time.sleep(0.01)
 
-        if start_dxl_thread:
-            self.dxl_head_thread.daemon = True
-            self.dxl_head_thread.start()
-            self.dxl_end_of_arm_thread.daemon = True
-            self.dxl_end_of_arm_thread.start()
+        return success
 
-        if start_sys_mon_thread:
-            self.sys_thread.daemon = True
-            self.sys_thread.start()
+    def _add_scheduler(self, name):
+        """
+        Return a new scheduler thread, started and stopped along with the RobotScheduler
+        """
+        s = DeadlineScheduler(name)
+        self.schedulers.append(s)
+        return s
 
-        if start_sys_mon_thread and self.collision_mgmt_thread:
-            self.collision_mgmt_thread.daemon = True
-            self.collision_mgmt_thread.start()
+    def _add_task(self, name, fn, rate_hz, stats=None, scheduler=None):
+        """
+        Schedule fn at rate_hz on scheduler (default the RobotScheduler),
+        with the priority and offset of the task in the scheduler params
+        """
+        p = self.params['scheduler'].get(name, {})
+        return (scheduler or self.scheduler).add_task(PeriodicTask(name, fn, rate_hz, priority=p.get('priority', 0),
+                                                    offset=p.get('offset', 0.0), stats=stats))
 
-        return success
+    def _step_if(self, param, step):
+        """
+        Return a task that calls step while the robot param is set (it can be changed at runtime)
+        """
+        def task():
+            if self.params[param]:
+                step()
+        return task
 
     def stop(self):
         """
@@ -357,41 +407,77 @@ class Robot(Device):
         """
         self.logger.debug('---- Shutting down robot ----')
         self._file_lock.release()
-        if self.non_dxl_thread:
-            if self.non_dxl_thread.running:
-                self.non_dxl_thread.shutdown_flag.set()
-                self.non_dxl_thread.join(1)
-        if self.dxl_head_thread:
-            if self.dxl_head_thread.running:
-                self.dxl_head_thread.shutdown_flag.set()
-                self.dxl_head_thread.join(1)
-        if self.dxl_end_of_arm_thread:
-            if self.dxl_end_of_arm_thread.running:
-                self.dxl_end_of_arm_thread.shutdown_flag.set()
-                self.dxl_end_of_arm_thread.join(1)
-        if self.sys_thread:
-            if self.sys_thread.running:
-                self.sys_thread.shutdown_flag.set()
-                self.sys_thread.join(1)
-        if self.collision_mgmt_thread:
-            if self.collision_mgmt_thread.running:
-                self.collision_mgmt_thread.shutdown_flag.set()
-                self.collision_mgmt_thread.join(1)
+        self.status_publisher_running = False
+        for s in self.schedulers:
+            if s.running:
+                s.stop()
+            if s.get_task('collision') is not None:
                 self.collision.stop()
+        if self.non_dxl_thread:
+            self.non_dxl_thread.stop()
         for k in self.devices:
             if self.devices[k] is not None:
                 self.logger.debug('Shutting down %s'%k)
                 self.devices[k].stop()
         self.stop_event_loop()
+        self.stop_transport_capture()
         self.logger.debug('---- Shutdown complete ----')
 
+    def start_transport_capture(self, filename=None):
+        """
+        Log the serial traffic of the Stepper, Pimu and Wacc boards to a binary capture file
+        Default file is stretch_user/log/capture/transport_capture_<time>.sbcap
+        Replay with stretch_transport_replay.py
+        """
+        if self.transport_capture is not None:
+            return self.transport_capture.filename
+        if filename is None:
+            path = hello_utils.get_stretch_directory() + 'log/capture'
+            try:
+                os.makedirs(path)
+            except OSError:
+                pass  # Exists
+            filename = path + '/transport_capture_' + hello_utils.create_time_string() + '.sbcap'
+        self.transport_capture = TransportCapture(filename)
+        for d in [self.pimu, self.wacc, self.lift.motor, self.arm.motor, self.base.left_wheel, self.base.right_wheel]:
+            d.transport.start_capture(self.transport_capture)
+        self.logger.debug('Transport capture to %s' % filename)
+        return filename
+
+    def stop_transport_capture(self):
+        if self.transport_capture is None:
+            return
+        for d in [self.pimu, self.wacc, self.lift.motor, self.arm.motor, self.base.left_wheel, self.base.right_wheel]:
+            d.transport.stop_capture()
+        self.transport_capture.stop()
+        if self.transport_capture.status['dropped']:
+            self.logger.warning('Transport capture dropped %d records' % self.transport_capture.status['dropped'])
+        self.transport_capture = None
+
     def get_status(self):
         """
         Thread safe and atomic read of current Robot status data
-        Returns as a dict.
+        Returns as a dict (of each caller's own) of the device status of the latest status snapshot:
+        consistent across devices, and read only (use status_snapshot.copy_status to modify it)
         """
-        with self.lock:
-            return self.status.copy()
+        return dict(self.get_status_snapshot().status)
+
+    def get_status_snapshot(self):
+        """
+        Latest StatusSnapshot (seq, timestamp, status) published by the status threads. Does not take a lock.
+        If the non-DXL status thread is not running (eg startup(start_non_dxl_thread=False), with the caller
+        pulling the status itself), publishes the current status on each call instead.
+        """
+        if not self.status_publisher_running:
+            return self.snapshots.publish(self.status)
+        return self.snapshots.get()
+
+    def wait_for_status_snapshot(self, seq, timeout=1.0):
+        """
+        Block until a status snapshot newer than seq is published
+        Returns the StatusSnapshot, or None on timeout
+        """
+        return self.snapshots.wait(seq, timeout)
 
     def pretty_print(self):
         s=self.get_status()
@@ -428,17 +514,129 @@ class Robot(Device):
                 self.pimu.push_command()
                 self.wacc.push_command()
 
-            # Check if need to do a motor sync by looking at if there's been a pimu sync signal sent
-            # since the last stepper.set_command for each joint
-            sync_required = (self.pimu.ts_last_motor_sync is not None) and (
-                    self.arm.motor.is_sync_required(self.pimu.ts_last_motor_sync)
-                    or self.lift.motor.is_sync_required(self.pimu.ts_last_motor_sync)
-                    or self.base.right_wheel.is_sync_required(self.pimu.ts_last_motor_sync)
-                        or self.base.left_wheel.is_sync_required(self.pimu.ts_last_motor_sync))
-
-            if (self.pimu.ts_last_motor_sync is None or ( ready and sync_required)):
+            if self._is_motor_sync_required(ready):
                 self.pimu.trigger_motor_sync()
 
+    async def push_command_async(self, on_robot_loop=False):
+        """
+        Cause all queued up RPC commands to be sent down to Devices, from the caller's event loop
+
+        The Device RPCs are gathered (overlapping across ports) and the loop runs its other tasks while they
+        are in flight, so an asyncio controller needs no thread of its own to command the robot.
+        on_robot_loop: run it on the Robot's event loop (start_event_loop) instead, awaited without blocking the caller's loop
+        """
+        if on_robot_loop:
+            return await self.run_on_robot_loop(self.push_command_async())
+        # self.lock is not held across the awaits: it would block the threads, not the other coroutines
+        with self.lock:
+            ready = self.pimu.is_ready_for_sync()
+        await self.push_command_coro()
+        with self.lock:
+            sync = self._is_motor_sync_required(ready)
+        if sync:
+            await self.pimu.trigger_motor_sync_async()
+
+    def _is_motor_sync_required(self, ready):
+        # Check if need to do a motor sync by looking at if there's been a pimu sync signal sent
+        # since the last stepper.set_command for each joint
+        sync_required = (self.pimu.ts_last_motor_sync is not None) and (
+                self.arm.motor.is_sync_required(self.pimu.ts_last_motor_sync)
+                or self.lift.motor.is_sync_required(self.pimu.ts_last_motor_sync)
+                or self.base.right_wheel.is_sync_required(self.pimu.ts_last_motor_sync)
+                    or self.base.left_wheel.is_sync_required(self.pimu.ts_last_motor_sync))
+        return self.pimu.ts_last_motor_sync is None or (ready and sync_required)
+
+    async def run_on_robot_loop(self, coro):
+        """
+        Hand coro off to the Robot's event loop (start_event_loop) and await its result from the caller's loop
+        """
+        if self.async_event_loop is None:
+            raise RuntimeError('Robot event loop not started, see Robot.start_event_loop')
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.async_event_loop))
+
+    async def status_stream(self, rate_hz=None):
+        """
+        Async iterator of the StatusSnapshots published by the status threads
+
+            async for s in robot.status_stream(30.0):
+                print(s.seq, s.status['lift']['pos'])
+
+        rate_hz: yield at most at this rate (the latest snapshot at each period), or each new snapshot if None
+        """
+        loop = asyncio.get_running_loop()
+        t_next = loop.time()
+        snapshot = self.get_status_snapshot()
+        while True:
+            yield snapshot
+            if rate_hz is not None:
+                t_next += 1.0 / rate_hz
+                delay = t_next - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    t_next = loop.time()  # Fell behind, don't burst to catch up
+            s = None
+            while s is None:
+                s = await self.snapshots.wait_async(snapshot.seq, timeout=1.0)
+            snapshot = s
+
+    async def wait_for_status_async(self, predicate, timeout=15.0):
+        """
+        Suspend until predicate(status) is true of the latest status snapshot (see get_status)
+        It is checked on each snapshot the status threads publish.
+
+        Returns
+        -------
+        bool
+            True if the predicate became true, False if timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        snapshot = self.get_status_snapshot()
+        while not predicate(snapshot.status):
+            snapshot = await self.snapshots.wait_async(snapshot.seq, max(0.0, deadline - loop.time()))
+            if snapshot is None:
+                return False
+        return True
+
+    async def wait_command_async(self, timeout=15.0, use_motion_generator=True):
+        """
+        Awaitable wait_command: suspend until all motion is complete, without blocking the event loop
+
+        The steppers are checked on the status snapshots. The Dynamixel moving status is not part of their status,
+        so once the steppers are done it is read from the servos, as DynamixelHelloXL430.wait_until_at_setpoint
+        does, on the loop's default executor as the serial reads block.
+
+        Returns
+        -------
+        bool
+            True if motion completed, False if timed out before motion completed
+        """
+        await asyncio.sleep(0.1)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(0.0, timeout - 0.1)
+        s = 'is_mg_moving' if use_motion_generator else 'is_moving_filtered'
+        dxl = [m for chain in (self.head, self.end_of_arm) for m in chain.motors.values() if m.hw_valid]
+
+        def dxl_done():
+            if use_motion_generator:
+                return all([m.motor.get_moving_status() & (1 << 1) == 0 for m in dxl])
+            return all([m.motor.is_moving() == False for m in dxl])
+
+        def steppers_done(status):
+            return not (status['base']['left_wheel'][s] or status['base']['right_wheel'][s] or
+                        status['arm']['motor'][s] or status['lift']['motor'][s])
+
+        snapshot = self.get_status_snapshot()
+        while True:
+            if steppers_done(snapshot.status) and (not dxl or await loop.run_in_executor(None, dxl_done)):
+                return True
+            if loop.time() >= deadline:
+                return False
+            snapshot = await self.snapshots.wait_async(snapshot.seq, deadline - loop.time())
+            if snapshot is None:
+                return False
+
     def enable_collision_mgmt(self):
         self.collision.enable()
 
@@ -467,18 +665,12 @@ class Robot(Device):
         """
         time.sleep(0.1)
         timeout = max(0.0, timeout - 0.1)
-        done = []
-        def check_wait(wait_method):
-            done.append(wait_method(timeout, use_motion_generator))
         start = time.time()
-        threads = []
-        threads.append(threading.Thread(target=check_wait, args=(self.base.wait_while_is_moving,)))
-        threads.append(threading.Thread(target=check_wait, args=(self.arm.wait_while_is_moving,)))
-        threads.append(threading.Thread(target=check_wait, args=(self.lift.wait_while_is_moving,)))
-        threads.append(threading.Thread(target=check_wait, args=(self.head.wait_until_at_setpoint,)))
-        threads.append(threading.Thread(target=check_wait, args=(self.end_of_arm.wait_until_at_setpoint,)))
-        [thread.start() for thread in threads]
-        [thread.join() for thread in threads]
+        # Each wait is woken by the status threads (see Device.wait_for_status), so waiting on the joints
+        # one after the other in this thread takes as long as the slowest joint
+        done = [w(max(0.0, timeout - (time.time() - start)), use_motion_generator) for w in
+                (self.base.wait_while_is_moving, self.arm.wait_while_is_moving, self.lift.wait_while_is_moving,
+                 self.head.wait_until_at_setpoint, self.end_of_arm.wait_until_at_setpoint)]
         return all(done)
 
     # ######### Waypoint Trajectory Interface ##############################
@@ -642,11 +834,15 @@ class Robot(Device):
         self.push_command()
     # ################ Helpers #################################
 
+    def _publish_status(self, *names):
+        self.snapshots.publish({n: self.status[n] for n in names})
+
     def _pull_status_head_dynamixel(self):
         try:
             self.head.pull_status()
         except SerialException:
             self.logger.warning('Serial Exception on Robot._pull_status_head_dynamixel')
+        self._publish_status('head')
 
     def _update_trajectory_head_dynamixel(self):
         try:
@@ -660,6 +856,7 @@ class Robot(Device):
             self.end_of_arm.pull_status()
         except SerialException:
             self.logger.warning('Serial Exception on Robot._pull_status_end_of_arm_dynamixel')
+        self._publish_status('end_of_arm')
 
     def _update_trajectory_end_of_arm_dynamixel(self):
         try:
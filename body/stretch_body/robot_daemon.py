@@ -0,0 +1,348 @@
+from __future__ import print_function
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+from stretch_body.status_snapshot import StatusSnapshot
+from stretch_body.robot_params import RobotParams
+import stretch_body.hello_utils as hello_utils
+
+"""
+Optional out of process owner of the robot hardware, shared by several client processes
+
+Only one process can open the robot (acquire_body_filelock, and the flock of each Transport port). The RobotDaemon
+is that process: it runs a Robot (all the Transport and Dynamixel ports), and
+  * publishes each StatusSnapshot (see status_snapshot.py) into a shared memory StatusSegment, guarded by a seqlock,
+    so any number of processes read the status without IPC, without a lock and without touching the serial ports
+  * serves the Robot API to clients over a Unix domain socket (multiprocessing.connection): a RobotProxy forwards
+    robot.arm.move_to(0.1), robot.push_command() etc. to the daemon, where the calls are run one at a time.
+    Calls that block until motion completes (wait_command, wait_until_at_setpoint, home, ...) are the exception,
+    see BLOCKING_CALLS: they run alongside the others, so one client waiting does not hold up the rest.
+
+    $ stretch_robot_daemon.py                       # Process 1, owns the hardware
+
+    from stretch_body.robot_daemon import RobotProxy # Processes 2..N
+    r = RobotProxy()
+    r.startup()
+    r.arm.move_to(0.1)
+    r.push_command()
+    print(r.get_status()['arm']['pos'])
+    r.stop()
+
+Seqlock: the writer makes the sequence odd, writes the snapshot, then makes it even. A reader copies the snapshot out
+between two reads of an even, unchanged sequence, and retries otherwise; it only unpickles a copy known to be whole.
+The stores are in program order on the x86 robot computer, so no fences are needed.
+The socket (mode 0600) and the shared memory are only open to the user running the daemon.
+"""
+
+SEGMENT_HEADER = struct.Struct('<QQdI4x')  # seqlock, snapshot seq, snapshot timestamp, payload bytes
+
+# Calls (by method name) run without the daemon's lock: they wait on the status threads for motion to complete.
+# A method named wait* (wait_command, wait_while_is_moving, wait_for_status_snapshot, ...) is also one.
+BLOCKING_CALLS = ('home', 'stow')
+
+
+def is_blocking_call(path):
+    name = path.rsplit('.', 1)[-1]
+    return name.startswith('wait') or name in BLOCKING_CALLS
+
+
+class StatusSegment():
+    """
+    Shared memory region holding the latest StatusSnapshot, written by one process and read by many
+    name: of the shared memory
+    size: (bytes) of the region, when creating it
+    create: create the region (the writer), else map an existing one read only (a reader)
+    """
+    def __init__(self, name, size=1048576, create=False):
+        self.name = name
+        self.create = create
+        if create:
+            try:  # Left over by a daemon that did not exit cleanly
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            SEGMENT_HEADER.pack_into(self.shm.buf, 0, 0, 0, 0.0, 0)
+            self.buf = self.shm.buf
+        else:
+            # Mapped directly rather than with SharedMemory, whose resource tracker would unlink it at the reader's exit
+            fd = os.open('/dev/shm/' + name.lstrip('/'), os.O_RDONLY)
+            try:
+                self.shm = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+            finally:
+                os.close(fd)
+            self.buf = memoryview(self.shm)
+        self.capacity = len(self.buf) - SEGMENT_HEADER.size
+        self.status = {'writes': 0, 'reads': 0, 'retries': 0}
+
+    def write(self, snapshot):
+        data = pickle.dumps(snapshot.status, protocol=pickle.HIGHEST_PROTOCOL)
+        n = len(data)
+        if n > self.capacity:
+            raise ValueError('Status of %d bytes does not fit StatusSegment %s of %d bytes' % (n, self.name, self.capacity))
+        seq = SEGMENT_HEADER.unpack_from(self.buf, 0)[0]
+        struct.pack_into('<Q', self.buf, 0, seq + 1)  # Odd: write in progress
+        self.buf[SEGMENT_HEADER.size:SEGMENT_HEADER.size + n] = data
+        SEGMENT_HEADER.pack_into(self.buf, 0, seq + 1, snapshot.seq, snapshot.timestamp, n)
+        struct.pack_into('<Q', self.buf, 0, seq + 2)
+        self.status['writes'] += 1
+
+    def seq(self):
+        """
+        Seqlock sequence: changes with each write, 0 if nothing has been written
+        """
+        return struct.unpack_from('<Q', self.buf, 0)[0]
+
+    def read(self, timeout=1.0):
+        """
+        Returns the latest StatusSnapshot, or None if nothing has been written
+        Raises TimeoutError if no whole copy could be taken within timeout (s)
+        """
+        ts = time.time()
+        while True:
+            seq, snapshot_seq, timestamp, n = SEGMENT_HEADER.unpack_from(self.buf, 0)
+            if seq == 0:
+                return None
+            if not seq & 1:
+                data = bytes(self.buf[SEGMENT_HEADER.size:SEGMENT_HEADER.size + n])
+                if struct.unpack_from('<Q', self.buf, 0)[0] == seq:
+                    self.status['reads'] += 1
+                    return StatusSnapshot(snapshot_seq, timestamp, pickle.loads(data))
+            self.status['retries'] += 1
+            if time.time() - ts > timeout:
+                raise TimeoutError('StatusSegment %s: no consistent read' % self.name)
+
+    def close(self):
+        if not self.create:
+            self.buf.release()
+        self.buf = None
+        self.shm.close()
+        if self.create:
+            self.shm.unlink()
+
+
+def get_daemon_params():
+    return RobotParams.get_params()[1]['robot']['daemon']
+
+
+class RobotDaemon():
+    """
+    Runs robot (a Robot by default) for the RobotProxy clients, see above
+    address, shm_name, shm_size: default to the robot.daemon params
+    """
+    def __init__(self, robot=None, address=None, shm_name=None, shm_size=None):
+        params = get_daemon_params() if None in (address, shm_name, shm_size) else {}
+        self.address = address if address is not None else params['address']
+        self.shm_name = shm_name if shm_name is not None else params['shm_name']
+        self.shm_size = shm_size if shm_size is not None else params['shm_size']
+        if robot is None:
+            from stretch_body.robot import Robot
+            robot = Robot()
+        self.robot = robot
+        self.logger = logging.getLogger('RobotDaemon')
+        self.lock = threading.Lock()  # Client calls run one at a time, but for the blocking calls
+        self.shutdown_flag = threading.Event()
+        self.segment = None
+        self.listener = None
+        self.threads = []
+        self.status = {'clients': 0, 'calls': 0, 'errors': 0, 'published': 0}
+
+    def startup(self):
+        if not self.robot.startup():
+            return False
+        self.segment = StatusSegment(self.shm_name, self.shm_size, create=True)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX')
+        os.chmod(self.address, 0o600)
+        for target, name in ((self._publish_loop, 'RobotDaemonPublish'), (self._accept_loop, 'RobotDaemonAccept')):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self.threads.append(t)
+        self.logger.debug('RobotDaemon serving on %s, status in %s' % (self.address, self.shm_name))
+        return True
+
+    def serve_forever(self):
+        try:
+            while not self.shutdown_flag.wait(0.5):
+                pass
+        except (KeyboardInterrupt, SystemExit, hello_utils.ThreadServiceExit):
+            pass
+
+    def stop(self):
+        self.shutdown_flag.set()
+        if self.listener is not None:
+            try:
+                Client(self.address, family='AF_UNIX').close()  # Wake the accept loop
+            except OSError:
+                pass
+            self.listener.close()
+            self.listener = None
+        for t in self.threads:
+            t.join(1.0)
+        self.threads = []
+        with self.lock:
+            self.robot.stop()
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def _publish_loop(self):
+        snapshot = self.robot.get_status_snapshot()
+        self.segment.write(snapshot)
+        while not self.shutdown_flag.is_set():
+            s = self.robot.snapshots.wait(snapshot.seq, timeout=0.5)
+            if s is not None and not self.shutdown_flag.is_set():
+                snapshot = s
+                self.segment.write(snapshot)
+                self.status['published'] += 1
+
+    def _accept_loop(self):
+        while not self.shutdown_flag.is_set():
+            try:
+                conn = self.listener.accept()
+            except (OSError, AttributeError):  # Listener closed
+                return
+            if self.shutdown_flag.is_set():
+                conn.close()
+                return
+            self.status['clients'] += 1
+            t = threading.Thread(target=self._serve_client, args=(conn,), name='RobotDaemonClient', daemon=True)
+            t.start()
+
+    def _resolve(self, path):
+        obj = self.robot
+        for name in path.split('.'):
+            if name.startswith('_'):
+                raise AttributeError('RobotDaemon does not serve private attribute %s' % path)
+            obj = getattr(obj, name)
+        return obj
+
+    def _serve_client(self, conn):
+        """
+        Requests are ('call', path, args, kwargs) or ('get', path); replies are ('ok', value) or ('error', exception)
+        """
+        while not self.shutdown_flag.is_set():
+            try:
+                req = conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                self.status['calls'] += 1
+                if req[0] == 'call' and is_blocking_call(req[1]):
+                    reply = ('ok', self._resolve(req[1])(*req[2], **req[3]))
+                else:
+                    with self.lock:
+                        if req[0] == 'call':
+                            reply = ('ok', self._resolve(req[1])(*req[2], **req[3]))
+                        else:
+                            reply = ('ok', self._resolve(req[1]))
+            except Exception as e:
+                self.status['errors'] += 1
+                reply = ('error', e)
+            try:
+                conn.send(reply)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                conn.send(('error', TypeError('Reply to %s can not be sent: %s' % (req[1], e))))
+            except (EOFError, OSError):
+                break
+        conn.close()
+
+
+class RemoteAttribute():
+    """
+    An attribute of the robot in the daemon (eg proxy.arm.motor): call it to call it in the daemon
+    """
+    def __init__(self, proxy, path):
+        self._proxy = proxy
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return RemoteAttribute(self._proxy, self._path + '.' + name)
+
+    def __call__(self, *args, **kwargs):
+        return self._proxy.request(('call', self._path, args, kwargs))
+
+
+class RobotProxy():
+    """
+    Robot-compatible client of a RobotDaemon
+    get_status / get_status_snapshot read the shared memory; all else (r.push_command(), r.lift.move_by(0.1),...)
+    is forwarded to the daemon. Use get_attribute('lift.params') for values rather than calls.
+    address, shm_name: default to the robot.daemon params
+    """
+    def __init__(self, address=None, shm_name=None):
+        params = get_daemon_params() if None in (address, shm_name) else {}
+        self.address = address if address is not None else params['address']
+        self.shm_name = shm_name if shm_name is not None else params['shm_name']
+        self.conn = None
+        self.segment = None
+        self.lock = threading.Lock()  # One request in flight per connection
+
+    def startup(self):
+        try:
+            self.conn = Client(self.address, family='AF_UNIX')
+            self.segment = StatusSegment(self.shm_name)
+        except (OSError, FileNotFoundError) as e:
+            logging.getLogger('RobotProxy').error('No RobotDaemon at %s: %s' % (self.address, e))
+            return False
+        return True
+
+    def stop(self):
+        """
+        Disconnect from the daemon. The robot keeps running for the other clients.
+        """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+    def request(self, req):
+        with self.lock:
+            self.conn.send(req)
+            result, value = self.conn.recv()
+        if result == 'error':
+            raise value
+        return value
+
+    def get_attribute(self, path):
+        return self.request(('get', path))
+
+    def get_status(self, timeout=1.0):
+        return self.get_status_snapshot(timeout).status
+
+    def get_status_snapshot(self, timeout=1.0):
+        """
+        Returns the latest StatusSnapshot of the daemon
+        Right after the daemon starts, waits up to timeout (s) for its first one, then raises TimeoutError
+        """
+        ts = time.time()
+        snapshot = self.segment.read(timeout)
+        while snapshot is None:
+            if time.time() - ts > timeout:
+                raise TimeoutError('RobotProxy: no status from the RobotDaemon in %s' % self.shm_name)
+            time.sleep(0.001)
+            snapshot = self.segment.read(timeout)
+        return snapshot
+
+    def pretty_print(self):
+        hello_utils.pretty_print_dict('Status', self.get_status())
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return RemoteAttribute(self, name)
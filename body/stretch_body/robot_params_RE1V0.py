@@ -751,6 +751,15 @@ nominal_params={
             #'SystemMonitorThread_collision_downrate_int': 1,
             'SystemMonitorThread_sentry_downrate_int': 1,
             'SystemMonitorThread_nondxl_trajectory_downrate_int': 2},
+        'scheduler':{ #Priority (higher runs first when due together) and offset (s) within the period of each Robot task
+            'non_dxl_status': {'priority': 10, 'offset': 0.0},
+            'non_dxl_trajectory': {'priority': 9, 'offset': 0.02},
+            'dxl_head': {'priority': 8, 'offset': 0.01},
+            'dxl_end_of_arm': {'priority': 8, 'offset': 0.045},
+            'collision': {'priority': 6, 'offset': 0.0},
+            'sentry': {'priority': 4, 'offset': 0.03},
+            'monitor': {'priority': 2, 'offset': 0.035},
+            'trace': {'priority': 1, 'offset': 0.055}},
         'tool': 'tool_stretch_gripper',
         'use_collision_manager': 0,
         'stow':{
@@ -760,6 +769,15 @@ nominal_params={
         'lift': 0.2},
         'use_monitor': 1,
         'use_trace': 0,
+        'use_transport_capture': 0,
+        'use_transport_worker': 0,
+        'use_transport_reactor': 0,
+        'use_adaptive_rpc_timeout': 0,
+        'rpc_max_retries': 0,
+        'status_cache_max_age': 0.05,
+        'stepper_command_keep_alive': 0,
+        'status_wait_period': 0.1,
+        'daemon': {'address': '/tmp/stretch_pid_dir/robot_daemon.sock', 'shm_name': 'stretch_body_status', 'shm_size': 1048576},
         'use_sentry': 1,
         'use_asyncio':1},
     'robot_monitor':{
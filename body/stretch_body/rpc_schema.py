@@ -0,0 +1,308 @@
+from __future__ import print_function
+import struct
+import operator
+from collections.abc import MutableMapping
+
+"""
+Declarative layouts of the RPC messages of the Stepper, Pimu and Wacc
+
+A message layout is a list of fields (dest, type) or (dest, type, convert), in the order of the firmware C struct.
+RPCSchema compiles the layout once into a single struct.Struct, so a message is decoded with one unpack_from
+rather than a slice + struct.unpack per field.
+
+dest: key in the status dict. A dotted dest goes into a nested dict or list ('waypoint_traj.setpoint', 'cliff_range.0').
+      A dest of None skips the field.
+type: one of the C types in CTYPES
+convert: name of a method of the device (dotted names allowed, eg 'timestamp.set') applied to the raw value
+
+Bit flags packed into a status word (eg Stepper diag, Pimu state) are expanded with a StatusFlags table.
+Care should still be taken that these layouts match the C-structs of the firmware.
+
+A message can also be decoded into / packed from a Record (fixed fields in __slots__) rather than a dict.
+For a Record the schema compiles the assignments to the fields into one function, as namedtuple does.
+"""
+
+CTYPES = {'uint8_t': 'B', 'int8_t': 'b', 'uint16_t': 'H', 'int16_t': 'h', 'uint32_t': 'I', 'int32_t': 'i',
+          'uint64_t': 'Q', 'int64_t': 'q', 'float_t': 'f', 'double_t': 'd'}
+
+
+def _compile(name, lines, env):
+    """
+    Return the function name defined by the source lines, with the names of env in scope
+    """
+    ns = dict(env)
+    exec('\n'.join(lines), ns)
+    return ns[name]
+
+
+class Record(MutableMapping):
+    """
+    Fixed set of fields held in __slots__, for the status and command data written every control cycle
+    Fields are attributes (status.pos) and the record is also a dict-compatible view (status['pos'], keys(),
+    items(), copy(), update(), ...) so code written against the former dict keeps working.
+    Fields can't be added or removed.
+
+    A subclass lists its fields with their defaults in FIELDS (mutable defaults are copied per record):
+
+        class Command(Record):
+            FIELDS = {'mode': 0, 'x_des': 0.0}
+            __slots__ = tuple(FIELDS)
+    """
+    __slots__ = ()
+    FIELDS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.field_set = frozenset(cls.FIELDS)
+
+    def __init__(self, **values):
+        for k, v in self.FIELDS.items():
+            setattr(self, k, v.copy() if isinstance(v, (dict, list)) else v)
+        self.update(values)
+
+    def __getitem__(self, key):
+        if key in self.field_set:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.field_set:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        raise TypeError('Fields of a %s can not be removed' % type(self).__name__)
+
+    def __contains__(self, key):
+        return key in self.field_set
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, dict(self.items()))
+
+    def copy(self):
+        """
+        Shallow copy, as dict.copy
+        """
+        r = type(self).__new__(type(self))
+        for k in self.FIELDS:
+            setattr(r, k, getattr(self, k))
+        return r
+
+    def to_dict(self):
+        return dict(self.items())
+
+
+class RPCSchema():
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.struct = struct.Struct('<' + ''.join([CTYPES[f[1]] for f in self.fields]))
+        self.size = self.struct.size
+        self.names = []  # Fields written straight to the dict
+        self.nested = []  # (index, outer key, inner key)
+        self.converted = []  # (index, attrgetter of the convert method, dest)
+        plain = []
+        for i, f in enumerate(self.fields):
+            dest = f[0]
+            if dest is None:
+                continue
+            if len(f) > 2:
+                self.converted.append((i, operator.attrgetter(f[2]), dest))
+            elif '.' in dest:
+                outer, inner = dest.split('.')
+                self.nested.append((i, outer, int(inner) if inner.isdigit() else inner))
+            else:
+                self.names.append(dest)
+                plain.append(i)
+        if len(plain) == len(self.fields):
+            self.plain = lambda v: v
+        elif len(plain) == 0:
+            self.plain = lambda v: ()
+        elif len(plain) == 1:
+            self.plain = lambda v, i=plain[0]: (v[i],)
+        else:
+            self.plain = operator.itemgetter(*plain)
+        self.unpack_record = self.compile_unpack_record()
+        self.get_items = self.pack_record = None  # Only for messages of plain fields
+        dests = [f[0] for f in self.fields]
+        if None not in dests and not any(['.' in d for d in dests]):
+            self.get_items = operator.itemgetter(*dests)
+            if len(dests) == 1:
+                self.get_items = lambda v, g=self.get_items: (g(v),)
+            self.pack_record = _compile('pack_record', ['def pack_record(s, sidx, r):',
+                                                        '    pack_into(s, sidx, %s)' % ', '.join(['r.' + d for d in dests])],
+                                        {'pack_into': self.struct.pack_into})
+
+    def compile_unpack_record(self):
+        """
+        Return unpack_record(record, values, device), assigning the raw values of the message to the fields of a Record
+        """
+        targets = []
+        post = []
+        env = {}
+        for i, f in enumerate(self.fields):
+            dest = f[0]
+            if dest is None:
+                targets.append('_')
+                continue
+            if not all([d.isidentifier() or d.isdigit() for d in dest.split('.')]):
+                raise ValueError('Invalid field name %s' % dest)
+            if len(f) > 2:
+                targets.append('v%d' % i)
+                env['c%d' % i] = operator.attrgetter(f[2])
+                post.append('    r.%s = c%d(device)(v%d)' % (dest, i, i))
+            elif '.' in dest:
+                outer, inner = dest.split('.')
+                targets.append('v%d' % i)
+                post.append('    r.%s[%r] = v%d' % (outer, int(inner) if inner.isdigit() else inner, i))
+            else:
+                targets.append('r.' + dest)
+        lines = ['def unpack_record(r, v, device):', '    %s, = v' % ', '.join(targets)] + post
+        return _compile('unpack_record', lines, env)
+
+    def extend(self, fields):
+        """
+        Return a new schema of this layout followed by fields (eg a later protocol that appends to a message)
+        """
+        return RPCSchema(self.fields + list(fields))
+
+    def unpack(self, s, sidx=0):
+        """
+        Return the tuple of raw values of the message at s[sidx:]
+        """
+        return self.struct.unpack_from(s, sidx)
+
+    def unpack_into(self, s, sidx, unpack_to, device=None):
+        """
+        Decode the message at s[sidx:] into the dict (or Record) unpack_to
+        device: owner of the convert methods
+        Return the tuple of raw values
+        """
+        v = self.struct.unpack_from(s, sidx)
+        if isinstance(unpack_to, Record):
+            self.unpack_record(unpack_to, v, device)
+            return v
+        unpack_to.update(zip(self.names, self.plain(v)))
+        for i, outer, inner in self.nested:
+            unpack_to[outer][inner] = v[i]
+        for i, convert, dest in self.converted:
+            unpack_to[dest] = convert(device)(v[i])
+        return v
+
+    def pack_into(self, s, sidx, values):
+        """
+        Pack the fields of the message from the dict (or Record) values into s at sidx
+        Return sidx following the message
+        """
+        if isinstance(values, Record):
+            self.pack_record(s, sidx, values)
+        else:
+            self.struct.pack_into(s, sidx, *self.get_items(values))
+        return sidx + self.size
+
+
+class StatusFlags():
+    """
+    Table of (dest, mask) to expand a status word into booleans
+    """
+    def __init__(self, flags):
+        self.flags = tuple(flags)
+        lines = ['def expand_record(w, r):'] + ['    r.%s = (w & %d) != 0' % (dest, mask) for dest, mask in self.flags
+                                                if dest.isidentifier()]
+        self.expand_record = _compile('expand_record', lines if self.flags else lines + ['    pass'], {})
+
+    def expand(self, word, unpack_to):
+        if isinstance(unpack_to, Record):
+            self.expand_record(word, unpack_to)
+            return
+        for dest, mask in self.flags:
+            unpack_to[dest] = (word & mask) != 0
+
+
+# ######################## STEPPER #################################
+
+STEPPER_STATUS_P0 = RPCSchema([('mode', 'uint8_t'), ('effort_ticks', 'float_t'), ('pos', 'double_t'), ('vel', 'float_t'),
+                               ('err', 'float_t'), ('diag', 'uint32_t'), ('timestamp', 'uint32_t', 'timestamp.set'),
+                               ('debug', 'float_t'), ('guarded_event', 'uint32_t')])
+
+STEPPER_STATUS_P1 = RPCSchema([('mode', 'uint8_t'), ('effort_ticks', 'float_t'), ('pos', 'double_t'), ('vel', 'float_t'),
+                               ('err', 'float_t'), ('diag', 'uint32_t'), ('timestamp', 'uint64_t', 'timestamp.set'),
+                               ('debug', 'float_t'), ('guarded_event', 'uint32_t'),
+                               ('waypoint_traj.setpoint', 'float_t'), ('waypoint_traj.segment_id', 'uint16_t')])
+
+STEPPER_STATUS_P2 = STEPPER_STATUS_P1
+
+STEPPER_STATUS_P4 = STEPPER_STATUS_P2.extend([('voltage', 'float_t', 'get_voltage')])
+
+class StepperStatus(Record):
+    FIELDS = {'mode': 0, 'effort_ticks': 0, 'effort_pct': 0, 'current': 0, 'pos': 0, 'vel': 0, 'err': 0, 'diag': 0,
+              'timestamp': 0, 'debug': 0, 'guarded_event': 0, 'transport': None, 'pos_calibrated': 0, 'runstop_on': 0,
+              'near_pos_setpoint': 0, 'near_vel_setpoint': 0, 'is_moving': 0, 'is_moving_filtered': 0,
+              'at_current_limit': 0, 'is_mg_accelerating': 0, 'is_mg_moving': 0, 'calibration_rcvd': 0,
+              'in_guarded_event': 0, 'in_safety_event': 0, 'waiting_on_sync': 0, 'in_sync_mode': 0, 'trace_on': 0,
+              'ctrl_cycle_cnt': 0, 'waypoint_traj': {'state': 'idle', 'setpoint': None, 'segment_id': 0},
+              'voltage': 0}
+    __slots__ = tuple(FIELDS)
+
+
+class StepperCommand(Record):
+    FIELDS = {'mode': 0, 'x_des': 0, 'v_des': 0, 'a_des': 0, 'stiffness': 1.0, 'i_feedforward': 0.0,
+              'i_contact_pos': 0, 'i_contact_neg': 0, 'incr_trigger': 0}
+    __slots__ = tuple(FIELDS)
+
+
+STEPPER_COMMAND = RPCSchema([('mode', 'uint8_t'), ('x_des', 'float_t'), ('v_des', 'float_t'), ('a_des', 'float_t'),
+                             ('stiffness', 'float_t'), ('i_feedforward', 'float_t'), ('i_contact_pos', 'float_t'),
+                             ('i_contact_neg', 'float_t'), ('incr_trigger', 'uint8_t')])
+
+# ######################## PIMU #################################
+
+IMU_STATUS_P1 = RPCSchema([('ax', 'float_t'), ('ay', 'float_t'), ('az', 'float_t'),
+                           ('gx', 'float_t'), ('gy', 'float_t'), ('gz', 'float_t'),
+                           ('mx', 'float_t'), ('my', 'float_t'), ('mz', 'float_t'),
+                           ('roll', 'float_t'), ('pitch', 'float_t'), ('heading', 'float_t'),  # deg
+                           ('qw', 'float_t'), ('qx', 'float_t'), ('qy', 'float_t'), ('qz', 'float_t'), ('bump', 'float_t')])
+
+IMU_STATUS_P0 = IMU_STATUS_P1.extend([('timestamp', 'uint32_t', 'timestamp.set')])
+
+PIMU_STATUS_P0 = RPCSchema([('voltage', 'float_t', 'get_voltage'), ('current', 'float_t', 'get_current'),
+                            ('temp', 'float_t', 'get_temp'),
+                            ('cliff_range.0', 'float_t'), ('cliff_range.1', 'float_t'), ('cliff_range.2', 'float_t'), ('cliff_range.3', 'float_t'),
+                            ('state', 'uint32_t'), ('timestamp', 'uint32_t', 'timestamp.set'),
+                            ('bump_event_cnt', 'uint16_t'), ('debug', 'float_t')])
+
+PIMU_STATUS_P1 = RPCSchema([('voltage', 'float_t', 'get_voltage'), ('current', 'float_t', 'get_current'),
+                            ('temp', 'float_t', 'get_temp'),
+                            ('cliff_range.0', 'float_t'), ('cliff_range.1', 'float_t'), ('cliff_range.2', 'float_t'), ('cliff_range.3', 'float_t'),
+                            ('state', 'uint32_t'), ('timestamp', 'uint64_t', 'timestamp.set'),
+                            ('bump_event_cnt', 'uint16_t'), ('debug', 'float_t')])
+
+PIMU_STATUS_P2 = PIMU_STATUS_P1
+
+PIMU_STATUS_P4 = PIMU_STATUS_P2.extend([('current_charge', 'float_t', 'get_current_charge')])
+
+PIMU_STATUS_P5 = PIMU_STATUS_P4
+
+PIMU_STATUS_P6 = PIMU_STATUS_P5.extend([('over_tilt_type', 'uint8_t', 'get_tilt_type')])
+
+# ######################## WACC #################################
+
+WACC_STATUS_P0 = RPCSchema([('ax', 'float_t'), ('ay', 'float_t'), ('az', 'float_t'), ('a0', 'int16_t'),
+                            ('d0', 'uint8_t'), ('d1', 'uint8_t'), ('d2', 'uint8_t'), ('d3', 'uint8_t'),
+                            ('single_tap_count', 'uint32_t'), ('state', 'uint32_t'),
+                            ('timestamp', 'uint32_t', 'timestamp.set'), ('debug', 'uint32_t')])
+
+WACC_STATUS_P1 = RPCSchema([('ax', 'float_t'), ('ay', 'float_t'), ('az', 'float_t'), ('a0', 'int16_t'),
+                            ('d0', 'uint8_t'), ('d1', 'uint8_t'), ('d2', 'uint8_t'), ('d3', 'uint8_t'),
+                            ('single_tap_count', 'uint32_t'), ('state', 'uint32_t'),
+                            ('timestamp', 'uint64_t', 'timestamp.set'), ('debug', 'uint32_t')])
+
+WACC_STATUS_P2 = WACC_STATUS_P1
+
+WACC_COMMAND = RPCSchema([('d2', 'uint8_t'), ('d3', 'uint8_t'), ('trigger', 'uint32_t')])
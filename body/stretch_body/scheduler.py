@@ -0,0 +1,172 @@
+from __future__ import print_function
+import logging
+import sys
+import threading
+import time
+from stretch_body.transport_stats import LatencyHistogram
+
+"""
+Deadline scheduler of periodic tasks on a single thread
+
+Each PeriodicTask is released at absolute monotonic times t0 + offset + k * period, so its rate does not drift
+with its execution time, and tasks of the same rate can be staggered by their offsets (eg to spread the
+status pulls of different buses over the cycle). When several tasks are due, the highest priority runs first.
+Between releases the thread sleeps until the next one is due; it does not poll.
+
+A task that is still running at its next release has overrun: the releases it missed are skipped
+(counted in skipped) rather than run back to back. Per task accounting is in PeriodicTask.status / get_stats().
+
+A task that raises is stopped, as its thread would have ended, and the exception goes to threading.excepthook
+(the Robot records it in GLOBAL_EXCEPTIONS_LIST, see Robot.custom_excepthook). The other tasks keep running.
+
+    s = DeadlineScheduler()
+    s.add_task(PeriodicTask('status', robot._pull_status_non_dynamixel, 25.0, priority=10))
+    s.add_task(PeriodicTask('monitor', robot.monitor.step, 7.5, priority=1, offset=0.02))
+    s.start()
+    ...
+    s.stop()
+"""
+
+
+class PeriodicTask():
+    """
+    name: of the task, in the stats and log
+    fn: called with no arguments at each release
+    rate_hz: release rate
+    priority: of the task when several are due together (higher runs first)
+    offset: (s) of the releases within the period
+    stats: LoopStats (or other with mark_loop_start / mark_loop_end) to update on each run, optional
+    """
+    def __init__(self, name, fn, rate_hz, priority=0, offset=0.0, stats=None):
+        self.name = name
+        self.fn = fn
+        self.period = 1.0 / rate_hz
+        self.priority = priority
+        self.offset = offset
+        self.stats = stats
+        self.release = None  # Next release (time.monotonic)
+        self.stopped = False  # After the task raised
+        self.lateness = LatencyHistogram()  # Start of each run after its release
+        self.status = {'runs': 0, 'overruns': 0, 'skipped': 0, 'errors': 0,
+                       'execution_time_s': 0.0, 'max_execution_time_s': 0.0}
+
+    def start(self, t0):
+        self.release = t0 + self.offset
+
+    def run(self, now):
+        """
+        Run the task released at self.release, then set the next release
+        Return the time.monotonic() the run ended
+        """
+        self.lateness.record(now - self.release)
+        if self.stats is not None:
+            self.stats.mark_loop_start()
+        try:
+            self.fn()
+        except Exception:
+            self.status['errors'] += 1
+            self.stopped = True
+            logging.getLogger(self.name).error('Stopping scheduled task %s after an error' % self.name)
+            threading.excepthook(threading.ExceptHookArgs(sys.exc_info() + (threading.current_thread(),)))
+        if self.stats is not None:
+            self.stats.mark_loop_end()
+        t_end = time.monotonic()
+        dt = t_end - now
+        self.status['runs'] += 1
+        self.status['execution_time_s'] = dt
+        if dt > self.status['max_execution_time_s']:
+            self.status['max_execution_time_s'] = dt
+        self.release += self.period
+        if self.release <= t_end:  # Still running at the next release
+            n = int((t_end - self.release) / self.period) + 1
+            self.status['overruns'] += 1
+            self.status['skipped'] += n
+            self.release += n * self.period
+        return t_end
+
+    def get_stats(self):
+        s = dict(self.status)
+        s.update({'rate_hz': 1.0 / self.period, 'priority': self.priority, 'offset': self.offset, 'stopped': self.stopped,
+                  'lateness': self.lateness.snapshot()})
+        return s
+
+
+class DeadlineScheduler(threading.Thread):
+    """
+    Runs PeriodicTasks on one daemon thread. Tasks can be added or removed while it runs.
+    """
+    def __init__(self, name='DeadlineScheduler'):
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.tasks = []
+        self.cond = threading.Condition()
+        self.shutdown_flag = threading.Event()
+        self.running = False
+        self.status = {'wakeups': 0, 'runs': 0}
+
+    def add_task(self, task):
+        with self.cond:
+            if self.running:
+                task.start(time.monotonic())
+            self.tasks.append(task)
+            self.cond.notify()
+        return task
+
+    def remove_task(self, name):
+        with self.cond:
+            self.tasks = [t for t in self.tasks if t.name != name]
+
+    def get_task(self, name):
+        for t in self.tasks:
+            if t.name == name:
+                return t
+        return None
+
+    def start(self):
+        t0 = time.monotonic()
+        with self.cond:
+            for t in self.tasks:
+                t.start(t0)
+            self.running = True
+        threading.Thread.start(self)
+
+    def stop(self, timeout=1.0):
+        self.shutdown_flag.set()
+        with self.cond:
+            self.cond.notify()
+        if self.running:
+            self.join(timeout)
+
+    def run(self):
+        while not self.shutdown_flag.is_set():
+            with self.cond:
+                now = time.monotonic()
+                active = [t for t in self.tasks if not t.stopped]
+                due = [t for t in active if t.release <= now]
+                if not due:
+                    timeout = min([t.release for t in active]) - now if active else None
+                    self.cond.wait(timeout)
+                    self.status['wakeups'] += 1
+                    continue
+            due.sort(key=lambda t: (-t.priority, t.release))
+            for t in due:
+                if self.shutdown_flag.is_set():
+                    break
+                if t not in self.tasks:  # Removed since it was due
+                    continue
+                t.run(time.monotonic())
+                self.status['runs'] += 1
+        self.running = False
+
+    def get_stats(self):
+        s = dict(self.status)
+        s['tasks'] = {t.name: t.get_stats() for t in self.tasks}
+        return s
+
+    def pretty_print(self):
+        print('--------- %s -----------' % self.name)
+        print('Wakeups: %d  Runs: %d' % (self.status['wakeups'], self.status['runs']))
+        for t in self.tasks:
+            l = t.lateness.snapshot()
+            print('%-20s %6.1f Hz  prio %3d  runs %6d  overruns %4d  skipped %4d  errors %3d  exec max %.2f ms  late p99 %.2f ms' %
+                  (t.name, 1.0 / t.period, t.priority, t.status['runs'], t.status['overruns'], t.status['skipped'],
+                   t.status['errors'], t.status['max_execution_time_s'] * 1e3, l['p99'] * 1e3))
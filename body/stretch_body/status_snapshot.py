@@ -0,0 +1,166 @@
+from __future__ import print_function
+import asyncio
+import threading
+import time
+from stretch_body.rpc_schema import Record
+
+"""
+Sequence numbered snapshots of the Robot status, published by the status threads and read without a lock
+
+Each status thread publishes the status of the devices it pulls (eg the non-DXL thread: pimu, base, lift, arm, wacc)
+as a read only copy (FrozenStatus), merged with the latest copies of the other devices into a new StatusSnapshot.
+A snapshot can not be modified once published, so a reader holding one sees the same, consistent, values for all
+devices no matter what the threads or the other readers do afterwards. Use copy_status for a modifiable copy.
+
+The two latest snapshots are kept in a pair of slots. The writer fills the slot not being read, then advances seq;
+readers take seq and the slot it points to, with no lock. Writers are serialized among themselves only.
+Readers can also block for the next snapshot: wait() from a thread, or await wait_async() from any event loop.
+
+    s = robot.get_status_snapshot()
+    print(s.seq, s.timestamp, s.status['lift']['pos'], s.status['arm']['pos'])
+"""
+
+
+def copy_status(d):
+    """
+    Copy of a (nested) status dict or Record (eg the StepperStatus of a motor): dicts, Records and lists
+    are copied, values are shared
+    """
+    c = d.copy() if isinstance(d, Record) else {}
+    for k, v in d.items():
+        if isinstance(v, (dict, Record)):
+            c[k] = copy_status(v)
+        elif type(v) == list:
+            c[k] = [copy_status(x) if isinstance(x, (dict, Record)) else x for x in v]
+        else:
+            c[k] = v
+    return c
+
+
+class FrozenStatus(dict):
+    """
+    Read only dict of a published status. Changing it raises a TypeError.
+    """
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Published status is read only, use copy_status for a modifiable copy')
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def copy(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return (FrozenStatus, (dict(self),))
+
+
+def freeze_status(d):
+    """
+    Read only copy of a (nested) status dict or Record: dicts and Records become FrozenStatus, lists tuples
+    """
+    c = {}
+    for k, v in d.items():
+        if isinstance(v, (dict, Record)):
+            c[k] = freeze_status(v)
+        elif type(v) == list:
+            c[k] = tuple([freeze_status(x) if isinstance(x, (dict, Record)) else x for x in v])
+        else:
+            c[k] = v
+    return FrozenStatus(c)
+
+
+class StatusSnapshot():
+    """
+    seq: of the snapshot, increasing by one per publish
+    timestamp: time.time() of the publish
+    status: FrozenStatus of device name to a read only copy of its status, shared by all readers
+    """
+    __slots__ = ('seq', 'timestamp', 'status')
+
+    def __init__(self, seq, timestamp, status):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.status = status
+
+
+class StatusSnapshots():
+    def __init__(self):
+        self.seq = 0
+        self.slots = [StatusSnapshot(0, time.time(), FrozenStatus()), None]
+        self.write_lock = threading.Lock()
+        self.cond = threading.Condition()  # Only for readers blocking in wait()
+        self.async_waiters = []  # (loop, future) of coroutines in wait_async()
+        self.status = {'publishes': 0, 'waits': 0}
+
+    def publish(self, devices):
+        """
+        devices: dict of device name to its (live) status dict, copied into the new snapshot
+        The devices not in devices keep their (read only) copy of the previous snapshot
+        Returns the published StatusSnapshot
+        """
+        updates = {k: freeze_status(v) for k, v in devices.items()}
+        with self.write_lock:
+            status = dict(self.slots[self.seq & 1].status)
+            status.update(updates)
+            seq = self.seq + 1
+            snapshot = StatusSnapshot(seq, time.time(), FrozenStatus(status))
+            self.slots[seq & 1] = snapshot
+            self.seq = seq
+            self.status['publishes'] += 1
+            waiters = self.async_waiters
+            self.async_waiters = []
+        with self.cond:
+            self.cond.notify_all()
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(self._wake, fut)
+            except RuntimeError:  # Loop closed
+                pass
+        return snapshot
+
+    def get(self):
+        """
+        The latest StatusSnapshot, without taking a lock
+        """
+        return self.slots[self.seq & 1]
+
+    def wait(self, seq, timeout=None):
+        """
+        Block until a snapshot newer than seq is published
+        Returns the latest StatusSnapshot, or None on timeout
+        """
+        with self.cond:
+            self.status['waits'] += 1
+            if self.cond.wait_for(lambda: self.seq > seq, timeout):
+                return self.get()
+        return None
+
+    async def wait_async(self, seq, timeout=None):
+        """
+        Suspend until a snapshot newer than seq is published, without blocking the event loop
+        Returns the latest StatusSnapshot, or None on timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self.seq <= seq:
+            fut = loop.create_future()
+            waiter = (loop, fut)
+            with self.write_lock:
+                if self.seq > seq:  # Published before we were queued
+                    break
+                self.async_waiters.append(waiter)
+            self.status['waits'] += 1
+            try:
+                await asyncio.wait_for(fut, None if deadline is None else max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                with self.write_lock:
+                    if waiter in self.async_waiters:
+                        self.async_waiters.remove(waiter)
+                return self.get() if self.seq > seq else None
+        return self.get()
+
+    @staticmethod
+    def _wake(fut):
+        if not fut.done():
+            fut.set_result(None)
@@ -2,6 +2,10 @@ from __future__ import print_function
 from stretch_body.transport import *
 from stretch_body.device import Device
 from stretch_body.hello_utils import *
+from stretch_body.rpc_schema import *
+from stretch_body.trace_reader import FirmwareTraceReader
+import stretch_body.encoder_calibration as encoder_calibration
+import os
 import textwrap
 import threading
 import sys
@@ -98,6 +102,15 @@ class StepperBase(Device):
     DIAG_IN_SYNC_MODE = 16384        # Currently running in sync mode
     DIAG_IS_TRACE_ON = 32768   #Is trace recording
 
+    DIAG_FLAGS_P0 = StatusFlags([('pos_calibrated', DIAG_POS_CALIBRATED), ('runstop_on', DIAG_RUNSTOP_ON),
+                                 ('near_pos_setpoint', DIAG_NEAR_POS_SETPOINT), ('near_vel_setpoint', DIAG_NEAR_VEL_SETPOINT),
+                                 ('is_moving', DIAG_IS_MOVING), ('at_current_limit', DIAG_AT_CURRENT_LIMIT),
+                                 ('is_mg_accelerating', DIAG_IS_MG_ACCELERATING), ('is_mg_moving', DIAG_IS_MG_MOVING),
+                                 ('calibration_rcvd', DIAG_CALIBRATION_RCVD), ('in_guarded_event', DIAG_IN_GUARDED_EVENT),
+                                 ('in_safety_event', DIAG_IN_SAFETY_EVENT), ('waiting_on_sync', DIAG_WAITING_ON_SYNC)])
+    DIAG_FLAGS_P1 = StatusFlags(DIAG_FLAGS_P0.flags + (('in_sync_mode', DIAG_IN_SYNC_MODE),))
+    DIAG_FLAGS_P2 = StatusFlags(DIAG_FLAGS_P1.flags + (('trace_on', DIAG_IS_TRACE_ON),))
+
     CONFIG_SAFETY_HOLD = 1  # Hold position in safety mode? Otherwise freewheel
     CONFIG_ENABLE_RUNSTOP = 2  # Recognize runstop signal?
     CONFIG_ENABLE_SYNC_MODE = 4  # Commands are synchronized from digital trigger
@@ -128,13 +141,9 @@ class StepperBase(Device):
         self.usb=usb
         self.transport = Transport(usb=self.usb, logger=self.logger)
 
-        self._command = {'mode':0, 'x_des':0,'v_des':0,'a_des':0,'stiffness':1.0,'i_feedforward':0.0,'i_contact_pos':0,'i_contact_neg':0,'incr_trigger':0}
-        self.status = {'mode': 0, 'effort_ticks': 0, 'effort_pct':0,'current':0,'pos': 0, 'vel': 0, 'err':0,'diag': 0,'timestamp': 0, 'debug':0,'guarded_event':0,
-                       'transport': self.transport.status,'pos_calibrated':0,'runstop_on':0,'near_pos_setpoint':0,'near_vel_setpoint':0,
-                       'is_moving':0,'is_moving_filtered':0,'at_current_limit':0,'is_mg_accelerating':0,'is_mg_moving':0,'calibration_rcvd': 0,'in_guarded_event':0,
-                       'in_safety_event':0,'waiting_on_sync':0,'in_sync_mode':0,'trace_on':0,'ctrl_cycle_cnt':0,
-                       'waypoint_traj':{'state':'idle','setpoint':None, 'segment_id':0,},
-                       'voltage':0}
+        #Records with the fields of the dicts used previously (see rpc_schema.py), status['pos'] or status.pos
+        self._command = StepperCommand()
+        self.status = StepperStatus(transport=self.transport.status)
 
         self.status_aux={'cmd_cnt_rpc':0,'cmd_cnt_exec':0,'cmd_rpc_overflow':0,'sync_irq_cnt':0,'sync_irq_overflow':0}
 
@@ -149,11 +158,17 @@ class StepperBase(Device):
         self._waypoint_traj_set_next_traj_success = False
         self._waypoint_traj_start_error_msg = ""
         self._waypoint_traj_set_next_error_msg = ""
+        self._enc_calib_acked = False
         self._waypoint_ts = None
 
         self.ts_last_syncd_motion=0
 
         self._dirty_command = False
+        self._sent_command = None  # Last RPC_SET_COMMAND sent, and acknowledged, see queue_command_rpc
+        self._acked_command = None
+        self._ts_command_sent = 0
+        self._command_events = (False, False, False)  # in_guarded_event, in_safety_event, runstop_on of the last status
+        self.command_keep_alive = self.robot_params['robot']['stepper_command_keep_alive']
         self._dirty_gains = False
         self._dirty_trigger = False
         self._dirty_read_gains_from_flash=False
@@ -172,9 +187,13 @@ class StepperBase(Device):
             self.hw_valid = self.transport.startup()
             if self.hw_valid:
                 # Pull board info
+                self.transport.configure_timeouts(self.robot_params['robot']['use_adaptive_rpc_timeout'],
+                                                  self.robot_params['robot']['rpc_max_retries'])
                 payload = arr.array('B', [self.RPC_GET_STEPPER_BOARD_INFO])
                 self.transport.do_pull_rpc_sync(payload, self.rpc_board_info_reply)
                 self.transport.configure_version(self.board_info['firmware_version'])
+                if self.robot_params['robot']['use_transport_worker']:
+                    self.transport.start_worker()
                 return True
             return False
         except KeyError:
@@ -188,6 +207,7 @@ class StepperBase(Device):
             return
         self.logger.debug('Shutting down Stepper on: ' + self.usb)
         self.enable_safety()
+        self._acked_command = None
         self.push_command(exiting=True)
         self.transport.stop()
         self.hw_valid = False
@@ -199,61 +219,95 @@ class StepperBase(Device):
         if not self.hw_valid:
             return
         payload = self.transport.get_empty_payload()
+        rpcs = []  # Each RPC is packed into its own slice of the payload, then sent as one batch
+        sidx = 0
 
         if self._dirty_trigger:
-            payload[0] = self.RPC_SET_TRIGGER
-            sidx = self.pack_trigger(payload, 1)
-            self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_trigger_reply, exiting=exiting)
+            payload[sidx] = self.RPC_SET_TRIGGER
+            rpc_start = sidx
+            sidx = self.pack_trigger(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_trigger_reply))
             self._trigger=0
             self._dirty_trigger = False
+            self._acked_command = None
 
         if self._dirty_gains:
-            payload[0] = self.RPC_SET_GAINS
-            sidx = self.pack_gains(payload, 1)
-            self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_gains_reply, exiting=exiting)
+            payload[sidx] = self.RPC_SET_GAINS
+            rpc_start = sidx
+            sidx = self.pack_gains(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_gains_reply))
             self._dirty_gains = False
+            self._acked_command = None
 
         if self._dirty_command:
-            if self.status['in_sync_mode']:  # Mark the time of latest new motion command sent
-                self.ts_last_syncd_motion = time.time()
-            else:
-                self.ts_last_syncd_motion = 0
-
-            payload[0] = self.RPC_SET_COMMAND
-            sidx = self.pack_command(payload, 1)
-            self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_command_reply, exiting=exiting)
+            sidx = self.queue_command_rpc(payload, sidx, rpcs)
             self._dirty_command = False
+        self.transport.do_push_rpc_batch_sync(rpcs, exiting=exiting)
+
+    def queue_command_rpc(self, payload, sidx, rpcs):
+        """
+        Pack RPC_SET_COMMAND into payload at sidx and append it to rpcs
+        The RPC is skipped (counted as suppressed in the transport stats) if the command is the same as the last one
+        acknowledged by the board and that was sent less than stepper_command_keep_alive ago. The keep alive
+        covers the firmware velocity watchdog. MODE_POS_TRAJ_INCR commands are always sent, as are all commands while
+        the board is in a guarded or safety event or runstopped, and the first one after that changes
+        (the firmware needs the command again to leave the event, see update_command_events).
+        Return sidx following the RPC
+        """
+        payload[sidx] = self.RPC_SET_COMMAND
+        rpc_start = sidx
+        sidx = self.pack_command(payload, sidx + 1)
+        command = payload[rpc_start:sidx]
+        ts = time.time()
+        if self.command_keep_alive > 0 and command == self._acked_command and \
+                ts - self._ts_command_sent < self.command_keep_alive and self._command.mode != self.MODE_POS_TRAJ_INCR \
+                and True not in self._command_events:
+            self.transport.stats.record_suppressed()
+            return rpc_start
+
+        if self.status['in_sync_mode']:  # Mark the time of latest new motion command sent
+            self.ts_last_syncd_motion = ts
+        else:
+            self.ts_last_syncd_motion = 0
+        self._acked_command = None  # Set by rpc_command_reply
+        self._sent_command = bytes(command)  # The payload buffer is reused
+        self._ts_command_sent = ts
+        rpcs.append((command, self.rpc_command_reply))
+        return sidx
 
     async def push_command_async(self,exiting=False):
         if not self.hw_valid:
             return
-        payload = self.transport.get_empty_payload()
+        payload = self.transport.get_empty_payload(reuse=False)  # Not shared with other coroutines
+        rpcs = []  # Each RPC is packed into its own slice of the payload, then sent as one batch
+        sidx = 0
 
         if self._dirty_trigger:
-            payload[0] = self.RPC_SET_TRIGGER
-            sidx = self.pack_trigger(payload, 1)
-            await self.transport.do_push_rpc_async(payload[:sidx], self.rpc_trigger_reply, exiting=exiting)
+            payload[sidx] = self.RPC_SET_TRIGGER
+            rpc_start = sidx
+            sidx = self.pack_trigger(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_trigger_reply))
             self._trigger=0
             self._dirty_trigger = False
+            self._acked_command = None
 
         if self._dirty_gains:
-            payload[0] = self.RPC_SET_GAINS
-            sidx = self.pack_gains(payload, 1)
-            await self.transport.do_push_rpc_async(payload[:sidx], self.rpc_gains_reply, exiting=exiting)
+            payload[sidx] = self.RPC_SET_GAINS
+            rpc_start = sidx
+            sidx = self.pack_gains(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_gains_reply))
             self._dirty_gains = False
+            self._acked_command = None
 
         if self._dirty_command:
-            if self.status['in_sync_mode']: #Mark the time of latest new motion command sent
-                self.ts_last_syncd_motion=time.time()
-            else:
-                self.ts_last_syncd_motion = 0
-
-            payload[0] = self.RPC_SET_COMMAND
-            sidx = self.pack_command(payload, 1)
-            await self.transport.do_push_rpc_async(payload[:sidx], self.rpc_command_reply, exiting=exiting)
+            sidx = self.queue_command_rpc(payload, sidx, rpcs)
             self._dirty_command = False
+        await self.transport.do_push_rpc_batch_async(rpcs, exiting=exiting)
 
-    def pull_status(self, exiting=False):
+    def pull_status(self, exiting=False, max_age=None):
+        """
+        max_age: if set, reuse a status pulled (by any thread) less than max_age (s) ago instead of a new RPC
+        """
         if not self.hw_valid:
             return
         if self._dirty_read_gains_from_flash:
@@ -261,7 +315,7 @@ class StepperBase(Device):
             self.transport.do_pull_rpc_sync(payload, self.rpc_read_gains_from_flash_reply)
             self._dirty_read_gains_from_flash = False
         payload = arr.array('B', [self.RPC_GET_STATUS])
-        self.transport.do_pull_rpc_sync(payload, self.rpc_status_reply, exiting=exiting)
+        self.transport.do_pull_rpc_sync(payload, self.rpc_status_reply, exiting=exiting, max_age=max_age)
 
     async def pull_status_async(self, exiting=False):
         if not self.hw_valid:
@@ -305,6 +359,7 @@ class StepperBase(Device):
             payload[0] = self.RPC_SET_MOTION_LIMITS
             sidx = self.pack_motion_limits(payload, 1)
             self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_motion_limits_reply)
+            self._acked_command = None  # Resend the next command, even if unchanged
 
     def set_gains(self,g):
         self.gains=g.copy()
@@ -419,54 +474,56 @@ class StepperBase(Device):
     #This allows user to override defaults every control cycle and then easily revert to defaults
     def set_command(self,mode=None, x_des=None, v_des=None, a_des=None,i_des=None, stiffness=None,i_feedforward=None, i_contact_pos=None, i_contact_neg=None  ):
         
-        if  True in [self.check_nan_value(d) for d in (x_des, v_des, a_des, i_des, stiffness, i_feedforward, i_contact_pos, i_contact_neg)]:
-            self.logger.warning('Received NaN value. dropping the command.')
-            return
-        
+        for d in (x_des, v_des, a_des, i_des, stiffness, i_feedforward, i_contact_pos, i_contact_neg):
+            if d is not None and self.check_nan_value(d):
+                self.logger.warning('Received NaN value. dropping the command.')
+                return
+
+        c=self._command
         if mode is not None:
-            self._command['mode'] = mode
+            c.mode = mode
 
         if x_des is not None:
-            self._command['x_des'] = x_des
-            if self._command['mode'] == self.MODE_POS_TRAJ_INCR:
-                self._command['incr_trigger'] = (self._command['incr_trigger']+1)%255
+            c.x_des = x_des
+            if c.mode == self.MODE_POS_TRAJ_INCR:
+                c.incr_trigger = (c.incr_trigger+1)%255
 
         if v_des is not None:
-            self._command['v_des'] = v_des
+            c.v_des = v_des
         else:
             if mode == self.MODE_VEL_PID or mode == self.MODE_VEL_TRAJ:
-                self._command['v_des'] = 0
+                c.v_des = 0
             else:
-                self._command['v_des'] = self.params['motion']['vel']
+                c.v_des = self.params['motion']['vel']
 
         if a_des is not None:
-            self._command['a_des'] = a_des
+            c.a_des = a_des
         else:
-            self._command['a_des'] = self.params['motion']['accel']
+            c.a_des = self.params['motion']['accel']
 
         if stiffness is not None:
-            self._command['stiffness'] = max(0.0, min(1.0, stiffness))
+            c.stiffness = max(0.0, min(1.0, stiffness))
         else:
-            self._command['stiffness'] =1
+            c.stiffness =1
 
         if i_feedforward is not None:
-            self._command['i_feedforward'] = i_feedforward
+            c.i_feedforward = i_feedforward
         else:
-            self._command['i_feedforward'] = 0
+            c.i_feedforward = 0
 
         if i_des is not None and mode == self.MODE_CURRENT:
-            self._command['i_feedforward'] =i_des
+            c.i_feedforward =i_des
 
 
         if i_contact_pos is not None:
-            self._command['i_contact_pos'] = i_contact_pos
+            c.i_contact_pos = i_contact_pos
         else:
-            self._command['i_contact_pos']=self.params['gains']['i_contact_pos']
+            c.i_contact_pos=self.params['gains']['i_contact_pos']
 
         if i_contact_neg is not None:
-            self._command['i_contact_neg'] = i_contact_neg
+            c.i_contact_neg = i_contact_neg
         else:
-            self._command['i_contact_neg'] = self.params['gains']['i_contact_neg']
+            c.i_contact_neg = self.params['gains']['i_contact_neg']
         #print(time.time(), i_des, self._command['i_feedforward'],mode == self.MODE_CURRENT)
         #print(time.time(),self._command['x_des'],self._command['incr_trigger'],self._command['v_des'],self._command['a_des'])
         self._dirty_command=True
@@ -474,30 +531,22 @@ class StepperBase(Device):
 
     def wait_while_is_moving(self,timeout=15.0, use_motion_generator=True):
         """
-        Poll until is moving flag is false
+        Wait until is moving flag is false (see Device.wait_for_status)
         Return True if success
         Return False if timeout
         """
-        ts = time.time()
-        self.pull_status()
+        self.pull_status(max_age=self.robot_params['robot']['status_cache_max_age'])
         s = 'is_mg_moving' if use_motion_generator else 'is_moving_filtered'
-        while self.status[s] and time.time() - ts < timeout:
-            time.sleep(0.1)
-            self.pull_status()
-        return not self.status[s]
+        return self.wait_for_status(lambda: not self.status[s], timeout)
 
     def wait_until_at_setpoint(self,timeout=15.0):
         """
-        Poll until near setpoint
+        Wait until near setpoint (see Device.wait_for_status)
         Return True if success
         Return False if timeout
         """
-        ts = time.time()
-        self.pull_status()
-        while not self.status['near_pos_setpoint'] and time.time() - ts < timeout:
-            time.sleep(0.1)
-            self.pull_status()
-        return self.status['near_pos_setpoint']
+        self.pull_status(max_age=self.robot_params['robot']['status_cache_max_age'])
+        return self.wait_for_status(lambda: self.status['near_pos_setpoint'], timeout)
 
     ########### Handle current and effort conversions  ###########
 
@@ -549,20 +598,44 @@ class StepperBase(Device):
         time.sleep(0.5)
         return cid.decode('utf-8')
 
+    def encoder_calibration_filename(self, ext='yaml'):
+        device_name = self.usb[5:]
+        sn = self.robot_params[device_name]['serial_no']
+        return 'calibration_steppers/' + device_name + '_' + sn + '.' + ext
+
     def read_encoder_calibration_from_YAML(self):
-        device_name=self.usb[5:]
-        sn=self.robot_params[device_name]['serial_no']
-        fn='calibration_steppers/'+device_name+'_'+sn+'.yaml'
+        fn=self.encoder_calibration_filename()
         enc_data=read_fleet_yaml(fn)
         return enc_data
 
     def write_encoder_calibration_to_YAML(self,data,filename=None, fleet_dir=None):
-        device_name = self.usb[5:]
         if filename is None:
-            sn = self.robot_params[device_name]['serial_no']
-            filename = 'calibration_steppers/'+device_name + '_' + sn + '.yaml'
+            filename = self.encoder_calibration_filename()
         print('Writing encoder calibration: %s'%filename)
-        write_fleet_yaml(filename,data,fleet_dir=fleet_dir)
+        write_fleet_yaml(filename,list(map(float,data)),fleet_dir=fleet_dir)
+        if len(data)==encoder_calibration.ENCODER_CALIBRATION_SIZE:  # Keep the .npy cache in step with the YAML
+            if fleet_dir is None:
+                fleet_dir = get_fleet_directory()
+            encoder_calibration.save_calibration(os.path.join(fleet_dir, os.path.splitext(filename)[0] + '.npy'), data)
+
+    def read_encoder_calibration(self, mmap=True):
+        """
+        Return the encoder calibration of the fleet directory as a float32 array (memory-mapped by default)
+        The .npy is built from the YAML the first time, and again whenever the YAML is newer
+        Return None if there is no calibration
+        """
+        fn_yaml = get_fleet_directory() + self.encoder_calibration_filename()
+        fn_npy = get_fleet_directory() + self.encoder_calibration_filename('npy')
+        if os.path.isfile(fn_npy) and not (os.path.isfile(fn_yaml) and os.path.getmtime(fn_yaml) > os.path.getmtime(fn_npy)):
+            try:
+                return encoder_calibration.load_calibration(fn_npy, mmap=mmap)
+            except ValueError:
+                self.logger.warning('Bad encoder calibration cache %s, rebuilding from YAML' % fn_npy)
+        data = self.read_encoder_calibration_from_YAML()
+        if len(data) != encoder_calibration.ENCODER_CALIBRATION_SIZE:
+            return None
+        encoder_calibration.save_calibration(fn_npy, data)
+        return encoder_calibration.load_calibration(fn_npy, mmap=mmap)
 
     def read_encoder_calibration_from_flash(self):
         self.turn_menu_interface_on()
@@ -575,47 +648,76 @@ class StepperBase(Device):
         self.logger.debug('Reseting board')
         self.board_reset()
         self.push_command()
-        e = e[:-4].decode('utf-8')  # We now have string of floats, convert to list of floats
-        enc_calib = []
-        while len(e):
-            ff = e.find(',')
-            if ff != -1:
-                enc_calib.append(float(e[:ff]))
-                e = e[ff + 2:]
-            else:
-                enc_calib.append(float(e))
-                e = []
-        if len(enc_calib)==16384:
+        enc_calib = encoder_calibration.parse_menu_dump(e[:-4])  # Comma separated floats
+        if len(enc_calib)==encoder_calibration.ENCODER_CALIBRATION_SIZE:
             self.logger.debug('Successful read of encoder calibration')
         else:
             self.logger.debug('Failed to read encoder calibration')
-        return enc_calib
+        return enc_calib.tolist()
 
     def write_encoder_calibration_to_flash(self,data):
+        """
+        Returns True if every page was acked by the board. Only then is the flash record written.
+        """
         if not self.hw_valid:
-            return
+            return False
         #This will take a few seconds. Blocks until complete.
-        if len(data)!=16384:
+        if len(data)!=encoder_calibration.ENCODER_CALIBRATION_SIZE:
             self.logger.warning('Bad encoder data')
-        else:
-            self.logger.debug('Writing encoder calibration...')
-            payload=self.transport.get_empty_payload()
-            for p in range(256):
-                if p%10==0:
-                    sys.stdout.write('.')
-                    sys.stdout.flush()
-                payload[0] = self.RPC_SET_ENC_CALIB
-                payload[1] = p
-                sidx=2
-                for i in range(64):
-                    pack_float_t(payload, sidx, data[p*64+i])
-                    sidx += 4
-                # self.logger.debug('Sending encoder calibration rpc of size',sidx)
-                self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_enc_calib_reply)
+            return False
+        self.logger.debug('Writing encoder calibration...')
+        payload=self.transport.get_empty_payload()
+        n_pages=0
+        n_acked=0
+        for p, page in encoder_calibration.calibration_pages(data):
+            if p%10==0:
+                sys.stdout.write('.')
+                sys.stdout.flush()
+            payload[0] = self.RPC_SET_ENC_CALIB
+            payload[1] = p
+            payload[2:2+len(page)] = page
+            self._enc_calib_acked = False
+            self.transport.do_push_rpc_sync(payload[:2+len(page)], self.rpc_enc_calib_reply)
+            n_pages += 1
+            if self._enc_calib_acked:
+                n_acked += 1
+        if n_acked != n_pages:
+            self.logger.error('Encoder calibration write failed: %d of %d pages acked' % (n_acked, n_pages))
+            return False
+        self.write_encoder_calibration_record(data)
+        return True
+
+    def write_encoder_calibration_record(self, data):
+        """
+        Record the checksum of the table written to flash, and the chip it was written to
+        """
+        record = {'checksum': encoder_calibration.calibration_checksum(data), 'chip_id': self.get_chip_id()}
+        write_fleet_yaml(self.encoder_calibration_filename('flash.yaml'), record)
+
+    def verify_encoder_calibration(self, data=None):
+        """
+        Check the calibration (by default that of the fleet directory) is the table last written to the flash
+        of this board, comparing checksums against the flash record rather than reading back the table
+        (the firmware has no checksum RPC, a full check is read_encoder_calibration_from_flash)
+        """
+        if data is None:
+            data = self.read_encoder_calibration()
+            if data is None:
+                return False
+        record = read_fleet_yaml(self.encoder_calibration_filename('flash.yaml'))
+        if record.get('checksum') != encoder_calibration.calibration_checksum(data):
+            self.logger.warning('Encoder calibration does not match the flash record')
+            return False
+        if record.get('chip_id') != self.get_chip_id():
+            self.logger.warning('Encoder calibration was written to another board')
+            return False
+        return True
 
     def rpc_enc_calib_reply(self,reply):
         if reply[0] != self.RPC_REPLY_ENC_CALIB:
-            self.logger.debug('Error RPC_REPLY_ENC_CALIB', reply[0])
+            self.logger.debug('Error RPC_REPLY_ENC_CALIB %d' % reply[0])
+        else:
+            self._enc_calib_acked = True
 
     # ######################Menu Interface ################################3
 
@@ -629,6 +731,7 @@ class StepperBase(Device):
             return
         payload = arr.array('B',[self.RPC_SET_MENU_ON])
         self.transport.do_push_rpc_sync(payload, self.rpc_menu_on_reply)
+        self._acked_command = None  # Resend the next command, even if unchanged
 
 
     def print_menu(self):
@@ -723,25 +826,7 @@ class StepperBase(Device):
         return sidx
 
     def pack_command(self, s, sidx):
-        pack_uint8_t(s, sidx, self._command['mode'])
-        sidx += 1
-        pack_float_t(s, sidx, self._command['x_des'])
-        sidx += 4
-        pack_float_t(s, sidx, self._command['v_des'])
-        sidx += 4
-        pack_float_t(s, sidx, self._command['a_des'])
-        sidx += 4
-        pack_float_t(s, sidx, self._command['stiffness'])
-        sidx += 4
-        pack_float_t(s, sidx, self._command['i_feedforward'])
-        sidx += 4
-        pack_float_t(s, sidx, self._command['i_contact_pos'])
-        sidx += 4
-        pack_float_t(s, sidx, self._command['i_contact_neg'])
-        sidx += 4
-        pack_uint8_t(s, sidx, self._command['incr_trigger'])
-        sidx += 1
-        return sidx
+        return STEPPER_COMMAND.pack_into(s, sidx, self._command)
 
     def pack_gains(self,s,sidx): #Base
         pack_float_t(s, sidx, self.gains['pKp_d']);sidx += 4
@@ -809,6 +894,8 @@ class StepperBase(Device):
     def rpc_command_reply(self, reply):
         if reply[0] != self.RPC_REPLY_COMMAND:
             print('Error RPC_REPLY_COMMAND', reply[0])
+        else:
+            self._acked_command = self._sent_command
 
     def rpc_motion_limits_reply(self, reply):
         if reply[0] != self.RPC_REPLY_MOTION_LIMITS:
@@ -818,9 +905,22 @@ class StepperBase(Device):
         if reply[0] != self.RPC_REPLY_MENU_ON:
             print('Error RPC_REPLY_MENU_ON', reply[0])
 
+    def update_command_events(self):
+        """
+        Track the guarded / safety event and runstop flags of the status, and resend the next command
+        (even if unchanged) when one of them changes
+        """
+        events = (bool(self.status['in_guarded_event']), bool(self.status['in_safety_event']),
+                  bool(self.status['runstop_on']))
+        if events != self._command_events:
+            self._acked_command = None
+            self._command_events = events
+
     def rpc_status_reply(self, reply):
         if reply[0] == self.RPC_REPLY_STATUS:
             nr = self.unpack_status(reply[1:])
+            self.update_command_events()
+            self.notify_status()
         else:
             print('Error RPC_REPLY_STATUS', reply[0])
 
@@ -843,6 +943,10 @@ class StepperBase(Device):
             .format(self.board_info['protocol_version']))
 
 
+    def read_firmware_trace_arrays(self, out=None):
+        raise NotImplementedError('This method not supported for firmware on protocol {0}.'
+                                  .format(self.board_info['protocol_version']))
+
     def rpc_read_firmware_trace_reply(self, reply):
         raise NotImplementedError('This method not supported for firmware on protocol {0}.'
                                   .format(self.board_info['protocol_version']))
@@ -880,32 +984,11 @@ class Stepper_Protocol_P0(StepperBase):
     def unpack_status(self,s,unpack_to=None): #P0
         if unpack_to is None:
             unpack_to=self.status
-        sidx=0
-        unpack_to['mode']=unpack_uint8_t(s[sidx:]);sidx+=1
-        unpack_to['effort_ticks'] = unpack_float_t(s[sidx:]);sidx+=4
+        STEPPER_STATUS_P0.unpack_into(s,0,unpack_to,self)
         unpack_to['current']=self.effort_ticks_to_current(unpack_to['effort_ticks'])
         unpack_to['effort_pct']=self.current_to_effort_pct(unpack_to['current'])
-        unpack_to['pos'] = unpack_double_t(s[sidx:]);sidx+=8
-        unpack_to['vel'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['err'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['diag'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint32_t(s[sidx:]));sidx += 4
-        unpack_to['debug'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['guarded_event'] = unpack_uint32_t(s[sidx:]);sidx += 4
-
-        unpack_to['pos_calibrated'] =unpack_to['diag'] & self.DIAG_POS_CALIBRATED > 0
-        unpack_to['runstop_on'] =unpack_to['diag'] & self.DIAG_RUNSTOP_ON > 0
-        unpack_to['near_pos_setpoint'] =unpack_to['diag'] & self.DIAG_NEAR_POS_SETPOINT > 0
-        unpack_to['near_vel_setpoint'] = unpack_to['diag'] & self.DIAG_NEAR_VEL_SETPOINT > 0
-        unpack_to['is_moving'] =unpack_to['diag'] & self.DIAG_IS_MOVING > 0
-        unpack_to['at_current_limit'] =unpack_to['diag'] & self.DIAG_AT_CURRENT_LIMIT > 0
-        unpack_to['is_mg_accelerating'] = unpack_to['diag'] & self.DIAG_IS_MG_ACCELERATING > 0
-        unpack_to['is_mg_moving'] =unpack_to['diag'] & self.DIAG_IS_MG_MOVING > 0
-        unpack_to['calibration_rcvd'] = unpack_to['diag'] & self.DIAG_CALIBRATION_RCVD > 0
-        unpack_to['in_guarded_event'] = unpack_to['diag'] & self.DIAG_IN_GUARDED_EVENT > 0
-        unpack_to['in_safety_event'] = unpack_to['diag'] & self.DIAG_IN_SAFETY_EVENT > 0
-        unpack_to['waiting_on_sync'] = unpack_to['diag'] & self.DIAG_WAITING_ON_SYNC > 0
-        return sidx
+        self.DIAG_FLAGS_P0.expand(unpack_to['diag'],unpack_to)
+        return STEPPER_STATUS_P0.size
 
     def pretty_print(self): #P0
         print('-----------')
@@ -950,42 +1033,31 @@ class Stepper_Protocol_P1(StepperBase):
     def unpack_status(self,s,unpack_to=None): #P1
         if unpack_to is None:
             unpack_to=self.status
-        sidx=0
-        unpack_to['mode']=unpack_uint8_t(s[sidx:]);sidx+=1
-        unpack_to['effort_ticks'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['current']=self.effort_ticks_to_current(unpack_to['effort_ticks'])
-        unpack_to['effort_pct'] = self.current_to_effort_pct(unpack_to['current'])
-        unpack_to['pos'] = unpack_double_t(s[sidx:]);sidx+=8
-        unpack_to['vel'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['err'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['diag'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint64_t(s[sidx:]));sidx += 8
-        unpack_to['debug'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['guarded_event'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        unpack_to['waypoint_traj']['setpoint'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['waypoint_traj']['segment_id'] = unpack_uint16_t(s[sidx:]);sidx += 2
-
-        unpack_to['pos_calibrated'] =unpack_to['diag'] & self.DIAG_POS_CALIBRATED > 0
-        unpack_to['runstop_on'] =unpack_to['diag'] & self.DIAG_RUNSTOP_ON > 0
-        unpack_to['near_pos_setpoint'] =unpack_to['diag'] & self.DIAG_NEAR_POS_SETPOINT > 0
-        unpack_to['near_vel_setpoint'] = unpack_to['diag'] & self.DIAG_NEAR_VEL_SETPOINT > 0
-        unpack_to['is_moving'] =unpack_to['diag'] & self.DIAG_IS_MOVING > 0
-        unpack_to['at_current_limit'] =unpack_to['diag'] & self.DIAG_AT_CURRENT_LIMIT > 0
-        unpack_to['is_mg_accelerating'] = unpack_to['diag'] & self.DIAG_IS_MG_ACCELERATING > 0
-        unpack_to['is_mg_moving'] =unpack_to['diag'] & self.DIAG_IS_MG_MOVING > 0
-        unpack_to['calibration_rcvd'] = unpack_to['diag'] & self.DIAG_CALIBRATION_RCVD > 0
-        unpack_to['in_guarded_event'] = unpack_to['diag'] & self.DIAG_IN_GUARDED_EVENT > 0
-        unpack_to['in_safety_event'] = unpack_to['diag'] & self.DIAG_IN_SAFETY_EVENT > 0
-        unpack_to['waiting_on_sync'] = unpack_to['diag'] & self.DIAG_WAITING_ON_SYNC > 0
-        unpack_to['in_sync_mode'] = unpack_to['diag'] & self.DIAG_IN_SYNC_MODE > 0
-        if unpack_to['diag'] & self.DIAG_TRAJ_WAITING_ON_SYNC > 0:
-            unpack_to['waypoint_traj']['state']='waiting_on_sync'
-        elif unpack_to['diag'] & self.DIAG_TRAJ_ACTIVE > 0:
-            unpack_to['waypoint_traj']['state']='active'
-        else:
-            unpack_to['waypoint_traj']['state']='idle'
+        return Stepper_Protocol_P1.unpack_status_schema(self,STEPPER_STATUS_P1,self.DIAG_FLAGS_P1,s,unpack_to)
 
-        return sidx
+    def unpack_status_schema(self,schema,flags,s,unpack_to): #P1
+        """
+        Decode a status message with the waypoint trajectory fields (P1 and later) using schema and the diag table flags
+        """
+        schema.unpack_into(s,0,unpack_to,self)
+        if isinstance(unpack_to,Record):
+            unpack_to.current=self.effort_ticks_to_current(unpack_to.effort_ticks)
+            unpack_to.effort_pct = self.current_to_effort_pct(unpack_to.current)
+            diag=unpack_to.diag
+            waypoint_traj=unpack_to.waypoint_traj
+        else:
+            unpack_to['current']=self.effort_ticks_to_current(unpack_to['effort_ticks'])
+            unpack_to['effort_pct'] = self.current_to_effort_pct(unpack_to['current'])
+            diag=unpack_to['diag']
+            waypoint_traj=unpack_to['waypoint_traj']
+        flags.expand(diag,unpack_to)
+        if diag & self.DIAG_TRAJ_WAITING_ON_SYNC > 0:
+            waypoint_traj['state']='waiting_on_sync'
+        elif diag & self.DIAG_TRAJ_ACTIVE > 0:
+            waypoint_traj['state']='active'
+        else:
+            waypoint_traj['state']='idle'
+        return schema.size
 
     def pretty_print(self): #P1
         print('-----------')
@@ -1058,6 +1130,7 @@ class Stepper_Protocol_P1(StepperBase):
             payload[0] = self.RPC_START_NEW_TRAJECTORY
             sidx = self.pack_trajectory_segment(payload, 1)
             self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_start_new_traj_reply)
+            self._acked_command = None  # Resend the next command, even if unchanged
         if not self._waypoint_traj_start_success:
             self.logger.warning('start_waypoint_trajectory: %s' % self._waypoint_traj_start_error_msg.capitalize())
         # return self._waypoint_traj_start_success
@@ -1104,6 +1177,7 @@ class Stepper_Protocol_P1(StepperBase):
         self._waypoint_ts = None
         payload = arr.array('B', [self.RPC_RESET_TRAJECTORY])
         self.transport.do_push_rpc_sync(payload, self.rpc_reset_traj_reply)
+        self._acked_command = None  # Resend the next command, even if unchanged
 
     def pack_trajectory_segment(self, s, sidx):
         for i in range(7):
@@ -1140,6 +1214,15 @@ class Stepper_Protocol_P1(StepperBase):
 
 # ######################## STEPPER PROTOCOL P2 #################################
 class Stepper_Protocol_P2(StepperBase):
+    trace_status_schema = STEPPER_STATUS_P2
+
+    def read_firmware_trace_arrays(self, out=None):
+        """
+        Read the firmware trace into NumPy structured arrays (raw firmware values), without sleeps between RPCs
+        out: file to stream the trace to (see trace_reader.load_trace)
+        Returns the FirmwareTraceReader (status, debug, print and entries arrays)
+        """
+        return FirmwareTraceReader(self.transport, self.RPC_READ_TRACE, self.trace_status_schema).read(out=out)
 
     def read_firmware_trace(self):
         self.trace_buf = []
@@ -1148,7 +1231,8 @@ class Stepper_Protocol_P2(StepperBase):
         ts=time.time()
         while ( self.n_trace_read) and time.time()-ts<60.0:
             payload = arr.array('B', [self.RPC_READ_TRACE])
-            self.transport.do_pull_rpc_sync(payload, self.rpc_read_firmware_trace_reply)
+            self.transport.do_pull_rpc_sync(payload, self.rpc_read_firmware_trace_reply, priority=RPC_PRIORITY_TRACE,
+                                            retries=0)
             time.sleep(.001)
         return self.trace_buf
     def unpack_debug_trace(self,s,unpack_to):
@@ -1196,44 +1280,7 @@ class Stepper_Protocol_P2(StepperBase):
     def unpack_status(self,s,unpack_to=None): #P2
         if unpack_to is None:
             unpack_to=self.status
-        sidx=0
-        unpack_to['mode']=unpack_uint8_t(s[sidx:]);sidx+=1
-        unpack_to['effort_ticks'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['current']=self.effort_ticks_to_current(unpack_to['effort_ticks'])
-        unpack_to['effort_pct'] = self.current_to_effort_pct(unpack_to['current'])
-        unpack_to['pos'] = unpack_double_t(s[sidx:]);sidx+=8
-        unpack_to['vel'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['err'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['diag'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint64_t(s[sidx:]));sidx += 8
-        unpack_to['debug'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['guarded_event'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        unpack_to['waypoint_traj']['setpoint'] = unpack_float_t(s[sidx:]);sidx += 4
-        unpack_to['waypoint_traj']['segment_id'] = unpack_uint16_t(s[sidx:]);sidx += 2
-
-        unpack_to['pos_calibrated'] =unpack_to['diag'] & self.DIAG_POS_CALIBRATED > 0
-        unpack_to['runstop_on'] =unpack_to['diag'] & self.DIAG_RUNSTOP_ON > 0
-        unpack_to['near_pos_setpoint'] =unpack_to['diag'] & self.DIAG_NEAR_POS_SETPOINT > 0
-        unpack_to['near_vel_setpoint'] = unpack_to['diag'] & self.DIAG_NEAR_VEL_SETPOINT > 0
-        unpack_to['is_moving'] =unpack_to['diag'] & self.DIAG_IS_MOVING > 0
-        unpack_to['at_current_limit'] =unpack_to['diag'] & self.DIAG_AT_CURRENT_LIMIT > 0
-        unpack_to['is_mg_accelerating'] = unpack_to['diag'] & self.DIAG_IS_MG_ACCELERATING > 0
-        unpack_to['is_mg_moving'] =unpack_to['diag'] & self.DIAG_IS_MG_MOVING > 0
-        unpack_to['calibration_rcvd'] = unpack_to['diag'] & self.DIAG_CALIBRATION_RCVD > 0
-        unpack_to['in_guarded_event'] = unpack_to['diag'] & self.DIAG_IN_GUARDED_EVENT > 0
-        unpack_to['in_safety_event'] = unpack_to['diag'] & self.DIAG_IN_SAFETY_EVENT > 0
-        unpack_to['waiting_on_sync'] = unpack_to['diag'] & self.DIAG_WAITING_ON_SYNC > 0
-        unpack_to['in_sync_mode'] = unpack_to['diag'] & self.DIAG_IN_SYNC_MODE > 0
-        unpack_to['trace_on'] = unpack_to['diag'] & self.DIAG_IS_TRACE_ON > 0
-
-        if unpack_to['diag'] & self.DIAG_TRAJ_WAITING_ON_SYNC > 0:
-            unpack_to['waypoint_traj']['state']='waiting_on_sync'
-        elif unpack_to['diag'] & self.DIAG_TRAJ_ACTIVE > 0:
-            unpack_to['waypoint_traj']['state']='active'
-        else:
-            unpack_to['waypoint_traj']['state']='idle'
-
-        return sidx
+        return Stepper_Protocol_P1.unpack_status_schema(self,STEPPER_STATUS_P2,self.DIAG_FLAGS_P2,s,unpack_to)
 
 # ######################## STEPPER PROTOCOL P3 #################################
 
@@ -1265,7 +1312,7 @@ class Stepper_Protocol_P3(StepperBase):
         if not self.hw_valid:
             return
         payload = arr.array('B',[self.RPC_LOAD_TEST_PULL])
-        self.transport.do_pull_rpc_sync(payload, self.rpc_load_test_pull_reply)
+        self.transport.do_pull_rpc_sync(payload, self.rpc_load_test_pull_reply, retries=0)
 
     def rpc_load_test_push_reply(self, reply):
         if reply[0] != self.RPC_REPLY_LOAD_TEST_PUSH:
@@ -1277,7 +1324,7 @@ class Stepper_Protocol_P3(StepperBase):
             for i in range(1024):
                 if d[i] != self.load_test_payload[(i + 1) % 1024]:
                     print('Load test pull bad data', d[i], self.load_test_payload[(i + 1) % 1024])
-            self.load_test_payload = d
+            self.load_test_payload = bytearray(d)  # Reply is a view of a reused transport buffer
             print('Successful load test pull')
         else:
             print('Error RPC_REPLY_LOAD_TEST_PULL', reply[0])
@@ -1318,19 +1365,19 @@ class Stepper_Protocol_P3(StepperBase):
     def rpc_command_reply(self, reply):
         if reply[0] == self.RPC_REPLY_COMMAND:
             nr = self.unpack_command_reply(reply[1:])
+            self._acked_command = self._sent_command
         else:
             print('Error RPC_REPLY_COMMAND', reply[0])
 
 
 # ######################## STEPPER PROTOCOL P4 #################################
 class Stepper_Protocol_P4(StepperBase):
+    trace_status_schema = STEPPER_STATUS_P4
+
     def unpack_status(self,s,unpack_to=None): #P4
         if unpack_to is None:
             unpack_to=self.status
-        sidx=0
-        sidx=sidx+Stepper_Protocol_P2.unpack_status(self,s,unpack_to)
-        unpack_to['voltage']=self.get_voltage(unpack_float_t(s[sidx:]));sidx+=4
-        return sidx
+        return Stepper_Protocol_P1.unpack_status_schema(self,STEPPER_STATUS_P4,self.DIAG_FLAGS_P2,s,unpack_to)
 
     def get_voltage(self,raw):
         raw_to_V = 20.0/1024 #10bit adc, 0-20V per 0-3.3V reading
@@ -1362,13 +1409,12 @@ class Stepper_Protocol_P5(StepperBase):
             return
         payload = self.transport.get_empty_payload()
         payload[0] = self.RPC_SET_STEPPER_TYPE
-        payload[1:] = arr.array('B', [motor_type])
-        self.transport.do_push_rpc_sync(payload, self.rpc_write_stepper_type_to_flash_reply)
+        payload[1] = motor_type
+        self.transport.do_push_rpc_sync(payload[:2], self.rpc_write_stepper_type_to_flash_reply)
     
     def read_stepper_type_from_flash(self):
         if not self.hw_valid:
             return
-        payload = self.transport.get_empty_payload()
         payload = arr.array('B', [self.RPC_READ_STEPPER_TYPE_FROM_FLASH])
         self.transport.do_pull_rpc_sync(payload, self.rpc_read_stepper_type_from_flash_reply)
 
@@ -1388,32 +1434,23 @@ class Stepper(StepperBase):
     """
     API to the Stretch Stepper Board
     """
-    def __init__(self,usb, name=None):
-        StepperBase.__init__(self,usb,name)
-        # Order in descending order so more recent protocols/methods override less recent
-        self.supported_protocols = {'p0': (Stepper_Protocol_P0,),
-                                    'p1': (Stepper_Protocol_P1,Stepper_Protocol_P0,),
-                                    'p2': (Stepper_Protocol_P2,Stepper_Protocol_P1,Stepper_Protocol_P0,),
-                                    'p3': (Stepper_Protocol_P3,Stepper_Protocol_P2,Stepper_Protocol_P1,Stepper_Protocol_P0,),
-                                    'p4': (Stepper_Protocol_P4,Stepper_Protocol_P3,Stepper_Protocol_P2,Stepper_Protocol_P1,Stepper_Protocol_P0,),
-                                    'p5': (Stepper_Protocol_P5,Stepper_Protocol_P4,Stepper_Protocol_P3,Stepper_Protocol_P2,Stepper_Protocol_P1,Stepper_Protocol_P0,)}
-    
-    def expand_protocol_methods(self, protocol_class):
-        for attr_name, attr_value in protocol_class.__dict__.items():
-            if callable(attr_value) and not attr_name.startswith("__"):
-                setattr(self, attr_name, attr_value.__get__(self, Stepper))
-                
+    # Order in descending order so more recent protocols/methods override less recent
+    supported_protocols = {'p0': (Stepper_Protocol_P0,),
+                           'p1': (Stepper_Protocol_P1,Stepper_Protocol_P0,),
+                           'p2': (Stepper_Protocol_P2,Stepper_Protocol_P1,Stepper_Protocol_P0,),
+                           'p3': (Stepper_Protocol_P3,Stepper_Protocol_P2,Stepper_Protocol_P1,Stepper_Protocol_P0,),
+                           'p4': (Stepper_Protocol_P4,Stepper_Protocol_P3,Stepper_Protocol_P2,Stepper_Protocol_P1,Stepper_Protocol_P0,),
+                           'p5': (Stepper_Protocol_P5,Stepper_Protocol_P4,Stepper_Protocol_P3,Stepper_Protocol_P2,Stepper_Protocol_P1,Stepper_Protocol_P0,)}
+
     def startup(self, threaded=False):
         """
         First determine which protocol version the uC firmware is running.
-        Based on that version, populates Stepper class with the supported specific Stepper_protocol_P* class methods.
+        Based on that version, switches to the Stepper class inheriting from the supported Stepper_Protocol_P* classes (see Device.set_protocol_class)
         """
         StepperBase.startup(self, threaded=threaded)
         if self.hw_valid:
             if self.board_info['protocol_version'] in self.supported_protocols:
-                protocol_classes = self.supported_protocols[self.board_info['protocol_version']]
-                for p in protocol_classes[::-1]:
-                    self.expand_protocol_methods(p)
+                self.set_protocol_class(self.supported_protocols[self.board_info['protocol_version']])
             else:
                 if self.board_info['protocol_version'] is None:
                     protocol_msg = """
@@ -0,0 +1,184 @@
+from __future__ import print_function
+import time
+import array as arr
+import numpy as np
+from stretch_body.transport import *
+from stretch_body.rpc_schema import CTYPES
+
+"""
+Bulk reader of the firmware trace of the Stepper, Pimu and Wacc (protocol p2 and later)
+
+The firmware records status, debug and print entries to a trace buffer while the trace is on.
+FirmwareTraceReader drains that buffer with back-to-back RPC_READ_TRACE pulls, and copies each entry as raw bytes
+into preallocated NumPy structured arrays, one per entry type, instead of decoding it into a dict per entry.
+Values are the raw firmware values of the C structs (eg timestamp in us, Pimu voltage in ADC counts).
+
+    r = s.read_firmware_trace_arrays()  # Or FirmwareTraceReader(transport, RPC_READ_TRACE, status_schema).read()
+    pos = r.status['pos']
+    t = (r.status['timestamp'] - r.status['timestamp'][0]) / 1e6
+
+A long trace can be streamed to a file as it is read (read(out=...)) and loaded back with load_trace.
+"""
+
+TRACE_TYPE_STATUS = 0
+TRACE_TYPE_DEBUG = 1
+TRACE_TYPE_PRINT = 2
+
+TRACE_DEBUG_DTYPE = np.dtype([('u8_1', '<u1'), ('u8_2', '<u1'), ('f_1', '<f4'), ('f_2', '<f4'), ('f_3', '<f4')])
+TRACE_PRINT_DTYPE = np.dtype([('timestamp', '<u8'), ('line', 'S32'), ('x', '<f4')])
+TRACE_ENTRY_DTYPE = np.dtype([('type', '<u1'), ('index', '<u4')])  # Entry type, and index into the array of that type
+
+
+def schema_dtype(schema):
+    """
+    Return the NumPy structured dtype with the (packed) layout of the RPCSchema
+    Nested fields are named outer_inner (eg waypoint_traj_setpoint), skipped fields pad_<index>
+    """
+    return np.dtype([(f[0].replace('.', '_') if f[0] is not None else 'pad_%d' % i, '<' + CTYPES[f[1]])
+                     for i, f in enumerate(schema.fields)])
+
+
+def load_trace(f):
+    """
+    Load a trace streamed to the file (path or binary file object) f by FirmwareTraceReader.read
+    Return a dict of the concatenated entries, status, debug and print arrays
+    """
+    if isinstance(f, str):
+        with open(f, 'rb') as fo:
+            return load_trace(fo)
+    chunks = {'entries': [], 'status': [], 'debug': [], 'print': []}
+    while True:
+        try:
+            for k in ('entries', 'status', 'debug', 'print'):
+                chunks[k].append(np.load(f))
+        except EOFError:
+            break
+    return {k: np.concatenate(v) if len(v) else np.zeros(0) for k, v in chunks.items()}
+
+
+class FirmwareTraceReader():
+    """
+    transport: Transport of the board
+    rpc_read_trace: RPC_READ_TRACE of the board (the reply is RPC_READ_TRACE + 1)
+    status_schema: RPCSchema of the status entries, as the status of the protocol of the board
+    capacity: number of entries of each type preallocated. The arrays grow when reading into memory.
+    When streaming, they are written out each time one is full.
+    max_missed: consecutive pulls with no reply (eg a timeout) before read raises a TransportError.
+    A pull with no reply counts as an error and is retried; the entry it was reading may have been lost.
+
+    After read:
+        entries: type and index of each entry, in trace order
+        status, debug, print: structured arrays of the entries of each type
+        n_rpcs, errors, missed, duration: of the read (missed: pulls with no reply, included in errors)
+    """
+    def __init__(self, transport, rpc_read_trace, status_schema, capacity=1024, max_missed=3):
+        self.transport = transport
+        self.payload = arr.array('B', [rpc_read_trace])
+        self.reply_id = rpc_read_trace + 1
+        self.dtypes = {TRACE_TYPE_STATUS: schema_dtype(status_schema), TRACE_TYPE_DEBUG: TRACE_DEBUG_DTYPE,
+                       TRACE_TYPE_PRINT: TRACE_PRINT_DTYPE}
+        self.capacity = capacity
+        self.max_missed = max_missed
+        self.n_rpcs = 0
+        self.errors = 0
+        self.missed = 0
+        self.replied = False
+        self.duration = 0.0
+        self.allocate()
+
+    def allocate(self):
+        self.arrays = {t: np.zeros(self.capacity, d) for t, d in self.dtypes.items()}
+        self.views = {t: memoryview(a.view(np.uint8)) for t, a in self.arrays.items()}  # Entries are copied in as bytes
+        self.sizes = {t: d.itemsize for t, d in self.dtypes.items()}
+        self.counts = {t: 0 for t in self.dtypes}
+        self.offsets = {t: 0 for t in self.dtypes}  # Entries of each type already written out
+        self.entries = np.zeros(self.capacity, TRACE_ENTRY_DTYPE)
+        self.n_entries = 0
+        self.n_remaining = 0
+
+    def read(self, out=None, timeout=60.0):
+        """
+        Read the trace until the board reports none remaining (or timeout s)
+        out: file (path or binary file object) to stream the entries to, in chunks, rather than keep them in memory
+        Return self
+        """
+        self.allocate()
+        self.n_rpcs = 0
+        self.errors = 0
+        self.missed = 0
+        f = open(out, 'wb') if isinstance(out, str) else out
+        self.out = f
+        ts = time.time()
+        try:
+            self.n_remaining = 1
+            n_missed = 0
+            while self.n_remaining and time.time() - ts < timeout:
+                n_remaining = self.n_remaining
+                self.n_remaining = 0
+                self.replied = False
+                self.transport.do_pull_rpc_sync(self.payload, self.rpc_read_trace_reply, priority=RPC_PRIORITY_TRACE,
+                                                retries=0)
+                self.n_rpcs += 1
+                if self.replied:
+                    n_missed = 0
+                    continue
+                self.errors += 1
+                self.missed += 1
+                n_missed += 1
+                if n_missed >= self.max_missed:
+                    raise TransportError('FirmwareTraceReader: no reply to %d RPC_READ_TRACE pulls on %s'
+                                         % (n_missed, self.transport.port_name))
+                self.n_remaining = n_remaining
+            if f is not None:
+                self.flush()
+        finally:
+            self.out = None
+            if f is not None and f is not out:
+                f.close()
+        self.duration = time.time() - ts
+        self.status = self.arrays[TRACE_TYPE_STATUS][:self.counts[TRACE_TYPE_STATUS]]
+        self.debug = self.arrays[TRACE_TYPE_DEBUG][:self.counts[TRACE_TYPE_DEBUG]]
+        self.print = self.arrays[TRACE_TYPE_PRINT][:self.counts[TRACE_TYPE_PRINT]]
+        self.entries = self.entries[:self.n_entries]
+        return self
+
+    def rpc_read_trace_reply(self, reply):
+        self.replied = True
+        if len(reply) < 3 or reply[0] != self.reply_id or reply[2] not in self.dtypes:
+            self.errors += 1
+            return
+        t = reply[2]
+        size = self.sizes[t]
+        if len(reply) < 3 + size:
+            self.errors += 1
+            return
+        self.n_remaining = reply[1]
+        n = self.counts[t]
+        if n == len(self.arrays[t]) or self.n_entries == len(self.entries):
+            self.make_room()
+            n = self.counts[t]
+        self.views[t][n * size:(n + 1) * size] = reply[3:3 + size]
+        self.counts[t] = n + 1
+        self.entries[self.n_entries] = (t, self.offsets[t] + n)
+        self.n_entries += 1
+
+    def make_room(self):
+        if self.out is not None:
+            self.flush()
+            return
+        for t in self.dtypes:
+            self.arrays[t] = np.resize(self.arrays[t], 2 * len(self.arrays[t]))
+            self.views[t] = memoryview(self.arrays[t].view(np.uint8))
+        self.entries = np.resize(self.entries, 2 * len(self.entries))
+
+    def flush(self):
+        """
+        Write the entries read since the last flush to the out file, as np.save arrays
+        (entries, status, debug, print) so that load_trace can concatenate them back
+        """
+        np.save(self.out, self.entries[:self.n_entries])
+        for t in (TRACE_TYPE_STATUS, TRACE_TYPE_DEBUG, TRACE_TYPE_PRINT):
+            np.save(self.out, self.arrays[t][:self.counts[t]])
+            self.offsets[t] += self.counts[t]
+            self.counts[t] = 0
+        self.n_entries = 0
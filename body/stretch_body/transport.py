@@ -4,11 +4,17 @@ import time
 import struct
 import array as arr
 import stretch_body.cobbs_framing as cobbs_framing
+from stretch_body.transport_stats import TransportStats
+from stretch_body.transport_worker import TransportWorker, RPC_PRIORITY_COMMAND, RPC_PRIORITY_STATUS, RPC_PRIORITY_TRACE
 import copy
 import fcntl
 import logging
 import math
 import threading
+import collections
+import select
+import os
+import io
 import aioserial
 import asyncio
 
@@ -38,6 +44,21 @@ class TransportError(Exception):
     pass
 
 
+_reactor_local = threading.local()
+
+
+def set_running_reactor(reactor):
+    """
+    Set (or clear with None) the TransportReactor running on this thread, see transport_reactor.py
+    While set, the do_*_rpc_async calls of Transport hand their RPCs to the reactor
+    """
+    _reactor_local.reactor = reactor
+
+
+def get_running_reactor():
+    return getattr(_reactor_local, 'reactor', None)
+
+
 RPC_V1_MAX_FRAMES = 18  # Required to support 1024 bytes
 RPC_V1_PUSH_FRAME_FIRST_MORE = 201
 RPC_V1_PUSH_FRAME_FIRST_ONLY = 202
@@ -67,24 +88,124 @@ COBBS_FRAME_SIZE_V0 = 64
 # //////////////////////////////  Shared Defines ///////////////////////////////////////////////////
 RPC_DATA_MAX_BYTES = 1024
 RPC_MAX_FRAME_SIZE = 64  # Arduino and Linux USB Uart has a 64 byte buffer. When frame is >64 have seen issues.
+RX_BUFFER_SIZE = 1024  # Incoming bytes are accumulated here until a packet marker is seen
 
 RPC_TRANSPORT_VERSION_0 = 0
 RPC_TRANSPORT_VERSION_1 = 1
 
 
+RPC_TIMEOUT_K = 4.0  # Adaptive frame timeout is the mean reply time + K deviations
+RPC_TIMEOUT_MIN = 0.05  # Floor of the adaptive frame timeout (s), allows for host scheduling jitter
+RPC_TIMEOUT_WARMUP = 16  # Replies measured before the adaptive timeout is used
+RPC_MAX_RETRIES = 2  # Retries of a failed pull RPC
+
+
+class AdaptiveTimeout():
+    """
+    Frame timeout of a port derived from its measured reply times, as for TCP retransmission (RFC 6298)
+    timeout = srtt + k * rttvar, clamped to [t_min, t_max]
+    Each timeout doubles the next one (up to t_max) until a reply is measured again
+    """
+    def __init__(self, k=RPC_TIMEOUT_K, t_min=RPC_TIMEOUT_MIN, n_warmup=RPC_TIMEOUT_WARMUP):
+        self.k = k
+        self.t_min = t_min
+        self.n_warmup = n_warmup
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.backoff = 1
+
+    def record(self, rtt):
+        if self.n == 0:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = self.rttvar + (abs(rtt - self.srtt) - self.rttvar) / 4
+            self.srtt = self.srtt + (rtt - self.srtt) / 8
+        self.n = self.n + 1
+        self.backoff = 1
+
+    def on_timeout(self):
+        self.backoff = self.backoff * 2
+
+    def quiet(self):
+        """
+        Return how long (s) the port should be silent before a late reply can be ruled out
+        """
+        return max(self.t_min, 2 * self.srtt) if self.n else self.t_min
+
+    def get(self, t_max):
+        """
+        Return the frame timeout (s), t_max until warmed up
+        """
+        if self.n < self.n_warmup:
+            return t_max
+        return min(t_max, max(self.t_min, self.srtt + self.k * self.rttvar) * self.backoff)
+
+
 class SyncTransactionHandler():
     def __init__(self, port_name, ser, logger, lock):
         self.ser = ser
         self.logger = logger
         self.port_name = port_name
         self.empty_frame = arr.array('B', [0] * RPC_MAX_FRAME_SIZE)
-        self.status = {'read_error': 0, 'write_error': 0, 'transactions': 0}
+        self.status = {'read_error': 0, 'write_error': 0, 'transactions': 0, 'allocs': 0, 'frames': 0,
+                       'timeouts': 0, 'crc_errors': 0, 'retries': 0, 'recovered': 0}
         self.version = RPC_TRANSPORT_VERSION_0
         self.timeout = 1 # was .2  # Was .05 but on heavy loads can get starved
+        # Pull RPCs use an adaptive frame timeout (capped at timeout) and are retried on failure.
+        # Pushes keep the fixed timeout and are not retried: the device may be busy applying them (eg, a flash write)
+        # and may already have applied one whose ack was lost.
+        self.adaptive_timeout = True
+        self.max_retries = RPC_MAX_RETRIES
+        self.rtt = AdaptiveTimeout()
+        self.rx_timeout = None  # Frame timeout of the transaction in progress, None outside of one (timeout)
+        self.measure_rtt = False
+        self.t_sent = 0.0
+        self.stats = None  # TransportStats that retries are counted in, set by Transport
         self.packet_marker = 0
         self.lock = lock
         self.dbg_buf = ''
         self.dbg_on = 0
+        self.framer = cobbs_framing.CobbsFraming()
+        # Buffers are allocated once and reused for every transaction. Views are held on each so that
+        # an accidental resize raises a BufferError rather than silently reallocating.
+        self.frame_buf = self.alloc_buffer(RPC_MAX_FRAME_SIZE)  # Outgoing frame, CRC is appended in place
+        self.tx_buf = self.alloc_buffer(2 * RPC_MAX_FRAME_SIZE)  # Cobbs encoded outgoing frame
+        self.rx_buf = self.alloc_buffer(RX_BUFFER_SIZE)  # Cobbs encoded incoming frames, rx_head:rx_tail is pending
+        self.decode_buf = self.alloc_buffer(2 * RPC_MAX_FRAME_SIZE)  # Decoded incoming frame
+        self.reply_buf = self.alloc_buffer(RPC_DATA_MAX_BYTES + 2 * RPC_MAX_FRAME_SIZE)  # Reassembled RPC reply
+        self.frame_view = memoryview(self.frame_buf)
+        self.tx_view = memoryview(self.tx_buf)
+        self.rx_view = memoryview(self.rx_buf)
+        self.decode_view = memoryview(self.decode_buf)
+        self.reply_view = memoryview(self.reply_buf)
+        self.rx_head = 0
+        self.rx_tail = 0
+        self.capture = None  # TransportCapture that frames are logged to, see Transport.start_capture
+        self.capture_id = 0
+        # Wait for incoming data with poll() on the port's file descriptor rather than spinning on inWaiting().
+        # Serial objects without a file descriptor fall back to polling inWaiting().
+        self.fd = None
+        self.poller = None
+        try:
+            self.fd = ser.fileno()
+            self.poller = select.poll()
+            self.poller.register(self.fd, select.POLLIN)
+        except (AttributeError, ValueError, OSError, io.UnsupportedOperation, serial.SerialException):
+            self.fd = None
+            self.poller = None
+
+    def alloc_buffer(self, n):
+        """
+        Allocate a transaction buffer, counting it in status['allocs']
+        A steady state RPC loop should not increase this count
+        """
+        self.status['allocs'] += 1
+        return bytearray(n)
 
     def get_empty_frame(self):  # Just a fast convience function to create a large array of 'B'
         return self.empty_frame[:]
@@ -100,6 +221,7 @@ class SyncTransactionHandler():
             else:
                 self.dbg_buf = self.dbg_buf + 'Framer rcvd 0 bytes on RPC_PUSH_ACK'
         if crc != 1:
+            self.status['crc_errors'] += 1
             self.logger.error('Transport CRC Error on RPC_V1_PUSH_ACK {0} {1} {2}'.format(crc, nr, ack_code))
             raise TransportError
         if ack_code != RPC_V1_PUSH_ACK:
@@ -118,36 +240,189 @@ class SyncTransactionHandler():
             else:
                 self.dbg_buf = self.dbg_buf + 'Framer rcvd 0 bytes on RPC_PULL_ACK'
         if crc != 1:
+            self.status['crc_errors'] += 1
             self.logger.error('Transport CRC Error on RPC_PUSH_ACK {0} {1} {2}'.format(crc, nr, ack_code))
             raise TransportError
         if ack_code != RPC_V1_PULL_FRAME_ACK_MORE and ack_code != RPC_V1_PULL_FRAME_ACK_LAST:
             self.logger.error('Transport RX Error on RPC_PUSH_ACK {0} {1} {2}'.format(crc, nr, ack_code))
             raise TransportError
 
-    def sendFramedData(self, data, size):
-        framer = cobbs_framing.CobbsFraming()
-        encoded_data = framer.encode_data(data[:size])
-        self.ser.write(encoded_data)
+    def encode_frame(self, data, size):
+        """
+        Cobbs encode the first size bytes of data into tx_buf
+        Return a view of the encoded frame
+        """
+        if data is not self.frame_buf:
+            self.frame_view[:size] = data[:size]
+        n = self.framer.encode_into(self.frame_buf, size, self.tx_buf)
+        self.status['frames'] += 1
+        if self.capture is not None:
+            self.capture.record_tx(self.capture_id, self.tx_view[:n - 1])
+        return self.tx_view[:n]
+
+    def reset_input_buffer(self):
+        """
+        Drop pending incoming data, both in the port and in rx_buf
+        """
+        self.rx_head = 0
+        self.rx_tail = 0
+        self.ser.reset_input_buffer()
 
-    def receiveFramedData(self):
-        t_start = time.time()
-        rx_buffer = []
-        framer = cobbs_framing.CobbsFraming()
-        while ((time.time() - t_start) < self.timeout):
+    def frame_timeout(self):
+        """
+        Return the timeout (s) to wait for a reply frame of a pull RPC
+        """
+        if self.adaptive_timeout:
+            return self.rtt.get(self.timeout)
+        return self.timeout
+
+    def begin_transaction(self, push):
+        """
+        Set the frame timeout of the transaction to follow, see __init__
+        """
+        self.measure_rtt = not push and self.adaptive_timeout
+        self.rx_timeout = self.frame_timeout() if self.measure_rtt else self.timeout
+        self.t_sent = 0.0
+
+    def on_frame_received(self):
+        if self.t_sent:
+            if self.measure_rtt:
+                self.rtt.record(time.perf_counter() - self.t_sent)
+            self.t_sent = 0.0
+
+    def on_frame_timeout(self):
+        self.status['timeouts'] += 1
+        if self.measure_rtt:
+            self.rtt.on_timeout()
+        self.rx_head = self.rx_tail = 0
+
+    def on_retry(self):
+        self.status['retries'] += 1
+        if self.stats is not None:
+            self.stats.record_retry()
+        self.rx_timeout = self.frame_timeout()
+
+    def resync(self):
+        """
+        Before retrying a failed RPC, wait for the port to go quiet and drop what arrived,
+        so that a late reply to the failed attempt is not taken for the reply to the retry
+        """
+        t_end = time.time() + self.timeout
+        while time.time() < t_end and self.read_rx(self.rtt.quiet()):
+            pass
+        self.reset_input_buffer()
+
+    def rx_space(self):
+        """
+        Return a view of the free space at the end of rx_buf, first moving any pending bytes to the start
+        If rx_buf is full without a packet marker it can not hold a valid frame, and is dropped
+        """
+        if self.rx_head:
+            n = self.rx_tail - self.rx_head
+            self.rx_view[:n] = self.rx_view[self.rx_head:self.rx_tail]
+            self.rx_head = 0
+            self.rx_tail = n
+        if self.rx_tail == len(self.rx_buf):
+            self.logger.warning('Transport dropped %d bytes without a packet marker: %s' % (self.rx_tail, self.port_name))
+            self.rx_tail = 0
+        return self.rx_view[self.rx_tail:]
+
+    def feed_rx(self, rbuf):
+        """
+        Append bytes read from the port to rx_buf
+        """
+        rv = memoryview(rbuf)
+        i = 0
+        while i < len(rv):
+            space = self.rx_space()
+            k = min(len(space), len(rv) - i)
+            space[:k] = rv[i:i + k]
+            self.rx_tail = self.rx_tail + k
+            i = i + k
+
+    def take_frame(self):
+        """
+        Decode the next complete frame pending in rx_buf into decode_buf
+        Return crc ok, num bytes, or None if no complete frame has arrived
+        Bytes following the frame are kept for the next call
+        """
+        while True:
+            z = self.rx_buf.find(self.packet_marker, self.rx_head, self.rx_tail)
+            if z == -1:
+                return None
+            start = self.rx_head
+            self.rx_head = z + 1
+            if self.rx_head == self.rx_tail:
+                self.rx_head = self.rx_tail = 0
+            if z > start:  # Skip empty frames (repeated packet markers)
+                self.status['frames'] += 1
+                if self.capture is not None:
+                    self.capture.record_rx(self.capture_id, self.rx_view[start:z])
+                return self.framer.decode_into(self.rx_view[start:z], z - start, self.decode_buf)
+
+    def read_rx(self, timeout):
+        """
+        Wait up to timeout (s) for data on the port and read what is available into rx_buf
+        Return num bytes read
+        """
+        if self.poller is None:
             nn = self.ser.inWaiting()
-            if (nn > 0):
-                rbuf = self.ser.read(nn)
-                nu = 0
-                for byte_in in rbuf:
-                    nu = nu + 1
-                    if byte_in == self.packet_marker:
-                        crc_ok, nr, decoded_data = framer.decode_data(rx_buffer)  # [:-1])
-                        return crc_ok, nr, decoded_data
-                    else:
-                        rx_buffer.append(byte_in)
-            else:
+            if nn == 0:
                 time.sleep(.00001)
-        return 0, 0, arr.array('B', [])
+                return 0
+            self.feed_rx(self.ser.read(nn))
+            return nn
+        if not self.poller.poll(max(timeout, 0) * 1000.0):
+            return 0
+        return self.read_fd()
+
+    def read_fd(self):
+        """
+        Read the data available on the (non-blocking) port file descriptor straight into rx_buf
+        Return num bytes read
+        """
+        try:
+            n = os.readv(self.fd, [self.rx_space()])
+        except BlockingIOError:
+            return 0
+        if n == 0:
+            raise serial.SerialException('device reports readiness to read but returned no data '
+                                         '(device disconnected or multiple access on port?)')
+        self.rx_tail = self.rx_tail + n
+        return n
+
+    def append_reply(self, nrep, decoded_data, nr):
+        """
+        Copy the data of a reply frame (less the frame cmd byte) onto reply_buf
+        Return the new length of the reply
+        """
+        n = nr - 1
+        if nrep + n > len(self.reply_buf):
+            raise TransportError('RPC reply overflow')
+        self.reply_view[nrep:nrep + n] = decoded_data[1:nr]
+        return nrep + n
+
+    def sendFramedData(self, data, size):
+        self.ser.write(self.encode_frame(data, size))
+        self.t_sent = time.perf_counter()
+
+    def receiveFramedData(self):
+        """
+        Return crc ok, num bytes, view of the decoded frame
+        The view is only valid until the next call
+        """
+        t_end = time.time() + (self.rx_timeout or self.timeout)
+        while True:
+            r = self.take_frame()
+            if r is not None:
+                self.on_frame_received()
+                return r[0], r[1], self.decode_view
+            remaining = t_end - time.time()
+            if remaining <= 0:
+                break
+            self.read_rx(remaining)
+        self.on_frame_timeout()
+        return 0, 0, self.decode_view
 
     def receiveFramedData2(self):
         framer = cobbs_framing.CobbsFraming()
@@ -158,33 +433,125 @@ class SyncTransactionHandler():
         crc_ok, nr, decoded_data = framer.decode_data(rbuf[:-1])
         return crc_ok, nr, decoded_data
 
-    def do_rpc(self, push, payload, reply_callback, exiting=False):
+    def do_rpc(self, push, payload, reply_callback, exiting=False, retries=None):
+        """
+        retries: of a failed pull, default max_retries. Pass 0 for a pull that is not idempotent (eg RPC_READ_TRACE).
+        """
         if not self.ser:
-            return
+            return False
         self.status['transactions'] += 1
         if exiting:
             time.sleep(0.1)  # May have been a hard exit, give time for bad data to land, remove, do final RPC
             self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
+            self.reset_input_buffer()
         # This will block until all RPCs have been completed
+        self.begin_transaction(push)
+        ok = False
         try:
             # Now run RPC calls
             if push:
                 if self.version == RPC_TRANSPORT_VERSION_0:
-                    self.do_transaction_v0(payload, reply_callback)
+                    ok = self.do_transaction_v0(payload, reply_callback)
                 elif self.version == RPC_TRANSPORT_VERSION_1:
-                    self.do_push_transaction_v1(payload, reply_callback)
+                    ok = self.do_push_transaction_v1(payload, reply_callback)
             else:
-                if self.version == RPC_TRANSPORT_VERSION_0:
+                for attempt in range((self.max_retries if retries is None else retries) + 1):
+                    if attempt:
+                        self.on_retry()
+                        self.resync()
+                    if self.version == RPC_TRANSPORT_VERSION_0:
+                        ok = self.do_transaction_v0(payload, reply_callback)
+                    else:
+                        ok = self.do_pull_transaction_v1(payload, reply_callback)
+                    if ok or not self.ser:
+                        break
+                if ok and attempt:
+                    self.status['recovered'] += 1
+        except IOError as e:
+            self.logger.error("IOError({0}): {1} : {2}".format(e.errno, e.strerror, self.port_name))
+            self.status['read_error'] += 1
+        except serial.SerialTimeoutException as e:
+            self.status['write_error'] += 1
+            self.logger.error("SerialException({0}): {1} : {2}".format(e.errno, e.strerror, self.port_name))
+        return ok
+
+    def do_push_batch(self, rpcs, exiting=False):
+        """
+        Push a list of (payload, reply_callback) RPCs in a single transaction
+        With V1, single frame RPCs are pipelined (see do_push_pipeline_v1). V0 runs them one after another.
+        """
+        if not self.ser:
+            return
+        self.status['transactions'] += len(rpcs)
+        self.begin_transaction(True)
+        if exiting:
+            time.sleep(0.1)  # May have been a hard exit, give time for bad data to land, remove, do final RPC
+            self.ser.reset_output_buffer()
+            self.reset_input_buffer()
+        try:
+            if self.version == RPC_TRANSPORT_VERSION_0:
+                for payload, reply_callback in rpcs:
                     self.do_transaction_v0(payload, reply_callback)
-                elif self.version == RPC_TRANSPORT_VERSION_1:
-                    self.do_pull_transaction_v1(payload, reply_callback)
+            elif self.version == RPC_TRANSPORT_VERSION_1:
+                self.do_push_pipeline_v1(rpcs)
         except IOError as e:
-            print("IOError({0}): {1}".format(e.errno, e.strerror))
+            self.logger.error("IOError({0}): {1} : {2}".format(e.errno, e.strerror, self.port_name))
             self.status['read_error'] += 1
         except serial.SerialTimeoutException as e:
             self.status['write_error'] += 1
-            print("SerialException({0}): {1}".format(e.errno, e.strerror))
+            self.logger.error("SerialException({0}): {1} : {2}".format(e.errno, e.strerror, self.port_name))
+
+    def do_push_pipeline_v1(self, rpcs):
+        """
+                Parameters
+        ----------
+        rpcs: List of (rpc_data, rpc_callback)
+        Returns: True/False if successful
+        -------
+        Runs of RPCs that fit in a single frame (RPC_V1_PUSH_FRAME_FIRST_ONLY) are written back to back,
+        and then their RPC_V1_PUSH_ACKs are read back in order. The device handles frames in the order received.
+        An RPC that needs more than one frame is sent with do_push_transaction_v1.
+        """
+        i = 0
+        while i < len(rpcs):
+            j = i
+            while j < len(rpcs) and len(rpcs[j][0]) <= RPC_V1_FRAME_DATA_MAX_BYTES:
+                j = j + 1
+            if j == i:
+                if not self.do_push_transaction_v1(rpcs[i][0], rpcs[i][1]):
+                    return False
+                i = i + 1
+                continue
+            try:
+                for k in range(i, j):
+                    rpc_data = rpcs[k][0]
+                    self.frame_buf[0] = RPC_V1_PUSH_FRAME_FIRST_ONLY
+                    self.frame_view[1:len(rpc_data) + 1] = rpc_data
+                    self.sendFramedData(self.frame_buf, len(rpc_data) + 1)
+                for k in range(i, j):
+                    crc_ok, nr, decoded_data = self.receiveFramedData()
+                    self.handle_push_ack_v1(crc_ok, nr, decoded_data[0])
+                    rpcs[k][1](decoded_data[1:nr])
+            except TransportError as e:
+                if self.dbg_on:
+                    print('---- Debug Exception')
+                    print(self.dbg_buf)
+                self.status['read_error'] += 1
+                self.ser.reset_output_buffer()
+                self.reset_input_buffer()
+                self.logger.error("TransportError: %s : %s" % (self.port_name, str(e)))
+                return False
+            except serial.SerialTimeoutException as e:
+                self.status['write_error'] += 1
+                self.ser = None
+                self.logger.error("SerialTimeoutException: %s : %s" % (self.port_name, str(e)))
+                return False
+            except serial.SerialException as e:
+                self.logger.error("SerialException: %s : %s" % (self.port_name, str(e)))
+                self.ser = None
+                return False
+            i = j
+        return True
 
     def do_push_transaction_v1(self, rpc_data, rpc_callback):
         """
@@ -226,7 +593,7 @@ class SyncTransactionHandler():
         """
         n_frames = math.ceil(len(rpc_data) / RPC_V1_FRAME_DATA_MAX_BYTES)
         widx = 0
-        frame_buf_out = self.get_empty_frame()
+        frame_buf_out = self.frame_buf
 
         try:
             for fid in range(n_frames):
@@ -255,7 +622,7 @@ class SyncTransactionHandler():
                 print(self.dbg_buf)
             self.status['read_error'] += 1
             self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
+            self.reset_input_buffer()
             self.logger.error("TransportError: %s : %s" % (self.port_name, str(e)))
         except serial.SerialTimeoutException as e:
             self.status['write_error'] += 1
@@ -281,7 +648,7 @@ class SyncTransactionHandler():
         However, here we send down only a pull request (single frame with an RPC_ID).
         We get back one or more frames of status data which is then decoded and passed to the callback.
         """
-        frame_buf_out = self.get_empty_frame()
+        frame_buf_out = self.frame_buf
         try:
             # First initiate a pull transaction
             frame_buf_out[0] = RPC_V1_PULL_FRAME_FIRST
@@ -289,16 +656,16 @@ class SyncTransactionHandler():
             frame_buf_out[1:nb_frame + 1] = rpc_data[0:nb_frame]
             self.sendFramedData(frame_buf_out, nb_frame + 1)
 
-            reply = arr.array('B')
+            nrep = 0
 
             # Next read out the N reply frames (up to 18, if no ACK_LAST, then error
             for i in range(RPC_V1_MAX_FRAMES):
 
                 crc, nr, decoded_data = self.receiveFramedData()
                 self.handle_pull_ack_v1(crc, nr, decoded_data[0])
-                reply = reply + decoded_data[1:nr]
+                nrep = self.append_reply(nrep, decoded_data, nr)
                 if decoded_data[0] == RPC_V1_PULL_FRAME_ACK_LAST:  # No more frames to request
-                    rpc_callback(reply)
+                    rpc_callback(self.reply_view[:nrep])
                     return True
                 elif decoded_data[0] == RPC_V1_PULL_FRAME_ACK_MORE:  # More frames to request
                     frame_buf_out[0] = RPC_V1_PULL_FRAME_MORE
@@ -315,7 +682,7 @@ class SyncTransactionHandler():
                 print(self.dbg_buf)
             self.status['read_error'] += 1
             self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
+            self.reset_input_buffer()
             self.logger.error("TransportError: %s : %s" % (self.port_name, str(e)))
         except serial.SerialTimeoutException as e:
             self.status['write_error'] += 1
@@ -330,7 +697,7 @@ class SyncTransactionHandler():
         return False
 
     def do_transaction_v0(self, rpc, rpc_callback):  # Handle a single RPC transaction
-        frame_buf = arr.array('B', [0] * (COBBS_FRAME_SIZE_V0))
+        frame_buf = self.frame_buf
         try:
             if self.dbg_on:
                 dbg_buf = self.dbg_buf + '--------------- New RPC -------------------------\n'
@@ -410,7 +777,7 @@ class SyncTransactionHandler():
                                                                                                                     0]))
                         raise TransportError
             ########### Receive all blocks
-            reply = arr.array('B')
+            nrep = 0
             # if self.dbg_on:
             #    print('Receiving RPC reply')
             while True:
@@ -426,7 +793,7 @@ class SyncTransactionHandler():
                     self.logger.error(
                         'Transport RX Error on RPC_V0_GET_BLOCK {0} {1} {2}'.format(crc, nr, decoded_data[0]))
                     raise TransportError
-                reply = reply + decoded_data[1:nr]
+                nrep = self.append_reply(nrep, decoded_data, nr)
 
                 if decoded_data[0] == RPC_V0_ACK_GET_BLOCK_LAST:
                     break
@@ -434,14 +801,15 @@ class SyncTransactionHandler():
             # if self.dbg_on:
             #    print('Got reply',len(reply))
             # print('---------------------- RPC complete, elapsed time------------------:',time.time()-ts)
-            rpc_callback(reply)
+            rpc_callback(self.reply_view[:nrep])
+            return True
         except TransportError as e:
             if self.dbg_on:
                 print('---- Debug Exception')
                 print(self.dbg_buf)
             self.status['read_error'] += 1
             self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
+            self.reset_input_buffer()
             self.logger.error("TransportError: %s : %s" % (self.port_name, str(e)))
         except serial.SerialTimeoutException as e:
             self.status['write_error'] += 1
@@ -453,66 +821,203 @@ class SyncTransactionHandler():
         # except TypeError as e:
         #     self.logger.error("TypeError: %s : %s" % (self.port_name, str(e)))
         #     self.ser=None
+        return False
 
 
 class AsyncTransactionHandler(SyncTransactionHandler):
     def __init__(self, port_name, ser, logger, lock):
         SyncTransactionHandler.__init__(self, port_name, ser, logger, lock)
 
+    async def wait_fd(self, add_watcher, remove_watcher, timeout):
+        """
+        Suspend until the port file descriptor is ready, without blocking the event loop
+        add_watcher / remove_watcher are the loop's add_reader / remove_reader (or add_writer / remove_writer)
+        Return False on timeout
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def done(ready):
+            if not fut.done():
+                fut.set_result(ready)
+
+        add_watcher(self.fd, done, True)
+        th = loop.call_later(max(timeout, 0), done, False)
+        try:
+            return await fut
+        finally:
+            remove_watcher(self.fd)
+            th.cancel()
+
     async def sendFramedData(self, data, size):
-        framer = cobbs_framing.CobbsFraming()
-        encoded_data = framer.encode_data(data[:size])
-        await self.ser.write_async(encoded_data)
+        frame = self.encode_frame(data, size)
+        if self.fd is None:
+            await self.ser.write_async(frame)
+            self.t_sent = time.perf_counter()
+            return
+        loop = asyncio.get_running_loop()
+        while len(frame):
+            try:
+                n = os.write(self.fd, frame)
+                frame = frame[n:]
+            except BlockingIOError:
+                if not await self.wait_fd(loop.add_writer, loop.remove_writer, self.ser.write_timeout or self.timeout):
+                    raise serial.SerialTimeoutException('Write timeout')
+        self.t_sent = time.perf_counter()
 
     async def receiveFramedData(self):
-        t_start = time.time()
-        rx_buffer = []
-        framer = cobbs_framing.CobbsFraming()
-        while ((time.time() - t_start) < self.timeout):
-            nn = self.ser.inWaiting()
-            if (nn > 0):
-                rbuf = await self.ser.read_async(nn)
-                nu = 0
-                for byte_in in rbuf:
-                    nu = nu + 1
-                    if byte_in == self.packet_marker:
-                        crc_ok, nr, decoded_data = framer.decode_data(rx_buffer)  # [:-1])
-                        # self.logger.info(f"AsyncTransaction Wait: {1000*(time.time() - t_start)}ms")
-                        return crc_ok, nr, decoded_data
-                    else:
-                        rx_buffer.append(byte_in)
-            else:
-                time.sleep(.00001)
+        loop = asyncio.get_running_loop()
+        t_end = time.time() + (self.rx_timeout or self.timeout)
+        while True:
+            r = self.take_frame()
+            if r is not None:
+                self.on_frame_received()
+                return r[0], r[1], self.decode_view
+            remaining = t_end - time.time()
+            if remaining <= 0:
+                break
+            if self.fd is None:
+                nn = self.ser.inWaiting()
+                if nn > 0:
+                    self.feed_rx(await self.ser.read_async(nn))
+                else:
+                    await asyncio.sleep(.0001)
+            elif await self.wait_fd(loop.add_reader, loop.remove_reader, remaining):
+                self.read_fd()
+        self.on_frame_timeout()
         self.logger.error(f"Async-Transaction Timeout.")
-        return 0, 0, arr.array('B', [])
+        return 0, 0, self.decode_view
 
-    async def do_rpc(self, push, payload, reply_callback, exiting=False):
+    async def resync(self):
+        """
+        See SyncTransactionHandler.resync
+        """
+        loop = asyncio.get_running_loop()
+        t_end = time.time() + self.timeout
+        while self.fd is not None and time.time() < t_end and \
+                await self.wait_fd(loop.add_reader, loop.remove_reader, self.rtt.quiet()):
+            self.read_fd()
+        self.reset_input_buffer()
+
+    async def do_rpc(self, push, payload, reply_callback, exiting=False, retries=None):
+        """
+        See SyncTransactionHandler.do_rpc
+        """
         if not self.ser:
-            return
+            return False
         self.status['transactions'] += 1
         # if exiting:
         #     time.sleep(0.1) #May have been a hard exit, give time for bad data to land, remove, do final RPC
         #     self.ser.reset_output_buffer()
-        #     self.ser.reset_input_buffer()
+        #     self.reset_input_buffer()
         # This will block until all RPCs have been completed
+        self.begin_transaction(push)
+        ok = False
         try:
             # Now run RPC calls
             if push:
                 if self.version == RPC_TRANSPORT_VERSION_0:
-                    await self.do_transaction_v0(payload, reply_callback)
+                    ok = await self.do_transaction_v0(payload, reply_callback)
                 elif self.version == RPC_TRANSPORT_VERSION_1:
-                    await self.do_push_transaction_v1(payload, reply_callback)
+                    ok = await self.do_push_transaction_v1(payload, reply_callback)
             else:
-                if self.version == RPC_TRANSPORT_VERSION_0:
+                for attempt in range((self.max_retries if retries is None else retries) + 1):
+                    if attempt:
+                        self.on_retry()
+                        await self.resync()
+                    if self.version == RPC_TRANSPORT_VERSION_0:
+                        ok = await self.do_transaction_v0(payload, reply_callback)
+                    else:
+                        ok = await self.do_pull_transaction_v1(payload, reply_callback)
+                    if ok or not self.ser:
+                        break
+                if ok and attempt:
+                    self.status['recovered'] += 1
+        except IOError as e:
+            self.logger.error("IOError({0}): {1} : {2}".format(e.errno, e.strerror, self.port_name))
+            self.status['read_error'] += 1
+        except serial.SerialTimeoutException as e:
+            self.status['write_error'] += 1
+            self.logger.error("SerialException({0}): {1} : {2}".format(e.errno, e.strerror, self.port_name))
+        return ok
+
+    async def do_push_batch(self, rpcs, exiting=False):
+        """
+        Push a list of (payload, reply_callback) RPCs in a single transaction
+        With V1, single frame RPCs are pipelined (see do_push_pipeline_v1). V0 runs them one after another.
+        """
+        if not self.ser:
+            return
+        self.status['transactions'] += len(rpcs)
+        self.begin_transaction(True)
+        if exiting:
+            await asyncio.sleep(0.1)  # May have been a hard exit, give time for bad data to land, remove, do final RPC
+            self.ser.reset_output_buffer()
+            self.reset_input_buffer()
+        try:
+            if self.version == RPC_TRANSPORT_VERSION_0:
+                for payload, reply_callback in rpcs:
                     await self.do_transaction_v0(payload, reply_callback)
-                elif self.version == RPC_TRANSPORT_VERSION_1:
-                    await self.do_pull_transaction_v1(payload, reply_callback)
+            elif self.version == RPC_TRANSPORT_VERSION_1:
+                await self.do_push_pipeline_v1(rpcs)
         except IOError as e:
-            print("IOError({0}): {1}".format(e.errno, e.strerror))
+            self.logger.error("IOError({0}): {1} : {2}".format(e.errno, e.strerror, self.port_name))
             self.status['read_error'] += 1
         except serial.SerialTimeoutException as e:
             self.status['write_error'] += 1
-            print("SerialException({0}): {1}".format(e.errno, e.strerror))
+            self.logger.error("SerialException({0}): {1} : {2}".format(e.errno, e.strerror, self.port_name))
+
+    async def do_push_pipeline_v1(self, rpcs):
+        """
+                Parameters
+        ----------
+        rpcs: List of (rpc_data, rpc_callback)
+        Returns: True/False if successful
+        -------
+        Runs of RPCs that fit in a single frame (RPC_V1_PUSH_FRAME_FIRST_ONLY) are written back to back,
+        and then their RPC_V1_PUSH_ACKs are read back in order. The device handles frames in the order received.
+        An RPC that needs more than one frame is sent with do_push_transaction_v1.
+        """
+        i = 0
+        while i < len(rpcs):
+            j = i
+            while j < len(rpcs) and len(rpcs[j][0]) <= RPC_V1_FRAME_DATA_MAX_BYTES:
+                j = j + 1
+            if j == i:
+                if not await self.do_push_transaction_v1(rpcs[i][0], rpcs[i][1]):
+                    return False
+                i = i + 1
+                continue
+            try:
+                for k in range(i, j):
+                    rpc_data = rpcs[k][0]
+                    self.frame_buf[0] = RPC_V1_PUSH_FRAME_FIRST_ONLY
+                    self.frame_view[1:len(rpc_data) + 1] = rpc_data
+                    await self.sendFramedData(self.frame_buf, len(rpc_data) + 1)
+                for k in range(i, j):
+                    crc_ok, nr, decoded_data = await self.receiveFramedData()
+                    self.handle_push_ack_v1(crc_ok, nr, decoded_data[0])
+                    rpcs[k][1](decoded_data[1:nr])
+            except TransportError as e:
+                if self.dbg_on:
+                    print('---- Debug Exception')
+                    print(self.dbg_buf)
+                self.status['read_error'] += 1
+                self.ser.reset_output_buffer()
+                self.reset_input_buffer()
+                self.logger.error("TransportError: %s : %s" % (self.port_name, str(e)))
+                return False
+            except serial.SerialTimeoutException as e:
+                self.status['write_error'] += 1
+                self.ser = None
+                self.logger.error("SerialTimeoutException: %s : %s" % (self.port_name, str(e)))
+                return False
+            except serial.SerialException as e:
+                self.logger.error("SerialException: %s : %s" % (self.port_name, str(e)))
+                self.ser = None
+                return False
+            i = j
+        return True
 
     async def do_pull_transaction_v1(self, rpc_data, rpc_callback):
         """
@@ -526,7 +1031,7 @@ class AsyncTransactionHandler(SyncTransactionHandler):
         However, here we send down only a pull request (single frame with an RPC_ID).
         We get back one or more frames of status data which is then decoded and passed to the callback.
         """
-        frame_buf_out = self.get_empty_frame()
+        frame_buf_out = self.frame_buf
 
         try:
             # First initiate a pull transaction
@@ -534,15 +1039,15 @@ class AsyncTransactionHandler(SyncTransactionHandler):
             nb_frame = min(RPC_V1_FRAME_DATA_MAX_BYTES, len(rpc_data))
             frame_buf_out[1:nb_frame + 1] = rpc_data[0:nb_frame]
             await self.sendFramedData(frame_buf_out, nb_frame + 1)
-            reply = arr.array('B')
+            nrep = 0
 
             # Next read out the N reply frames (up to 18, if no ACK_LAST, then error
             for i in range(RPC_V1_MAX_FRAMES):
                 crc, nr, decoded_data = await self.receiveFramedData()
                 self.handle_pull_ack_v1(crc, nr, decoded_data[0])
-                reply = reply + decoded_data[1:nr]
+                nrep = self.append_reply(nrep, decoded_data, nr)
                 if decoded_data[0] == RPC_V1_PULL_FRAME_ACK_LAST:  # No more frames to request
-                    rpc_callback(reply)
+                    rpc_callback(self.reply_view[:nrep])
                     return True
                 elif decoded_data[0] == RPC_V1_PULL_FRAME_ACK_MORE:  # More frames to request
                     frame_buf_out[0] = RPC_V1_PULL_FRAME_MORE
@@ -559,7 +1064,7 @@ class AsyncTransactionHandler(SyncTransactionHandler):
                 print(self.dbg_buf)
             self.status['read_error'] += 1
             self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
+            self.reset_input_buffer()
             self.logger.error("TransportError: %s : %s" % (self.port_name, str(e)))
         except serial.SerialTimeoutException as e:
             self.status['write_error'] += 1
@@ -614,8 +1119,7 @@ class AsyncTransactionHandler(SyncTransactionHandler):
 
         n_frames = math.ceil(len(rpc_data) / RPC_V1_FRAME_DATA_MAX_BYTES)
         widx = 0
-        frame_buf_in = self.get_empty_frame()
-        frame_buf_out = self.get_empty_frame()
+        frame_buf_out = self.frame_buf
 
         try:
             for fid in range(n_frames):
@@ -633,13 +1137,10 @@ class AsyncTransactionHandler(SyncTransactionHandler):
                 widx = widx + nb_frame
                 await self.sendFramedData(frame_buf_out, nb_frame + 1)
                 # Get Ack back
-                frame_buf_in[0] = 0  # Remove stale data
-                crc, nr = await self.receiveFramedData()
-                self.handle_push_ack_v1(crc, nr, frame_buf_in[0])
-                if frame_buf_in[0] != RPC_V1_PUSH_ACK:
-                    raise TransportError("Byte 0 not RPC_V1_PUSH_ACK")
+                crc_ok, nr, decoded_data = await self.receiveFramedData()
+                self.handle_push_ack_v1(crc_ok, nr, decoded_data[0])
                 if fid == n_frames - 1:
-                    rpc_callback(frame_buf_in[1:nr])
+                    rpc_callback(decoded_data[1:nr])
             return True
         except TransportError as e:
             if self.dbg_on:
@@ -647,7 +1148,7 @@ class AsyncTransactionHandler(SyncTransactionHandler):
                 print(self.dbg_buf)
             self.status['read_error'] += 1
             self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
+            self.reset_input_buffer()
             self.logger.error("TransportError: %s : %s" % (self.port_name, str(e)))
         except serial.SerialTimeoutException as e:
             self.status['write_error'] += 1
@@ -662,7 +1163,7 @@ class AsyncTransactionHandler(SyncTransactionHandler):
         return False
 
     async def do_transaction_v0(self, rpc, rpc_callback):  # Handle a single RPC transaction
-        frame_buf = arr.array('B', [0] * (COBBS_FRAME_SIZE_V0))
+        frame_buf = self.frame_buf
         try:
             if self.dbg_on:
                 self.dbg_buf = self.dbg_buf + '--------------- New RPC -------------------------\n'
@@ -744,7 +1245,7 @@ class AsyncTransactionHandler(SyncTransactionHandler):
                                                                                                   frame_buf[0]))
                         raise TransportError
             ########### Receive all blocks
-            reply = arr.array('B')
+            nrep = 0
             # if self.dbg_on:
             #    print('Receiving RPC reply')
             while True:
@@ -760,7 +1261,7 @@ class AsyncTransactionHandler(SyncTransactionHandler):
                     self.logger.error(
                         'Transport RX Error on RPC_V0_GET_BLOCK {0} {1} {2}'.format(crc_ok, nr, decoded_data[0]))
                     raise TransportError
-                reply = reply + decoded_data[1:nr]
+                nrep = self.append_reply(nrep, decoded_data, nr)
 
                 if decoded_data[0] == RPC_V0_ACK_GET_BLOCK_LAST:
                     break
@@ -768,14 +1269,15 @@ class AsyncTransactionHandler(SyncTransactionHandler):
             # if self.dbg_on:
             #    print('Got reply',len(reply))
             # print('---------------------- RPC complete, elapsed time------------------:',time.time()-ts)
-            rpc_callback(reply)
+            rpc_callback(self.reply_view[:nrep])
+            return True
         except TransportError as e:
             if self.dbg_on:
                 print('---- Debug Exception')
                 print(self.dbg_buf)
             self.status['read_error'] += 1
             self.ser.reset_output_buffer()
-            self.ser.reset_input_buffer()
+            self.reset_input_buffer()
             self.logger.error("TransportError: %s : %s" % (self.port_name, str(e)))
         except serial.SerialTimeoutException as e:
             self.status['write_error'] += 1
@@ -787,6 +1289,65 @@ class AsyncTransactionHandler(SyncTransactionHandler):
         except TypeError as e:
             self.logger.error("TypeError: %s : %s" % (self.port_name, str(e)))
             self.ser = None
+        return False
+
+
+class TransportLock():
+    """
+    Lock shared by the sync and asyncio callers of a Transport
+
+    Threads acquire it as a threading.Lock (including with-statements).
+    Coroutines await acquire_async(), which suspends on a future rather than blocking
+    the event loop or a worker thread. Waiting coroutines, in any event loop, are woken on release.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = collections.deque()
+        self._waiters_lock = threading.Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self._lock.acquire(blocking, timeout)
+
+    def release(self):
+        self._lock.release()
+        with self._waiters_lock:
+            waiters = list(self._waiters)
+            self._waiters.clear()
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(self._wake, fut)
+            except RuntimeError:  # Loop closed
+                pass
+
+    def locked(self):
+        return self._lock.locked()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while not self._lock.acquire(blocking=False):
+            fut = loop.create_future()
+            waiter = (loop, fut)
+            with self._waiters_lock:
+                self._waiters.append(waiter)
+            if self._lock.acquire(blocking=False):  # Released before we were queued
+                with self._waiters_lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                return True
+            await fut
+        return True
+
+    @staticmethod
+    def _wake(fut):
+        if not fut.done():
+            fut.set_result(None)
+
+    def __enter__(self):
+        self._lock.acquire()
+        return True
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
 
 
 class Transport():
@@ -797,14 +1358,25 @@ class Transport():
     This enables Transport to support both synchronous and asynchromous calls.
     Devices can use standard pySerial for non-timing critical transactions.
     They can use the asyncio interfaces for timing critical transactions where blocking on the RPC call is not desirable
+
+    The asyncio calls wait on the port file descriptor from the event loop (add_reader / add_writer) and take
+    the TransportLock without a worker thread, so RPCs to several ports can overlap in one asyncio.gather
+
+    Optionally (start_worker) the sync calls are run by a per-port TransportWorker thread, in priority order,
+    rather than by the calling thread contending for the lock
     """
 
     def __init__(self, usb, logger=logging.getLogger()):
         self.port_name = usb
         self.logger = logger
-        self.lock = threading.Lock()
-        self.status = {}
-        self.empty_payload = arr.array('B', [0] * (RPC_DATA_MAX_BYTES + 1))  # RPC ID + 1024 bytes of data
+        self.lock = TransportLock()
+        self.status = {'payload_allocs': 0}
+        self.payload_local = threading.local()  # Per thread payload buffer, see get_empty_payload
+        self.stats = TransportStats(usb)
+        self.reply_times = {}  # Payload of a pull RPC: time it was last sent and completed, see reply_is_fresh
+        self.capture = None
+        self.capture_id = 0
+        self.worker = None
         self.version = RPC_TRANSPORT_VERSION_0
 
     def startup(self):
@@ -816,8 +1388,11 @@ class Transport():
                                                          lock=self.lock)
             self.sync_handler = SyncTransactionHandler(port_name=self.port_name, ser=self.ser, logger=self.logger,
                                                        lock=self.lock)
+            self.async_handler.rtt = self.sync_handler.rtt  # One reply time estimate per port
+            self.sync_handler.stats = self.async_handler.stats = self.stats
             self.status['async'] = self.async_handler.status
             self.status['sync'] = self.sync_handler.status
+            self.set_capture()
             if self.ser.isOpen():
                 try:
                     fcntl.flock(self.ser.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
@@ -834,6 +1409,7 @@ class Transport():
         return self.ser is not None  # return if hardware connection valid
 
     def stop(self):
+        self.stop_worker()
         if self.ser:
             self.logger.debug('Shutting down TransportConnection on: ' + self.port_name)
             try:
@@ -844,8 +1420,133 @@ class Transport():
             self.ser.close()
             self.ser = None
 
-    def get_empty_payload(self):  # Just a fast convience function to create a large array of 'B'
-        return self.empty_payload[:]
+    def get_empty_payload(self, reuse=True):
+        """
+        Return a writable view of RPC_DATA_MAX_BYTES+1 bytes (RPC ID + data) to pack an RPC into
+        The buffer is allocated once per calling thread and reused on every call, so it is not zeroed.
+        Pass payload[:sidx] to the do_*_rpc_* calls; slicing the view does not copy the data.
+        reuse=False returns a newly allocated buffer instead. The async push paths must use it: coroutines on the
+        same thread would share the per thread buffer, and one could repack it while another awaits its RPC.
+        """
+        if not reuse:
+            return memoryview(bytearray(RPC_DATA_MAX_BYTES + 1))
+        try:
+            return self.payload_local.view
+        except AttributeError:
+            self.payload_local.view = memoryview(bytearray(RPC_DATA_MAX_BYTES + 1))
+            self.status['payload_allocs'] += 1
+            return self.payload_local.view
+
+    def configure_timeouts(self, adaptive=True, max_retries=RPC_MAX_RETRIES):
+        """
+        Turn the adaptive frame timeout of pull RPCs on / off and set how many times a failed pull is retried
+        """
+        for h in (self.sync_handler, self.async_handler):
+            h.adaptive_timeout = adaptive
+            h.max_retries = max_retries
+
+    def get_stats(self):
+        """
+        Return a snapshot (dict) of the RPC latency, frames per RPC and lock wait histograms for this port
+        See transport_stats.TransportStats
+        'timeout' is the current frame timeout of pull RPCs, see AdaptiveTimeout
+        In worker mode, 'worker' holds the queue depth and queue wait histograms (see TransportWorker.get_stats)
+        """
+        s = self.stats.snapshot()
+        if getattr(self, 'sync_handler', None) is not None:
+            s['timeout'] = self.sync_handler.frame_timeout()
+        if self.worker is not None:
+            s['worker'] = self.worker.get_stats()
+        return s
+
+    def start_worker(self):
+        """
+        Switch the sync calls to worker mode: RPCs are queued to a per-port thread and run in priority order
+        """
+        if self.worker is None:
+            self.worker = TransportWorker(self)
+            self.status['worker'] = self.worker.status
+
+    def stop_worker(self):
+        """
+        Run any queued RPCs, then return to calling the port from the caller's thread
+        """
+        worker = self.worker
+        if worker is not None:
+            worker.stop()
+            self.worker = None
+
+    def submit_pull_rpc(self, payload, reply_callback, priority=RPC_PRIORITY_STATUS, exiting=False, retries=None):
+        """
+        Queue an RPC that pulls data from the device, return a concurrent.futures.Future of its completion
+        Requires worker mode (start_worker). reply_callback is called from the worker thread.
+        """
+        return self.worker.submit(False, payload, reply_callback, priority, exiting, retries)
+
+    def submit_push_rpc(self, payload, reply_callback, priority=RPC_PRIORITY_COMMAND, exiting=False):
+        """
+        Queue an RPC that pushes data to the device, return a concurrent.futures.Future of its completion
+        Requires worker mode (start_worker). reply_callback is called from the worker thread.
+        """
+        return self.worker.submit(True, payload, reply_callback, priority, exiting)
+
+    def submit_push_rpc_batch(self, rpcs, priority=RPC_PRIORITY_COMMAND, exiting=False):
+        """
+        Queue a batch of push RPCs (see do_push_rpc_batch_sync), return a concurrent.futures.Future of its completion
+        Requires worker mode (start_worker)
+        """
+        return self.worker.submit_batch(rpcs, priority, exiting)
+
+    def use_worker(self):
+        worker = self.worker
+        return worker is not None and not worker.in_worker()
+
+    def start_capture(self, capture):
+        """
+        Log every frame sent and received on this port to capture (a transport_capture.TransportCapture)
+        The capture can be shared by several Transports. Start it before startup() to include the board info RPC.
+        """
+        with self.lock:
+            self.capture_id = capture.add_port(self.port_name)
+            self.capture = capture
+            self.set_capture()
+
+    def stop_capture(self):
+        with self.lock:
+            self.capture = None
+            self.set_capture()
+
+    def set_capture(self):
+        for h in (getattr(self, 'sync_handler', None), getattr(self, 'async_handler', None)):
+            if h is not None:
+                h.capture = self.capture
+                h.capture_id = self.capture_id
+
+    def record_rpc(self, handler, rpcs, t_lock, t_start, frames_start):
+        """
+        Add a completed RPC (or batch of RPCs) to the stats. Batched RPCs are each recorded with the time of the batch.
+        """
+        t_end = time.perf_counter()
+        frames = (handler.status['frames'] - frames_start) / len(rpcs)
+        for payload in rpcs:
+            self.stats.record(payload[0], t_end - t_start, t_start - t_lock, frames)
+
+    def mark_reply(self, payload, t_start):
+        """
+        Note that the pull RPC with this payload, started at t_start, completed
+        """
+        self.reply_times[bytes(payload)] = t_start
+
+    def reply_is_fresh(self, payload, max_age):
+        """
+        Return True if the pull RPC with this payload completed, from any thread, within the last max_age (s)
+        Age is counted from when that RPC was sent. Its reply_callback has already handled the reply,
+        so a caller pulling status into the same Device can skip the RPC. Counted as a cache hit / miss in the stats.
+        """
+        t = self.reply_times.get(bytes(payload))
+        hit = t is not None and time.perf_counter() - t < max_age
+        self.stats.record_cache(hit)
+        return hit
 
     def configure_version(self, firmware_version):
         """
@@ -872,25 +1573,41 @@ class Transport():
         else:
             self.version = self.sync_handler.version = self.async_handler.version = v
 
-    async def do_pull_rpc_async(self, payload, reply_callback, exiting=False):
+    async def do_pull_rpc_async(self, payload, reply_callback, exiting=False, max_age=None, retries=None):
         """
         Do an RPC that pulls data from the device
         Parameters
         ----------
         payload: Array of type 'B' with length of RPC data to transmit
-        reply_callback: Called after RPC data has been returned
+        reply_callback: Called after RPC data has been returned. The reply is a view of a reused buffer, copy to keep it
         exiting: Cleanup if a final call during exit
+        max_age: Skip the RPC if the same pull (same payload) completed less than max_age (s) ago, see reply_is_fresh
+        retries: of a failed pull, default the rpc_max_retries param. Pass 0 if the pull is not idempotent,
+        ie the board changes state on each one (RPC_READ_TRACE, RPC_LOAD_TEST_PULL)
 
         Returns
         -------
         None
         """
-        # Acquire the lock in a worker thread, suspending us while waiting.
-        # See https://stackoverflow.com/questions/63420413/how-to-use-threading-lock-in-async-function-while-object-can-be-accessed-from-mu
-        await asyncio.get_event_loop().run_in_executor(None, self.lock.acquire)
-        success = await self.async_handler.do_rpc(push=False, payload=payload, reply_callback=reply_callback,
-                                                  exiting=exiting)
-        self.lock.release()
+        reactor = get_running_reactor()
+        if reactor is not None:
+            if max_age is not None and self.reply_is_fresh(payload, max_age):
+                return
+            await reactor.rpc(self, False, payload, reply_callback, exiting, retries)
+            return
+        t_lock = time.perf_counter()
+        await self.lock.acquire_async()
+        try:
+            if max_age is not None and self.reply_is_fresh(payload, max_age):
+                return
+            t_start = time.perf_counter()
+            frames_start = self.async_handler.status['frames']
+            if await self.async_handler.do_rpc(push=False, payload=payload, reply_callback=reply_callback,
+                                               exiting=exiting, retries=retries):
+                self.mark_reply(payload, t_start)
+            self.record_rpc(self.async_handler, (payload,), t_lock, t_start, frames_start)
+        finally:
+            self.lock.release()
 
     async def do_push_rpc_async(self, payload, reply_callback, exiting=False):
         """
@@ -898,48 +1615,138 @@ class Transport():
         Parameters
         ----------
         payload: Array of type 'B' with length of RPC data to transmit
-        reply_callback: Called after RPC data has been returned
+        reply_callback: Called after RPC data has been returned. The reply is a view of a reused buffer, copy to keep it
         exiting: Cleanup if a final call during exit
         Returns
         -------
         None
         """
-        await asyncio.get_event_loop().run_in_executor(None, self.lock.acquire)
-        success = await self.async_handler.do_rpc(push=False, payload=payload, reply_callback=reply_callback,
-                                                  exiting=exiting)
-        self.lock.release()
-
-    def do_pull_rpc_sync(self, payload, reply_callback, exiting=False):
+        reactor = get_running_reactor()
+        if reactor is not None:
+            await reactor.rpc(self, True, payload, reply_callback, exiting)
+            return
+        t_lock = time.perf_counter()
+        await self.lock.acquire_async()
+        try:
+            t_start = time.perf_counter()
+            frames_start = self.async_handler.status['frames']
+            await self.async_handler.do_rpc(push=True, payload=payload, reply_callback=reply_callback,
+                                            exiting=exiting)
+            self.record_rpc(self.async_handler, (payload,), t_lock, t_start, frames_start)
+        finally:
+            self.lock.release()
+
+    def do_pull_rpc_sync(self, payload, reply_callback, exiting=False, priority=RPC_PRIORITY_STATUS, max_age=None,
+                         retries=None):
         """
         Do an RPC that pulls data from the device
         Parameters
         ----------
         payload: Array of type 'B' with length of RPC data to transmit
-        reply_callback: Called after RPC data has been returned
+        reply_callback: Called after RPC data has been returned. The reply is a view of a reused buffer, copy to keep it
+        exiting: Cleanup if a final call during exit
+        priority: Queue priority in worker mode (RPC_PRIORITY_*)
+        max_age: Skip the RPC if the same pull (same payload) completed less than max_age (s) ago, see reply_is_fresh
+        retries: of a failed pull, default the rpc_max_retries param. Pass 0 if the pull is not idempotent,
+        ie the board changes state on each one (RPC_READ_TRACE, RPC_LOAD_TEST_PULL)
+
+        Returns
+        -------
+        None
+        """
+        if self.use_worker():
+            if max_age is not None and self.reply_is_fresh(payload, max_age):
+                return
+            self.worker.submit(False, payload, reply_callback, priority, exiting, retries).result()
+        else:
+            self.do_rpc_locked(False, payload, reply_callback, exiting, max_age, retries)
+
+    def do_rpc_locked(self, push, payload, reply_callback, exiting=False, max_age=None, retries=None):
+        t_lock = time.perf_counter()
+        with self.lock:
+            if max_age is not None and self.reply_is_fresh(payload, max_age):
+                return
+            t_start = time.perf_counter()
+            frames_start = self.sync_handler.status['frames']
+            if self.sync_handler.do_rpc(push=push, payload=payload, reply_callback=reply_callback, exiting=exiting,
+                                        retries=retries) and not push:
+                self.mark_reply(payload, t_start)
+            self.record_rpc(self.sync_handler, (payload,), t_lock, t_start, frames_start)
+
+    def do_push_rpc_batch_sync(self, rpcs, exiting=False, priority=RPC_PRIORITY_COMMAND):
+        """
+        Do several RPCs that push data to the device, holding the port for the whole batch
+        Parameters
+        ----------
+        rpcs: List of (payload, reply_callback). Payloads of 58 bytes or less are pipelined, not sent lock-step
         exiting: Cleanup if a final call during exit
+        priority: Queue priority in worker mode (RPC_PRIORITY_*)
 
         Returns
         -------
         None
         """
+        if not len(rpcs):
+            return
+        if self.use_worker():
+            self.worker.submit_batch(rpcs, priority, exiting).result()
+        else:
+            self.do_push_rpc_batch_locked(rpcs, exiting)
+
+    def do_push_rpc_batch_locked(self, rpcs, exiting=False):
+        t_lock = time.perf_counter()
         with self.lock:
-            self.sync_handler.do_rpc(push=False, payload=payload, reply_callback=reply_callback, exiting=exiting)
+            t_start = time.perf_counter()
+            frames_start = self.sync_handler.status['frames']
+            self.sync_handler.do_push_batch(rpcs, exiting=exiting)
+            self.record_rpc(self.sync_handler, [r[0] for r in rpcs], t_lock, t_start, frames_start)
 
-    def do_push_rpc_sync(self, payload, reply_callback, exiting=False):
+    async def do_push_rpc_batch_async(self, rpcs, exiting=False):
+        """
+        Do several RPCs that push data to the device, holding the port for the whole batch
+        Parameters
+        ----------
+        rpcs: List of (payload, reply_callback). Payloads of 58 bytes or less are pipelined, not sent lock-step
+        exiting: Cleanup if a final call during exit
+
+        Returns
+        -------
+        None
+        """
+        if not len(rpcs):
+            return
+        reactor = get_running_reactor()
+        if reactor is not None:
+            await reactor.rpc_batch(self, rpcs, exiting)
+            return
+        t_lock = time.perf_counter()
+        await self.lock.acquire_async()
+        try:
+            t_start = time.perf_counter()
+            frames_start = self.async_handler.status['frames']
+            await self.async_handler.do_push_batch(rpcs, exiting=exiting)
+            self.record_rpc(self.async_handler, [r[0] for r in rpcs], t_lock, t_start, frames_start)
+        finally:
+            self.lock.release()
+
+    def do_push_rpc_sync(self, payload, reply_callback, exiting=False, priority=RPC_PRIORITY_COMMAND):
         """
         Do an RPC that pushes data to the device
         Parameters
         ----------
         payload: Array of type 'B' with length of RPC data to transmit
-        reply_callback: Called after RPC data has been returned
+        reply_callback: Called after RPC data has been returned. The reply is a view of a reused buffer, copy to keep it
         exiting: Cleanup if a final call during exit
+        priority: Queue priority in worker mode (RPC_PRIORITY_*)
 
         Returns
         -------
         None
         """
-        with self.lock:
-            self.sync_handler.do_rpc(push=True, payload=payload, reply_callback=reply_callback, exiting=exiting)
+        if self.use_worker():
+            self.worker.submit(True, payload, reply_callback, priority, exiting).result()
+        else:
+            self.do_rpc_locked(True, payload, reply_callback, exiting)
 
 
 # #####################################
@@ -0,0 +1,150 @@
+from __future__ import print_function
+import asyncio
+import functools
+import json
+import platform
+import time
+import array as arr
+from stretch_body.transport import *
+from stretch_body.transport_stats import LatencyHistogram
+from stretch_body.stepper import StepperBase
+from stretch_body.pimu import PimuBase
+from stretch_body.wacc import WaccBase
+
+"""
+Throughput benchmark of a Transport, built on the load test RPCs of the Stepper, Pimu and Wacc firmware
+
+For each transport version (V0, V1), call mode (sync, async), direction (push, pull) and load size it runs
+n RPCs and reports RPCs/s, payload bytes/s and the latency percentiles (see LatencyHistogram).
+A push carries the load size bytes of data. A pull first pushes a load of that size: the emulated firmware
+(device_emulator.py) replies with the same size, the board firmware with its full load test buffer,
+so the bytes of a pull are counted from the replies.
+
+Works against a board (Transport on its port) or an emulated one (PtyDeviceEmulator) alike:
+
+    b = TransportBenchmark(transport, 'Stepper')
+    results = b.run()
+    print(results_to_json(results))
+"""
+
+LOAD_TEST_RPC = {'Stepper': (StepperBase.RPC_LOAD_TEST_PUSH, StepperBase.RPC_LOAD_TEST_PULL),
+                 'Pimu': (PimuBase.RPC_LOAD_TEST_PUSH, PimuBase.RPC_LOAD_TEST_PULL),
+                 'Wacc': (WaccBase.RPC_LOAD_TEST_PUSH, WaccBase.RPC_LOAD_TEST_PULL)}
+LOAD_TEST_SIZES = [1, 16, 32, 57, 58, 115, 116, 256, 512, 1024]  # Bytes of load. With the RPC id, 57/58 and 115/116 fall either side of a V1 frame boundary
+
+
+class TransportBenchmark():
+    """
+    Load test benchmark of one board
+    transport: a started Transport
+    board: 'Stepper', 'Pimu' or 'Wacc' (first field of the board firmware version)
+    """
+    def __init__(self, transport, board, n_rpcs=100):
+        if board not in LOAD_TEST_RPC:
+            raise TransportError('No load test RPC for board %s' % board)
+        self.transport = transport
+        self.board = board
+        self.n_rpcs = n_rpcs
+        self.rpc_push, self.rpc_pull = LOAD_TEST_RPC[board]
+        self.reply_bytes = 0
+        self.errors = 0
+
+    def load_payload(self, size):
+        payload = arr.array('B', [self.rpc_push])
+        payload.extend([i % 256 for i in range(size)])
+        return payload
+
+    def push_reply(self, reply):
+        if reply[0] != self.rpc_push + 1:
+            self.errors += 1
+
+    def pull_reply(self, reply):
+        if reply[0] != self.rpc_pull + 1:
+            self.errors += 1
+        self.reply_bytes += len(reply) - 1
+
+    def run(self, sizes=LOAD_TEST_SIZES, versions=(RPC_TRANSPORT_VERSION_0, RPC_TRANSPORT_VERSION_1),
+            modes=('sync', 'async')):
+        """
+        Sweep all combinations, return a list of result dicts (see run_one)
+        The transport version is restored when done
+        """
+        results = []
+        version = self.transport.version
+        loop = asyncio.new_event_loop() if 'async' in modes else None
+        try:
+            for v in versions:
+                self.transport.set_version(v)
+                for mode in modes:
+                    for direction in ('push', 'pull'):
+                        for size in sizes:
+                            results.append(self.run_one(v, mode, direction, size, loop))
+        finally:
+            self.transport.set_version(version)
+            if loop is not None:
+                loop.close()
+        return results
+
+    def run_one(self, version, mode, direction, size, loop=None):
+        """
+        Time n_rpcs RPCs of one kind, with the Transport already set to version
+        """
+        if not 0 < size <= RPC_DATA_MAX_BYTES:
+            raise TransportError('Load size must be 1 to %d bytes' % RPC_DATA_MAX_BYTES)
+        t = self.transport
+        load = self.load_payload(size)
+        h = LatencyHistogram()
+        self.reply_bytes = 0
+        self.errors = 0
+        errors_start = t.status['sync']['read_error'] + t.status['async']['read_error']
+        if direction == 'push':
+            payload, cb = load, self.push_reply
+        else:
+            t.do_push_rpc_sync(load, self.push_reply)
+            payload, cb = arr.array('B', [self.rpc_pull]), self.pull_reply
+        push = direction == 'push'
+        if mode == 'sync':
+            call = t.do_push_rpc_sync if push else functools.partial(t.do_pull_rpc_sync, retries=0)
+            t0 = time.perf_counter()
+            for i in range(self.n_rpcs):
+                ts = time.perf_counter()
+                call(payload, cb)
+                h.record(time.perf_counter() - ts)
+            dt = time.perf_counter() - t0
+        else:
+            call = t.do_push_rpc_async if push else functools.partial(t.do_pull_rpc_async, retries=0)
+
+            async def run_async():
+                for i in range(self.n_rpcs):
+                    ts = time.perf_counter()
+                    await call(payload, cb)
+                    h.record(time.perf_counter() - ts)
+
+            t0 = time.perf_counter()
+            loop.run_until_complete(run_async())
+            dt = time.perf_counter() - t0
+        n_bytes = size * self.n_rpcs if push else self.reply_bytes
+        return {'board': self.board,
+                'port': t.port_name,
+                'version': version,
+                'mode': mode,
+                'direction': direction,
+                'size': size,
+                'n': self.n_rpcs,
+                'duration': dt,
+                'rpcs_per_s': self.n_rpcs / dt,
+                'bytes_per_s': n_bytes / dt,
+                'latency': h.snapshot(),
+                'errors': self.errors + t.status['sync']['read_error'] + t.status['async']['read_error'] - errors_start}
+
+
+def results_to_json(results, **meta):
+    """
+    Return the results as a JSON document, with the run metadata (host, time, plus any given) alongside
+    """
+    doc = {'host': platform.node(),
+           'python': platform.python_version(),
+           'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'results': results}
+    doc.update(meta)
+    return json.dumps(doc, indent=1)
@@ -0,0 +1,177 @@
+from __future__ import print_function
+import collections
+import struct
+import threading
+import time
+import stretch_body.cobbs_framing as cobbs_framing
+from stretch_body.transport import *
+
+"""
+Binary capture of the serial traffic of one or more Transports
+
+Each framed TX / RX (Cobbs encoded, without the packet marker) is logged with a monotonic nanosecond timestamp.
+On the RPC path a record is a copy into a preallocated buffer under a lock; a background thread writes filled
+buffers to disk. If the writer falls behind (both buffers full) records are dropped and counted, the RPC never waits on disk.
+
+File format: CAPTURE_MAGIC, then records of [RECORD_HEADER, data]
+  RECORD_HEADER: t_ns (uint64), type (uint8), port id (uint8), num data bytes (uint16)
+  type CAPTURE_PORT: data is the port name (utf-8), the port id is used by the records that follow
+  type CAPTURE_TX / CAPTURE_RX: data is the encoded frame
+
+read_capture() iterates the records, and capture_rpcs() reassembles them into the RPC request / reply pairs.
+See tools/bin/stretch_transport_replay.py to decode a capture through the device unpack_status methods.
+"""
+
+CAPTURE_MAGIC = b'SBCAP01\n'
+RECORD_HEADER = struct.Struct('<QBBH')
+CAPTURE_TX = 0
+CAPTURE_RX = 1
+CAPTURE_PORT = 2
+
+
+class TransportCapture():
+    """
+    Writes the frames of all Transports it is attached to (see Transport.start_capture) to filename
+    """
+    def __init__(self, filename, buffer_size=1 << 20, flush_period=0.1):
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.flush_period = flush_period
+        self.buffers = [bytearray(buffer_size), bytearray(buffer_size)]
+        self.buf = self.buffers[0]  # Buffer that records are copied into
+        self.nbuf = 0
+        self.ports = []
+        self.status = {'records': 0, 'bytes': 0, 'dropped': 0}
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.shutdown_flag = False
+        self.fh = open(filename, 'wb')
+        self.fh.write(CAPTURE_MAGIC)
+        self.writer = threading.Thread(target=self._write_loop, name='TransportCapture', daemon=True)
+        self.writer.start()
+
+    def add_port(self, port_name):
+        """
+        Register a port, return its id for record()
+        """
+        with self.lock:
+            port_id = len(self.ports)
+            self.ports.append(port_name)
+        self.record(port_id, CAPTURE_PORT, port_name.encode('utf-8'))
+        return port_id
+
+    def record(self, port_id, record_type, data):
+        t_ns = time.monotonic_ns()
+        n = len(data)
+        with self.lock:
+            if self.nbuf + RECORD_HEADER.size + n > self.buffer_size:
+                self.status['dropped'] += 1
+                return
+            RECORD_HEADER.pack_into(self.buf, self.nbuf, t_ns, record_type, port_id, n)
+            idx = self.nbuf + RECORD_HEADER.size
+            self.buf[idx:idx + n] = data
+            self.nbuf = idx + n
+            self.status['records'] += 1
+            if self.nbuf > self.buffer_size // 2:
+                self.ready.notify()
+
+    def record_tx(self, port_id, frame):
+        self.record(port_id, CAPTURE_TX, frame)
+
+    def record_rx(self, port_id, frame):
+        self.record(port_id, CAPTURE_RX, frame)
+
+    def _write_loop(self):
+        while True:
+            with self.lock:
+                if not self.shutdown_flag and self.nbuf <= self.buffer_size // 2:
+                    self.ready.wait(self.flush_period)
+                buf, n = self.buf, self.nbuf
+                self.buf = self.buffers[1] if buf is self.buffers[0] else self.buffers[0]
+                self.nbuf = 0
+                shutdown = self.shutdown_flag
+            if n:
+                self.fh.write(memoryview(buf)[:n])
+                self.status['bytes'] += n
+            if shutdown:
+                break
+
+    def stop(self):
+        """
+        Write any buffered records and close the file
+        """
+        if self.fh is None:
+            return
+        with self.lock:
+            self.shutdown_flag = True
+            self.ready.notify()
+        self.writer.join()
+        self.fh.close()
+        self.fh = None
+
+
+def read_capture(filename):
+    """
+    Iterate the records of a capture file
+    Yield t_ns, record type (CAPTURE_TX / CAPTURE_RX), port name, encoded frame (memoryview)
+    """
+    with open(filename, 'rb') as fh:
+        data = fh.read()
+    if data[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+        raise TransportError('Not a transport capture: %s' % filename)
+    view = memoryview(data)
+    ports = {}
+    idx = len(CAPTURE_MAGIC)
+    while idx + RECORD_HEADER.size <= len(data):
+        t_ns, record_type, port_id, n = RECORD_HEADER.unpack_from(data, idx)
+        idx = idx + RECORD_HEADER.size
+        if record_type == CAPTURE_PORT:
+            ports[port_id] = bytes(view[idx:idx + n]).decode('utf-8')
+        else:
+            yield t_ns, record_type, ports[port_id], view[idx:idx + n]
+        idx = idx + n
+
+
+def capture_rpcs(records):
+    """
+    Reassemble the frames of a capture (from read_capture) into RPCs, for both V0 and V1 transport
+    Yield t_ns of the last frame, port name, RPC request (bytes), RPC reply (bytes)
+    For V1 push RPCs the reply is the RPC ID ack. Pipelined pushes (see do_push_pipeline_v1) are matched to their acks in order.
+    """
+    framer = cobbs_framing.CobbsFraming()
+    ports = {}
+    for t_ns, record_type, port, frame in records:
+        crc_ok, nr, d = framer.decode_data(frame)
+        if not crc_ok or nr == 0:
+            continue
+        p = ports.get(port)
+        if p is None:
+            p = ports[port] = {'request': bytearray(), 'reply': bytearray(), 'push': bytearray(), 'pushed': collections.deque()}
+        cmd = d[0]
+        data = d[1:nr].tobytes()
+        if record_type == CAPTURE_TX:
+            if cmd == RPC_V1_PUSH_FRAME_FIRST_ONLY:
+                p['pushed'].append(data)
+            elif cmd == RPC_V1_PUSH_FRAME_FIRST_MORE:
+                p['push'] = bytearray(data)
+            elif cmd == RPC_V1_PUSH_FRAME_MORE:
+                p['push'] += data
+            elif cmd == RPC_V1_PUSH_FRAME_LAST:
+                p['pushed'].append(bytes(p['push'] + data))
+            elif cmd == RPC_V1_PULL_FRAME_FIRST:
+                p['request'] = bytearray(data)
+                p['reply'] = bytearray()
+                p['pushed'].clear()
+            elif cmd == RPC_V0_START_NEW_RPC:
+                p['request'] = bytearray()
+                p['reply'] = bytearray()
+                p['pushed'].clear()
+            elif cmd == RPC_V0_SEND_BLOCK_MORE or cmd == RPC_V0_SEND_BLOCK_LAST:
+                p['request'] += data
+        else:
+            if cmd == RPC_V1_PULL_FRAME_ACK_MORE or cmd == RPC_V0_ACK_GET_BLOCK_MORE:
+                p['reply'] += data
+            elif cmd == RPC_V1_PULL_FRAME_ACK_LAST or cmd == RPC_V0_ACK_GET_BLOCK_LAST:
+                yield t_ns, port, bytes(p['request']), bytes(p['reply'] + data)
+            elif cmd == RPC_V1_PUSH_ACK and len(data) and len(p['pushed']):  # Ack of the last frame of a push carries the reply RPC ID
+                yield t_ns, port, p['pushed'].popleft(), data
@@ -0,0 +1,337 @@
+from __future__ import print_function
+import collections
+import selectors
+import time
+import serial
+from stretch_body.transport import *
+
+"""
+Single-threaded reactor that multiplexes the V1 RPCs of several Transports over one selector
+
+The reactor runs coroutines such as Stepper.pull_status_async() or Pimu.pull_status_async(): while it is running
+on a thread, the do_*_rpc_async calls of Transport hand their RPC to the reactor rather than to asyncio.
+Each RPC then runs as a non-blocking state machine, driven by the frames that arrive on its port, so the status
+pulls of all boards are in flight at once and a cycle costs about the slowest board rather than the sum of all.
+
+Ports are registered with the selector only while one of their RPCs is in flight, holding the port's TransportLock
+(taken without blocking; an RPC whose port is busy waits its turn on the next poll).
+Frame timeouts and retries of failed pulls follow the port's SyncTransactionHandler (see AdaptiveTimeout).
+RPCs on V0 ports, on exit, or without a port file descriptor fall back to the blocking sync path.
+"""
+
+
+class ReactorRPC():
+    """
+    A pull RPC, or a batch of push RPCs, of one Transport, run by the reactor
+    Awaited by the coroutine that issued it
+    """
+    def __init__(self, transport, push, rpcs, exiting=False, retries=None):
+        self.transport = transport
+        self.handler = transport.sync_handler
+        self.push = push
+        self.rpcs = rpcs  # List of (payload, reply_callback), a single entry for a pull
+        self.exiting = exiting
+        self.retries = retries  # Of a failed pull, None for the handler's max_retries
+        self.task = None
+        self.t_submit = time.perf_counter()
+        self.t_start = 0.0
+        self.frames_start = 0
+        self.deadline = 0.0
+        self.k = 0  # Next RPC of the batch to be acked
+        self.group = 0  # End of the run of pipelined single frame pushes in flight
+        self.fid = 0  # Frame of a multi-frame push
+        self.nrep = 0  # Bytes of pull reply received
+        self.n_frames = 0
+        self.attempt = 0  # Retries of a failed pull
+        self.resync_end = 0.0  # Set while waiting for the port to go quiet before a retry
+
+    def __await__(self):
+        yield self
+
+    def start(self):
+        self.handler.status['transactions'] += len(self.rpcs)
+        self.send_first()
+
+    def send_first(self):
+        self.k = self.group = self.fid = self.nrep = self.n_frames = 0
+        if self.push:
+            self.send_push()
+        else:
+            self.send_pull(RPC_V1_PULL_FRAME_FIRST)
+
+    def send(self, cmd, data):
+        h = self.handler
+        h.frame_buf[0] = cmd
+        n = len(data)
+        h.frame_view[1:n + 1] = data
+        h.ser.write(h.encode_frame(h.frame_buf, n + 1))
+        h.t_sent = time.perf_counter()
+
+    def send_pull(self, cmd):
+        self.send(cmd, self.rpcs[0][0][:RPC_V1_FRAME_DATA_MAX_BYTES])
+
+    def send_push(self):
+        """
+        Send the frame(s) of the next RPC(s) of the batch
+        A run of single frame RPCs is pipelined, as in SyncTransactionHandler.do_push_pipeline_v1
+        Return False once the whole batch has been acked
+        """
+        rpcs = self.rpcs
+        if self.k == len(rpcs):
+            return False
+        payload = rpcs[self.k][0]
+        if len(payload) <= RPC_V1_FRAME_DATA_MAX_BYTES:
+            j = self.k
+            while j < len(rpcs) and len(rpcs[j][0]) <= RPC_V1_FRAME_DATA_MAX_BYTES:
+                self.send(RPC_V1_PUSH_FRAME_FIRST_ONLY, rpcs[j][0])
+                j = j + 1
+            self.group = j
+        else:
+            n_frames = math.ceil(len(payload) / RPC_V1_FRAME_DATA_MAX_BYTES)
+            if self.fid == 0:
+                cmd = RPC_V1_PUSH_FRAME_FIRST_MORE
+            elif self.fid == n_frames - 1:
+                cmd = RPC_V1_PUSH_FRAME_LAST
+            else:
+                cmd = RPC_V1_PUSH_FRAME_MORE
+            widx = self.fid * RPC_V1_FRAME_DATA_MAX_BYTES
+            self.send(cmd, payload[widx:widx + RPC_V1_FRAME_DATA_MAX_BYTES])
+            self.group = self.k + 1
+        return True
+
+    def on_frame(self, crc, nr, decoded_data):
+        """
+        Handle a reply frame. Return True once the RPC is complete
+        """
+        h = self.handler
+        if self.push:
+            h.handle_push_ack_v1(crc, nr, decoded_data[0])
+            payload, reply_callback = self.rpcs[self.k]
+            if len(payload) > RPC_V1_FRAME_DATA_MAX_BYTES:
+                if (self.fid + 1) * RPC_V1_FRAME_DATA_MAX_BYTES < len(payload):
+                    self.fid = self.fid + 1
+                    self.send_push()
+                    return False
+                self.fid = 0
+            reply_callback(decoded_data[1:nr])
+            self.k = self.k + 1
+            if self.k < self.group:
+                return False
+            return not self.send_push()
+        h.handle_pull_ack_v1(crc, nr, decoded_data[0])
+        self.nrep = h.append_reply(self.nrep, decoded_data, nr)
+        if decoded_data[0] == RPC_V1_PULL_FRAME_ACK_LAST:
+            self.rpcs[0][1](h.reply_view[:self.nrep])
+            return True
+        self.n_frames = self.n_frames + 1
+        if self.n_frames >= RPC_V1_MAX_FRAMES:
+            raise TransportError('Failed to get RPC_V1_PULL_FRAME_ACK_LAST')
+        self.send_pull(RPC_V1_PULL_FRAME_MORE)
+        return False
+
+
+class TransportReactor():
+    """
+    Run coroutines that do Transport RPCs, multiplexing all ports over one selector on the calling thread
+
+    reactor.run_until_complete([robot.wacc.pull_status_async(), robot.pimu.pull_status_async(), ...])
+    """
+    def __init__(self, poll_period=0.0005):
+        self.selector = selectors.DefaultSelector()
+        self.poll_period = poll_period  # Max wait in select() while an RPC waits on a busy port
+        self.ready = collections.deque()  # (task, exception to throw into it or None)
+        self.waiting = collections.deque()  # RPCs waiting for their port lock
+        self.active = {}  # fd: ReactorRPC in flight
+        self.status = {'cycles': 0, 'rpcs': 0, 'lock_waits': 0, 'timeouts': 0, 'errors': 0, 'fallbacks': 0}
+
+    def rpc(self, transport, push, payload, reply_callback, exiting=False, retries=None):
+        """
+        Return an awaitable that runs a single RPC on transport
+        """
+        return ReactorRPC(transport, push, [(payload, reply_callback)], exiting, retries)
+
+    def rpc_batch(self, transport, rpcs, exiting=False):
+        """
+        Return an awaitable that runs a batch of push RPCs, list of (payload, reply_callback), on transport
+        """
+        return ReactorRPC(transport, True, rpcs, exiting)
+
+    def run_until_complete(self, coros):
+        """
+        Run the coroutines until all have returned
+        An exception raised by a coroutine (including from a reply callback) is raised once the others are done
+        """
+        error = None
+        n_running = 0
+        for c in coros:
+            self.ready.append((c, None))
+            n_running = n_running + 1
+        self.status['cycles'] += 1
+        set_running_reactor(self)
+        try:
+            while n_running:
+                while self.ready:
+                    task, exc = self.ready.popleft()
+                    try:
+                        rpc = task.throw(exc) if exc is not None else task.send(None)
+                    except StopIteration:
+                        n_running = n_running - 1
+                        continue
+                    except Exception as e:
+                        n_running = n_running - 1
+                        error = error or e
+                        continue
+                    if not isinstance(rpc, ReactorRPC):
+                        task.close()
+                        raise TransportError('TransportReactor can only run coroutines awaiting Transport RPCs')
+                    rpc.task = task
+                    self.start(rpc)
+                if n_running:
+                    self.poll()
+        finally:
+            set_running_reactor(None)
+            for rpc in list(self.active.values()):
+                self.fail(rpc, TransportError('Reactor stopped'), retry=False)
+            for rpc in self.waiting:
+                rpc.task.close()
+            self.waiting.clear()
+            self.ready.clear()
+        if error is not None:
+            raise error
+
+    def start(self, rpc):
+        self.status['rpcs'] += 1
+        t = rpc.transport
+        h = rpc.handler
+        if t.version != RPC_TRANSPORT_VERSION_1 or h.fd is None or rpc.exiting or not h.ser:
+            self.status['fallbacks'] += 1
+            try:
+                if rpc.push:
+                    t.do_push_rpc_batch_locked(rpc.rpcs, exiting=rpc.exiting)
+                else:
+                    t.do_rpc_locked(False, rpc.rpcs[0][0], rpc.rpcs[0][1], exiting=rpc.exiting, retries=rpc.retries)
+                self.ready.append((rpc.task, None))
+            except Exception as e:
+                self.ready.append((rpc.task, e))
+            return
+        if not t.lock.acquire(blocking=False):
+            self.status['lock_waits'] += 1
+            self.waiting.append(rpc)
+            return
+        self.begin(rpc)
+
+    def begin(self, rpc):
+        """
+        Send the first frame(s) of an RPC whose port lock is held
+        """
+        h = rpc.handler
+        rpc.t_start = time.perf_counter()
+        rpc.frames_start = h.status['frames']
+        h.begin_transaction(rpc.push)
+        rpc.deadline = rpc.t_start + h.rx_timeout
+        self.active[h.fd] = rpc
+        self.selector.register(h.fd, selectors.EVENT_READ, rpc)
+        try:
+            rpc.start()
+        except (TransportError, serial.SerialException, OSError) as e:
+            self.fail(rpc, e)
+
+    def poll(self):
+        now = time.perf_counter()
+        timeout = None
+        if self.active:
+            timeout = max(0.0, min([r.deadline for r in self.active.values()]) - now)
+        if self.waiting:
+            timeout = self.poll_period if timeout is None else min(timeout, self.poll_period)
+        for key, mask in self.selector.select(timeout):
+            rpc = key.data
+            h = rpc.handler
+            try:
+                h.read_fd()
+                if rpc.resync_end:  # Drop the late replies of the failed attempt
+                    h.rx_head = h.rx_tail = 0
+                    rpc.deadline = min(rpc.resync_end, time.perf_counter() + h.rtt.quiet())
+                    continue
+                while True:
+                    r = h.take_frame()
+                    if r is None:
+                        rpc.deadline = time.perf_counter() + h.rx_timeout
+                        break
+                    h.on_frame_received()
+                    if rpc.on_frame(r[0], r[1], h.decode_view):
+                        self.finish(rpc, None)
+                        break
+            except (TransportError, serial.SerialException, OSError) as e:
+                self.fail(rpc, e)
+            except Exception as e:  # Reply callback, raise it in the coroutine that awaits the RPC
+                self.finish(rpc, e)
+        now = time.perf_counter()
+        for rpc in [r for r in self.active.values() if r.deadline < now]:
+            if rpc.resync_end:
+                self.retry(rpc)
+            else:
+                self.status['timeouts'] += 1
+                rpc.handler.on_frame_timeout()
+                self.fail(rpc, TransportError('Timeout'))
+        for i in range(len(self.waiting)):
+            rpc = self.waiting.popleft()
+            if rpc.transport.lock.acquire(blocking=False):
+                self.begin(rpc)
+            else:
+                self.waiting.append(rpc)
+
+    def release(self, rpc):
+        h = rpc.handler
+        if self.active.get(h.fd) is rpc:
+            self.selector.unregister(h.fd)
+            del self.active[h.fd]
+            rpc.transport.lock.release()
+            return True
+        return False
+
+    def finish(self, rpc, exc):
+        if rpc.attempt and exc is None:
+            rpc.handler.status['recovered'] += 1
+        if self.release(rpc):
+            if not rpc.push and exc is None:
+                rpc.transport.mark_reply(rpc.rpcs[0][0], rpc.t_start)
+            rpc.transport.record_rpc(rpc.handler, [p for p, cb in rpc.rpcs], rpc.t_submit, rpc.t_start, rpc.frames_start)
+            self.ready.append((rpc.task, exc))
+
+    def fail(self, rpc, e, retry=True):
+        """
+        Handle a transport error as the sync path does: count it, flush the port, and either retry a pull
+        (once the port has gone quiet) or let the coroutine continue
+        """
+        h = rpc.handler
+        self.status['errors'] += 1
+        h.status['read_error'] += 1
+        h.logger.error("TransportError: %s : %s" % (h.port_name, str(e)))
+        try:
+            h.ser.reset_output_buffer()
+            h.reset_input_buffer()
+        except (serial.SerialException, OSError, AttributeError):
+            h.ser = None
+        max_retries = h.max_retries if rpc.retries is None else rpc.retries
+        if retry and not rpc.push and rpc.attempt < max_retries and h.ser and self.active.get(h.fd) is rpc:
+            rpc.attempt = rpc.attempt + 1
+            h.on_retry()
+            now = time.perf_counter()
+            rpc.resync_end = now + h.timeout
+            rpc.deadline = min(rpc.resync_end, now + h.rtt.quiet())
+            return
+        if self.release(rpc):
+            self.ready.append((rpc.task, None))
+
+    def retry(self, rpc):
+        h = rpc.handler
+        rpc.resync_end = 0.0
+        h.reset_input_buffer()
+        rpc.deadline = time.perf_counter() + h.rx_timeout
+        try:
+            rpc.send_first()
+        except (TransportError, serial.SerialException, OSError) as e:
+            self.fail(rpc, e)
+
+    def close(self):
+        self.selector.close()
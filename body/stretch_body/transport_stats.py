@@ -0,0 +1,149 @@
+from __future__ import print_function
+import bisect
+import threading
+
+"""
+Low overhead instrumentation of Transport RPCs
+
+Each RPC round trip time is added to a fixed-bucket histogram (per port, and per RPC id).
+Time spent waiting for the port lock is kept in its own histogram.
+Recording an RPC is a bisect over the bucket edges and a few integer updates: no allocation, no sorting.
+Percentiles are estimated from the buckets, to within the bucket resolution (~19%).
+"""
+
+def _make_bucket_edges(t_min=1e-5, t_max=10.0, per_octave=4):
+    edges = []
+    t = t_min
+    while t < t_max:
+        edges.append(t)
+        t = t * 2.0 ** (1.0 / per_octave)
+    edges.append(t_max)
+    return tuple(edges)
+
+BUCKET_EDGES = _make_bucket_edges()  # Upper edge (s) of each bucket. A final bucket catches anything slower.
+
+
+class LatencyHistogram():
+    """
+    Fixed-bucket histogram of durations (s)
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, dt):
+        self.counts[bisect.bisect_left(BUCKET_EDGES, dt)] += 1
+        self.n += 1
+        self.total += dt
+        if dt > self.max:
+            self.max = dt
+
+    def reset(self):
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def percentile(self, p):
+        """
+        Return the upper edge of the bucket holding the p-th (0-100) percentile, capped at the max seen
+        """
+        if self.n == 0:
+            return 0.0
+        target = p / 100.0 * self.n
+        cnt = 0
+        for i in range(len(self.counts)):
+            cnt += self.counts[i]
+            if cnt >= target and cnt > 0:
+                edge = BUCKET_EDGES[i] if i < len(BUCKET_EDGES) else self.max
+                return min(edge, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {'n': self.n,
+                'mean': self.total / self.n if self.n else 0.0,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'max': self.max}
+
+
+class TransportStats():
+    """
+    RPC instrumentation for one Transport (port)
+
+    rpc: histogram of round trip time for all RPCs on the port
+    rpc_id: histogram of round trip time per RPC id (first byte of the payload)
+    lock_wait: histogram of the time spent waiting for the port lock
+    frames: frames sent + received, per RPC id
+    retries: failed pull RPCs that were retried
+    cache: pulls skipped (hits) or not (misses) because a recent reply was already in, see Transport.reply_is_fresh
+    suppressed: command RPCs not sent as unchanged since the last one acknowledged (eg Stepper.push_command)
+    """
+    def __init__(self, port_name):
+        self.port_name = port_name
+        self.lock = threading.Lock()
+        self.rpc = LatencyHistogram()
+        self.lock_wait = LatencyHistogram()
+        self.rpc_id = {}
+        self.frames = {}
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.suppressed = 0
+
+    def record(self, rpc_id, dt, lock_wait, frames):
+        with self.lock:
+            self.rpc.record(dt)
+            self.lock_wait.record(lock_wait)
+            h = self.rpc_id.get(rpc_id)
+            if h is None:
+                h = self.rpc_id[rpc_id] = LatencyHistogram()
+                self.frames[rpc_id] = 0
+            h.record(dt)
+            self.frames[rpc_id] += frames
+
+    def record_cache(self, hit):
+        with self.lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def record_suppressed(self):
+        with self.lock:
+            self.suppressed += 1
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def reset(self):
+        with self.lock:
+            self.rpc.reset()
+            self.lock_wait.reset()
+            self.rpc_id = {}
+            self.frames = {}
+            self.retries = 0
+            self.cache_hits = 0
+            self.cache_misses = 0
+            self.suppressed = 0
+
+    def snapshot(self):
+        """
+        Return a dict (plain values only) of the current stats, safe to use from another thread
+        """
+        with self.lock:
+            s = {'port': self.port_name,
+                 'rpc': self.rpc.snapshot(),
+                 'lock_wait': self.lock_wait.snapshot(),
+                 'retries': self.retries,
+                 'cache': {'hits': self.cache_hits, 'misses': self.cache_misses},
+                 'suppressed': self.suppressed,
+                 'rpc_id': {}}
+            for rpc_id, h in self.rpc_id.items():
+                s['rpc_id'][rpc_id] = h.snapshot()
+                s['rpc_id'][rpc_id]['frames_per_rpc'] = self.frames[rpc_id] / h.n if h.n else 0.0
+            return s
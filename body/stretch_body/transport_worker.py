@@ -0,0 +1,115 @@
+from __future__ import print_function
+import concurrent.futures
+import itertools
+import queue
+import threading
+import time
+from stretch_body.transport_stats import LatencyHistogram
+
+"""
+Per-port I/O worker for a Transport
+
+In worker mode (see Transport.start_worker) a single thread owns the port. Callers submit RPCs to its
+priority queue and get a concurrent.futures.Future back; the sync Transport calls submit and wait on it.
+Queued RPCs run in priority order (commands, then status, then traces) and in submission order within a priority,
+so a status pull or a long trace read can no longer hold a command off the port for more than the RPC in flight.
+
+Queue depth and the time each RPC waited in the queue (per priority) are kept in status / get_stats().
+"""
+
+RPC_PRIORITY_COMMAND = 0
+RPC_PRIORITY_STATUS = 1
+RPC_PRIORITY_TRACE = 2
+RPC_PRIORITY_NAMES = {RPC_PRIORITY_COMMAND: 'command', RPC_PRIORITY_STATUS: 'status', RPC_PRIORITY_TRACE: 'trace'}
+
+_RPC_PRIORITY_STOP = 3  # Queued after all pending RPCs
+
+
+class TransportWorker():
+    """
+    Runs all RPCs of one Transport on a dedicated thread
+    """
+    def __init__(self, transport):
+        self.transport = transport
+        self.queue = queue.PriorityQueue()
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        self.wait = {p: LatencyHistogram() for p in RPC_PRIORITY_NAMES}
+        self.status = {'queue_depth': 0, 'max_queue_depth': 0, 'submitted': 0, 'completed': 0, 'errors': 0}
+        self.thread = threading.Thread(target=self._run, name='TransportWorker_%s' % transport.port_name, daemon=True)
+        self.thread.start()
+
+    def in_worker(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, push, payload, reply_callback, priority, exiting=False, retries=None):
+        """
+        Queue a single RPC, return a Future of its completion (result None)
+        The payload is copied, so the caller may reuse its buffer once submit returns.
+        reply_callback is called from the worker thread. retries: of a failed pull, see Transport.do_pull_rpc_sync
+        """
+        return self._put(priority, (push, bytearray(payload), reply_callback, exiting, None, retries))
+
+    def submit_batch(self, rpcs, priority=RPC_PRIORITY_COMMAND, exiting=False):
+        """
+        Queue a batch of push RPCs (see Transport.do_push_rpc_batch_sync), return a Future of its completion
+        """
+        return self._put(priority, ([(bytearray(p), cb) for p, cb in rpcs], exiting))
+
+    def _put(self, priority, request):
+        fut = concurrent.futures.Future()
+        with self.lock:
+            self.status['submitted'] += 1
+            self.status['queue_depth'] += 1
+            if self.status['queue_depth'] > self.status['max_queue_depth']:
+                self.status['max_queue_depth'] = self.status['queue_depth']
+        self.queue.put((priority, next(self.seq), time.perf_counter(), request, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            priority, seq, t_submit, request, fut = self.queue.get()
+            if request is None:
+                break
+            t_start = time.perf_counter()
+            with self.lock:
+                self.status['queue_depth'] -= 1
+                self.wait[priority].record(t_start - t_submit)
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                if len(request) == 2:
+                    self.transport.do_push_rpc_batch_locked(request[0], exiting=request[1])
+                else:
+                    self.transport.do_rpc_locked(*request)
+                fut.set_result(None)
+                with self.lock:
+                    self.status['completed'] += 1
+            except BaseException as e:
+                with self.lock:
+                    self.status['errors'] += 1
+                fut.set_exception(e)
+
+    def stop(self):
+        """
+        Finish the queued RPCs and stop the thread
+        """
+        if self.thread.is_alive():
+            self.queue.put((_RPC_PRIORITY_STOP, next(self.seq), 0.0, None, None))
+            if not self.in_worker():
+                self.thread.join()
+
+    def get_stats(self):
+        """
+        Return a snapshot (dict) of the queue counters and the queue wait time histogram of each priority
+        """
+        with self.lock:
+            s = self.status.copy()
+            s['wait'] = {RPC_PRIORITY_NAMES[p]: h.snapshot() for p, h in self.wait.items()}
+        return s
+
+    def reset_stats(self):
+        with self.lock:
+            for h in self.wait.values():
+                h.reset()
+            self.status['max_queue_depth'] = self.status['queue_depth']
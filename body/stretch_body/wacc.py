@@ -1,6 +1,8 @@
 from __future__ import print_function
 from stretch_body.transport import *
 from stretch_body.device import Device, DeviceTimestamp
+from stretch_body.rpc_schema import *
+from stretch_body.trace_reader import FirmwareTraceReader
 import threading
 import textwrap
 import array as arr
@@ -41,6 +43,7 @@ class WaccBase(Device):
     TRIGGER_DISABLE_TRACE = 4
 
     STATE_IS_TRACE_ON = 1
+    STATE_FLAGS_P2 = StatusFlags([('trace_on', STATE_IS_TRACE_ON)])
     TRACE_TYPE_STATUS = 0
     TRACE_TYPE_DEBUG = 1
     TRACE_TYPE_PRINT = 2
@@ -72,9 +75,13 @@ class WaccBase(Device):
             self.hw_valid = self.transport.startup()
             if self.hw_valid:
                 # Pull board info
+                self.transport.configure_timeouts(self.robot_params['robot']['use_adaptive_rpc_timeout'],
+                                                  self.robot_params['robot']['rpc_max_retries'])
                 payload=arr.array('B',[self.RPC_GET_WACC_BOARD_INFO])
                 self.transport.do_pull_rpc_sync(payload,self.rpc_board_info_reply)
                 self.transport.configure_version(self.board_info['firmware_version'])
+                if self.robot_params['robot']['use_transport_worker']:
+                    self.transport.start_worker()
                 return True
             return False
         except KeyError:
@@ -108,12 +115,12 @@ class WaccBase(Device):
         self._command['d3']=bool(on)
         self._dirty_command = True
 
-    def pull_status(self,exiting=False):
+    def pull_status(self,exiting=False,max_age=None):
         if not self.hw_valid:
             return
         # Queue Status RPC
         payload = arr.array('B',[self.RPC_GET_WACC_STATUS])
-        self.transport.do_pull_rpc_sync(payload, self.rpc_status_reply,exiting=exiting )
+        self.transport.do_pull_rpc_sync(payload, self.rpc_status_reply,exiting=exiting,max_age=max_age)
 
     async def pull_status_async(self,exiting=False):
         if not self.hw_valid:
@@ -124,36 +131,46 @@ class WaccBase(Device):
     async def push_command_async(self,exiting=False):
         if not self.hw_valid:
             return
-        payload = self.transport.get_empty_payload()
+        payload = self.transport.get_empty_payload(reuse=False)  # Not shared with other coroutines
+        rpcs = []  # Each RPC is packed into its own slice of the payload, then sent as one batch
+        sidx = 0
         if self._dirty_config:
-            payload[0] = self.RPC_SET_WACC_CONFIG
-            sidx = self.pack_config(payload, 1)
-            await self.transport.do_push_rpc_async(payload[:sidx], self.rpc_config_reply,exiting=exiting)
+            payload[sidx] = self.RPC_SET_WACC_CONFIG
+            rpc_start = sidx
+            sidx = self.pack_config(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_config_reply))
             self._dirty_config=False
 
         if self._dirty_command:
-            payload[0] = self.RPC_SET_WACC_COMMAND
-            sidx = self.pack_command( payload, 1)
-            await self.transport.do_push_rpc_async(payload[:sidx], self.rpc_command_reply,exiting=exiting)
+            payload[sidx] = self.RPC_SET_WACC_COMMAND
+            rpc_start = sidx
+            sidx = self.pack_command(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_command_reply))
             self._command['trigger'] =0
             self._dirty_command=False
+        await self.transport.do_push_rpc_batch_async(rpcs, exiting=exiting)
 
     def push_command(self,exiting=False):
         if not self.hw_valid:
             return
         payload = self.transport.get_empty_payload()
+        rpcs = []  # Each RPC is packed into its own slice of the payload, then sent as one batch
+        sidx = 0
         if self._dirty_config:
-            payload[0] = self.RPC_SET_WACC_CONFIG
-            sidx = self.pack_config(payload, 1)
-            self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_config_reply,exiting=exiting)
+            payload[sidx] = self.RPC_SET_WACC_CONFIG
+            rpc_start = sidx
+            sidx = self.pack_config(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_config_reply))
             self._dirty_config=False
 
         if self._dirty_command:
-            payload[0] = self.RPC_SET_WACC_COMMAND
-            sidx = self.pack_command( payload, 1)
-            self.transport.do_push_rpc_sync(payload[:sidx], self.rpc_command_reply,exiting=exiting)
+            payload[sidx] = self.RPC_SET_WACC_COMMAND
+            rpc_start = sidx
+            sidx = self.pack_command(payload, sidx + 1)
+            rpcs.append((payload[rpc_start:sidx], self.rpc_command_reply))
             self._command['trigger'] =0
             self._dirty_command=False
+        self.transport.do_push_rpc_batch_sync(rpcs, exiting=exiting)
 
     def pretty_print(self):
         print('------------------------------')
@@ -196,13 +213,7 @@ class WaccBase(Device):
     def pack_command(self,s,sidx):
         if self.ext_command_cb is not None:  # Pack custom data first
             sidx += self.ext_command_cb(s, sidx)
-        pack_uint8_t(s, sidx, self._command['d2'])
-        sidx += 1
-        pack_uint8_t(s, sidx, self._command['d3'])
-        sidx += 1
-        pack_uint32_t(s, sidx, self._command['trigger'])
-        sidx += 4
-        return sidx
+        return WACC_COMMAND.pack_into(s, sidx, self._command)
 
     def pack_config(self,s,sidx):
         pack_uint8_t(s, sidx, self.config['accel_range_g'])
@@ -227,6 +238,10 @@ class WaccBase(Device):
         raise NotImplementedError('This method not supported for firmware on protocol {0}.'
                                   .format(self.board_info['protocol_version']))
 
+    def read_firmware_trace_arrays(self, out=None):
+        raise NotImplementedError('This method not supported for firmware on protocol {0}.'
+                                  .format(self.board_info['protocol_version']))
+
     def rpc_read_firmware_trace_reply(self, reply):
         raise NotImplementedError('This method not supported for firmware on protocol {0}.'
                                   .format(self.board_info['protocol_version']))
@@ -285,20 +300,8 @@ class Wacc_Protocol_P0(WaccBase):
         sidx=0
         if self.ext_status_cb is not None:
             sidx+=self.ext_status_cb(s[sidx:])
-        unpack_to['ax'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['ay'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['az'] = unpack_float_t(s[sidx:]);sidx+=4
-
-        unpack_to['a0'] = unpack_int16_t(s[sidx:]);sidx+=2
-        unpack_to['d0'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d1'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d2'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d3'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['single_tap_count'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        unpack_to['state'] = unpack_uint32_t(s[sidx:]); sidx += 4
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint32_t(s[sidx:]));sidx += 4
-        unpack_to['debug'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        return sidx
+        WACC_STATUS_P0.unpack_into(s,sidx,unpack_to,self)
+        return sidx+WACC_STATUS_P0.size
 
 # ######################## Wacc PROTOCOL P1 #################################
 class Wacc_Protocol_P1(WaccBase):
@@ -308,42 +311,28 @@ class Wacc_Protocol_P1(WaccBase):
         sidx=0
         if self.ext_status_cb is not None:
             sidx+=self.ext_status_cb(s[sidx:])
-        unpack_to['ax'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['ay'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['az'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['a0'] = unpack_int16_t(s[sidx:]);sidx+=2
-        unpack_to['d0'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d1'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d2'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d3'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['single_tap_count'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        unpack_to['state'] = unpack_uint32_t(s[sidx:]); sidx += 4
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint64_t(s[sidx:]));sidx += 8
-        unpack_to['debug'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        return sidx
+        WACC_STATUS_P1.unpack_into(s,sidx,unpack_to,self)
+        return sidx+WACC_STATUS_P1.size
 
 # ######################## Wacc PROTOCOL P1 #################################
 class Wacc_Protocol_P2(WaccBase):
+    trace_status_schema = WACC_STATUS_P2
+
+    def read_firmware_trace_arrays(self, out=None):
+        """
+        Trace of the Wacc as NumPy arrays, see FirmwareTraceReader
+        """
+        return FirmwareTraceReader(self.transport, self.RPC_READ_TRACE, self.trace_status_schema).read(out=out)
+
     def unpack_status(self,s,unpack_to=None):
         if unpack_to is None:
             unpack_to=self.status
         sidx=0
         if self.ext_status_cb is not None:
             sidx+=self.ext_status_cb(s[sidx:])
-        unpack_to['ax'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['ay'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['az'] = unpack_float_t(s[sidx:]);sidx+=4
-        unpack_to['a0'] = unpack_int16_t(s[sidx:]);sidx+=2
-        unpack_to['d0'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d1'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d2'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['d3'] = unpack_uint8_t(s[sidx:]); sidx += 1
-        unpack_to['single_tap_count'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        unpack_to['state'] = unpack_uint32_t(s[sidx:]); sidx += 4
-        unpack_to['trace_on'] = unpack_to['state'] & self.STATE_IS_TRACE_ON > 0
-        unpack_to['timestamp'] = self.timestamp.set(unpack_uint64_t(s[sidx:]));sidx += 8
-        unpack_to['debug'] = unpack_uint32_t(s[sidx:]);sidx += 4
-        return sidx
+        WACC_STATUS_P2.unpack_into(s,sidx,unpack_to,self)
+        self.STATE_FLAGS_P2.expand(unpack_to['state'],unpack_to)
+        return sidx+WACC_STATUS_P2.size
 
     def read_firmware_trace(self):
         self.trace_buf = []
@@ -352,7 +341,8 @@ class Wacc_Protocol_P2(WaccBase):
         ts=time.time()
         payload = arr.array('B',[self.RPC_READ_TRACE])
         while ( self.n_trace_read) and time.time()-ts<60.0:
-            self.transport.do_pull_rpc(payload, self.rpc_read_firmware_trace_reply)
+            self.transport.do_pull_rpc_sync(payload, self.rpc_read_firmware_trace_reply, priority=RPC_PRIORITY_TRACE,
+                                            retries=0)
             time.sleep(.001)
         return self.trace_buf
 
@@ -413,7 +403,7 @@ class Wacc_Protocol_P3(WaccBase):
         if not self.hw_valid:
             return
         payload = arr.array('B',[self.RPC_LOAD_TEST_PULL])
-        self.transport.do_pull_rpc_sync(payload, self.rpc_load_test_pull_reply)
+        self.transport.do_pull_rpc_sync(payload, self.rpc_load_test_pull_reply, retries=0)
 
 
     def rpc_load_test_push_reply(self, reply):
@@ -426,7 +416,7 @@ class Wacc_Protocol_P3(WaccBase):
             for i in range(1024):
                 if d[i] != self.load_test_payload[(i + 1) % 1024]:
                     print('Load test pull bad data', d[i], self.load_test_payload[(i + 1) % 1024])
-            self.load_test_payload = d
+            self.load_test_payload = bytearray(d)  # Reply is a view of a reused transport buffer
             print('Successful load test pull')
         else:
             print('Error RPC_REPLY_LOAD_TEST_PULL', reply[0])
@@ -435,21 +425,22 @@ class Wacc(WaccBase):
     """
     API to the Stretch Wrist Accelerometer (Wacc) Board
     """
+    #Order in descending order so more recent protocols/methods override less recent
+    supported_protocols = {'p0': (Wacc_Protocol_P0,), 'p1': (Wacc_Protocol_P1, Wacc_Protocol_P0),'p2': (Wacc_Protocol_P2, Wacc_Protocol_P1, Wacc_Protocol_P0,),
+                           'p3': (Wacc_Protocol_P3, Wacc_Protocol_P2, Wacc_Protocol_P1, Wacc_Protocol_P0,),}
+
     def __init__(self, usb=None, ext_status_cb=None, ext_command_cb=None):
         WaccBase.__init__(self, usb=usb, ext_status_cb=ext_status_cb, ext_command_cb=ext_command_cb)
-        #Order in descending order so more recent protocols/methods override less recent
-        self.supported_protocols = {'p0': (Wacc_Protocol_P0,), 'p1': (Wacc_Protocol_P1, Wacc_Protocol_P0),'p2': (Wacc_Protocol_P2, Wacc_Protocol_P1, Wacc_Protocol_P0,),
-                                    'p3': (Wacc_Protocol_P3, Wacc_Protocol_P2, Wacc_Protocol_P1, Wacc_Protocol_P0,),}
 
     def startup(self, threaded=False):
         """
         First determine which protocol version the uC firmware is running.
-        Based on that version, replaces PimuBase class inheritance with a inheritance to a child class of PimuBase that supports that protocol
+        Based on that version, switches to the Wacc class inheriting from the child classes of WaccBase that support that protocol (see Device.set_protocol_class)
         """
         WaccBase.startup(self, threaded=threaded)
         if self.hw_valid:
             if self.board_info['protocol_version'] in self.supported_protocols:
-                Wacc.__bases__ = self.supported_protocols[self.board_info['protocol_version']]
+                self.set_protocol_class(self.supported_protocols[self.board_info['protocol_version']])
             else:
                 if self.board_info['protocol_version'] is None:
                     protocol_msg = """
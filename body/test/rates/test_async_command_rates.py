@@ -0,0 +1,74 @@
+# Logging level must be set before importing any stretch_body class
+import stretch_body.robot_params
+
+import unittest
+import asyncio
+import threading
+import time
+import stretch_body.stepper
+import stretch_body.transport as transport
+from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator
+
+
+class TestAsyncCommandRates(unittest.TestCase):
+    """
+    An asyncio controller pushing stepper commands for 0.5s, with a 1kHz ticker task on its loop:
+    handing push_command_async to another loop's thread and blocking on .result() (as Robot.push_command
+    does with use_asyncio) vs awaiting it on the controller's own loop (as Robot.push_command_async does).
+    Reports the commands/s and how many ticks the controller's loop still ran.
+    """
+    def test_push_command(self):
+        emu = PtyDeviceEmulator(StepperEmulator())
+        emu.start()
+        s = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+        s.transport = transport.Transport(emu.port)
+        robot_loop = asyncio.new_event_loop()
+        robot_thread = threading.Thread(target=robot_loop.run_forever, daemon=True)
+        robot_thread.start()
+        results = {}
+        try:
+            self.assertTrue(s.transport.startup())
+            s.transport.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            s.board_info['protocol_version'] = 'p5'
+            s.set_protocol_class(s.supported_protocols['p5'])
+            s.hw_valid = True
+
+            def push_hop():
+                asyncio.run_coroutine_threadsafe(s.push_command_async(), robot_loop).result()
+
+            async def push_await():
+                await s.push_command_async()
+
+            async def controller(name):
+                ticks = [0]
+
+                async def ticker():
+                    while True:
+                        await asyncio.sleep(0.001)
+                        ticks[0] += 1
+
+                t = asyncio.ensure_future(ticker())
+                n = 0
+                ts = time.time()
+                while time.time() - ts < 0.5:
+                    s.set_command(x_des=0.001 * (n % 100))
+                    if name == 'hop':
+                        push_hop()
+                    else:
+                        await push_await()
+                    n += 1
+                    await asyncio.sleep(0)
+                t.cancel()
+                return n / (time.time() - ts), ticks[0]
+
+            for name in ('hop', 'await'):
+                results[name] = asyncio.run(controller(name))
+        finally:
+            robot_loop.call_soon_threadsafe(robot_loop.stop)
+            robot_thread.join()
+            s.transport.stop()
+            emu.stop()
+        print('--------- Stepper push_command from an asyncio controller, 0.5s -----------')
+        for name, (rate, ticks) in results.items():
+            print('%s: %.0f commands/s, %d of ~500 ticks ran' % (name, rate, ticks))
+        self.assertGreater(results['await'][1], results['hop'][1])
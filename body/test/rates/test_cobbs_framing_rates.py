@@ -0,0 +1,116 @@
+import unittest
+import timeit
+import random
+import array as arr
+import stretch_body.cobbs_framing as cobbs_framing
+
+
+class ReferenceCobbsFraming():
+    """
+    Byte at a time framing with a bit by bit CRC, as used prior to the table driven CobbsFraming.
+    Kept here as the baseline for the micro-benchmark.
+    """
+    def encode_data(self, data):
+        crc = self._calc_crc(data, len(data))
+        data.append((crc >> 8) & 0xFF)
+        data.append(crc & 0xFF)
+        encoded_data = self._encode(data)
+        encoded_data.append(0x00)
+        return encoded_data
+
+    def decode_data(self, data):
+        crc1, nr, decode_buffer = self._decode(data)
+        crc2 = self._calc_crc(decode_buffer, nr)
+        return crc1 == crc2, nr, decode_buffer
+
+    def _calc_crc(self, buf, nr):
+        crc = 0xFFFF
+        for i in range(nr):
+            crc ^= buf[i]
+            for i in range(8):
+                if ((crc & 1) != 0):
+                    crc >>= 1
+                    crc ^= 0xA001
+                else:
+                    crc >>= 1
+        return crc
+
+    def _encode(self, data):
+        nb = len(data)
+        read_index = 0
+        write_index = 1
+        code_index = 0
+        code = 1
+        encode_buffer = arr.array('B', [0] * 2 * nb)
+        while (read_index < nb):
+            if (data[read_index] == 0):
+                encode_buffer[code_index] = code
+                code = 1
+                code_index = write_index
+                write_index = write_index + 1
+                read_index = read_index + 1
+            else:
+                encode_buffer[write_index] = data[read_index]
+                read_index = read_index + 1
+                write_index = write_index + 1
+                code = code + 1
+                if (code == 0xFF):
+                    encode_buffer[code_index] = code
+                    code = 1
+                    code_index = write_index
+                    write_index = write_index + 1
+        encode_buffer[code_index] = code
+        return encode_buffer[:write_index]
+
+    def _decode(self, data):
+        nb = len(data)
+        read_index = 0
+        write_index = 0
+        decode_buffer = arr.array('B', [0] * 2 * nb)
+        while read_index < nb:
+            code = data[read_index]
+            read_index = read_index + 1
+            for i in range(1, code):
+                decode_buffer[write_index] = data[read_index]
+                read_index = read_index + 1
+                write_index = write_index + 1
+            if (code != 0xFF and read_index != nb):
+                decode_buffer[write_index] = 0
+                write_index = write_index + 1
+        crc = (decode_buffer[write_index - 2] << 8) | decode_buffer[write_index - 1]
+        return crc, write_index - 2, decode_buffer[:write_index - 2]
+
+
+class TestCobbsFramingRates(unittest.TestCase):
+    """
+    Micro-benchmark of the framing engine on a full V1 frame (63 bytes) and a full RPC (1024 bytes)
+    """
+    def _payload(self, n):
+        random.seed(n)
+        # Mix of zero runs and non-zero data, similar to packed floats
+        return arr.array('B', [0 if random.random() < 0.2 else random.randint(1, 255) for _ in range(n)])
+
+    def _run(self, n, itr):
+        ref = ReferenceCobbsFraming()
+        new = cobbs_framing.CobbsFraming()
+        data = self._payload(n)
+        encoded = new.encode_data(data)
+        self.assertEqual(bytes(encoded), bytes(ref.encode_data(arr.array('B', data))))
+        frame = encoded[:-1]
+        frame_list = list(frame)
+
+        t_ref_enc = timeit.timeit(lambda: ref.encode_data(arr.array('B', data)), number=itr) / itr
+        t_new_enc = timeit.timeit(lambda: new.encode_data(data), number=itr) / itr
+        t_ref_dec = timeit.timeit(lambda: ref.decode_data(frame_list), number=itr) / itr
+        t_new_dec = timeit.timeit(lambda: new.decode_data(frame), number=itr) / itr
+        print('--------- CobbsFraming %d bytes -----------' % n)
+        print('Encode reference (us): %.2f  table/slice (us): %.2f  speedup: %.1fx' % (t_ref_enc * 1e6, t_new_enc * 1e6, t_ref_enc / t_new_enc))
+        print('Decode reference (us): %.2f  table/slice (us): %.2f  speedup: %.1fx' % (t_ref_dec * 1e6, t_new_dec * 1e6, t_ref_dec / t_new_dec))
+        self.assertLess(t_new_enc, t_ref_enc)
+        self.assertLess(t_new_dec, t_ref_dec)
+
+    def test_frame_63_bytes(self):
+        self._run(63, 2000)
+
+    def test_rpc_1024_bytes(self):
+        self._run(1024, 200)
@@ -0,0 +1,75 @@
+import unittest
+import time
+import asyncio
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.device_emulator import *
+
+
+class TestDeviceEmulatorRates(unittest.TestCase):
+    """
+    Hardware-free throughput of the non-Dynamixel status RPCs, against emulated boards served on pty pairs
+    """
+    def test_status_rate_v0_v1(self):
+        """
+        Stepper status pull rate with each Transport version
+        """
+        n = 300
+        sink = lambda r: None
+        rates = {}
+        for version in (transport.RPC_TRANSPORT_VERSION_0, transport.RPC_TRANSPORT_VERSION_1):
+            emu = PtyDeviceEmulator(StepperEmulator())
+            emu.start()
+            t = transport.Transport(emu.port)
+            try:
+                self.assertTrue(t.startup())
+                t.set_version(version)
+                payload = arr.array('B', [3])
+                t0 = time.perf_counter()
+                for i in range(n):
+                    t.do_pull_rpc_sync(payload, sink)
+                rates[version] = n / (time.perf_counter() - t0)
+                self.assertEqual(t.status['sync']['read_error'], 0)
+            finally:
+                t.stop()
+                emu.stop()
+        print('--------- Stepper status pull (RPC/s) -----------')
+        print('V0: %.0f  V1: %.0f' % (rates[0], rates[1]))
+        self.assertGreater(rates[1], rates[0])
+
+    def test_robot_status_cycle(self):
+        """
+        One status cycle of a robot's non-Dynamixel boards (4 steppers, pimu, wacc), gathered on one event loop
+        With a 1ms device turnaround, reports the achievable cycle rate
+        """
+        n_cycles = 100
+        devices = [StepperEmulator() for i in range(4)] + [PimuEmulator(), WaccEmulator()]
+        emus = [PtyDeviceEmulator(d, reply_delay=0.001) for d in devices]
+        ts = [transport.Transport(e.port) for e in emus]
+        payload = arr.array('B', [3])  # GET_STATUS on all three boards
+        sink = lambda r: None
+
+        async def run():
+            t0 = time.perf_counter()
+            for i in range(n_cycles):
+                await asyncio.gather(*[t.do_pull_rpc_async(payload, sink) for t in ts])
+            return (time.perf_counter() - t0) / n_cycles
+
+        try:
+            for e in emus:
+                e.start()
+            for t in ts:
+                self.assertTrue(t.startup())
+                t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            loop = asyncio.new_event_loop()
+            dt = loop.run_until_complete(run())
+            loop.close()
+            for t in ts:
+                self.assertEqual(t.status['async']['read_error'], 0)
+        finally:
+            for t in ts:
+                t.stop()
+            for e in emus:
+                e.stop()
+        print('--------- Status cycle, %d emulated boards -----------' % len(ts))
+        print('Cycle (ms): %.2f  rate (Hz): %.0f' % (dt * 1e3, 1 / dt))
@@ -0,0 +1,64 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+import yaml
+import numpy as np
+from stretch_body.encoder_calibration import *
+
+
+class TestEncoderCalibrationRates(unittest.TestCase):
+    """
+    Parsing and loading the 16384 float encoder calibration table
+    """
+    def setUp(self):
+        self.data = np.cumsum(np.random.default_rng(0).uniform(0.0, 0.00077, ENCODER_CALIBRATION_SIZE))
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_parse_menu_dump(self):
+        """
+        Menu dump parse: find(',') and slice per float vs a single np.fromstring pass
+        """
+        s = ', '.join(['%f' % x for x in self.data])
+        t0 = time.perf_counter()
+        e = s
+        legacy = []
+        while len(e):
+            ff = e.find(',')
+            if ff != -1:
+                legacy.append(float(e[:ff]))
+                e = e[ff + 2:]
+            else:
+                legacy.append(float(e))
+                e = []
+        dt_legacy = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        parsed = parse_menu_dump(s)
+        dt_parse = time.perf_counter() - t0
+        self.assertEqual(parsed.tolist(), legacy)
+        print('--------- Parse menu dump (ms) -----------')
+        print('find loop: %.2f  parse_menu_dump: %.2f' % (dt_legacy * 1e3, dt_parse * 1e3))
+        self.assertLess(dt_parse, dt_legacy)
+
+    def test_load(self):
+        """
+        Load from the fleet YAML (as read_fleet_yaml) vs the memory-mapped .npy
+        """
+        fn_yaml = os.path.join(self.dir, 'cal.yaml')
+        fn_npy = os.path.join(self.dir, 'cal.npy')
+        with open(fn_yaml, 'w') as f:
+            yaml.dump(self.data.tolist(), f, default_flow_style=False)
+        save_calibration(fn_npy, self.data)
+        t0 = time.perf_counter()
+        with open(fn_yaml, 'r') as f:
+            d = yaml.load(f, Loader=yaml.FullLoader)
+        dt_yaml = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        t = load_calibration(fn_npy)
+        dt_npy = time.perf_counter() - t0
+        self.assertTrue(np.array_equal(t, np.array(d, dtype=np.float32)))
+        print('--------- Load encoder calibration (ms) -----------')
+        print('YAML: %.2f  npy mmap: %.3f' % (dt_yaml * 1e3, dt_npy * 1e3))
+        self.assertLess(dt_npy, dt_yaml)
@@ -0,0 +1,133 @@
+# Logging level must be set before importing any stretch_body class
+import stretch_body.robot_params
+
+import unittest
+import asyncio
+import logging
+import threading
+import time
+import stretch_body.stepper
+import stretch_body.transport as transport
+from stretch_body.robot import NonDXLStatusThread
+from stretch_body.transport_stats import LatencyHistogram
+from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator
+
+
+class EmulatedRobot():
+    """
+    The parts of Robot used by NonDXLStatusThread, with a Stepper on an emulated board (1ms turnaround) for each of
+    the five non-DXL boards, and the Robot's event loop running on its own thread
+    """
+    def __init__(self):
+        self.logger = logging.getLogger('EmulatedRobot')
+        self.params = {'use_asyncio': 1}
+        self.transport_reactor = None
+        self.emulators = []
+        self.devices = {}
+        for b in NonDXLStatusThread.BOARDS:
+            emu = PtyDeviceEmulator(StepperEmulator(), reply_delay=0.001)
+            emu.start()
+            self.emulators.append(emu)
+            s = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+            s.transport = transport.Transport(emu.port)
+            s.transport.startup()
+            s.transport.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            s.board_info['protocol_version'] = 'p5'
+            s.set_protocol_class(s.supported_protocols['p5'])
+            s.hw_valid = True
+            self.devices[b] = s
+        self.async_event_loop = asyncio.new_event_loop()
+        self.event_loop_thread = threading.Thread(target=self.async_event_loop.run_forever, daemon=True)
+        self.event_loop_thread.start()
+
+    def _pull_status_non_dynamixel(self):
+        for b in NonDXLStatusThread.BOARDS:
+            self.devices[b].pull_status()
+
+    def _publish_status(self, *names):
+        pass
+
+    def push_command(self):
+        """
+        As Robot.push_command with use_asyncio: the pushes run on the Robot's event loop
+        """
+        async def push():
+            await asyncio.gather(*[self.devices[b].push_command_async() for b in ('lift', 'arm')])
+        asyncio.run_coroutine_threadsafe(push(), self.async_event_loop).result()
+
+    def stop(self):
+        self.async_event_loop.call_soon_threadsafe(self.async_event_loop.stop)
+        self.event_loop_thread.join()
+        for d in self.devices.values():
+            d.transport.stop()
+        for emu in self.emulators:
+            emu.stop()
+
+
+def legacy_step(t):
+    """
+    NonDXLStatusThread.step with use_asyncio prior to the long-lived status coroutine, kept here as the baseline
+    (with the board latencies recorded as the coroutine does)
+    """
+    asyncio.set_event_loop(t.loop)
+    t.stats.mark_loop_start()
+    t0 = time.perf_counter()
+    asyncio.get_event_loop().run_until_complete(asyncio.gather(*t.board_pulls()))
+    t.cycle_latency.record(time.perf_counter() - t0)
+    t.stats.mark_loop_end()
+
+
+class TestNonDXLStatusRates(unittest.TestCase):
+    """
+    The non-DXL status loop asked for 100Hz for 1s while a user thread pushes lift and arm commands at 50Hz:
+    status steps on their own thread (each cycle run to completion on a per-thread loop) vs the long-lived status
+    coroutine on the Robot's event loop, which the pushes share.
+    Reports the status cycles/s, per-board status latency and the push_command latency
+    """
+    def test_status_and_push(self):
+        rate_hz = 100.0
+        dt = 1.0
+        results = {}
+        r = EmulatedRobot()
+        try:
+            for name in ('thread steps', 'status coroutine'):
+                t = NonDXLStatusThread(r, target_rate_hz=rate_hz)
+                shutdown = threading.Event()
+                push_latency = LatencyHistogram()
+
+                def steps():
+                    ts = time.monotonic()
+                    while not shutdown.is_set():
+                        legacy_step(t)
+                        t.status['cycles'] += 1
+                        ts += 1.0 / rate_hz
+                        shutdown.wait(max(0.0, ts - time.monotonic()))
+
+                if name == 'thread steps':
+                    status_thread = threading.Thread(target=steps)
+                    status_thread.start()
+                else:
+                    t.start_async(r.async_event_loop)
+                ts = time.time()
+                while time.time() - ts < dt:
+                    for b in ('lift', 'arm'):
+                        r.devices[b].set_command(x_des=0.001)
+                    t0 = time.perf_counter()
+                    r.push_command()
+                    push_latency.record(time.perf_counter() - t0)
+                    time.sleep(0.02)
+                if name == 'thread steps':
+                    shutdown.set()
+                    status_thread.join()
+                else:
+                    t.stop()
+                results[name] = (t.status['cycles'] / dt, push_latency.snapshot(), t.get_latency())
+        finally:
+            r.stop()
+        print('--------- Non-DXL status at %.0fHz with 50Hz pushes, 5 emulated boards -----------' % rate_hz)
+        for name, (cycles, push, latency) in results.items():
+            print('%s: %.1f cycles/s  push p50 %.2f p90 %.2f ms' % (name, cycles, push['p50'] * 1e3, push['p90'] * 1e3))
+            if latency['cycle']['n']:
+                print('    per-board p90 (ms): ' + '  '.join(['%s %.2f' % (b, latency[b]['p90'] * 1e3) for b in NonDXLStatusThread.BOARDS]))
+        self.assertGreater(results['status coroutine'][0], 0.9 * rate_hz)
+        self.assertGreater(results['status coroutine'][2]['cycle']['n'], 0)
@@ -0,0 +1,57 @@
+# Logging level must be set before importing any stretch_body class
+import stretch_body.robot_params
+
+import unittest
+import timeit
+import array as arr
+import stretch_body.stepper
+import stretch_body.wacc
+from stretch_body.device_emulator import StepperEmulator
+
+
+def legacy_expand_protocol_methods(s, protocol_classes):
+    """
+    Copy of the protocol methods onto the instance, as done by Stepper.startup prior to Device.set_protocol_class
+    Kept here as the baseline
+    """
+    for protocol_class in protocol_classes[::-1]:
+        for attr_name, attr_value in protocol_class.__dict__.items():
+            if callable(attr_value) and not attr_name.startswith("__"):
+                setattr(s, attr_name, attr_value.__get__(s, stretch_body.stepper.Stepper))
+
+
+class TestProtocolClassRates(unittest.TestCase):
+    """
+    Protocol setup at startup, and dispatch of the protocol methods afterwards
+    Methods copied onto each instance vs the cached protocol class of Device.set_protocol_class
+    No hardware is used
+    """
+    def test_stepper(self):
+        protocol_classes = stretch_body.stepper.Stepper.supported_protocols['p5']
+        legacy = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+        s = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+        itr = 2000
+        t_legacy = timeit.timeit(lambda: legacy_expand_protocol_methods(legacy, protocol_classes), number=itr) / itr
+        t_class = timeit.timeit(lambda: s.set_protocol_class(protocol_classes), number=itr) / itr
+
+        e = StepperEmulator()
+        status = arr.array('B', e.pack_status())
+        itr = 20000
+        d_legacy = timeit.timeit(lambda: legacy.unpack_status(status), number=itr) / itr
+        d_class = timeit.timeit(lambda: s.unpack_status(status), number=itr) / itr
+        for k in ('pos', 'vel', 'diag', 'voltage', 'waypoint_traj', 'pos_calibrated'):
+            self.assertEqual(s.status[k], legacy.status[k])
+        self.assertEqual(len(vars(s)), len(vars(stretch_body.stepper.Stepper('/dev/hello-motor-arm'))))
+
+        print('--------- Stepper protocol P5 (us) -----------')
+        print('Setup   per instance: %.2f  class: %.2f' % (t_legacy * 1e6, t_class * 1e6))
+        print('unpack_status   per instance: %.2f  class: %.2f' % (d_legacy * 1e6, d_class * 1e6))
+        self.assertLess(t_class, t_legacy)
+
+    def test_wacc_classes_not_shared(self):
+        a = stretch_body.wacc.Wacc()
+        b = stretch_body.wacc.Wacc()
+        a.set_protocol_class(a.supported_protocols['p3'])
+        b.set_protocol_class(b.supported_protocols['p0'])
+        self.assertIsNot(type(a), type(b))
+        self.assertEqual(stretch_body.wacc.Wacc.__bases__, (stretch_body.wacc.WaccBase,))
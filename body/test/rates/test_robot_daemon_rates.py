@@ -0,0 +1,88 @@
+import unittest
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from stretch_body.status_snapshot import StatusSnapshots
+from stretch_body.robot_daemon import *
+
+
+class DaemonRobot():
+    """
+    The parts of Robot used by RobotDaemon: seven devices of 40 status fields, published at 25Hz
+    """
+    def __init__(self):
+        self.snapshots = StatusSnapshots()
+        self.status = {n: {'k%d' % i: 0.0 for i in range(40)} for n in
+                       ('pimu', 'base', 'lift', 'arm', 'head', 'wacc', 'end_of_arm')}
+        self.shutdown_flag = threading.Event()
+        self.thread = threading.Thread(target=self._status_loop, daemon=True)
+
+    def startup(self):
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.shutdown_flag.set()
+        self.thread.join()
+
+    def _status_loop(self):
+        while not self.shutdown_flag.wait(0.04):
+            self.snapshots.publish(self.status)
+
+    def get_status_snapshot(self):
+        return self.snapshots.get()
+
+    def get_status(self):
+        return self.snapshots.get().status
+
+
+def reader(mode, address, shm_name, dt, start, q):
+    p = RobotProxy(address=address, shm_name=shm_name)
+    p.startup()
+    start.wait()
+    n = 0
+    ts = time.time()
+    while time.time() - ts < dt:
+        if mode == 'shm':
+            p.get_status()
+        else:
+            p.request(('call', 'get_status', (), {}))
+        n += 1
+    p.stop()
+    q.put(n / dt)
+
+
+class TestRobotDaemonRates(unittest.TestCase):
+    """
+    get_status reads/s from client processes of a RobotDaemon: over the socket (a call in the daemon) vs
+    from the shared memory StatusSegment, with 1 and 4 reader processes
+    """
+    def test_readers(self):
+        dir = tempfile.mkdtemp()
+        address = os.path.join(dir, 'robot_daemon.sock')
+        shm_name = 'test_status_rates_%d' % os.getpid()
+        d = RobotDaemon(DaemonRobot(), address=address, shm_name=shm_name, shm_size=262144)
+        self.assertTrue(d.startup())
+        ctx = multiprocessing.get_context('spawn')
+        results = {}
+        try:
+            time.sleep(0.1)
+            for mode in ('socket', 'shm'):
+                for n_proc in (1, 4):
+                    q = ctx.Queue()
+                    start = ctx.Event()
+                    procs = [ctx.Process(target=reader, args=(mode, address, shm_name, 0.5, start, q)) for i in range(n_proc)]
+                    [p.start() for p in procs]
+                    time.sleep(0.5)  # Spawned and connected
+                    start.set()
+                    results[(mode, n_proc)] = sum([q.get(timeout=30) for p in procs])
+                    [p.join() for p in procs]
+        finally:
+            d.stop()
+        print('--------- get_status reads/s from RobotDaemon client processes -----------')
+        for (mode, n_proc), r in results.items():
+            print('%-6s %d process(es): %.0f' % (mode, n_proc, r))
+        self.assertGreater(results[('shm', 1)], results[('socket', 1)])
+        self.assertGreater(results[('shm', 4)], results[('socket', 4)])
@@ -0,0 +1,183 @@
+import unittest
+import timeit
+import array as arr
+from stretch_body.transport import *
+from stretch_body.rpc_schema import *
+from stretch_body.device_emulator import StepperEmulator, PimuEmulator, WaccEmulator
+
+
+class ReferenceDecoder():
+    """
+    Field by field status decode with the unpack_*_t(s[sidx:]) helpers, as used prior to the schemas.
+    Kept here as the baseline for the micro-benchmark. Unit conversions are identity.
+    """
+    STEPPER_DIAG = [('pos_calibrated', 1), ('runstop_on', 2), ('near_pos_setpoint', 4), ('near_vel_setpoint', 8),
+                    ('is_moving', 16), ('at_current_limit', 32), ('is_mg_accelerating', 64), ('is_mg_moving', 128),
+                    ('calibration_rcvd', 256), ('in_guarded_event', 512), ('in_safety_event', 1024),
+                    ('waiting_on_sync', 2048), ('in_sync_mode', 16384), ('trace_on', 32768)]
+    PIMU_STATE = [('runstop_event', 16), ('cliff_event', 32), ('fan_on', 64), ('buzzer_on', 128),
+                  ('low_voltage_alert', 256), ('high_current_alert', 1024), ('over_tilt_alert', 512),
+                  ('charger_connected', 2048), ('boot_detected', 4096), ('trace_on', 8192)]
+
+    def stepper_p4(self, s, unpack_to):
+        sidx = 0
+        unpack_to['mode'] = unpack_uint8_t(s[sidx:]);sidx += 1
+        unpack_to['effort_ticks'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['pos'] = unpack_double_t(s[sidx:]);sidx += 8
+        unpack_to['vel'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['err'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['diag'] = unpack_uint32_t(s[sidx:]);sidx += 4
+        unpack_to['timestamp'] = unpack_uint64_t(s[sidx:]);sidx += 8
+        unpack_to['debug'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['guarded_event'] = unpack_uint32_t(s[sidx:]);sidx += 4
+        unpack_to['waypoint_traj']['setpoint'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['waypoint_traj']['segment_id'] = unpack_uint16_t(s[sidx:]);sidx += 2
+        unpack_to['voltage'] = unpack_float_t(s[sidx:]);sidx += 4
+        for dest, mask in self.STEPPER_DIAG:
+            unpack_to[dest] = unpack_to['diag'] & mask > 0
+        return sidx
+
+    def pimu_p6(self, s, unpack_to):
+        sidx = 0
+        for k in ('ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my', 'mz', 'roll', 'pitch', 'heading', 'qw', 'qx', 'qy', 'qz', 'bump'):
+            unpack_to[k] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['voltage'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['current'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['temp'] = unpack_float_t(s[sidx:]);sidx += 4
+        for i in range(4):
+            unpack_to['cliff_range'][i] = unpack_float_t(s[sidx:])
+            sidx += 4
+        unpack_to['state'] = unpack_uint32_t(s[sidx:]);sidx += 4
+        unpack_to['at_cliff'] = [(unpack_to['state'] & m) != 0 for m in (1, 2, 4, 8)]
+        for dest, mask in self.PIMU_STATE:
+            unpack_to[dest] = (unpack_to['state'] & mask) != 0
+        unpack_to['timestamp'] = unpack_uint64_t(s[sidx:]);sidx += 8
+        unpack_to['bump_event_cnt'] = unpack_uint16_t(s[sidx:]);sidx += 2
+        unpack_to['debug'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['current_charge'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['over_tilt_type'] = unpack_uint8_t(s[sidx:]);sidx += 1
+        return sidx
+
+    def wacc_p2(self, s, unpack_to):
+        sidx = 0
+        unpack_to['ax'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['ay'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['az'] = unpack_float_t(s[sidx:]);sidx += 4
+        unpack_to['a0'] = unpack_int16_t(s[sidx:]);sidx += 2
+        unpack_to['d0'] = unpack_uint8_t(s[sidx:]);sidx += 1
+        unpack_to['d1'] = unpack_uint8_t(s[sidx:]);sidx += 1
+        unpack_to['d2'] = unpack_uint8_t(s[sidx:]);sidx += 1
+        unpack_to['d3'] = unpack_uint8_t(s[sidx:]);sidx += 1
+        unpack_to['single_tap_count'] = unpack_uint32_t(s[sidx:]);sidx += 4
+        unpack_to['state'] = unpack_uint32_t(s[sidx:]);sidx += 4
+        unpack_to['trace_on'] = unpack_to['state'] & 1 > 0
+        unpack_to['timestamp'] = unpack_uint64_t(s[sidx:]);sidx += 8
+        unpack_to['debug'] = unpack_uint32_t(s[sidx:]);sidx += 4
+        return sidx
+
+
+class IdentityTimestamp():
+    def set(self, ts):
+        return ts
+
+
+class IdentityDevice():
+    def __init__(self):
+        self.timestamp = IdentityTimestamp()
+
+    def get_voltage(self, raw):
+        return raw
+
+    get_current = get_temp = get_current_charge = get_tilt_type = get_voltage
+
+
+class TestRPCSchemaRates(unittest.TestCase):
+    """
+    Micro-benchmark of the decode of one status message per board, field by field vs compiled schema
+    Messages are as packed by the board emulators (Stepper P4/P5, Pimu P6, Wacc P2/P3 layouts)
+    """
+    def _run(self, name, s, reference, schema_decode, status, itr=20000):
+        ref_status = {k: (v.copy() if hasattr(v, 'copy') else v) for k, v in status.items()}
+        reference(s, ref_status)
+        schema_decode(s, status)
+        self.assertEqual(status, ref_status)
+        t_ref = timeit.timeit(lambda: reference(s, ref_status), number=itr) / itr
+        t_new = timeit.timeit(lambda: schema_decode(s, status), number=itr) / itr
+        print('--------- %s status decode -----------' % name)
+        print('Field by field (us): %.2f  schema (us): %.2f  speedup: %.1fx' % (t_ref * 1e6, t_new * 1e6, t_ref / t_new))
+        self.assertLess(t_new, t_ref)
+
+    def test_stepper_status(self):
+        d = IdentityDevice()
+        flags = StatusFlags(ReferenceDecoder.STEPPER_DIAG)
+
+        def decode(s, unpack_to):
+            STEPPER_STATUS_P4.unpack_into(s, 0, unpack_to, d)
+            flags.expand(unpack_to['diag'], unpack_to)
+            return STEPPER_STATUS_P4.size
+
+        e = StepperEmulator()
+        e.diag = 1 + 16 + 4096
+        self._run('Stepper P4', arr.array('B', e.pack_status()), ReferenceDecoder().stepper_p4, decode,
+                  {'waypoint_traj': {}})
+
+    def test_pimu_status(self):
+        d = IdentityDevice()
+        flags = StatusFlags(ReferenceDecoder.PIMU_STATE)
+
+        def decode(s, unpack_to):
+            sidx = IMU_STATUS_P1.size
+            IMU_STATUS_P1.unpack_into(s, 0, unpack_to, d)
+            PIMU_STATUS_P6.unpack_into(s, sidx, unpack_to, d)
+            state = unpack_to['state']
+            unpack_to['at_cliff'] = [(state & m) != 0 for m in (1, 2, 4, 8)]
+            flags.expand(state, unpack_to)
+            return sidx + PIMU_STATUS_P6.size
+
+        e = PimuEmulator()
+        e.state = 64 + 2048
+        self._run('Pimu P6', arr.array('B', e.pack_status()), ReferenceDecoder().pimu_p6, decode,
+                  {'cliff_range': [0, 0, 0, 0]})
+
+    def test_wacc_status(self):
+        d = IdentityDevice()
+        flags = StatusFlags([('trace_on', 1)])
+
+        def decode(s, unpack_to):
+            WACC_STATUS_P2.unpack_into(s, 0, unpack_to, d)
+            flags.expand(unpack_to['state'], unpack_to)
+            return WACC_STATUS_P2.size
+
+        self._run('Wacc P2', arr.array('B', WaccEmulator().pack_status()), ReferenceDecoder().wacc_p2, decode, {})
+
+    def test_stepper_record(self):
+        """
+        Stepper status decode and command pack, dict vs Record
+        """
+        d = IdentityDevice()
+        flags = StatusFlags(ReferenceDecoder.STEPPER_DIAG)
+        e = StepperEmulator()
+        e.diag = 1 + 16 + 4096
+        s = arr.array('B', e.pack_status())
+
+        def decode(unpack_to):
+            STEPPER_STATUS_P4.unpack_into(s, 0, unpack_to, d)
+            flags.expand(unpack_to['diag'], unpack_to)
+
+        status = StepperStatus().to_dict()
+        record = StepperStatus()
+        command = StepperCommand().to_dict()
+        command_record = StepperCommand()
+        payload = arr.array('B', [0] * 64)
+        itr = 5000
+        dt = {}
+        for name, fn in (('decode dict', lambda: decode(status)), ('decode record', lambda: decode(record)),
+                         ('pack dict', lambda: STEPPER_COMMAND.pack_into(payload, 1, command)),
+                         ('pack record', lambda: STEPPER_COMMAND.pack_into(payload, 1, command_record))):
+            dt[name] = min(timeit.repeat(fn, number=itr, repeat=5)) / itr  # Best of 5, robust to load from other tests
+        self.assertEqual(record.to_dict(), status)
+        print('--------- Stepper status / command, dict vs Record (us) -----------')
+        print('Decode dict: %.2f  record: %.2f   Pack dict: %.2f  record: %.2f' %
+              (dt['decode dict'] * 1e6, dt['decode record'] * 1e6, dt['pack dict'] * 1e6, dt['pack record'] * 1e6))
+        self.assertLess(dt['decode record'], dt['decode dict'])
+        self.assertLess(dt['pack record'], dt['pack dict'])
@@ -0,0 +1,56 @@
+import unittest
+import threading
+import time
+from stretch_body.scheduler import DeadlineScheduler, PeriodicTask
+
+RATES_HZ = (25.0, 15.0, 15.0, 15.0, 100.0)  # Robot's non-DXL status, two DXL status, system monitor and collision loops
+
+
+class LegacyLoopThread(threading.Thread):
+    """
+    A Robot status / monitor thread prior to the scheduler: LoopStats.wait_until_ready_to_run polling with 0.5ms sleeps
+    """
+    def __init__(self, rate_hz):
+        threading.Thread.__init__(self, daemon=True)
+        self.rate_hz = rate_hz
+        self.shutdown_flag = threading.Event()
+        self.runs = 0
+
+    def run(self):
+        ts_loop_start = time.time()
+        while not self.shutdown_flag.is_set():
+            while time.time() - ts_loop_start < (1 / self.rate_hz):
+                time.sleep(.0005)
+            ts_loop_start = time.time()
+            self.runs += 1
+
+
+class TestSchedulerRates(unittest.TestCase):
+    """
+    CPU used to pace Robot's five loops (with no work in them) for 1s:
+    five threads polling their LoopStats vs one DeadlineScheduler
+    """
+    def test_pacing_cpu(self):
+        dt = 1.0
+        threads = [LegacyLoopThread(r) for r in RATES_HZ]
+        c0 = time.process_time()
+        [t.start() for t in threads]
+        time.sleep(dt)
+        [t.shutdown_flag.set() for t in threads]
+        [t.join() for t in threads]
+        cpu_legacy = time.process_time() - c0
+        runs_legacy = sum([t.runs for t in threads])
+
+        s = DeadlineScheduler()
+        for i, r in enumerate(RATES_HZ):
+            s.add_task(PeriodicTask('task%d' % i, lambda: None, r, offset=0.005 * i))
+        c0 = time.process_time()
+        s.start()
+        time.sleep(dt)
+        s.stop()
+        cpu_scheduler = time.process_time() - c0
+        print('--------- Pacing 5 loops for %.1fs -----------' % dt)
+        print('threads: %.1f ms CPU, %d runs   scheduler: %.1f ms CPU, %d runs, %d wakeups' %
+              (cpu_legacy * 1e3, runs_legacy, cpu_scheduler * 1e3, s.status['runs'], s.status['wakeups']))
+        self.assertAlmostEqual(s.status['runs'], sum(RATES_HZ) * dt, delta=10)
+        self.assertLess(cpu_scheduler, cpu_legacy)
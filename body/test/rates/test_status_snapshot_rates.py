@@ -0,0 +1,57 @@
+import unittest
+import threading
+import time
+from stretch_body.status_snapshot import StatusSnapshots
+
+
+def device_status(n=40):
+    return {'pos': 0.0, 'vel': 0.0, 'effort': 0.0, 'motor': {'k%d' % i: 0.0 for i in range(n)}}
+
+
+class TestStatusSnapshotRates(unittest.TestCase):
+    """
+    Robot.get_status reader throughput with the status threads running (a 25Hz non-DXL and two 15Hz DXL writers),
+    Robot.get_status as it was (lock and shallow copy) vs the latest snapshot
+    """
+    def test_reader_throughput(self):
+        status = {n: device_status() for n in ('pimu', 'base', 'lift', 'arm', 'head', 'wacc', 'end_of_arm')}
+        lock = threading.RLock()
+        snapshots = StatusSnapshots()
+        snapshots.publish(status)
+        shutdown = threading.Event()
+
+        def writer(names, rate_hz):
+            i = 0
+            while not shutdown.wait(1.0 / rate_hz):
+                i += 1
+                with lock:  # As push_command holds the lock on the command path
+                    for n in names:
+                        for k in status[n]['motor']:
+                            status[n]['motor'][k] = i
+                snapshots.publish({n: status[n] for n in names})
+
+        threads = [threading.Thread(target=writer, args=(names, r)) for names, r in
+                   ((('wacc', 'base', 'lift', 'arm', 'pimu'), 25.0), (('head',), 15.0), (('end_of_arm',), 15.0))]
+        [t.start() for t in threads]
+
+        def legacy_get_status():
+            with lock:
+                return status.copy()
+
+        results = {}
+        try:
+            for name, get in (('lock + copy', legacy_get_status), ('snapshot', lambda: snapshots.get().status)):
+                n = 0
+                ts = time.perf_counter()
+                while time.perf_counter() - ts < 0.5:
+                    for i in range(100):
+                        get()
+                    n += 100
+                results[name] = n / (time.perf_counter() - ts)
+        finally:
+            shutdown.set()
+            [t.join() for t in threads]
+        print('--------- get_status reads/s with status threads running -----------')
+        for name, r in results.items():
+            print('%s: %.0f' % (name, r))
+        self.assertGreater(results['snapshot'], results['lock + copy'])
@@ -0,0 +1,80 @@
+# Logging level must be set before importing any stretch_body class
+import stretch_body.robot_params
+
+import unittest
+import threading
+import time
+import stretch_body.stepper
+import stretch_body.transport as transport
+from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator
+
+
+def legacy_wait_while_is_moving(s, timeout=15.0):
+    """
+    Stepper.wait_while_is_moving prior to Device.wait_for_status, kept here as the baseline
+    """
+    ts = time.time()
+    s.pull_status()
+    while s.status['is_mg_moving'] and time.time() - ts < timeout:
+        time.sleep(0.1)
+        s.pull_status()
+    return not s.status['is_mg_moving']
+
+
+class TestStatusWaitRates(unittest.TestCase):
+    """
+    Stepper wait_while_is_moving against an emulated board, with a 25Hz status thread pulling the status
+    as the NonDXLStatusThread does. Reports how long after the motion ends the wait returns,
+    and the RPCs the wait itself added: sleep and pull vs waiting on the status updates
+    """
+    def test_wait_while_is_moving(self):
+        emu = PtyDeviceEmulator(StepperEmulator())
+        emu.start()
+        s = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+        s.transport = transport.Transport(emu.port)
+        shutdown = threading.Event()
+        n_thread = [0]
+
+        def status_thread():
+            while not shutdown.wait(0.04):
+                s.pull_status()
+                n_thread[0] += 1
+
+        t = threading.Thread(target=status_thread)
+        results = {}
+        try:
+            self.assertTrue(s.transport.startup())
+            s.transport.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            s.board_info['protocol_version'] = 'p5'
+            s.set_protocol_class(s.supported_protocols['p5'])
+            s.hw_valid = True
+            t.start()
+            for name, wait in (('legacy', legacy_wait_while_is_moving), ('event', s.wait_while_is_moving)):
+                latency = []
+                rpcs = 0
+                for i in range(5):
+                    emu.device.diag |= s.DIAG_IS_MG_MOVING
+                    time.sleep(0.05)
+                    t_stop = []
+
+                    def stop_motion():
+                        emu.device.diag &= ~s.DIAG_IS_MG_MOVING
+                        t_stop.append(time.time())
+
+                    threading.Timer(0.23, stop_motion).start()
+                    n0, rpcs0 = n_thread[0], emu.device.status['rpcs']
+                    self.assertTrue(wait(s, 2.0) if name == 'legacy' else wait(2.0))
+                    latency.append(time.time() - t_stop[0])
+                    rpcs += (emu.device.status['rpcs'] - rpcs0) - (n_thread[0] - n0)
+                results[name] = (sum(latency) / len(latency), rpcs / 5.0)
+        finally:
+            shutdown.set()
+            if t.is_alive():
+                t.join()
+            s.transport.stop()
+            emu.stop()
+        print('--------- Stepper wait_while_is_moving, 25Hz status thread -----------')
+        for name, (latency, rpcs) in results.items():
+            print('%s: wakes %.1f ms after motion ends, %.1f RPCs per wait' % (name, latency * 1e3, rpcs))
+        self.assertLess(results['event'][0], results['legacy'][0])
+        self.assertLessEqual(results['event'][1], 1.0)  # At most the initial pull, the status cache aside
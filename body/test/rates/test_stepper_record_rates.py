@@ -0,0 +1,73 @@
+# Logging level must be set before importing any stretch_body class
+import stretch_body.robot_params
+
+import unittest
+import timeit
+import array as arr
+import stretch_body.stepper
+from stretch_body.rpc_schema import *
+from stretch_body.device_emulator import StepperEmulator
+
+
+def legacy_set_command(s, command, mode=None, x_des=None, v_des=None, a_des=None, i_des=None, stiffness=None,
+                       i_feedforward=None, i_contact_pos=None, i_contact_neg=None):
+    """
+    Stepper.set_command into a dict, as done prior to StepperCommand. Kept here as the baseline
+    """
+    if True in [s.check_nan_value(d) for d in (x_des, v_des, a_des, i_des, stiffness, i_feedforward, i_contact_pos, i_contact_neg)]:
+        return
+    if mode is not None:
+        command['mode'] = mode
+    if x_des is not None:
+        command['x_des'] = x_des
+        if command['mode'] == s.MODE_POS_TRAJ_INCR:
+            command['incr_trigger'] = (command['incr_trigger'] + 1) % 255
+    if v_des is not None:
+        command['v_des'] = v_des
+    elif mode == s.MODE_VEL_PID or mode == s.MODE_VEL_TRAJ:
+        command['v_des'] = 0
+    else:
+        command['v_des'] = s.params['motion']['vel']
+    command['a_des'] = a_des if a_des is not None else s.params['motion']['accel']
+    command['stiffness'] = max(0.0, min(1.0, stiffness)) if stiffness is not None else 1
+    command['i_feedforward'] = i_feedforward if i_feedforward is not None else 0
+    if i_des is not None and mode == s.MODE_CURRENT:
+        command['i_feedforward'] = i_des
+    command['i_contact_pos'] = i_contact_pos if i_contact_pos is not None else s.params['gains']['i_contact_pos']
+    command['i_contact_neg'] = i_contact_neg if i_contact_neg is not None else s.params['gains']['i_contact_neg']
+
+
+class TestStepperRecordRates(unittest.TestCase):
+    """
+    CPU time of one control cycle of a Stepper (set_command, pack_command, unpack_status of a P4 status)
+    Dict command / status as done previously vs the StepperCommand / StepperStatus records
+    No hardware is used: the status is as packed by the StepperEmulator
+    """
+    def test_control_cycle(self):
+        s = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+        s.set_protocol_class(s.supported_protocols['p4'])  # As done by startup for a P4 board
+        e = StepperEmulator()
+        e.diag = 1 + 16 + 4096
+        status = arr.array('B', e.pack_status())
+        payload = s.transport.get_empty_payload()
+        command_dict = StepperCommand().to_dict()
+        status_dict = StepperStatus(transport=s.transport.status).to_dict()
+        itr = 10000
+
+        def cycles(set_command, status_to):
+            return {'set_command': timeit.timeit(lambda: set_command(mode=s.MODE_POS_TRAJ, x_des=0.1), number=itr) / itr,
+                    'pack_command': timeit.timeit(lambda: s.pack_command(payload, 1), number=itr) / itr,
+                    'unpack_status': timeit.timeit(lambda: s.unpack_status(status, status_to), number=itr) / itr}
+
+        record = cycles(s.set_command, s.status)
+        command_record = s._command
+        s._command = command_dict  # pack_command from the dict
+        legacy = cycles(lambda **kw: legacy_set_command(s, command_dict, **kw), status_dict)
+        s._command = command_record
+        self.assertEqual(command_record.to_dict(), command_dict)
+        self.assertEqual(s.status.to_dict(), status_dict)
+        print('--------- Stepper control cycle CPU (us) -----------')
+        for k in ('set_command', 'pack_command', 'unpack_status'):
+            print('%-14s dict: %.2f  record: %.2f' % (k, legacy[k] * 1e6, record[k] * 1e6))
+        print('Per cycle saved (us): %.2f' % ((sum(legacy.values()) - sum(record.values())) * 1e6))
+        self.assertLess(sum(record.values()), sum(legacy.values()))
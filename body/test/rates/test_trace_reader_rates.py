@@ -0,0 +1,75 @@
+import unittest
+import time
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.rpc_schema import *
+from stretch_body.trace_reader import FirmwareTraceReader
+from stretch_body.device_emulator import *
+
+
+class TraceTimestamp():
+    def set(self, ts):
+        return ts * 1e-6
+
+
+class TraceDevice():
+    """
+    Stands in for the Stepper the legacy loop decodes the status with
+    """
+    def __init__(self):
+        self.timestamp = TraceTimestamp()
+
+    def get_voltage(self, raw):
+        return raw * 20.0 / 1024 - 0.3
+
+
+class TestTraceReaderRates(unittest.TestCase):
+    """
+    Reading a 1000 entry Stepper trace from an emulated board:
+    the read_firmware_trace loop (1ms sleep per RPC, a dict per entry) vs FirmwareTraceReader
+    """
+    def test_read_trace(self):
+        n = 1000
+        emu = PtyDeviceEmulator(StepperEmulator())
+        emu.start()
+        t = transport.Transport(emu.port)
+        device = TraceDevice()
+        trace_buf = []
+        remaining = [0]
+
+        def legacy_reply(reply):
+            remaining[0] = reply[1]
+            entry = {'id': len(trace_buf), 'status': {'waypoint_traj': {}}, 'debug': {}, 'print': {}}
+            if reply[2] == emu.device.TRACE_TYPE_STATUS:
+                STEPPER_STATUS_P4.unpack_into(reply, 3, entry['status'], device)
+            trace_buf.append(entry)
+
+        def legacy_read():
+            remaining[0] = 1
+            payload = arr.array('B', [27])
+            while remaining[0]:
+                t.do_pull_rpc_sync(payload, legacy_reply, priority=transport.RPC_PRIORITY_TRACE)
+                time.sleep(.001)
+
+        dt = {}
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            for name, read in (('legacy', legacy_read),
+                               ('reader', lambda: FirmwareTraceReader(t, 27, STEPPER_STATUS_P4).read())):
+                for i in range(n):
+                    emu.device.pos = 0.001 * i
+                    emu.device.record_trace()
+                t0 = time.perf_counter()
+                r = read()
+                dt[name] = time.perf_counter() - t0
+            self.assertEqual(len(trace_buf), n)
+            self.assertEqual(len(r.status), n)
+            self.assertEqual(r.status['pos'][-1], trace_buf[-1]['status']['pos'])
+            self.assertEqual(t.status['sync']['read_error'], 0)
+        finally:
+            t.stop()
+            emu.stop()
+        print('--------- Read %d entry trace (ms) -----------' % n)
+        print('legacy: %.1f  reader: %.1f  (%.1fx)' % (dt['legacy'] * 1e3, dt['reader'] * 1e3, dt['legacy'] / dt['reader']))
+        self.assertLess(dt['reader'], dt['legacy'])
@@ -0,0 +1,175 @@
+import unittest
+import os
+import tempfile
+import time
+import asyncio
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.transport_capture import TransportCapture
+from test.test_transport import PtyV1Device
+
+
+class TestTransportRates(unittest.TestCase):
+    """
+    Transport rates against simulated devices served on pty pairs
+    """
+    def _run(self, use_poll, n):
+        dev = PtyV1Device(bytes(range(1, 120)))
+        dev.start()
+        t = transport.Transport(dev.port)
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            if not use_poll:
+                t.sync_handler.poller = None
+            payload = arr.array('B', [10])
+            sink = lambda r: None
+            dt = []
+            c0 = time.thread_time()
+            for i in range(n):
+                ts = time.perf_counter()
+                t.do_pull_rpc_sync(payload, sink)
+                dt.append(time.perf_counter() - ts)
+            cpu = (time.thread_time() - c0) / n
+            self.assertEqual(t.status['sync']['read_error'], 0)
+        finally:
+            t.stop()
+            dev.stop()
+        dt.sort()
+        pct = lambda p: dt[min(len(dt) - 1, int(p * len(dt)))] * 1e6
+        print('--------- Transport receive: %s -----------' % ('poll' if use_poll else 'inWaiting spin'))
+        print('CPU per RPC (us): %.1f' % (cpu * 1e6))
+        print('Latency (us) p50: %.1f  p90: %.1f  p99: %.1f  max: %.1f' % (pct(.5), pct(.9), pct(.99), dt[-1] * 1e6))
+        return cpu
+
+    def test_receive_cpu_per_rpc(self):
+        """
+        Compare the poll() based receive with the inWaiting() spin it replaced
+        Reports the CPU time of the calling thread per RPC and the RPC latency percentiles
+        """
+        cpu_spin = self._run(use_poll=False, n=500)
+        cpu_poll = self._run(use_poll=True, n=500)
+        self.assertLess(cpu_poll, cpu_spin)
+
+    def test_async_gather_overlaps_boards(self):
+        """
+        Pull status from five simulated boards, as NonDXLStatusThread.step does with asyncio.gather
+        With a 2ms device turnaround the gathered cycle should take about one turnaround, not five
+        """
+        n_boards = 5
+        n_cycles = 50
+        devs = [PtyV1Device(bytes(range(1, 120)), reply_delay=0.002) for i in range(n_boards)]
+        ts = [transport.Transport(d.port) for d in devs]
+        payload = arr.array('B', [10])
+        sink = lambda r: None
+
+        async def sequential():
+            for t in ts:
+                await t.do_pull_rpc_async(payload, sink)
+
+        async def gathered():
+            await asyncio.gather(*[t.do_pull_rpc_async(payload, sink) for t in ts])
+
+        async def run(step):
+            t0 = time.perf_counter()
+            for i in range(n_cycles):
+                await step()
+            return (time.perf_counter() - t0) / n_cycles
+
+        try:
+            for d in devs:
+                d.start()
+            for t in ts:
+                self.assertTrue(t.startup())
+                t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            loop = asyncio.new_event_loop()
+            t_seq = loop.run_until_complete(run(sequential))
+            t_gather = loop.run_until_complete(run(gathered))
+            loop.close()
+            for t in ts:
+                self.assertEqual(t.status['async']['read_error'], 0)
+        finally:
+            for t in ts:
+                t.stop()
+            for d in devs:
+                d.stop()
+        print('--------- asyncio status cycle, %d boards -----------' % n_boards)
+        print('Sequential (ms): %.2f  gather (ms): %.2f  overlap: %.1fx' % (t_seq * 1e3, t_gather * 1e3, t_seq / t_gather))
+        self.assertLess(t_gather, t_seq / 2)
+
+    def test_push_batch_latency(self):
+        """
+        Push trigger + command style RPCs (single frame each) lock-step, then as a pipelined batch
+        Against a simulated device with a 1ms turnaround per read, the batch waits on fewer turnarounds
+        """
+        n = 100
+        dev = PtyV1Device(reply_delay=0.001)
+        dev.start()
+        t = transport.Transport(dev.port)
+        sink = lambda r: None
+
+        def rpcs():
+            payload = t.get_empty_payload()
+            out = []
+            sidx = 0
+            for rpc_id, nb in [(40, 9), (50, 30), (60, 24)]:
+                payload[sidx] = rpc_id
+                out.append((payload[sidx:sidx + nb], sink))
+                sidx = sidx + nb
+            return out
+
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            t0 = time.perf_counter()
+            for i in range(n):
+                for payload, cb in rpcs():
+                    t.do_push_rpc_sync(payload, cb)
+            t_lock_step = (time.perf_counter() - t0) / n
+            t0 = time.perf_counter()
+            for i in range(n):
+                t.do_push_rpc_batch_sync(rpcs())
+            t_batch = (time.perf_counter() - t0) / n
+            self.assertEqual(len(dev.dev.pushes), 6 * n)
+            self.assertEqual(t.status['sync']['read_error'], 0)
+        finally:
+            t.stop()
+            dev.stop()
+        print('--------- push_command, 3 RPCs -----------')
+        print('Lock-step (ms): %.2f  batch (ms): %.2f  speedup: %.1fx' % (t_lock_step * 1e3, t_batch * 1e3, t_lock_step / t_batch))
+        self.assertLess(t_batch, t_lock_step)
+
+    def test_capture_overhead(self):
+        """
+        RPC latency with and without a TransportCapture attached
+        """
+        n = 500
+        dev = PtyV1Device(bytes(range(1, 120)))
+        dev.start()
+        t = transport.Transport(dev.port)
+        fd, filename = tempfile.mkstemp(suffix='.sbcap')
+        os.close(fd)
+        payload = arr.array('B', [10])
+        sink = lambda r: None
+
+        def run():
+            t0 = time.perf_counter()
+            for i in range(n):
+                t.do_pull_rpc_sync(payload, sink)
+            return (time.perf_counter() - t0) / n
+
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            dt_off = run()
+            capture = TransportCapture(filename)
+            t.start_capture(capture)
+            dt_on = run()
+            capture.stop()
+            self.assertEqual(capture.status['dropped'], 0)
+        finally:
+            t.stop()
+            dev.stop()
+            os.remove(filename)
+        print('--------- Transport capture -----------')
+        print('RPC (us) without capture: %.1f  with capture: %.1f' % (dt_off * 1e6, dt_on * 1e6))
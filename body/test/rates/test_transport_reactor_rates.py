@@ -0,0 +1,59 @@
+import unittest
+import time
+import asyncio
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.transport_reactor import TransportReactor
+from stretch_body.device_emulator import *
+
+
+class TestTransportReactorRates(unittest.TestCase):
+    """
+    One status cycle of a robot's non-Dynamixel boards (4 steppers, pimu, wacc) with a 1ms device turnaround
+    Sync (one board after the other) vs asyncio.gather vs the single selector reactor
+    """
+    def test_status_cycle(self):
+        n_cycles = 100
+        devices = [StepperEmulator() for i in range(4)] + [PimuEmulator(), WaccEmulator()]
+        emus = [PtyDeviceEmulator(d, reply_delay=0.001) for d in devices]
+        ts = [transport.Transport(e.port) for e in emus]
+        payload = arr.array('B', [3])  # GET_STATUS on all three boards
+        sink = lambda r: None
+
+        def run_sync():
+            for t in ts:
+                t.do_pull_rpc_sync(payload, sink)
+
+        async def run_asyncio():
+            await asyncio.gather(*[t.do_pull_rpc_async(payload, sink) for t in ts])
+
+        reactor = TransportReactor()
+        loop = asyncio.new_event_loop()
+        dt = {}
+        try:
+            for e in emus:
+                e.start()
+            for t in ts:
+                self.assertTrue(t.startup())
+                t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            for name, cycle in (('sync', run_sync),
+                                ('asyncio', lambda: loop.run_until_complete(run_asyncio())),
+                                ('reactor', lambda: reactor.run_until_complete([t.do_pull_rpc_async(payload, sink) for t in ts]))):
+                t0 = time.perf_counter()
+                for i in range(n_cycles):
+                    cycle()
+                dt[name] = (time.perf_counter() - t0) / n_cycles
+            for t in ts:
+                self.assertEqual(t.status['sync']['read_error'], 0)
+                self.assertEqual(t.status['async']['read_error'], 0)
+            self.assertEqual(reactor.status['fallbacks'], 0)
+        finally:
+            loop.close()
+            reactor.close()
+            for t in ts:
+                t.stop()
+            for e in emus:
+                e.stop()
+        print('--------- Status cycle, %d emulated boards (ms) -----------' % len(ts))
+        print('sync: %.2f  asyncio: %.2f  reactor: %.2f' % (dt['sync'] * 1e3, dt['asyncio'] * 1e3, dt['reactor'] * 1e3))
+        self.assertLess(dt['reactor'], dt['sync'])
@@ -0,0 +1,49 @@
+import unittest
+import time
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.transport_stats import LatencyHistogram
+from stretch_body.device_emulator import *
+
+
+class TestTransportTimeoutRates(unittest.TestCase):
+    """
+    Stepper status pulls over a link that loses 2% of the reply frames (1ms device turnaround)
+    Fixed 1s timeout, no retries vs adaptive timeout with retries: cost of a lost frame and pulls lost
+    """
+    def _run(self, adaptive, n=300):
+        emu = PtyDeviceEmulator(StepperEmulator(), reply_delay=0.001, seed=1)
+        emu.start()
+        t = transport.Transport(emu.port)
+        h = LatencyHistogram()
+        replies = []
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            t.configure_timeouts(adaptive=adaptive, max_retries=transport.RPC_MAX_RETRIES if adaptive else 0)
+            payload = arr.array('B', [3])
+            for i in range(transport.RPC_TIMEOUT_WARMUP):  # Reply times measured, as during startup
+                t.do_pull_rpc_sync(payload, lambda r: None)
+            emu.drop_rate = 0.02
+            for i in range(n):
+                ts = time.perf_counter()
+                t.do_pull_rpc_sync(payload, lambda r: replies.append(r[0]))
+                h.record(time.perf_counter() - ts)
+            return h.snapshot(), n - len(replies), t.status['sync'].copy()
+        finally:
+            t.stop()
+            emu.stop()
+
+    def test_lost_frames(self):
+        fixed, fixed_lost, fixed_status = self._run(False)
+        adaptive, adaptive_lost, adaptive_status = self._run(True)
+        print('--------- Status pull with 2% of reply frames lost (ms) -----------')
+        for name, s, lost in (('fixed', fixed, fixed_lost), ('adaptive', adaptive, adaptive_lost)):
+            print('%-9s p50: %.2f  p99: %.2f  max: %.2f  total (s): %.2f  pulls lost: %d' %
+                  (name, s['p50'] * 1e3, s['p99'] * 1e3, s['max'] * 1e3, s['mean'] * s['n'], lost))
+        print('Adaptive timeouts: %d  retries: %d  recovered: %d' %
+              (adaptive_status['timeouts'], adaptive_status['retries'], adaptive_status['recovered']))
+        self.assertGreater(fixed_lost, 0)
+        self.assertGreater(fixed['max'], 0.9)
+        self.assertLess(adaptive['max'], 0.5)
+        self.assertLess(adaptive_lost, fixed_lost)
@@ -0,0 +1,64 @@
+import unittest
+import threading
+import time
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.transport_stats import LatencyHistogram
+from stretch_body.device_emulator import *
+
+
+class TestTransportWorkerRates(unittest.TestCase):
+    """
+    Command latency on a port that is also polled for status and read for traces (1024 byte pulls) by other threads
+    Lock mode (callers contend for Transport.lock) vs worker mode (priority queue, commands first)
+    """
+    def _run(self, use_worker, n_commands=200):
+        emu = PtyDeviceEmulator(StepperEmulator(), reply_delay=0.0002)
+        emu.start()
+        t = transport.Transport(emu.port)
+        done = threading.Event()
+        sink = lambda r: None
+
+        def poll(rpc_id, priority):
+            payload = arr.array('B', [rpc_id])
+            while not done.is_set():
+                t.do_pull_rpc_sync(payload, sink, priority=priority)
+
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            if use_worker:
+                t.start_worker()
+            threads = [threading.Thread(target=poll, args=(3, transport.RPC_PRIORITY_STATUS)),
+                       threading.Thread(target=poll, args=(31, transport.RPC_PRIORITY_TRACE))]  # Load test pull, 1024 bytes
+            for th in threads:
+                th.start()
+            h = LatencyHistogram()
+            payload = arr.array('B', [25])  # Reset trajectory
+            for i in range(n_commands):
+                ts = time.perf_counter()
+                t.do_push_rpc_sync(payload, sink)
+                h.record(time.perf_counter() - ts)
+                time.sleep(0.001)
+            done.set()
+            for th in threads:
+                th.join()
+            self.assertEqual(t.status['sync']['read_error'], 0)
+            return h.snapshot(), t.get_stats()
+        finally:
+            done.set()
+            t.stop()
+            emu.stop()
+
+    def test_command_latency_under_load(self):
+        lock, lock_stats = self._run(False)
+        worker, worker_stats = self._run(True)
+        print('--------- Command latency with status + trace load (ms) -----------')
+        for name, s in (('lock', lock), ('worker', worker)):
+            print('%-8s p50: %.2f  p99: %.2f  max: %.2f' % (name, s['p50'] * 1e3, s['p99'] * 1e3, s['max'] * 1e3))
+        w = worker_stats['worker']
+        print('Worker queue wait p99 (ms) command: %.2f  status: %.2f  trace: %.2f  max depth: %d' %
+              (w['wait']['command']['p99'] * 1e3, w['wait']['status']['p99'] * 1e3, w['wait']['trace']['p99'] * 1e3,
+               w['max_queue_depth']))
+        self.assertEqual(w['errors'], 0)
+        self.assertEqual(w['wait']['command']['n'], 200)
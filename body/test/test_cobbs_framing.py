@@ -0,0 +1,69 @@
+import unittest
+import random
+import array as arr
+import stretch_body.cobbs_framing as cobbs_framing
+
+
+class TestCobbsFraming(unittest.TestCase):
+
+    def test_crc_modbus(self):
+        f = cobbs_framing.CobbsFraming()
+        self.assertEqual(f._calc_crc(b'123456789', 9), 0x4B37)
+
+    def test_encoded_frame_has_no_zeros(self):
+        f = cobbs_framing.CobbsFraming()
+        data = arr.array('B', [0, 1, 0, 0, 2, 3, 0] + [7] * 300)
+        e = f.encode_data(data)
+        self.assertEqual(e[-1], 0)
+        self.assertNotIn(0, e[:-1])
+        self.assertEqual(len(data), 307) #Caller buffer not modified
+
+    def test_round_trip(self):
+        f = cobbs_framing.CobbsFraming()
+        random.seed(1)
+        for sz in [1, 2, 63, 253, 254, 255, 508, 1024]:
+            for zero_prob in [0.0, 0.1, 0.5, 1.0]:
+                data = arr.array('B', [0 if random.random() < zero_prob else random.randint(1, 255) for _ in range(sz)])
+                e = f.encode_data(data)
+                crc_ok, nr, d = f.decode_data(e[:-1])
+                self.assertTrue(crc_ok)
+                self.assertEqual(nr, sz)
+                self.assertEqual(bytes(d), bytes(data))
+
+    def test_bad_crc(self):
+        f = cobbs_framing.CobbsFraming()
+        e = f.encode_data(arr.array('B', [1, 2, 3, 4]))
+        e[2] = e[2] ^ 0x01
+        crc_ok, nr, d = f.decode_data(e[:-1])
+        self.assertFalse(crc_ok)
+
+    def test_truncated_frame(self):
+        f = cobbs_framing.CobbsFraming()
+        crc_ok, nr, d = f.decode_data(bytes([10, 1, 2]))
+        self.assertFalse(crc_ok)
+        self.assertEqual(nr, 0)
+
+    def test_encode_decode_into(self):
+        f = cobbs_framing.CobbsFraming()
+        random.seed(2)
+        src = bytearray(600)
+        dst = bytearray(700)
+        out = bytearray(700)
+        for sz in [1, 58, 253, 254, 255, 508]:
+            for zero_prob in [0.0, 0.3, 1.0]:
+                data = bytes([0 if random.random() < zero_prob else random.randint(1, 255) for _ in range(sz)])
+                src[:sz] = data
+                n = f.encode_into(src, sz, dst)
+                self.assertEqual(bytes(dst[:n]), bytes(f.encode_data(arr.array('B', data))))
+                crc_ok, nr = f.decode_into(dst, n - 1, out)
+                self.assertTrue(crc_ok)
+                self.assertEqual(bytes(out[:nr]), data)
+        self.assertEqual(len(dst), 700) #Buffers are never resized
+        self.assertEqual(len(out), 700)
+
+    def test_decode_into_overrun(self):
+        f = cobbs_framing.CobbsFraming()
+        e = f.encode_data(arr.array('B', [1] * 50))
+        crc_ok, nr = f.decode_into(e, len(e) - 1, bytearray(10))
+        self.assertFalse(crc_ok)
+        self.assertEqual(nr, 0)
@@ -82,3 +82,102 @@ class TestDevice(unittest.TestCase):
         time.sleep(0.1)
         self.assertFalse(d.pulling_status)
         d.stop()
+
+    def test_protocol_class(self):
+        """Test that a device switches to a cached class of its protocol, and back
+        """
+        class ToyBase(stretch_body.device.Device):
+            def version(self):
+                return 'base'
+
+            def name_p(self):
+                return 'base'
+
+        class Toy_Protocol_P0(ToyBase):
+            def version(self):
+                return 'p0'
+
+            def name_p(self):
+                return 'p0'
+
+        class Toy_Protocol_P1(ToyBase):
+            def version(self):
+                return 'p1'
+
+        class Toy(ToyBase):
+            supported_protocols = {'p0': (Toy_Protocol_P0,), 'p1': (Toy_Protocol_P1, Toy_Protocol_P0)}
+
+        a = Toy(req_params=False)
+        b = Toy(req_params=False)
+        self.assertEqual(a.version(), 'base')
+        a.set_protocol_class(Toy.supported_protocols['p1'])
+        b.set_protocol_class(Toy.supported_protocols['p1'])
+        self.assertIs(type(a), type(b))
+        self.assertIsInstance(a, Toy)
+        self.assertEqual(type(a).__name__, 'Toy')
+        self.assertEqual((a.version(), a.name_p()), ('p1', 'p0'))
+        a.set_protocol_class(Toy.supported_protocols['p0'])
+        self.assertEqual((a.version(), b.version()), ('p0', 'p1'))
+        self.assertEqual(type(a).__mro__[1], Toy)
+
+    def test_wacc_args(self):
+        """Test that Wacc keeps its (usb, ext_status_cb, ext_command_cb) argument order
+        """
+        import stretch_body.wacc
+        status_cb = lambda *args: None
+        command_cb = lambda *args: None
+        w = stretch_body.wacc.Wacc('/dev/hello-wacc-test', status_cb)
+        self.assertEqual(w.transport.port_name, '/dev/hello-wacc-test')
+        self.assertIs(w.ext_status_cb, status_cb)
+        self.assertIsNone(w.ext_command_cb)
+        w = stretch_body.wacc.Wacc(ext_command_cb=command_cb)
+        self.assertEqual(w.transport.port_name, w.params['usb_name'])
+        self.assertIs(w.ext_command_cb, command_cb)
+        self.assertIsNone(w.ext_status_cb)
+
+
+    def test_wait_for_status(self):
+        """Test that a wait wakes on the status updates of another thread without pulling,
+        and pulls the status itself when nothing updates it
+        """
+        print('\nUnittest: test_wait_for_status')
+        import threading
+
+        class CountingDevice(stretch_body.device.Device):
+            def __init__(self):
+                stretch_body.device.Device.__init__(self, req_params=False)
+                self.status = {'moving': True, 'n': 0}
+                self.n_pulls = 0
+
+            def pull_status(self):
+                self.n_pulls += 1
+                self.update()
+
+            def update(self):
+                self.status['n'] += 1
+                self.status['moving'] = self.status['n'] < 5
+                self.notify_status()
+
+        # Fed by a 100Hz status thread
+        d = CountingDevice()
+        shutdown = threading.Event()
+
+        def feed():
+            while not shutdown.wait(0.01):
+                d.update()
+
+        t = threading.Thread(target=feed)
+        t.start()
+        ts = time.time()
+        self.assertTrue(d.wait_for_status(lambda: not d.status['moving'], timeout=2.0, period=0.5))
+        dt = time.time() - ts
+        shutdown.set()
+        t.join()
+        self.assertEqual(d.n_pulls, 0)
+        self.assertLess(dt, 0.3)
+
+        # No status thread, falls back to pulling every period
+        d = CountingDevice()
+        self.assertTrue(d.wait_for_status(lambda: not d.status['moving'], timeout=2.0, period=0.01))
+        self.assertEqual(d.n_pulls, 5)
+        self.assertFalse(d.wait_for_status(lambda: False, timeout=0.05, period=0.01))
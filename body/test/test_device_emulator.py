@@ -0,0 +1,134 @@
+import unittest
+import struct
+import asyncio
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.device_emulator import *
+
+
+class TestDeviceEmulator(unittest.TestCase):
+
+    def _start(self, device, **kwargs):
+        emu = PtyDeviceEmulator(device, **kwargs)
+        emu.start()
+        t = transport.Transport(emu.port)
+        self.assertTrue(t.startup())
+        self.addCleanup(emu.stop)
+        self.addCleanup(t.stop)
+        return emu, t
+
+    def _pull(self, t, payload):
+        replies = []
+        t.do_pull_rpc_sync(arr.array('B', payload), lambda r: replies.append(bytes(r)))
+        return replies[0] if replies else None
+
+    def test_board_info_v0_then_v1(self):
+        emu, t = self._start(StepperEmulator(stepper_type=4))
+        reply = self._pull(t, [17])  # Transport starts in V0, as a Stepper does on startup
+        self.assertEqual(reply[0], 18)
+        self.assertEqual(reply[1:21].rstrip(b'\x00'), b'Stepper.1')
+        self.assertEqual(reply[21:41].rstrip(b'\x00').decode(), EMULATOR_STEPPER_FIRMWARE)
+        self.assertEqual(reply[41], 4)
+        t.configure_version(EMULATOR_STEPPER_FIRMWARE)
+        self.assertEqual(t.version, transport.RPC_TRANSPORT_VERSION_1)
+        reply = self._pull(t, [3])
+        self.assertEqual(reply[0], 4)
+        self.assertEqual(len(reply) - 1, StepperEmulator.status_fmt.size)
+        self.assertEqual(t.status['sync']['read_error'], 0)
+
+    def test_stepper_command_reflected_in_status(self):
+        emu, t = self._start(StepperEmulator())
+        t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        payload = t.get_empty_payload()
+        payload[0] = 1
+        StepperEmulator.command_fmt.pack_into(payload, 1, 3, 1.5, 0, 0, 1.0, 0, 0, 0, 0)
+        replies = []
+        t.do_push_rpc_batch_sync([(payload[:32], lambda r: replies.append(bytes(r)))])
+        self.assertEqual(replies, [bytes([2]) + struct.pack('<H', 1)])  # RPC_REPLY_COMMAND, ctrl_cycle_cnt
+        s = StepperEmulator.status_fmt.unpack(self._pull(t, [3])[1:])
+        self.assertEqual(s[0], 3)
+        self.assertEqual(s[2], 1.5)
+
+    def test_load_test(self):
+        for version in (transport.RPC_TRANSPORT_VERSION_0, transport.RPC_TRANSPORT_VERSION_1):
+            for device, push_id, pull_id in [(StepperEmulator(), 7, 31), (PimuEmulator(), 17, 15), (WaccEmulator(), 11, 13)]:
+                emu, t = self._start(device)
+                t.set_version(version)
+                data = bytes([(i * 7) % 256 for i in range(1024)])
+                payload = t.get_empty_payload()
+                payload[0] = push_id
+                payload[1:] = data
+                replies = []
+                t.do_push_rpc_sync(payload, lambda r: replies.append(bytes(r)))
+                self.assertEqual(replies, [bytes([push_id + 1])])
+                reply = self._pull(t, [pull_id])
+                self.assertEqual(reply, bytes([pull_id + 1]) + data[1:] + data[:1])
+
+    def test_pimu_and_wacc_status(self):
+        emu, t = self._start(PimuEmulator())
+        t.configure_version(EMULATOR_PIMU_FIRMWARE)
+        reply = self._pull(t, [3])
+        self.assertEqual(reply[0], 4)
+        self.assertEqual(len(reply) - 1, PimuEmulator.imu_fmt.size + PimuEmulator.status_fmt.size)
+        self.assertEqual(struct.unpack_from('<Bh', self._pull(t, [9]))[1], 1)  # Motor sync count
+        emu, t = self._start(WaccEmulator())
+        t.configure_version(EMULATOR_WACC_FIRMWARE)
+        reply = self._pull(t, [7])
+        self.assertEqual(reply[1:21].rstrip(b'\x00'), b'Wacc.1')
+        reply = self._pull(t, [3])
+        self.assertEqual(len(reply) - 1, WaccEmulator.status_fmt.size)
+
+    def test_async(self):
+        emu, t = self._start(PimuEmulator(), reply_delay=0.001)
+        t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        replies = []
+
+        async def pulls():
+            for i in range(10):
+                await t.do_pull_rpc_async(arr.array('B', [3]), lambda r: replies.append(bytes(r)))
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(pulls())
+        loop.close()
+        self.assertEqual(len(replies), 10)
+        self.assertEqual(t.status['async']['read_error'], 0)
+
+    def test_unknown_rpc(self):
+        emu, t = self._start(WaccEmulator())
+        t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        self.assertEqual(self._pull(t, [99]), bytes([0]))
+        self.assertEqual(emu.device.status['unknown_rpc'], 1)
+
+    def test_error_injection(self):
+        emu, t = self._start(StepperEmulator(), corrupt_rate=1.0)
+        t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        t.configure_timeouts(max_retries=0)  # One attempt per RPC
+        self.assertIsNone(self._pull(t, [3]))
+        self.assertEqual(t.status['sync']['read_error'], 1)
+        self.assertEqual(emu.status['corrupted'], 1)
+        emu.corrupt_rate = 0.0
+        self.assertEqual(self._pull(t, [3])[0], 4)  # Host and device recover on the next RPC
+
+        emu, t = self._start(StepperEmulator(), drop_rate=1.0)
+        t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        t.configure_timeouts(max_retries=0)
+        t.sync_handler.timeout = 0.05
+        self.assertIsNone(self._pull(t, [3]))
+        self.assertEqual(t.status['sync']['read_error'], 1)
+        self.assertEqual(emu.status['dropped'], 1)
+        emu.drop_rate = 0.0
+        self.assertEqual(self._pull(t, [3])[0], 4)
+
+    def test_error_injection_rate(self):
+        emu, t = self._start(PimuEmulator(), corrupt_rate=0.1, seed=3)
+        t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        t.configure_timeouts(max_retries=0)
+        n_ok = 0
+        for i in range(200):
+            reply = self._pull(t, [3])
+            if reply is not None:
+                self.assertEqual(len(reply) - 1, PimuEmulator.imu_fmt.size + PimuEmulator.status_fmt.size)
+                n_ok += 1
+        self.assertEqual(t.status['sync']['read_error'], 200 - n_ok)
+        self.assertGreater(emu.status['corrupted'], 0)
+        self.assertGreater(n_ok, 100)
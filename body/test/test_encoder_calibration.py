@@ -0,0 +1,74 @@
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+import numpy as np
+from stretch_body.encoder_calibration import *
+
+
+def legacy_parse(e):
+    """
+    read_encoder_calibration_from_flash before the vectorized parse
+    """
+    enc_calib = []
+    while len(e):
+        ff = e.find(',')
+        if ff != -1:
+            enc_calib.append(float(e[:ff]))
+            e = e[ff + 2:]
+        else:
+            enc_calib.append(float(e))
+            e = []
+    return enc_calib
+
+
+def menu_dump(data):
+    return ', '.join(['%f' % x for x in data]).encode('utf-8')
+
+
+class TestEncoderCalibration(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = np.cumsum(rng.uniform(0.0, 2 * 0.0003835, ENCODER_CALIBRATION_SIZE))  # Monotonic, ~2pi over the table
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_parse_menu_dump(self):
+        s = menu_dump(self.data)
+        parsed = parse_menu_dump(s)
+        self.assertEqual(len(parsed), ENCODER_CALIBRATION_SIZE)
+        self.assertEqual(parsed.tolist(), legacy_parse(s.decode('utf-8')))
+        self.assertEqual(parse_menu_dump('1.5, -2.25, 3e-4').tolist(), [1.5, -2.25, 3e-4])
+
+    def test_to_table(self):
+        t = to_table(self.data.tolist())
+        self.assertEqual(t.dtype, np.dtype('<f4'))
+        self.assertTrue(t.flags['C_CONTIGUOUS'])
+        with self.assertRaises(ValueError):
+            to_table(self.data[:100])
+
+    def test_pages_match_rpc_packing(self):
+        pages = list(calibration_pages(self.data))
+        self.assertEqual(len(pages), 256)
+        p, page = pages[3]
+        self.assertEqual(p, 3)
+        self.assertEqual(page, struct.pack('<64f', *self.data[3 * 64:4 * 64]))  # As pack_float_t wrote each float
+        self.assertEqual(calibration_checksum(self.data), zlib.crc32(b''.join([pg for i, pg in pages])))
+
+    def test_save_load(self):
+        fn = os.path.join(self.dir, 'hello-motor-lift_1234.npy')
+        crc = save_calibration(fn, self.data)
+        self.assertEqual(crc, calibration_checksum(self.data))
+        t = load_calibration(fn)
+        self.assertIsInstance(t, np.memmap)
+        self.assertFalse(t.flags['WRITEABLE'])
+        self.assertTrue(np.array_equal(t, self.data.astype(np.float32)))
+        self.assertEqual(calibration_checksum(t), crc)
+        self.assertNotIsInstance(load_calibration(fn, mmap=False), np.memmap)
+        self.assertFalse(os.path.exists(fn + '.tmp'))
+        np.save(fn, np.zeros(10))
+        with self.assertRaises(ValueError):
+            load_calibration(fn)
@@ -0,0 +1,177 @@
+import unittest
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+import time
+from stretch_body.status_snapshot import StatusSnapshots
+from stretch_body.robot_daemon import *
+
+
+class DaemonRobot():
+    """
+    The parts of Robot used by RobotDaemon, with a status thread publishing a counter
+    """
+    def __init__(self):
+        self.snapshots = StatusSnapshots()
+        self.status = {'lift': {'pos': 0.0, 'count': 0}}
+        self.x_des = None
+        self.shutdown_flag = threading.Event()
+        self.thread = threading.Thread(target=self._status_loop, daemon=True)
+
+    def startup(self):
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.shutdown_flag.set()
+        self.thread.join()
+
+    def _status_loop(self):
+        while not self.shutdown_flag.wait(0.005):
+            self.status['lift']['count'] += 1
+            self.status['lift']['pos'] = -self.status['lift']['count']
+            self.snapshots.publish(self.status)
+
+    def get_status_snapshot(self):
+        return self.snapshots.get()
+
+    def move_to(self, x_m):
+        self.x_des = x_m
+        return x_m * 2
+
+    def fail(self):
+        raise ValueError('bad move')
+
+    def wait_command(self, timeout=15.0):
+        return self.shutdown_flag.wait(timeout)
+
+
+def read_counts(name, n, q):
+    """
+    Another process: read n snapshots from the segment, report whether each was whole
+    """
+    seg = StatusSegment(name)
+    ok = True
+    last = 0
+    for i in range(n):
+        s = seg.read()
+        ok = ok and s.status['lift']['pos'] == -s.status['lift']['count'] and s.seq >= last
+        last = s.seq
+    seg.close()
+    q.put((ok, last))
+
+
+class TestRobotDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.shm_name = 'test_status_%d' % os.getpid()
+        self.address = os.path.join(self.dir, 'robot_daemon.sock')
+
+    def test_segment(self):
+        w = StatusSegment(self.shm_name, size=4096, create=True)
+        try:
+            r = StatusSegment(self.shm_name)
+            self.assertIsNone(r.read())
+            s = StatusSnapshots()
+            w.write(s.publish({'lift': {'pos': 0.5}}))
+            snap = r.read()
+            self.assertEqual((snap.seq, snap.status), (1, {'lift': {'pos': 0.5}}))
+            self.assertEqual(r.seq(), 2)
+            struct.pack_into('<Q', w.buf, 0, 3)  # A write in progress: never read
+            with self.assertRaises(TimeoutError):
+                r.read(timeout=0.01)
+            self.assertGreater(r.status['retries'], 0)
+            struct.pack_into('<Q', w.buf, 0, 2)
+            with self.assertRaises(ValueError):
+                w.write(s.publish({'big': {'x': bytes(8192)}}))
+            r.close()
+        finally:
+            w.close()
+
+    def test_proxy_waits_for_first_status(self):
+        w = StatusSegment(self.shm_name, size=4096, create=True)
+        try:
+            p = RobotProxy(address=self.address, shm_name=self.shm_name)
+            p.segment = StatusSegment(self.shm_name)  # Status only, no daemon to connect to
+            with self.assertRaises(TimeoutError):
+                p.get_status(timeout=0.02)
+            s = StatusSnapshots()
+            threading.Timer(0.05, lambda: w.write(s.publish({'lift': {'pos': 0.5}}))).start()
+            self.assertEqual(p.get_status(), {'lift': {'pos': 0.5}})
+            self.assertEqual(p.get_status_snapshot().seq, 1)
+            p.stop()
+        finally:
+            w.close()
+
+    def test_readers_in_other_processes(self):
+        robot = DaemonRobot()
+        d = RobotDaemon(robot, address=self.address, shm_name=self.shm_name, shm_size=65536)
+        self.assertTrue(d.startup())
+        try:
+            ctx = multiprocessing.get_context('spawn')
+            q = ctx.Queue()
+            procs = [ctx.Process(target=read_counts, args=(self.shm_name, 2000, q)) for i in range(2)]
+            [p.start() for p in procs]
+            results = [q.get(timeout=30) for p in procs]
+            [p.join() for p in procs]
+            self.assertTrue(all([ok for ok, last in results]))
+            self.assertTrue(all([last > 0 for ok, last in results]))
+        finally:
+            d.stop()
+        self.assertFalse(os.path.exists(self.address))
+
+    def test_proxy(self):
+        robot = DaemonRobot()
+        d = RobotDaemon(robot, address=self.address, shm_name=self.shm_name, shm_size=65536)
+        self.assertTrue(d.startup())
+        try:
+            self.assertEqual(os.stat(self.address).st_mode & 0o777, 0o600)
+            p = RobotProxy(address=self.address, shm_name=self.shm_name)
+            self.assertTrue(p.startup())
+            self.assertEqual(p.move_to(0.25), 0.5)
+            self.assertEqual(robot.x_des, 0.25)
+            self.assertEqual(p.get_attribute('x_des'), 0.25)
+            self.assertEqual(p.status.get('head', 5), 5)  # A dict method, called in the daemon
+            with self.assertRaises(TypeError):
+                p.status.keys()  # dict_keys can not be sent back
+            with self.assertRaises(ValueError):
+                p.fail()
+            with self.assertRaises(AttributeError):
+                p.get_attribute('shutdown_flag._flag')
+            with self.assertRaises(AttributeError):
+                p.no_such_method()
+            time.sleep(0.05)
+            s0 = p.get_status_snapshot()
+            time.sleep(0.05)
+            s1 = p.get_status_snapshot()
+            self.assertGreater(s1.seq, s0.seq)
+            status = p.get_status()
+            self.assertEqual(status['lift']['pos'], -status['lift']['count'])
+            p.stop()
+            self.assertEqual(d.status['clients'], 1)
+        finally:
+            d.stop()
+
+    def test_blocking_call_does_not_block_other_clients(self):
+        robot = DaemonRobot()
+        d = RobotDaemon(robot, address=self.address, shm_name=self.shm_name, shm_size=65536)
+        self.assertTrue(d.startup())
+        try:
+            p0 = RobotProxy(address=self.address, shm_name=self.shm_name)
+            p1 = RobotProxy(address=self.address, shm_name=self.shm_name)
+            self.assertTrue(p0.startup() and p1.startup())
+            waiter = threading.Thread(target=p0.wait_command, args=(1.0,))
+            waiter.start()
+            time.sleep(0.05)
+            ts = time.time()
+            self.assertEqual(p1.move_to(0.1), 0.2)
+            self.assertLess(time.time() - ts, 0.5)
+            self.assertTrue(waiter.is_alive())
+            waiter.join()
+            p0.stop()
+            p1.stop()
+        finally:
+            d.stop()
@@ -0,0 +1,164 @@
+import unittest
+import array as arr
+from stretch_body.transport import *
+from stretch_body.rpc_schema import *
+from stretch_body.device_emulator import StepperEmulator, PimuEmulator, WaccEmulator
+
+
+class SchemaTimestamp():
+    def set(self, ts):
+        return ts / 1e6
+
+
+class SchemaDevice():
+    """
+    Owner of the convert methods of the schemas, in place of a Stepper / Pimu / Wacc
+    """
+    def __init__(self):
+        self.timestamp = SchemaTimestamp()
+
+    def get_voltage(self, raw):
+        return raw * 2
+
+    def get_current(self, raw):
+        return raw * 3
+
+    def get_temp(self, raw):
+        return raw * 4
+
+    def get_current_charge(self, raw):
+        return raw * 5
+
+    def get_tilt_type(self, raw):
+        return {1: 'Left Tilt'}.get(raw, None)
+
+
+def unpack_stepper_status_p4(d, s, unpack_to):
+    """
+    Field by field decode of the Stepper P4 status, as done prior to the schemas
+    """
+    sidx = 0
+    unpack_to['mode'] = unpack_uint8_t(s[sidx:]);sidx += 1
+    unpack_to['effort_ticks'] = unpack_float_t(s[sidx:]);sidx += 4
+    unpack_to['pos'] = unpack_double_t(s[sidx:]);sidx += 8
+    unpack_to['vel'] = unpack_float_t(s[sidx:]);sidx += 4
+    unpack_to['err'] = unpack_float_t(s[sidx:]);sidx += 4
+    unpack_to['diag'] = unpack_uint32_t(s[sidx:]);sidx += 4
+    unpack_to['timestamp'] = d.timestamp.set(unpack_uint64_t(s[sidx:]));sidx += 8
+    unpack_to['debug'] = unpack_float_t(s[sidx:]);sidx += 4
+    unpack_to['guarded_event'] = unpack_uint32_t(s[sidx:]);sidx += 4
+    unpack_to['waypoint_traj']['setpoint'] = unpack_float_t(s[sidx:]);sidx += 4
+    unpack_to['waypoint_traj']['segment_id'] = unpack_uint16_t(s[sidx:]);sidx += 2
+    unpack_to['voltage'] = d.get_voltage(unpack_float_t(s[sidx:]));sidx += 4
+    return sidx
+
+
+class TestRPCSchema(unittest.TestCase):
+
+    def test_sizes_match_firmware(self):
+        self.assertEqual(STEPPER_STATUS_P4.size, StepperEmulator.status_fmt.size)
+        self.assertEqual(STEPPER_STATUS_P0.size, STEPPER_STATUS_P1.size - 4 - 6)
+        self.assertEqual(STEPPER_COMMAND.size, StepperEmulator.command_fmt.size)
+        self.assertEqual(IMU_STATUS_P1.size, PimuEmulator.imu_fmt.size)
+        self.assertEqual(PIMU_STATUS_P6.size, PimuEmulator.status_fmt.size)
+        self.assertEqual(WACC_STATUS_P2.size, WaccEmulator.status_fmt.size)
+        self.assertEqual(WACC_COMMAND.size, WaccEmulator.command_fmt.size)
+
+    def test_stepper_matches_field_decode(self):
+        e = StepperEmulator()
+        e.pos = 1.25
+        e.diag = 4096 + 2
+        e.setpoint = 0.5
+        e.segment_id = 3
+        e.voltage_raw = 600.0
+        s = arr.array('B', e.pack_status())
+        d = SchemaDevice()
+        legacy = {'waypoint_traj': {}}
+        schema = {'waypoint_traj': {}}
+        n = unpack_stepper_status_p4(d, s, legacy)
+        STEPPER_STATUS_P4.unpack_into(s, 0, schema, d)
+        self.assertEqual(n, STEPPER_STATUS_P4.size)
+        self.assertEqual(schema, legacy)
+        self.assertEqual(schema['voltage'], 1200.0)
+        self.assertEqual(schema['waypoint_traj'], {'setpoint': 0.5, 'segment_id': 3})
+
+    def test_pimu_nested_and_skipped(self):
+        e = PimuEmulator()
+        e.cliff_range = [1.0, 2.0, 3.0, 4.0]
+        s = e.pack_status()
+        d = SchemaDevice()
+        status = {'cliff_range': [0, 0, 0, 0]}
+        v = PIMU_STATUS_P6.unpack_into(s, IMU_STATUS_P1.size, status, d)
+        self.assertEqual(len(v), len(PIMU_STATUS_P6.fields))
+        self.assertEqual(status['cliff_range'], [1.0, 2.0, 3.0, 4.0])
+        self.assertAlmostEqual(status['voltage'], e.voltage_raw * 2, places=3)
+        self.assertIsNone(status['over_tilt_type'])
+        skip = RPCSchema([(None, 'float_t'), ('x', 'uint8_t')])
+        status = {}
+        skip.unpack_into(skip.struct.pack(1.0, 7), 0, status)
+        self.assertEqual(status, {'x': 7})
+
+    def test_status_flags(self):
+        flags = StatusFlags([('a', 1), ('b', 2), ('c', 1024)])
+        status = {}
+        flags.expand(1025, status)
+        self.assertEqual(status, {'a': True, 'b': False, 'c': True})
+
+    def test_pack_into(self):
+        command = {'d2': 1, 'd3': 0, 'trigger': 65536 + 8}
+        s = arr.array('B', [0] * 16)
+        self.assertEqual(WACC_COMMAND.pack_into(s, 3, command), 3 + WACC_COMMAND.size)
+        self.assertEqual(WaccEmulator.command_fmt.unpack_from(s, 3), (1, 0, 65536 + 8))
+        s2 = arr.array('B', [0] * 16)
+        sidx = 3
+        pack_uint8_t(s2, sidx, 1);sidx += 1
+        pack_uint8_t(s2, sidx, 0);sidx += 1
+        pack_uint32_t(s2, sidx, 65536 + 8)
+        self.assertEqual(s, s2)
+
+    def test_record_dict_view(self):
+        c = StepperCommand(x_des=0.5)
+        self.assertEqual(list(c.keys())[:3], ['mode', 'x_des', 'v_des'])
+        self.assertEqual(c['x_des'], 0.5)
+        c['v_des'] = 2.0
+        self.assertEqual(c.v_des, 2.0)
+        self.assertIn('stiffness', c)
+        self.assertNotIn('copy', c)
+        self.assertEqual(c.get('copy', 7), 7)
+        with self.assertRaises(KeyError):
+            c['copy']
+        with self.assertRaises(KeyError):
+            c['bogus'] = 1
+        with self.assertRaises(TypeError):
+            del c['mode']
+        with self.assertRaises(AttributeError):
+            c.bogus = 1  # No __dict__
+        c2 = c.copy()
+        c2.mode = 3
+        self.assertEqual((c.mode, c2.mode), (0, 3))
+        self.assertEqual(len(c.to_dict()), len(StepperCommand.FIELDS))
+        s1, s2 = StepperStatus(), StepperStatus()
+        self.assertIsNot(s1.waypoint_traj, s2.waypoint_traj)
+        self.assertIs(s1.copy().waypoint_traj, s1.waypoint_traj)
+
+    def test_record_matches_dict(self):
+        e = StepperEmulator()
+        e.pos = -0.75
+        e.diag = 1 + 4 + 16384
+        e.segment_id = 2
+        s = arr.array('B', e.pack_status())
+        d = SchemaDevice()
+        flags = StatusFlags([('pos_calibrated', 1), ('near_pos_setpoint', 4), ('in_sync_mode', 16384)])
+        status = StepperStatus().to_dict()
+        record = StepperStatus()
+        for unpack_to in (status, record):
+            STEPPER_STATUS_P4.unpack_into(s, 0, unpack_to, d)
+            flags.expand(unpack_to['diag'], unpack_to)
+        self.assertEqual(record.to_dict(), status)
+        self.assertIs(record.in_sync_mode, True)
+        command = {'mode': 2, 'x_des': 0.25, 'v_des': 1.0, 'a_des': 2.0, 'stiffness': 0.5, 'i_feedforward': 0.1,
+                   'i_contact_pos': 1.5, 'i_contact_neg': -1.5, 'incr_trigger': 7}
+        s1 = arr.array('B', [0] * 64)
+        s2 = arr.array('B', [0] * 64)
+        self.assertEqual(STEPPER_COMMAND.pack_into(s1, 1, command), STEPPER_COMMAND.pack_into(s2, 1, StepperCommand(**command)))
+        self.assertEqual(s1, s2)
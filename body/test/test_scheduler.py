@@ -0,0 +1,109 @@
+import unittest
+import threading
+import time
+from stretch_body.scheduler import *
+
+
+class TestScheduler(unittest.TestCase):
+
+    def run_for(self, s, dt):
+        s.start()
+        time.sleep(dt)
+        s.stop()
+        self.assertFalse(s.is_alive())
+
+    def test_rates(self):
+        s = DeadlineScheduler()
+        runs = {'a': [], 'b': []}
+        s.add_task(PeriodicTask('a', lambda: runs['a'].append(time.monotonic()), 100.0))
+        s.add_task(PeriodicTask('b', lambda: runs['b'].append(time.monotonic()), 25.0, offset=0.01))
+        self.run_for(s, 0.5)
+        self.assertAlmostEqual(len(runs['a']), 50, delta=3)
+        self.assertAlmostEqual(len(runs['b']), 12, delta=1)
+        a = s.get_task('a')
+        self.assertEqual(a.status['runs'], len(runs['a']))
+        self.assertEqual(a.status['overruns'], 0)
+        self.assertLess(s.get_stats()['tasks']['a']['lateness']['p90'], 0.005)
+        # Releases are on absolute deadlines: no drift over the run
+        self.assertAlmostEqual(runs['a'][-1] - runs['a'][0], (len(runs['a']) - 1) * 0.01, delta=0.005)
+        self.assertGreater(runs['b'][0] - runs['a'][0], 0.008)  # Offset
+
+    def test_priority(self):
+        s = DeadlineScheduler()
+        order = []
+        for name, prio in (('low', 1), ('high', 10), ('mid', 5)):
+            s.add_task(PeriodicTask(name, lambda n=name: order.append(n), 10.0, priority=prio))
+        self.run_for(s, 0.05)
+        self.assertEqual(order[:3], ['high', 'mid', 'low'])
+
+    def test_overrun(self):
+        s = DeadlineScheduler()
+        t = s.add_task(PeriodicTask('slow', lambda: time.sleep(0.025), 100.0))  # 25ms of work every 10ms
+        self.run_for(s, 0.3)
+        self.assertEqual(t.status['overruns'], t.status['runs'])
+        self.assertGreaterEqual(t.status['skipped'], 2 * t.status['runs'] - 1)
+        self.assertGreater(t.status['max_execution_time_s'], 0.02)
+
+    def test_errors_and_add_while_running(self):
+        s = DeadlineScheduler()
+        runs = []
+        errors = []
+
+        def fail():
+            raise ValueError('bad step')
+
+        hook = threading.excepthook
+        threading.excepthook = errors.append
+        try:
+            f = s.add_task(PeriodicTask('fail', fail, 50.0))
+            s.start()
+            time.sleep(0.05)
+            s.add_task(PeriodicTask('late', lambda: runs.append(1), 50.0))
+            time.sleep(0.1)
+            s.remove_task('fail')
+            s.stop()
+        finally:
+            threading.excepthook = hook
+        self.assertEqual((f.status['runs'], f.status['errors'], len(errors)), (1, 1, 1))
+        self.assertIsNone(s.get_task('fail'))
+        self.assertGreater(len(runs), 4)  # The scheduler keeps running after a task raises
+
+    def test_task_stops_after_error(self):
+        """
+        A task that raises is stopped, its exception goes to threading.excepthook (as recorded by the Robot)
+        """
+        s = DeadlineScheduler('TestScheduler')
+        runs = []
+        errors = []
+
+        def fail():
+            runs.append(1)
+            raise ValueError('bad step')
+
+        hook = threading.excepthook
+        threading.excepthook = errors.append
+        try:
+            f = s.add_task(PeriodicTask('fail', fail, 100.0))
+            ok = s.add_task(PeriodicTask('ok', lambda: None, 100.0))
+            self.run_for(s, 0.2)
+        finally:
+            threading.excepthook = hook
+        self.assertEqual(len(runs), 1)
+        self.assertEqual((f.status['runs'], f.status['errors']), (1, 1))
+        self.assertTrue(f.get_stats()['stopped'])
+        self.assertEqual(len(errors), 1)
+        self.assertIs(errors[0].exc_type, ValueError)
+        self.assertEqual(str(errors[0].exc_value), 'bad step')
+        self.assertEqual(errors[0].thread.name, 'TestScheduler')
+        self.assertFalse(ok.stopped)
+        self.assertGreater(ok.status['runs'], 15)
+        self.assertLessEqual(s.status['wakeups'], s.status['runs'] + 2)  # No busy loop on the stopped task
+
+    def test_idle_wakeups(self):
+        """
+        The thread sleeps until the next release instead of polling
+        """
+        s = DeadlineScheduler()
+        s.add_task(PeriodicTask('a', lambda: None, 20.0))
+        self.run_for(s, 0.5)
+        self.assertLessEqual(s.status['wakeups'], s.status['runs'] + 2)
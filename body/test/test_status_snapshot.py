@@ -0,0 +1,145 @@
+import unittest
+import asyncio
+import pickle
+import threading
+import time
+from stretch_body.status_snapshot import *
+
+
+class TestStatusSnapshot(unittest.TestCase):
+
+    def test_copy_status(self):
+        d = {'pos': 1.0, 'motor': {'current': 0.5, 'flags': [1, 2]}, 'list': [{'a': 1}]}
+        c = copy_status(d)
+        self.assertEqual(c, d)
+        d['motor']['current'] = 2.0
+        d['motor']['flags'].append(3)
+        d['list'][0]['a'] = 2
+        self.assertEqual(c['motor']['current'], 0.5)
+        self.assertEqual(c['motor']['flags'], [1, 2])
+        self.assertEqual(c['list'][0]['a'], 1)
+
+    def test_copy_stepper_status(self):
+        """
+        The StepperStatus Records of the lift, arm and base motors are copied, not shared with the live status
+        """
+        from stretch_body.rpc_schema import StepperStatus
+        m = StepperStatus(pos=1.0, transport={'rate': 10})
+        s = StatusSnapshots()
+        snap = s.publish({'lift': {'pos': 0.1, 'motor': m}})
+        m.pos = 5.0
+        m.waypoint_traj['state'] = 'active'
+        m.transport['rate'] = 20
+        self.assertIsInstance(snap.status['lift']['motor'], FrozenStatus)  # A read only copy of the Record
+        self.assertEqual(snap.status['lift']['motor']['pos'], 1.0)
+        self.assertEqual(snap.status['lift']['motor']['waypoint_traj']['state'], 'idle')
+        self.assertEqual(snap.status['lift']['motor']['transport']['rate'], 10)
+
+    def test_reader_can_not_change_snapshots(self):
+        """
+        A reader changing the status it got must not reach the other readers or the later snapshots
+        """
+        s = StatusSnapshots()
+        s.publish({'arm': {'pos': 0.2, 'motor': {'pos': 1.0}, 'flags': [1, 2]}, 'lift': {'pos': 0.1}})
+        st = s.get().status
+        with self.assertRaises(TypeError):
+            st['arm']['pos'] = 99
+        with self.assertRaises(TypeError):
+            st['junk'] = 1
+        with self.assertRaises(TypeError):
+            st['arm']['motor'].update({'pos': 99})
+        with self.assertRaises(AttributeError):
+            st['arm']['flags'].append(3)
+        mine = copy_status(st)  # A modifiable copy
+        mine['arm']['pos'] = 99
+        mine['junk'] = 1
+        snap = s.publish({'lift': {'pos': 0.5}})
+        self.assertEqual(snap.status['arm']['pos'], 0.2)
+        self.assertNotIn('junk', snap.status)
+        self.assertEqual(snap.status['arm']['flags'], (1, 2))
+        self.assertEqual(pickle.loads(pickle.dumps(snap.status)), snap.status)  # As written by the RobotDaemon
+        self.assertIsInstance(pickle.loads(pickle.dumps(snap.status))['arm'], FrozenStatus)
+
+    def test_publish(self):
+        s = StatusSnapshots()
+        self.assertEqual(s.get().seq, 0)
+        lift = {'pos': 0.1}
+        arm = {'pos': 0.2}
+        s0 = s.publish({'lift': lift, 'arm': arm})
+        head = {'pan': 0.3}
+        s1 = s.publish({'head': head})
+        self.assertEqual((s0.seq, s1.seq), (1, 2))
+        self.assertIs(s.get(), s1)
+        self.assertEqual(s1.status, {'lift': {'pos': 0.1}, 'arm': {'pos': 0.2}, 'head': {'pan': 0.3}})
+        lift['pos'] = 0.5  # The live status changes, the published snapshots do not
+        self.assertEqual(s1.status['lift']['pos'], 0.1)
+        s2 = s.publish({'lift': lift})
+        self.assertEqual(s2.status['lift']['pos'], 0.5)
+        self.assertEqual(s1.status['lift']['pos'], 0.1)
+        self.assertIs(s2.status['head'], s1.status['head'])  # Devices not republished are shared
+
+    def test_wait(self):
+        s = StatusSnapshots()
+        self.assertIsNone(s.wait(0, timeout=0.01))
+        threading.Timer(0.02, lambda: s.publish({'lift': {'pos': 1.0}})).start()
+        snap = s.wait(0, timeout=1.0)
+        self.assertEqual(snap.seq, 1)
+        self.assertEqual(snap.status['lift']['pos'], 1.0)
+
+    def test_consistent_under_writers(self):
+        """
+        Two writer threads update their devices' status in place and publish; every snapshot read
+        must hold the values of a single update of each device
+        """
+        s = StatusSnapshots()
+        shutdown = threading.Event()
+        live = {'lift': {'a': 0, 'b': 0}, 'head': {'a': 0, 'b': 0}}
+
+        def writer(name):
+            i = 0
+            while not shutdown.is_set():
+                i += 1
+                live[name]['a'] = i
+                live[name]['b'] = -i
+                s.publish({name: live[name]})
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in live]
+        [t.start() for t in threads]
+        last = 0
+        ts = time.time()
+        while time.time() - ts < 0.2:
+            snap = s.get()
+            self.assertGreaterEqual(snap.seq, last)
+            last = snap.seq
+            for name in snap.status:
+                d = snap.status[name]
+                self.assertEqual(d['a'], -d['b'])
+        shutdown.set()
+        [t.join() for t in threads]
+        self.assertGreater(last, 10)
+
+    def test_wait_async(self):
+        s = StatusSnapshots()
+
+        async def run():
+            self.assertIsNone(await s.wait_async(0, timeout=0.01))
+            threading.Timer(0.02, lambda: s.publish({'lift': {'pos': 1.0}})).start()
+            snap = await s.wait_async(0, timeout=1.0)
+            self.assertEqual(snap.seq, 1)
+            self.assertIs(await s.wait_async(0, timeout=0.0), snap)  # Already newer, no wait
+            ticks = [0]
+
+            async def ticker():
+                while True:
+                    await asyncio.sleep(0.001)
+                    ticks[0] += 1
+
+            t = asyncio.ensure_future(ticker())
+            threading.Timer(0.05, lambda: s.publish({'lift': {'pos': 2.0}})).start()
+            snap = await s.wait_async(1, timeout=1.0)
+            t.cancel()
+            self.assertEqual(snap.status['lift']['pos'], 2.0)
+            self.assertGreater(ticks[0], 10)  # The loop kept running while waiting
+            self.assertEqual(s.async_waiters, [])
+
+        asyncio.run(run())
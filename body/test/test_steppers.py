@@ -93,6 +93,98 @@ class TestSteppers(unittest.TestCase):
 
         s.stop()
 
+    def test_command_dedupe(self):
+        """Verify that unchanged commands are only resent as a keep alive
+        """
+        s = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+        self.assertTrue(s.startup())
+        s.command_keep_alive = 0.5
+        stats = s.transport.stats
+        n = stats.suppressed
+        for i in range(10):
+            s.set_command(mode=s.MODE_VEL_TRAJ, v_des=0.0)
+            s.push_command()
+        self.assertEqual(stats.suppressed - n, 9)
+        time.sleep(0.6)
+        s.set_command(mode=s.MODE_VEL_TRAJ, v_des=0.0)
+        s.push_command()  # Keep alive
+        self.assertEqual(stats.suppressed - n, 9)
+        s.set_command(mode=s.MODE_VEL_TRAJ, v_des=0.01)
+        s.push_command()  # Changed
+        self.assertEqual(stats.suppressed - n, 9)
+        for i in range(3):
+            s.set_command(mode=s.MODE_POS_TRAJ_INCR, x_des=0.0)
+            s.push_command()  # Always sent
+        self.assertEqual(stats.suppressed - n, 9)
+        s.stop()
+
+    def test_command_resent_after_guarded_event(self):
+        """Verify an unchanged command is not suppressed while in, or on leaving, a guarded event
+        (against an emulated board)
+        """
+        import stretch_body.transport as transport
+        from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator
+        emu = PtyDeviceEmulator(StepperEmulator())
+        emu.start()
+        s = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+        s.transport = transport.Transport(emu.port)
+        self.assertTrue(s.transport.startup())
+        s.transport.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        s.board_info['protocol_version'] = 'p5'
+        s.set_protocol_class(s.supported_protocols['p5'])
+        s.hw_valid = True
+        s.command_keep_alive = 10.0
+        stats = s.transport.stats
+
+        def push():
+            n = stats.suppressed
+            s.set_command(mode=s.MODE_POS_TRAJ, x_des=0.1)
+            s.push_command()
+            return stats.suppressed == n  # Sent
+
+        self.assertTrue(push())
+        self.assertFalse(push())  # Unchanged
+        emu.device.diag |= s.DIAG_IN_GUARDED_EVENT
+        s.pull_status()
+        self.assertTrue(s.status['in_guarded_event'])
+        self.assertTrue(push())
+        self.assertTrue(push())  # Always sent while in the event
+        emu.device.diag &= ~s.DIAG_IN_GUARDED_EVENT
+        s.pull_status()
+        self.assertTrue(push())  # First one after the event
+        self.assertFalse(push())
+        emu.device.diag |= s.DIAG_RUNSTOP_ON
+        s.pull_status()
+        self.assertTrue(push())
+        s.transport.stop()
+        emu.stop()
+
+    def test_encoder_calibration_write_acks(self):
+        """Verify the flash record is only written once every page of the calibration is acked
+        (against an emulated board)
+        """
+        import stretch_body.transport as transport
+        from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator
+        from stretch_body.encoder_calibration import ENCODER_CALIBRATION_SIZE
+        emu = PtyDeviceEmulator(StepperEmulator(), seed=1)
+        emu.start()
+        s = stretch_body.stepper.Stepper('/dev/hello-motor-arm')
+        s.transport = transport.Transport(emu.port)
+        self.assertTrue(s.transport.startup())
+        s.transport.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        s.transport.sync_handler.timeout = 0.02
+        s.hw_valid = True
+        records = []
+        s.write_encoder_calibration_record = records.append
+        data = [0.001 * i for i in range(ENCODER_CALIBRATION_SIZE)]
+        self.assertTrue(s.write_encoder_calibration_to_flash(data))
+        self.assertEqual(len(records), 1)
+        emu.drop_rate = 0.05
+        self.assertFalse(s.write_encoder_calibration_to_flash(data))
+        self.assertEqual(len(records), 1)
+        s.transport.stop()
+        emu.stop()
+
     def test_stop_waypoint_trajectory_interface(self):
         """Verify that waypoint trajectories stop as expected
         """
@@ -0,0 +1,121 @@
+import unittest
+import io
+import os
+import struct
+import tempfile
+import stretch_body.transport as transport
+from stretch_body.rpc_schema import *
+from stretch_body.trace_reader import *
+from stretch_body.device_emulator import *
+
+
+class TestTraceReader(unittest.TestCase):
+
+    def _start(self, device):
+        emu = PtyDeviceEmulator(device)
+        emu.start()
+        t = transport.Transport(emu.port)
+        self.assertTrue(t.startup())
+        t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        self.addCleanup(emu.stop)
+        self.addCleanup(t.stop)
+        return emu, t
+
+    def _record_stepper(self, d, n):
+        """
+        n status entries, with a debug entry after every 10th and a print entry after every 25th
+        """
+        for i in range(n):
+            d.pos = 0.01 * i
+            d.record_trace()
+            if i % 10 == 0:
+                d.record_trace(d.TRACE_TYPE_DEBUG, struct.pack('<BBfff', i % 256, 1, i, 2.0 * i, 0.5))
+            if i % 25 == 0:
+                d.record_trace(d.TRACE_TYPE_PRINT, struct.pack('<Q', i) + pack_string('line %d' % i, 32) + struct.pack('<f', i))
+
+    def test_schema_dtype(self):
+        dt = schema_dtype(STEPPER_STATUS_P4)
+        self.assertEqual(dt.itemsize, STEPPER_STATUS_P4.size)
+        self.assertIn('waypoint_traj_segment_id', dt.names)
+        s = STEPPER_STATUS_P4.struct.pack(3, 1.5, 2.25, 0.5, 0.0, 7, 123456789, 0.0, 2, 0.75, 9, 600.0)
+        a = np.frombuffer(s, dt)
+        self.assertEqual((a['mode'][0], a['pos'][0], a['timestamp'][0], a['waypoint_traj_segment_id'][0]),
+                         (3, 2.25, 123456789, 9))
+        dt = schema_dtype(IMU_STATUS_P1.extend(PIMU_STATUS_P6.fields))
+        self.assertEqual(dt.itemsize, PimuEmulator.imu_fmt.size + PimuEmulator.status_fmt.size)
+
+    def test_read_stepper_trace(self):
+        emu, t = self._start(StepperEmulator())
+        self._record_stepper(emu.device, 300)
+        r = FirmwareTraceReader(t, 27, STEPPER_STATUS_P4, capacity=16).read()  # Arrays grow from 16 entries
+        self.assertEqual(r.errors, 0)
+        self.assertEqual(r.n_rpcs, 300 + 30 + 12)
+        self.assertEqual(len(r.status), 300)
+        self.assertEqual(len(r.debug), 30)
+        self.assertEqual(len(r.print), 12)
+        self.assertTrue(np.allclose(r.status['pos'], 0.01 * np.arange(300)))
+        self.assertTrue(np.all(np.diff(r.status['timestamp'].astype(np.int64)) >= 0))
+        self.assertEqual(list(r.debug['u8_1'][:3]), [0, 10, 20])
+        self.assertEqual(r.debug['f_2'][2], 40.0)
+        self.assertEqual(r.print['line'][1], b'line 25')
+        self.assertEqual(list(r.entries['type'][:5]), [TRACE_TYPE_STATUS, TRACE_TYPE_DEBUG, TRACE_TYPE_PRINT,
+                                                       TRACE_TYPE_STATUS, TRACE_TYPE_STATUS])
+        self.assertEqual(list(r.entries['index'][:5]), [0, 0, 0, 1, 2])
+        self.assertEqual(len(emu.device.trace), 0)
+
+    def test_read_empty_trace(self):
+        """
+        With no trace recorded the board replies a single status entry
+        """
+        emu, t = self._start(WaccEmulator())
+        r = FirmwareTraceReader(t, 9, WACC_STATUS_P2).read()
+        self.assertEqual((r.n_rpcs, len(r.status), len(r.debug), r.errors), (1, 1, 0, 0))
+        self.assertAlmostEqual(r.status['az'][0], 9.8, places=5)
+
+    def test_missed_replies(self):
+        """
+        A pull with no reply is counted and retried; the read fails once max_missed pulls in a row get none
+        """
+        emu, t = self._start(StepperEmulator())
+        t.sync_handler.timeout = 0.02
+        self._record_stepper(emu.device, 50)
+        emu.drop_rate = 0.2
+        r = FirmwareTraceReader(t, 27, STEPPER_STATUS_P4).read()
+        self.assertGreater(r.missed, 0)
+        self.assertEqual(r.errors, r.missed)
+        self.assertEqual(len(emu.device.trace), 0)  # Read to the end
+        self.assertEqual(len(r.status) + len(r.debug) + len(r.print) + r.missed, r.n_rpcs)
+        emu.drop_rate = 1.0
+        r = FirmwareTraceReader(t, 27, STEPPER_STATUS_P4, max_missed=2)
+        with self.assertRaises(transport.TransportError):
+            r.read()
+        self.assertEqual((r.missed, r.errors), (2, 2))
+
+    def test_stream_to_file(self):
+        emu, t = self._start(StepperEmulator())
+        self._record_stepper(emu.device, 100)
+        f = io.BytesIO()
+        r = FirmwareTraceReader(t, 27, STEPPER_STATUS_P4, capacity=8).read(out=f)  # Written out every 8 entries
+        self.assertEqual(r.errors, 0)
+        f.seek(0)
+        d = load_trace(f)
+        self.assertEqual((len(d['status']), len(d['debug']), len(d['print'])), (100, 10, 4))
+        self.assertTrue(np.allclose(d['status']['pos'], 0.01 * np.arange(100)))
+        self.assertEqual(len(d['entries']), 114)
+        self.assertEqual(d['entries']['index'][-1], 99)  # Indices run across chunks
+        self.assertEqual(d['print']['line'][3], b'line 75')
+        fd, path = tempfile.mkstemp(suffix='.trace')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self._record_stepper(emu.device, 20)
+        FirmwareTraceReader(t, 27, STEPPER_STATUS_P4).read(out=path)
+        self.assertEqual(len(load_trace(path)['status']), 20)
+
+    def test_pimu_trace(self):
+        emu, t = self._start(PimuEmulator())
+        for i in range(5):
+            emu.device.voltage_raw = 600.0 + i
+            emu.device.record_trace()
+        r = FirmwareTraceReader(t, 11, IMU_STATUS_P1.extend(PIMU_STATUS_P6.fields)).read()
+        self.assertEqual(list(r.status['voltage']), [600.0, 601.0, 602.0, 603.0, 604.0])
+        self.assertEqual(r.status['qw'][0], 1.0)
@@ -0,0 +1,455 @@
+import unittest
+import threading
+import logging
+import os
+import select
+import time
+import asyncio
+import tracemalloc
+import array as arr
+import stretch_body.transport as transport
+import stretch_body.cobbs_framing as cobbs_framing
+
+
+class FakeV1Serial():
+    """
+    In process stand in for a V1 firmware serial port
+    Pushed RPC data is collected in self.pushed and acked with RPC_ID+1
+    Pulls reply with [RPC_ID+1, self.pull_data...], split across frames as the firmware does
+    """
+    def __init__(self, pull_data):
+        self.framer = cobbs_framing.CobbsFraming()
+        self.pull_data = bytes(pull_data)
+        self.pushed = bytearray()
+        self.pushes = []  # All completed push RPCs, in order
+        self.rx = bytearray()
+        self.out = bytearray()
+        self.pull_reply = b''
+        self.pull_idx = 0
+        self.drop = 0  # Number of reply frames to lose
+
+    def write(self, data):
+        self.rx += bytes(data)
+        while 0 in self.rx:
+            idx = self.rx.index(0)
+            frame = bytes(self.rx[:idx])
+            del self.rx[:idx + 1]
+            self._handle(frame)
+        return len(data)
+
+    def inWaiting(self):
+        return len(self.out)
+
+    def read(self, n):
+        b = bytes(self.out[:n])
+        del self.out[:n]
+        return b
+
+    def reset_input_buffer(self):
+        self.out = bytearray()
+
+    def reset_output_buffer(self):
+        self.rx = bytearray()
+
+    def _send(self, data):
+        if self.drop:
+            self.drop -= 1
+            return
+        self.out += self.framer.encode_data(arr.array('B', data))
+
+    def _handle(self, frame):
+        crc_ok, nr, d = self.framer.decode_data(frame)
+        assert crc_ok
+        cmd = d[0]
+        if cmd in (transport.RPC_V1_PUSH_FRAME_FIRST_ONLY, transport.RPC_V1_PUSH_FRAME_FIRST_MORE):
+            self.pushed = bytearray(d[1:nr])
+        elif cmd in (transport.RPC_V1_PUSH_FRAME_MORE, transport.RPC_V1_PUSH_FRAME_LAST):
+            self.pushed += bytes(d[1:nr])
+        if cmd in (transport.RPC_V1_PUSH_FRAME_FIRST_ONLY, transport.RPC_V1_PUSH_FRAME_LAST):
+            self.pushes.append(bytes(self.pushed))
+            self._send([transport.RPC_V1_PUSH_ACK, self.pushed[0] + 1])
+        elif cmd in (transport.RPC_V1_PUSH_FRAME_FIRST_MORE, transport.RPC_V1_PUSH_FRAME_MORE):
+            self._send([transport.RPC_V1_PUSH_ACK])
+        elif cmd in (transport.RPC_V1_PULL_FRAME_FIRST, transport.RPC_V1_PULL_FRAME_MORE):
+            if cmd == transport.RPC_V1_PULL_FRAME_FIRST:
+                self.pull_reply = bytes([d[1] + 1]) + self.pull_data
+                self.pull_idx = 0
+            chunk = self.pull_reply[self.pull_idx:self.pull_idx + transport.RPC_V1_FRAME_DATA_MAX_BYTES]
+            self.pull_idx += len(chunk)
+            last = self.pull_idx >= len(self.pull_reply)
+            code = transport.RPC_V1_PULL_FRAME_ACK_LAST if last else transport.RPC_V1_PULL_FRAME_ACK_MORE
+            self._send([code] + list(chunk))
+
+
+class PtyV1Device(threading.Thread):
+    """
+    Serve a FakeV1Serial device on the master side of a pty pair
+    Open a Transport on self.port to talk to it
+    """
+    def __init__(self, pull_data=b'', reply_delay=0.0):
+        threading.Thread.__init__(self, daemon=True)
+        self.master, self.slave = os.openpty()
+        self.port = os.ttyname(self.slave)
+        self.dev = FakeV1Serial(pull_data)
+        self.reply_delay = reply_delay  # Simulated device / USB turnaround time (s)
+        self.shutdown_flag = threading.Event()
+
+    def run(self):
+        while not self.shutdown_flag.is_set():
+            r, _, _ = select.select([self.master], [], [], 0.05)
+            if r:
+                self.dev.write(os.read(self.master, 1024))
+                out = self.dev.read(self.dev.inWaiting())
+                if out:
+                    if self.reply_delay:
+                        time.sleep(self.reply_delay)
+                    os.write(self.master, out)
+
+    def stop(self):
+        self.shutdown_flag.set()
+        self.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class TestTransport(unittest.TestCase):
+
+    def _handler(self, pull_data=b''):
+        ser = FakeV1Serial(pull_data)
+        h = transport.SyncTransactionHandler('fake', ser, logging.getLogger('test_transport'), threading.Lock())
+        h.version = transport.RPC_TRANSPORT_VERSION_1
+        return ser, h
+
+    def test_pull_multi_frame(self):
+        pull_data = bytes([i % 7 for i in range(300)])  # Zeros exercise the Cobbs encoding
+        ser, h = self._handler(pull_data)
+        replies = []
+        h.do_rpc(push=False, payload=arr.array('B', [10]), reply_callback=lambda r: replies.append(bytes(r)))
+        self.assertEqual(replies, [bytes([11]) + pull_data])
+        self.assertEqual(h.status['read_error'], 0)
+
+    def test_push_multi_frame(self):
+        ser, h = self._handler()
+        t = transport.Transport('fake')
+        payload = t.get_empty_payload()
+        payload[0] = 20
+        for i in range(1, 200):
+            payload[i] = i % 5
+        replies = []
+        h.do_rpc(push=True, payload=payload[:200], reply_callback=lambda r: replies.append(bytes(r)))
+        self.assertEqual(bytes(ser.pushed), bytes(payload[:200]))
+        self.assertEqual(replies, [bytes([21])])
+
+    def test_payload_reused_per_thread(self):
+        t = transport.Transport('fake')
+        p0 = t.get_empty_payload()
+        self.assertIs(t.get_empty_payload(), p0)
+        self.assertEqual(len(p0), transport.RPC_DATA_MAX_BYTES + 1)
+        other = []
+        th = threading.Thread(target=lambda: other.append(t.get_empty_payload()))
+        th.start()
+        th.join()
+        self.assertIsNot(other[0].obj, p0.obj)
+        self.assertEqual(t.status['payload_allocs'], 2)
+        p1 = t.get_empty_payload(reuse=False)  # For the async paths: never shared
+        self.assertIsNot(p1.obj, p0.obj)
+        self.assertIsNot(t.get_empty_payload(reuse=False).obj, p1.obj)
+        self.assertEqual(len(p1), transport.RPC_DATA_MAX_BYTES + 1)
+
+    def test_steady_state_allocations(self):
+        """
+        A status loop (pull + push of a small command) should not allocate transport buffers per cycle
+        or retain memory in the transport / framing code
+        """
+        ser, h = self._handler(bytes(range(1, 150)))
+        t = transport.Transport('fake')
+        status_rpc = arr.array('B', [10])
+        sink = lambda r: None
+
+        def cycle():
+            h.do_rpc(push=False, payload=status_rpc, reply_callback=sink)
+            payload = t.get_empty_payload()
+            payload[0] = 20
+            transport.pack_float_t(payload, 1, 1.5)
+            h.do_rpc(push=True, payload=payload[:5], reply_callback=sink)
+
+        for i in range(20):
+            cycle()
+        allocs = h.status['allocs']
+        filters = [tracemalloc.Filter(True, transport.__file__), tracemalloc.Filter(True, cobbs_framing.__file__)]
+        tracemalloc.start()
+        try:
+            s0 = tracemalloc.take_snapshot().filter_traces(filters)
+            for i in range(500):
+                cycle()
+            s1 = tracemalloc.take_snapshot().filter_traces(filters)
+        finally:
+            tracemalloc.stop()
+        growth = sum(d.size_diff for d in s1.compare_to(s0, 'filename'))
+        self.assertEqual(h.status['allocs'], allocs)
+        self.assertEqual(t.status['payload_allocs'], 1)
+        self.assertLess(growth, 1024)
+        self.assertEqual(h.status['read_error'], 0)
+
+    def test_leftover_bytes_kept(self):
+        ser, h = self._handler()
+        f = cobbs_framing.CobbsFraming()
+        ser.out += f.encode_data(arr.array('B', [1, 0, 2])) + bytes([0]) + f.encode_data(arr.array('B', [3, 4]))
+        crc_ok, nr, d = h.receiveFramedData()
+        self.assertTrue(crc_ok)
+        self.assertEqual(bytes(d[:nr]), bytes([1, 0, 2]))
+        self.assertEqual(ser.inWaiting(), 0) #Second frame was read with the first
+        crc_ok, nr, d = h.receiveFramedData()
+        self.assertTrue(crc_ok)
+        self.assertEqual(bytes(d[:nr]), bytes([3, 4]))
+
+    def test_receive_timeout(self):
+        ser, h = self._handler()
+        h.timeout = 0.01
+        ser.out += bytes([5, 1, 2])  # Partial frame, no packet marker
+        crc_ok, nr, d = h.receiveFramedData()
+        self.assertFalse(crc_ok)
+        self.assertEqual(nr, 0)
+        self.assertEqual(h.rx_tail, 0)
+
+    def test_adaptive_timeout(self):
+        t = transport.AdaptiveTimeout(k=4.0, t_min=0.005, n_warmup=4)
+        self.assertEqual(t.get(1.0), 1.0)  # Not warmed up
+        for i in range(4):
+            t.record(0.002)
+        self.assertEqual(t.get(1.0), 0.005)  # srtt + 4 * rttvar is under the floor
+        for i in range(100):
+            t.record(0.02)
+        self.assertAlmostEqual(t.get(1.0), 0.02, delta=0.001)
+        t.on_timeout()
+        t.on_timeout()
+        self.assertAlmostEqual(t.get(1.0), 0.08, delta=0.004)
+        self.assertEqual(t.get(0.05), 0.05)
+        t.record(0.02)
+        self.assertAlmostEqual(t.get(1.0), 0.02, delta=0.001)
+
+    def test_pull_retry_recovers_lost_frame(self):
+        pull_data = bytes(range(100))
+        ser, h = self._handler(pull_data)
+        replies = []
+        for i in range(transport.RPC_TIMEOUT_WARMUP):
+            h.do_rpc(False, arr.array('B', [9]), lambda r: replies.append(bytes(r)))
+        self.assertLess(h.frame_timeout(), 0.1)
+        ser.drop = 1
+        ts = time.time()
+        h.do_rpc(False, arr.array('B', [9]), lambda r: replies.append(bytes(r)))
+        self.assertLess(time.time() - ts, 0.5)  # Not the 1s fixed timeout
+        self.assertEqual(len(replies), transport.RPC_TIMEOUT_WARMUP + 1)
+        self.assertEqual(replies[-1], bytes([10]) + pull_data)
+        self.assertEqual(h.status['timeouts'], 1)
+        self.assertEqual(h.status['retries'], 1)
+        self.assertEqual(h.status['recovered'], 1)
+
+    def test_pull_not_retried_with_retries_0(self):
+        ser, h = self._handler(bytes(range(10)))
+        h.timeout = 0.02
+        ser.drop = 1
+        replies = []
+        self.assertFalse(h.do_rpc(False, arr.array('B', [9]), lambda r: replies.append(bytes(r)), retries=0))
+        self.assertEqual(replies, [])
+        self.assertEqual(h.status['timeouts'], 1)
+        self.assertEqual(h.status['retries'], 0)
+
+    def test_push_not_retried(self):
+        ser, h = self._handler()
+        h.timeout = 0.02
+        ser.drop = 1
+        replies = []
+        h.do_rpc(True, arr.array('B', [9, 1]), lambda r: replies.append(bytes(r)))
+        self.assertEqual(replies, [])
+        self.assertEqual(ser.pushes, [bytes([9, 1])])
+        self.assertEqual(h.status['retries'], 0)
+        self.assertEqual(h.status['read_error'], 1)
+
+    def test_pty_rpc(self):
+        pull_data = bytes([i % 3 for i in range(200)])
+        dev = PtyV1Device(pull_data)
+        dev.start()
+        t = transport.Transport(dev.port)
+        try:
+            self.assertTrue(t.startup())
+            self.assertIsNotNone(t.sync_handler.poller)
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            replies = []
+            for i in range(20):
+                t.do_pull_rpc_sync(arr.array('B', [10]), lambda r: replies.append(bytes(r)))
+            self.assertEqual(replies, [bytes([11]) + pull_data] * 20)
+            payload = t.get_empty_payload()
+            payload[0] = 30
+            payload[1:100] = bytes(range(99))
+            t.do_push_rpc_sync(payload[:100], lambda r: replies.append(bytes(r)))
+            self.assertEqual(replies[-1], bytes([31]))
+            self.assertEqual(bytes(dev.dev.pushed), bytes(payload[:100]))
+            self.assertEqual(t.status['sync']['read_error'], 0)
+        finally:
+            t.stop()
+            dev.stop()
+
+    def test_pty_rpc_async(self):
+        pull_data = bytes([i % 3 for i in range(200)])
+        dev = PtyV1Device(pull_data)
+        dev.start()
+        t = transport.Transport(dev.port)
+        replies = []
+
+        async def rpcs():
+            for i in range(10):
+                await t.do_pull_rpc_async(arr.array('B', [10]), lambda r: replies.append(bytes(r)))
+            payload = t.get_empty_payload()
+            payload[0] = 30
+            payload[1:100] = bytes(range(99))
+            await t.do_push_rpc_async(payload[:100], lambda r: replies.append(bytes(r)))
+
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            asyncio.run(rpcs())
+            self.assertEqual(replies[:10], [bytes([11]) + pull_data] * 10)
+            self.assertEqual(replies[10], bytes([31]))
+            self.assertEqual(bytes(dev.dev.pushed), bytes([30]) + bytes(range(99)))
+            self.assertEqual(t.status['async']['read_error'], 0)
+        finally:
+            t.stop()
+            dev.stop()
+
+    def test_pty_status_cache(self):
+        dev = PtyV1Device(bytes(10))
+        dev.start()
+        t = transport.Transport(dev.port)
+        replies = []
+        cb = lambda r: replies.append(r[0])
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            t.do_pull_rpc_sync(arr.array('B', [10]), cb, max_age=10.0)  # Miss, no reply yet
+            t.do_pull_rpc_sync(arr.array('B', [10]), cb, max_age=10.0)  # Hit
+            asyncio.run(t.do_pull_rpc_async(arr.array('B', [10]), cb, max_age=10.0))  # Hit
+            t.do_pull_rpc_sync(arr.array('B', [12]), cb, max_age=10.0)  # Miss, other RPC
+            time.sleep(0.01)
+            asyncio.run(t.do_pull_rpc_async(arr.array('B', [10]), cb, max_age=0.005))  # Miss, stale
+            t.do_pull_rpc_sync(arr.array('B', [10]), cb)  # Not cached
+            self.assertEqual(replies, [11, 13, 11, 11])
+            self.assertEqual(t.get_stats()['cache'], {'hits': 2, 'misses': 3})
+            self.assertEqual(t.get_stats()['rpc']['n'], 4)
+        finally:
+            t.stop()
+            dev.stop()
+
+    def _batch(self, t):
+        payload = t.get_empty_payload()
+        rpcs = []
+        sidx = 0
+        for rpc_id, n in [(40, 9), (50, 81), (60, 30), (70, 5)]:  # Trigger, gains (multi frame), command, ...
+            payload[sidx] = rpc_id
+            payload[sidx + 1:sidx + n] = bytes([(rpc_id + i) % 256 for i in range(n - 1)])
+            rpcs.append(payload[sidx:sidx + n])
+            sidx = sidx + n
+        return rpcs
+
+    def test_push_batch(self):
+        ser, h = self._handler()
+        t = transport.Transport('fake')
+        rpcs = self._batch(t)
+        replies = []
+        h.do_push_batch([(r, lambda x: replies.append(bytes(x))) for r in rpcs])
+        self.assertEqual(ser.pushes, [bytes(r) for r in rpcs])
+        self.assertEqual(replies, [bytes([41]), bytes([51]), bytes([61]), bytes([71])])
+        self.assertEqual(h.status['read_error'], 0)
+        self.assertEqual(h.status['transactions'], 4)
+
+    def test_pty_push_batch(self):
+        dev = PtyV1Device()
+        dev.start()
+        t = transport.Transport(dev.port)
+        replies = []
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            rpcs = self._batch(t)
+            t.do_push_rpc_batch_sync([(r, lambda x: replies.append(bytes(x))) for r in rpcs])
+            self.assertEqual(dev.dev.pushes, [bytes(r) for r in rpcs])
+            rpcs = self._batch(t)
+            asyncio.run(t.do_push_rpc_batch_async([(r, lambda x: replies.append(bytes(x))) for r in rpcs]))
+            self.assertEqual(dev.dev.pushes[4:], [bytes(r) for r in rpcs])
+            self.assertEqual(replies, [bytes([41]), bytes([51]), bytes([61]), bytes([71])] * 2)
+            self.assertEqual(t.status['sync']['read_error'] + t.status['async']['read_error'], 0)
+        finally:
+            t.stop()
+            dev.stop()
+
+
+class TestTransportLock(unittest.TestCase):
+
+    def test_sync_with(self):
+        lock = transport.TransportLock()
+        with lock:
+            self.assertTrue(lock.locked())
+            self.assertFalse(lock.acquire(blocking=False))
+        self.assertFalse(lock.locked())
+
+    def test_async_waits_on_thread_without_blocking_loop(self):
+        lock = transport.TransportLock()
+        lock.acquire()
+        ticks = []
+
+        async def ticker():
+            while not lock.locked() or len(ticks) < 5:
+                ticks.append(time.time())
+                await asyncio.sleep(0.005)
+
+        async def waiter():
+            await lock.acquire_async()
+            lock.release()
+
+        async def main():
+            t_ticker = asyncio.ensure_future(ticker())
+            t_waiter = asyncio.ensure_future(waiter())
+            await asyncio.sleep(0.05)
+            self.assertFalse(t_waiter.done())
+            threading.Thread(target=lock.release).start()
+            await t_waiter
+            await t_ticker
+
+        asyncio.run(main())
+        self.assertGreaterEqual(len(ticks), 5) #Event loop kept running while the coroutine waited
+        self.assertFalse(lock.locked())
+
+    def test_async_waiters_serialized(self):
+        lock = transport.TransportLock()
+        active = []
+        overlap = []
+
+        async def worker():
+            await lock.acquire_async()
+            try:
+                active.append(1)
+                overlap.append(len(active))
+                await asyncio.sleep(0.001)
+                active.pop()
+            finally:
+                lock.release()
+
+        async def main():
+            await asyncio.gather(*[worker() for i in range(10)])
+
+        asyncio.run(main())
+        self.assertEqual(overlap, [1] * 10)
+
+    def test_release_with_waiter_of_closed_loop(self):
+        lock = transport.TransportLock()
+        lock.acquire()
+
+        async def main():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(lock.acquire_async(), 0.02)
+
+        asyncio.run(main())  # Its loop is closed with the waiter still queued
+        lock.release()
+        self.assertFalse(lock.locked())
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
@@ -0,0 +1,45 @@
+import unittest
+import json
+import stretch_body.transport as transport
+from stretch_body.transport_benchmark import *
+from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator, WaccEmulator
+
+
+class TestTransportBenchmark(unittest.TestCase):
+
+    def start_board(self, device):
+        emu = PtyDeviceEmulator(device)
+        emu.start()
+        self.addCleanup(emu.stop)
+        t = transport.Transport(emu.port)
+        self.assertTrue(t.startup())
+        self.addCleanup(t.stop)
+        return t
+
+    def test_sweep(self):
+        t = self.start_board(StepperEmulator())
+        t.set_version(RPC_TRANSPORT_VERSION_1)
+        results = TransportBenchmark(t, 'Stepper', n_rpcs=5).run(sizes=[1, 58, 1024])
+        self.assertEqual(len(results), 2 * 2 * 2 * 3)
+        self.assertEqual(t.version, RPC_TRANSPORT_VERSION_1)
+        for r in results:
+            self.assertEqual(r['errors'], 0)
+            self.assertEqual(r['latency']['n'], 5)
+            self.assertAlmostEqual(r['bytes_per_s'], r['rpcs_per_s'] * r['size'], delta=r['bytes_per_s'] * 1e-6)
+        self.assertEqual({(r['version'], r['mode'], r['direction']) for r in results},
+                         {(v, m, d) for v in (0, 1) for m in ('sync', 'async') for d in ('push', 'pull')})
+
+    def test_json(self):
+        t = self.start_board(WaccEmulator())
+        results = TransportBenchmark(t, 'Wacc', n_rpcs=2).run(sizes=[16], versions=[RPC_TRANSPORT_VERSION_1], modes=['sync'])
+        doc = json.loads(results_to_json(results, emulated=True))
+        self.assertTrue(doc['emulated'])
+        self.assertEqual([(r['board'], r['direction'], r['size']) for r in doc['results']],
+                         [('Wacc', 'push', 16), ('Wacc', 'pull', 16)])
+
+    def test_bad_args(self):
+        t = self.start_board(StepperEmulator())
+        with self.assertRaises(TransportError):
+            TransportBenchmark(t, 'Dynamixel')
+        with self.assertRaises(TransportError):
+            TransportBenchmark(t, 'Stepper').run_one(RPC_TRANSPORT_VERSION_0, 'sync', 'push', RPC_DATA_MAX_BYTES + 1)
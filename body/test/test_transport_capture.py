@@ -0,0 +1,84 @@
+import unittest
+import os
+import tempfile
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.transport_capture import *
+from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator, PimuEmulator, EMULATOR_STEPPER_FIRMWARE
+
+
+class TestTransportCapture(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.sbcap')
+        os.close(fd)
+        self.addCleanup(os.remove, self.filename)
+
+    def _start(self, device, capture):
+        emu = PtyDeviceEmulator(device)
+        emu.start()
+        t = transport.Transport(emu.port)
+        t.start_capture(capture)
+        self.assertTrue(t.startup())
+        self.addCleanup(emu.stop)
+        self.addCleanup(t.stop)
+        return emu, t
+
+    def test_capture_and_reassemble(self):
+        capture = TransportCapture(self.filename)
+        emu_s, ts = self._start(StepperEmulator(), capture)
+        emu_p, tp = self._start(PimuEmulator(), capture)
+        sink = lambda r: None
+        ts.do_pull_rpc_sync(arr.array('B', [17]), sink)  # Board info, over V0
+        ts.configure_version(EMULATOR_STEPPER_FIRMWARE)
+        tp.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        for i in range(5):
+            ts.do_pull_rpc_sync(arr.array('B', [3]), sink)
+            tp.do_pull_rpc_sync(arr.array('B', [3]), sink)  # Multi frame reply
+        payload = ts.get_empty_payload()
+        payload[0] = 9
+        payload[5] = 5
+        ts.do_push_rpc_batch_sync([(payload[:9], sink), (payload[5:6], sink)])  # Pipelined pushes
+        capture.stop()
+        self.assertEqual(capture.status['dropped'], 0)
+        self.assertEqual(capture.status['bytes'], os.path.getsize(self.filename) - len(CAPTURE_MAGIC))
+
+        records = list(read_capture(self.filename))
+        self.assertEqual(len(records), ts.status['sync']['frames'] + tp.status['sync']['frames'])
+        self.assertTrue(all(b[0] <= a[0] for a, b in zip(records[1:], records[:-1])))  # Monotonic timestamps
+        rpcs = [(port, request, reply) for t_ns, port, request, reply in capture_rpcs(records)]
+        stepper = [r for r in rpcs if r[0] == emu_s.port]
+        pimu = [r for r in rpcs if r[0] == emu_p.port]
+        self.assertEqual(len(stepper), 8)
+        self.assertEqual(stepper[0][1], bytes([17]))
+        self.assertEqual(stepper[0][2][1:10], b'Stepper.1')
+        self.assertEqual([len(r[2]) for r in stepper[1:6]], [1 + StepperEmulator.status_fmt.size] * 5)
+        self.assertEqual(stepper[6], (emu_s.port, bytes(payload[:9]), bytes([10, 0, 0, 0, 0])))  # RPC_REPLY_SET_TRIGGER, trigger
+        self.assertEqual(stepper[7], (emu_s.port, bytes([5]), bytes([6])))
+        self.assertEqual(len(pimu), 5)
+        self.assertEqual(len(pimu[0][2]), 1 + PimuEmulator.imu_fmt.size + PimuEmulator.status_fmt.size)
+
+    def test_stop_capture(self):
+        capture = TransportCapture(self.filename)
+        emu, t = self._start(PimuEmulator(), capture)
+        t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        t.do_pull_rpc_sync(arr.array('B', [3]), lambda r: None)
+        t.stop_capture()
+        self.assertIsNone(t.sync_handler.capture)
+        t.do_pull_rpc_sync(arr.array('B', [3]), lambda r: None)
+        capture.stop()
+        self.assertEqual(len(list(capture_rpcs(read_capture(self.filename)))), 1)
+
+    def test_full_buffer_drops(self):
+        capture = TransportCapture(self.filename, buffer_size=256)
+        capture.record_tx(0, bytes(30))
+        capture.record_tx(0, bytes(300))  # Never blocks the RPC, the record is dropped
+        capture.stop()
+        self.assertEqual(capture.status['records'], 1)
+        self.assertEqual(capture.status['dropped'], 1)
+
+    def test_not_a_capture(self):
+        with open(self.filename, 'wb') as fh:
+            fh.write(b'not a capture')
+        with self.assertRaises(transport.TransportError):
+            list(read_capture(self.filename))
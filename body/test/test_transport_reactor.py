@@ -0,0 +1,139 @@
+import unittest
+import threading
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.transport_reactor import *
+from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator, PimuEmulator, WaccEmulator
+
+
+class TestTransportReactor(unittest.TestCase):
+
+    def start_boards(self, devices, version=RPC_TRANSPORT_VERSION_1, **kwargs):
+        ts = []
+        for d in devices:
+            emu = PtyDeviceEmulator(d, **kwargs)
+            emu.start()
+            self.emus.append(emu)
+            self.addCleanup(emu.stop)
+            t = transport.Transport(emu.port)
+            self.assertTrue(t.startup())
+            self.addCleanup(t.stop)
+            t.set_version(version)
+            ts.append(t)
+        return ts
+
+    def setUp(self):
+        self.emus = []
+        self.reactor = TransportReactor()
+        self.addCleanup(self.reactor.close)
+
+    def test_load_test_push_pull(self):
+        """
+        Multi-frame push then multi-frame pull (1024 bytes, 18 frames each way)
+        """
+        t, = self.start_boards([StepperEmulator()])
+        data = bytes([i % 256 for i in range(RPC_DATA_MAX_BYTES)])
+        replies = []
+
+        async def load_test():
+            await t.do_push_rpc_async(arr.array('B', [7]) + arr.array('B', data), lambda r: replies.append(r[0]))
+            await t.do_pull_rpc_async(arr.array('B', [31]), lambda r: replies.append(bytes(r)))
+
+        self.reactor.run_until_complete([load_test()])
+        self.assertEqual(replies, [8, bytes([32]) + data[1:] + data[:1]])
+        self.assertEqual(t.status['sync']['read_error'], 0)
+        self.assertEqual(t.status['sync']['transactions'], 2)
+        self.assertEqual(t.get_stats()['rpc']['n'], 2)
+        self.assertEqual(self.reactor.status['rpcs'], 2)
+
+    def test_push_batch(self):
+        t, = self.start_boards([StepperEmulator()])
+        replies = []
+        rpcs = [(arr.array('B', [25]), lambda r: replies.append(r[0])) for i in range(3)]
+        rpcs.insert(1, (arr.array('B', [7]) + arr.array('B', bytes(100)), lambda r: replies.append(r[0])))
+        self.reactor.run_until_complete([t.do_push_rpc_batch_async(rpcs)])
+        self.assertEqual(replies, [26, 8, 26, 26])
+        self.assertEqual(t.status['sync']['read_error'], 0)
+
+    def test_boards_in_flight_together(self):
+        ts = self.start_boards([StepperEmulator(), PimuEmulator(), WaccEmulator()], reply_delay=0.002)
+        replies = []
+        self.reactor.run_until_complete([t.do_pull_rpc_async(arr.array('B', [3]), lambda r: replies.append(r[0]))
+                                         for t in ts])
+        self.assertEqual(sorted(replies), [4, 4, 4])
+        self.assertEqual(len(self.reactor.active), 0)
+        for t in ts:
+            self.assertEqual(t.get_stats()['rpc']['n'], 1)
+            self.assertFalse(t.lock.locked())
+
+    def test_waits_for_busy_port(self):
+        t, = self.start_boards([StepperEmulator()])
+        t.lock.acquire()
+        threading.Timer(0.02, t.lock.release).start()
+        replies = []
+        self.reactor.run_until_complete([t.do_pull_rpc_async(arr.array('B', [3]), lambda r: replies.append(r[0]))])
+        self.assertEqual(replies, [4])
+        self.assertEqual(self.reactor.status['lock_waits'], 1)
+
+    def test_timeout(self):
+        t, = self.start_boards([StepperEmulator()])
+        t.sync_handler.timeout = 0.05
+        self.emus[0].drop_rate = 1.0
+        replies = []
+        self.reactor.run_until_complete([t.do_pull_rpc_async(arr.array('B', [3]), lambda r: replies.append(r[0]))])
+        self.assertEqual(replies, [])
+        n = 1 + t.sync_handler.max_retries  # Pulls are retried
+        self.assertEqual(self.reactor.status['timeouts'], n)
+        self.assertEqual(t.status['sync']['read_error'], n)
+        self.assertEqual(t.status['sync']['retries'], n - 1)
+        self.assertEqual(t.get_stats()['retries'], n - 1)
+        self.assertFalse(t.lock.locked())
+
+    def test_timeout_not_retried_with_retries_0(self):
+        t, = self.start_boards([StepperEmulator()])
+        t.sync_handler.timeout = 0.05
+        self.emus[0].drop_rate = 1.0
+        replies = []
+        self.reactor.run_until_complete([t.do_pull_rpc_async(arr.array('B', [3]), lambda r: replies.append(r[0]),
+                                                             retries=0)])
+        self.assertEqual(replies, [])
+        self.assertEqual(self.reactor.status['timeouts'], 1)
+        self.assertEqual(t.status['sync']['retries'], 0)
+        self.assertFalse(t.lock.locked())
+
+    def test_retry_recovers(self):
+        t, = self.start_boards([StepperEmulator()], seed=2)
+        t.sync_handler.timeout = 0.1
+        self.emus[0].drop_rate = 0.2
+        replies = []
+        for i in range(20):
+            self.reactor.run_until_complete([t.do_pull_rpc_async(arr.array('B', [3]), lambda r: replies.append(r[0]))])
+        s = t.status['sync']
+        self.assertGreater(s['recovered'], 0)
+        self.assertEqual(len(replies), 20 - (s['read_error'] - s['retries']))
+
+    def test_callback_error_to_coroutine(self):
+        t, = self.start_boards([StepperEmulator()])
+        caught = []
+
+        def fail(r):
+            raise ValueError('bad reply')
+
+        async def pull():
+            try:
+                await t.do_pull_rpc_async(arr.array('B', [3]), fail)
+            except ValueError as e:
+                caught.append(e)
+            await t.do_pull_rpc_async(arr.array('B', [3]), fail)
+
+        with self.assertRaises(ValueError):
+            self.reactor.run_until_complete([pull()])
+        self.assertEqual(len(caught), 1)
+        self.assertFalse(t.lock.locked())
+
+    def test_v0_fallback(self):
+        t, = self.start_boards([StepperEmulator()], version=RPC_TRANSPORT_VERSION_0)
+        replies = []
+        self.reactor.run_until_complete([t.do_pull_rpc_async(arr.array('B', [3]), lambda r: replies.append(r[0]))])
+        self.assertEqual(replies, [4])
+        self.assertEqual(self.reactor.status['fallbacks'], 1)
@@ -0,0 +1,59 @@
+import unittest
+import random
+import array as arr
+import stretch_body.transport as transport
+import stretch_body.transport_stats as transport_stats
+from test.test_transport import PtyV1Device
+
+
+class TestTransportStats(unittest.TestCase):
+
+    def test_histogram_percentiles(self):
+        h = transport_stats.LatencyHistogram()
+        random.seed(3)
+        x = [random.uniform(0.0001, 0.01) for i in range(10000)]
+        for dt in x:
+            h.record(dt)
+        x.sort()
+        for p in [50, 90, 99]:
+            exact = x[int(p / 100.0 * len(x)) - 1]
+            self.assertGreaterEqual(h.percentile(p), exact)
+            self.assertLess(h.percentile(p), exact * 1.25) #Within one bucket
+        self.assertEqual(h.percentile(100), max(x))
+        s = h.snapshot()
+        self.assertEqual(s['n'], 10000)
+        self.assertAlmostEqual(s['mean'], sum(x) / len(x))
+
+    def test_histogram_out_of_range(self):
+        h = transport_stats.LatencyHistogram()
+        h.record(0.0)
+        h.record(100.0)
+        self.assertEqual(h.percentile(50), transport_stats.BUCKET_EDGES[0])
+        self.assertEqual(h.percentile(99), 100.0)
+        h.reset()
+        self.assertEqual(h.snapshot()['n'], 0)
+
+    def test_transport_records_rpcs(self):
+        dev = PtyV1Device(bytes(range(1, 150)))
+        dev.start()
+        t = transport.Transport(dev.port)
+        try:
+            self.assertTrue(t.startup())
+            t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+            for i in range(10):
+                t.do_pull_rpc_sync(arr.array('B', [10]), lambda r: None)
+            payload = t.get_empty_payload()
+            payload[0] = 20
+            payload[1] = 30
+            t.do_push_rpc_batch_sync([(payload[0:1], lambda r: None), (payload[1:2], lambda r: None)])
+            s = t.get_stats()
+        finally:
+            t.stop()
+            dev.stop()
+        self.assertEqual(s['rpc']['n'], 12)
+        self.assertEqual(s['lock_wait']['n'], 12)
+        self.assertEqual(s['rpc_id'][10]['n'], 10)
+        self.assertEqual(s['rpc_id'][10]['frames_per_rpc'], 6) # 150 byte reply: 3 pull requests, 3 reply frames
+        self.assertEqual(s['rpc_id'][20]['n'], 1)
+        self.assertEqual(s['rpc_id'][30]['frames_per_rpc'], 2)
+        self.assertGreater(s['rpc']['p50'], 0)
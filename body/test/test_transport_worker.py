@@ -0,0 +1,83 @@
+import unittest
+import threading
+import array as arr
+import stretch_body.transport as transport
+from stretch_body.transport_worker import *
+from stretch_body.device_emulator import PtyDeviceEmulator, StepperEmulator
+
+
+class TestTransportWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.emu = PtyDeviceEmulator(StepperEmulator())
+        self.emu.start()
+        self.t = transport.Transport(self.emu.port)
+        self.assertTrue(self.t.startup())
+        self.t.set_version(transport.RPC_TRANSPORT_VERSION_1)
+        self.t.start_worker()
+        self.addCleanup(self.emu.stop)
+        self.addCleanup(self.t.stop)
+
+    def test_sync_calls_run_on_worker(self):
+        threads = []
+        payload = self.t.get_empty_payload()
+        payload[0] = 3
+        self.t.do_pull_rpc_sync(payload[:1], lambda r: threads.append(threading.current_thread()))
+        payload[0] = 25  # Reset trajectory, a push
+        self.t.do_push_rpc_sync(payload[:1], lambda r: threads.append(threading.current_thread()))
+        self.t.do_push_rpc_batch_sync([(payload[:1], lambda r: threads.append(threading.current_thread()))])
+        self.assertEqual(threads, [self.t.worker.thread] * 3)
+        s = self.t.get_stats()
+        self.assertEqual(s['rpc']['n'], 3)
+        self.assertEqual(s['worker']['submitted'], 3)
+        self.assertEqual(s['worker']['completed'], 3)
+        self.assertEqual(s['worker']['queue_depth'], 0)
+        self.assertEqual(s['worker']['wait']['status']['n'], 1)
+        self.assertEqual(s['worker']['wait']['command']['n'], 2)
+
+    def test_priority_order(self):
+        blocked = threading.Event()
+        release = threading.Event()
+
+        def block(r):
+            blocked.set()
+            release.wait(5.0)
+
+        order = []
+        busy = self.t.submit_pull_rpc(arr.array('B', [3]), block)
+        self.assertTrue(blocked.wait(5.0))
+        futs = [self.t.submit_pull_rpc(arr.array('B', [3]), lambda r: order.append('trace'), priority=RPC_PRIORITY_TRACE),
+                self.t.submit_pull_rpc(arr.array('B', [3]), lambda r: order.append('status')),
+                self.t.submit_push_rpc(arr.array('B', [25]), lambda r: order.append('command'))]
+        self.assertEqual(self.t.worker.status['queue_depth'], 3)
+        self.assertEqual(self.t.worker.status['max_queue_depth'], 3)
+        release.set()
+        for f in [busy] + futs:
+            self.assertIsNone(f.result(5.0))
+        self.assertEqual(order, ['command', 'status', 'trace'])
+
+    def test_payload_copied_on_submit(self):
+        replies = []
+        payload = self.t.get_empty_payload()
+        payload[0] = 3
+        f = self.t.submit_pull_rpc(payload[:1], lambda r: replies.append(r[0]))
+        payload[0] = 0  # Caller reuses its buffer
+        f.result(5.0)
+        self.assertEqual(replies, [4])
+
+    def test_callback_error_to_caller(self):
+        def fail(r):
+            raise ValueError('bad reply')
+        f = self.t.submit_pull_rpc(arr.array('B', [3]), fail)
+        self.assertIsInstance(f.exception(5.0), ValueError)
+        with self.assertRaises(ValueError):
+            self.t.do_pull_rpc_sync(arr.array('B', [3]), fail)
+        self.assertEqual(self.t.worker.status['errors'], 2)
+
+    def test_stop_worker_drains_queue(self):
+        futs = [self.t.submit_pull_rpc(arr.array('B', [3]), lambda r: None) for i in range(5)]
+        self.t.stop_worker()
+        self.assertIsNone(self.t.worker)
+        self.assertTrue(all(f.done() and f.exception() is None for f in futs))
+        self.t.do_pull_rpc_sync(arr.array('B', [3]), lambda r: None)  # Back to caller's thread
+        self.assertEqual(self.t.stats.rpc.n, 6)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+from stretch_body.device_emulator import *
+import argparse
+import time
+
+parser=argparse.ArgumentParser(description='Serve emulated Stepper / Pimu / Wacc firmware on pseudo-terminals, for running Stretch Body without hardware. Ctrl-C to exit')
+parser.add_argument("--stepper", type=int, default=4, help="Number of Stepper boards to emulate")
+parser.add_argument("--no_pimu", action="store_true", help="Do not emulate a Pimu")
+parser.add_argument("--no_wacc", action="store_true", help="Do not emulate a Wacc")
+parser.add_argument("--latency", type=float, default=0.0, help="Device turnaround added to each reply (ms)")
+parser.add_argument("--drop", type=float, default=0.0, help="Probability a reply frame is dropped")
+parser.add_argument("--corrupt", type=float, default=0.0, help="Probability a reply frame is corrupted")
+args=parser.parse_args()
+
+devices=[('Stepper %d'%i,StepperEmulator()) for i in range(args.stepper)]
+if not args.no_pimu:
+    devices.append(('Pimu',PimuEmulator()))
+if not args.no_wacc:
+    devices.append(('Wacc',WaccEmulator()))
+
+emus=[]
+for name,d in devices:
+    e=PtyDeviceEmulator(d,reply_delay=args.latency/1000.0,drop_rate=args.drop,corrupt_rate=args.corrupt,seed=len(emus))
+    e.start()
+    emus.append(e)
+    print('%-12s %s  (%s)'%(name,e.port,d.firmware_version))
+print('Set the usb param of each device to its port above')
+
+try:
+    while True:
+        time.sleep(1.0)
+except (KeyboardInterrupt, SystemExit):
+    pass
+for e in emus:
+    e.stop()
+    print('%-12s RPCs %d  dropped %d  corrupted %d'%(e.port,e.device.status['rpcs'],e.status['dropped'],e.status['corrupted']))
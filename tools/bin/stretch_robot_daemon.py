@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+import stretch_body.robot_params
+from stretch_body.robot_daemon import RobotDaemon
+from stretch_body.hello_utils import *
+import argparse
+import time
+print_stretch_re_use()
+
+parser=argparse.ArgumentParser(description='Own the robot hardware for several processes: serve the Robot API to RobotProxy clients '
+                                           'and publish its status to shared memory. Ctrl-C to exit')
+parser.add_argument("--address", type=str, default=None, help="Unix socket of the daemon (default robot.daemon.address)")
+parser.add_argument("--shm", type=str, default=None, help="Name of the status shared memory (default robot.daemon.shm_name)")
+parser.add_argument("--stats", type=float, default=0.0, help="Print the daemon stats at this rate (Hz)")
+args=parser.parse_args()
+
+d=RobotDaemon(address=args.address, shm_name=args.shm)
+if not d.startup():
+    print('Unable to start the robot')
+    exit(1)
+print('Serving the robot on %s, status in shared memory %s'%(d.address,d.shm_name))
+try:
+    if args.stats>0:
+        while True:
+            time.sleep(1.0/args.stats)
+            print('Clients %d  Calls %d  Errors %d  Status published %d'%(d.status['clients'],d.status['calls'],
+                                                                        d.status['errors'],d.status['published']))
+    else:
+        d.serve_forever()
+except (KeyboardInterrupt, SystemExit,ThreadServiceExit):
+    pass
+d.stop()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+from stretch_body.transport_benchmark import *
+from stretch_body.device_emulator import *
+import stretch_body.transport as transport
+import argparse
+
+parser=argparse.ArgumentParser(description='Benchmark the Transport of a Stepper / Pimu / Wacc board with the load test RPCs. '
+                                           'Reports RPC/s, bytes/s and latency per transport version, call mode and load size')
+parser.add_argument("board", choices=['Stepper','Pimu','Wacc'], help="Board type")
+parser.add_argument("--port", type=str, default=None, help="Board port, eg /dev/hello-motor-lift (default: an emulated board)")
+parser.add_argument("--latency", type=float, default=0.0, help="Turnaround of the emulated board (ms)")
+parser.add_argument("--n", type=int, default=100, help="RPCs per measurement")
+parser.add_argument("--sizes", type=int, nargs='+', default=LOAD_TEST_SIZES, help="Load sizes (bytes, 1 to 1024)")
+parser.add_argument("--versions", type=int, nargs='+', default=[0,1], choices=[0,1], help="Transport versions")
+parser.add_argument("--modes", nargs='+', default=['sync','async'], choices=['sync','async'], help="Call modes")
+parser.add_argument("--json", type=str, default=None, help="Write the results as JSON to this file ('-' for stdout)")
+args=parser.parse_args()
+
+emu=None
+port=args.port
+if port is None:
+    emu=PtyDeviceEmulator({'Stepper':StepperEmulator,'Pimu':PimuEmulator,'Wacc':WaccEmulator}[args.board](),reply_delay=args.latency/1000.0)
+    emu.start()
+    port=emu.port
+
+t=transport.Transport(port)
+try:
+    if not t.startup():
+        print('Unable to open %s'%port)
+        exit(1)
+    results=TransportBenchmark(t,args.board,n_rpcs=args.n).run(sizes=args.sizes,versions=args.versions,modes=args.modes)
+finally:
+    t.stop()
+    if emu is not None:
+        emu.stop()
+
+if args.json=='-':
+    print(results_to_json(results,emulated=emu is not None))
+else:
+    print('%-2s %-5s %-4s %6s %9s %10s %8s %8s %8s %6s'%('V','mode','dir','bytes','RPC/s','KB/s','p50 ms','p99 ms','max ms','errors'))
+    for r in results:
+        l=r['latency']
+        print('%-2d %-5s %-4s %6d %9.0f %10.1f %8.2f %8.2f %8.2f %6d'%(r['version'],r['mode'],r['direction'],r['size'],r['rpcs_per_s'],
+                                                                    r['bytes_per_s']/1000.0,l['p50']*1e3,l['p99']*1e3,l['max']*1e3,r['errors']))
+    if args.json:
+        with open(args.json,'w') as f:
+            f.write(results_to_json(results,emulated=emu is not None))
+        print('Wrote %s'%args.json)
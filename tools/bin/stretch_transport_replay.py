@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+from stretch_body.transport_capture import read_capture, capture_rpcs
+from stretch_body.stepper import Stepper
+from stretch_body.pimu import Pimu, IMU
+from stretch_body.wacc import Wacc
+import stretch_body.hello_utils as hu
+import argparse
+import time
+hu.print_stretch_re_use()
+
+parser=argparse.ArgumentParser(description='Replay a transport capture (see Robot.start_transport_capture) through the unpack_status of the Stepper, Pimu and Wacc, as fast as possible')
+parser.add_argument("capture", type=str, help="Capture file (.sbcap)")
+parser.add_argument("--repeat", type=int, default=10, help="Number of times to decode each status message")
+parser.add_argument("--rpcs", action="store_true", help="Print a summary of the RPCs in the capture")
+args=parser.parse_args()
+
+# Board info RPCs identify the board and its firmware protocol on each port
+BOARD_INFO={Stepper.RPC_GET_STEPPER_BOARD_INFO:'Stepper', Pimu.RPC_GET_PIMU_BOARD_INFO:'Pimu', Wacc.RPC_GET_WACC_BOARD_INFO:'Wacc'}
+
+def make_device(board, port, board_info_reply):
+    """
+    Create the device for a captured port, and configure it for the protocol in its board info
+    The port is not opened
+    """
+    if board=='Stepper':
+        d=Stepper(usb=port if port.startswith('/dev/hello-motor') else '/dev/hello-motor-lift')
+    elif board=='Pimu':
+        d=Pimu(usb=port)
+    else:
+        d=Wacc(usb=port)
+    d.rpc_board_info_reply(board_info_reply)
+    p=d.board_info['protocol_version']
+    if p not in d.supported_protocols:
+        print('%s: protocol %s not supported by this version of Stretch Body, skipping'%(port,p))
+        return None
+    if board=='Stepper':
+        for c in d.supported_protocols[p][::-1]:
+            d.expand_protocol_methods(c)
+    elif board=='Pimu':
+        Pimu.__bases__=d.supported_protocols[p]
+        IMU.__bases__=d.imu.supported_protocols[p]
+    else:
+        Wacc.__bases__=d.supported_protocols[p]
+    return d
+
+# Decode the capture into RPCs up front, so only unpack_status is timed
+t0=time.perf_counter()
+ports={}
+n_rpcs=0
+for t_ns,port,request,reply in capture_rpcs(read_capture(args.capture)):
+    p=ports.setdefault(port,{'board':None,'board_info':None,'status':[],'rpc_ids':{},'t_ns':[t_ns,t_ns]})
+    p['t_ns'][1]=t_ns
+    n_rpcs+=1
+    if len(request)==0 or len(reply)==0:
+        continue
+    p['rpc_ids'][request[0]]=p['rpc_ids'].get(request[0],0)+1
+    if request[0] in BOARD_INFO and len(reply)>20 and reply[1:21].decode('utf-8','ignore').startswith(BOARD_INFO[request[0]]):
+        p['board']=BOARD_INFO[request[0]]
+        p['board_info']=reply
+    elif request[0]==Stepper.RPC_GET_STATUS and reply[0]==Stepper.RPC_REPLY_STATUS:  #Same RPC ID on Pimu and Wacc
+        p['status'].append(reply)
+print('Read %d RPCs on %d ports in %.2fs'%(n_rpcs,len(ports),time.perf_counter()-t0))
+
+print('----------------------------------------------------------------------------')
+print('%-24s %-8s %-6s %10s %10s %12s'%('Port','Board','Proto','Status','Rate (Hz)','Decode (us)'))
+for port in sorted(ports):
+    p=ports[port]
+    if args.rpcs:
+        print('%s RPC IDs: %s'%(port,', '.join(['%d:%d'%(k,v) for k,v in sorted(p['rpc_ids'].items())])))
+    if p['board'] is None:
+        print('%-24s no board info in capture (start the capture before Robot startup)'%port)
+        continue
+    d=make_device(p['board'],port,p['board_info'])
+    if d is None or not len(p['status']):
+        continue
+    dt_capture=(p['t_ns'][1]-p['t_ns'][0])/1e9
+    t0=time.perf_counter()
+    for i in range(args.repeat):
+        for reply in p['status']:
+            d.rpc_status_reply(reply)
+    dt=(time.perf_counter()-t0)/(args.repeat*len(p['status']))
+    print('%-24s %-8s %-6s %10d %10.1f %12.2f'%(port,p['board'],d.board_info['protocol_version'],len(p['status']),
+                                                 len(p['status'])/dt_capture if dt_capture else 0,dt*1e6))
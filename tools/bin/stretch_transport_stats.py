@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+from __future__ import print_function
+import stretch_body.robot_params
+from stretch_body.robot import Robot
+from stretch_body.hello_utils import *
+import argparse
+import time
+print_stretch_re_use()
+
+parser=argparse.ArgumentParser(description='Print live RPC latency (p50 / p99 / max) and lock wait per board. Ctrl-C to exit')
+parser.add_argument("--rate", type=float, default=1.0, help="Print rate (Hz)")
+parser.add_argument("--rpc", action="store_true", help="Also print the latency of each RPC id")
+parser.add_argument("--reset", action="store_true", help="Reset the stats after each print")
+args=parser.parse_args()
+
+r=Robot()
+r.startup()
+
+boards=[('Pimu',r.pimu),('Wacc',r.wacc),('Lift',r.lift.motor),('Arm',r.arm.motor),
+        ('Left wheel',r.base.left_wheel),('Right wheel',r.base.right_wheel)]
+
+def ms(x):
+    return '%8.2f'%(x*1000.0)
+
+try:
+    while True:
+        time.sleep(1.0/args.rate)
+        print('----------------------------------------------------------------------------------------------')
+        print('%-12s %8s %8s %8s %8s | %8s %8s %8s'%('Board','RPCs','p50 ms','p99 ms','max ms','wait p50','wait p99','wait max'))
+        for name,d in boards:
+            if not d.hw_valid:
+                continue
+            s=d.transport.get_stats()
+            print('%-12s %8d %s %s %s | %s %s %s'%(name,s['rpc']['n'],ms(s['rpc']['p50']),ms(s['rpc']['p99']),ms(s['rpc']['max']),
+                                                 ms(s['lock_wait']['p50']),ms(s['lock_wait']['p99']),ms(s['lock_wait']['max'])))
+            st=d.transport.status['sync']
+            print('  Timeout %s ms  timeouts %d  CRC errors %d  retries %d  recovered %d'%(ms(s.get('timeout',0.0)).strip(),
+                  st['timeouts'],st['crc_errors'],st['retries'],st['recovered']))
+            print('  Status cache hits %d  misses %d  suppressed commands %d'%(s['cache']['hits'],s['cache']['misses'],s['suppressed']))
+            if args.rpc:
+                for rpc_id in sorted(s['rpc_id']):
+                    x=s['rpc_id'][rpc_id]
+                    print('  RPC %-6d %8d %s %s %s | frames/RPC %.1f'%(rpc_id,x['n'],ms(x['p50']),ms(x['p99']),ms(x['max']),x['frames_per_rpc']))
+            if 'worker' in s: #use_transport_worker
+                w=s['worker']
+                print('  Queue depth %d (max %d)  errors %d'%(w['queue_depth'],w['max_queue_depth'],w['errors']))
+                for p in ('command','status','trace'):
+                    x=w['wait'][p]
+                    if x['n']:
+                        print('  Queue wait %-8s %8d %s %s %s'%(p,x['n'],ms(x['p50']),ms(x['p99']),ms(x['max'])))
+            if args.reset:
+                d.transport.stats.reset()
+                if d.transport.worker is not None:
+                    d.transport.worker.reset_stats()
+except (KeyboardInterrupt, SystemExit,ThreadServiceExit):
+    pass
+r.stop()